@@ -0,0 +1,70 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+std::vector<paddle::Tensor> GetPaddingOffset(const paddle::Tensor& input_ids,
+                                             const paddle::Tensor& cum_offsets,
+                                             const paddle::Tensor& token_num,
+                                             const paddle::Tensor& seq_len) {
+  WaitForStreamWork(input_ids);
+  const int64_t bsz = input_ids.shape()[0];
+  const int64_t max_seq_len = input_ids.shape()[1];
+  const int64_t token_num_data = token_num.data<int64_t>()[0];
+  CheckTokenNum(seq_len.data<int>(), bsz, max_seq_len, token_num_data);
+
+  auto x_remove_padding = paddle::empty(
+      {token_num_data}, paddle::DataType::INT64, input_ids.place());
+  auto cum_offsets_out =
+      paddle::empty({bsz}, paddle::DataType::INT32, input_ids.place());
+  auto padding_offset = paddle::empty(
+      {token_num_data}, paddle::DataType::INT32, input_ids.place());
+  custom_kernel::GetPaddingOffsetCompute(bsz,
+                                         max_seq_len,
+                                         input_ids.data<int64_t>(),
+                                         cum_offsets.data<int>(),
+                                         seq_len.data<int>(),
+                                         x_remove_padding.data<int64_t>(),
+                                         cum_offsets_out.data<int>(),
+                                         padding_offset.data<int>(),
+                                         nullptr,
+                                         nullptr);
+  return {x_remove_padding, cum_offsets_out, padding_offset};
+}
+
+std::vector<std::vector<int64_t>> GetPaddingOffsetInferShape(
+    const std::vector<int64_t>& input_ids_shape,
+    const std::vector<int64_t>& cum_offsets_shape,
+    const std::vector<int64_t>& token_num_shape,
+    const std::vector<int64_t>& seq_len_shape) {
+  int64_t bsz = input_ids_shape[0];
+  return {{-1}, {bsz}, {-1}};
+}
+
+std::vector<paddle::DataType> GetPaddingOffsetInferDtype(
+    const paddle::DataType& input_ids_dtype,
+    const paddle::DataType& cum_offsets_dtype,
+    const paddle::DataType& token_num_dtype,
+    const paddle::DataType& seq_len_dtype) {
+  return {input_ids_dtype, seq_len_dtype, seq_len_dtype};
+}
+
+PD_BUILD_OP(get_padding_offset)
+    .Inputs({"input_ids", "cum_offsets", "token_num", "seq_len"})
+    .Outputs({"x_remove_padding", "cum_offsets_out", "padding_offset"})
+    .SetKernelFn(PD_KERNEL(GetPaddingOffset))
+    .SetInferShapeFn(PD_INFER_SHAPE(GetPaddingOffsetInferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(GetPaddingOffsetInferDtype));
@@ -0,0 +1,78 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <vector>
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+// Gathers the hidden state of the last token of every sequence from the
+// packed [token_num, dim_embed] tmp_out.
+std::vector<paddle::Tensor> RebuildPadding(const paddle::Tensor& tmp_out,
+                                           const paddle::Tensor& padding_offset,
+                                           const paddle::Tensor& seq_lens,
+                                           const paddle::Tensor& input_ids) {
+  WaitForStreamWork(tmp_out);
+  const int64_t dim_embed = tmp_out.shape().back();
+  const int64_t bsz = seq_lens.shape()[0];
+  const int* lens = seq_lens.data<int>();
+  std::vector<int64_t> rows(bsz);
+  int64_t token = 0;
+  for (int64_t b = 0; b < bsz; ++b) {
+    token += lens[b];
+    rows[b] = lens[b] > 0 ? token - 1 : -1;
+  }
+  PD_CHECK(token * dim_embed <= tmp_out.numel(),
+           "rebuild_padding got ",
+           tmp_out.numel() / dim_embed,
+           " tokens for sequences of ",
+           token,
+           " tokens.");
+
+  auto out = paddle::empty({bsz, dim_embed}, tmp_out.dtype(), tmp_out.place());
+  LLAMA_INFER_DISPATCH_FLOAT_TYPES(tmp_out.dtype(), "rebuild_padding", [&] {
+    custom_kernel::GatherRowsCompute(bsz,
+                                     dim_embed,
+                                     rows.data(),
+                                     tmp_out.data<data_t>(),
+                                     out.data<data_t>());
+  });
+  return {out};
+}
+
+std::vector<std::vector<int64_t>> RebuildPaddingInferShape(
+    const std::vector<int64_t>& tmp_out_shape,
+    const std::vector<int64_t>& padding_offset_shape,
+    const std::vector<int64_t>& seq_lens_shape,
+    const std::vector<int64_t>& input_ids_shape) {
+  int64_t bsz = seq_lens_shape[0];
+  int64_t dim_embed = tmp_out_shape[1];
+  return {{bsz, dim_embed}};
+}
+
+std::vector<paddle::DataType> RebuildPaddingInferDtype(
+    const paddle::DataType& tmp_out_dtype,
+    const paddle::DataType& padding_offset_dtype,
+    const paddle::DataType& seq_lens_dtype,
+    const paddle::DataType& input_ids_dtype) {
+  return {tmp_out_dtype};
+}
+
+PD_BUILD_OP(rebuild_padding)
+    .Inputs({"tmp_out", "padding_offset", "seq_lens", "input_ids"})
+    .Outputs({"out"})
+    .SetKernelFn(PD_KERNEL(RebuildPadding))
+    .SetInferShapeFn(PD_INFER_SHAPE(RebuildPaddingInferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(RebuildPaddingInferDtype));
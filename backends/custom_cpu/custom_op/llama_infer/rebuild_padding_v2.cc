@@ -0,0 +1,90 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <vector>
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+// Gathers, from the packed [token_num, dim_embed] tmp_out, the hidden state
+// of the last prompt token of every sequence in prefill and of the single
+// token of every sequence in decode. Stopped sequences get zeros.
+std::vector<paddle::Tensor> RebuildPaddingV2(
+    const paddle::Tensor& tmp_out,      // [token_num, dim_embed]
+    const paddle::Tensor& cum_offsets,  // [bsz, 1]
+    const paddle::Tensor& seq_lens_decoder,
+    const paddle::Tensor& seq_lens_encoder,
+    int max_input_length) {
+  WaitForStreamWork(tmp_out);
+  const int64_t dim_embed = tmp_out.shape().back();
+  const int64_t bsz = cum_offsets.shape()[0];
+  const int64_t token_num = tmp_out.numel() / dim_embed;
+  const int* offsets = cum_offsets.data<int>();
+  const int* decoder = seq_lens_decoder.data<int>();
+  const int* encoder = seq_lens_encoder.data<int>();
+  std::vector<int64_t> rows(bsz);
+  for (int64_t b = 0; b < bsz; ++b) {
+    if (decoder[b] == 0 && encoder[b] == 0) {
+      rows[b] = -1;
+      continue;
+    }
+    const int seq_id = encoder[b] > 0 ? encoder[b] - 1 : 0;
+    rows[b] = b * max_input_length - offsets[b] + seq_id;
+    PD_CHECK(rows[b] >= 0 && rows[b] < token_num,
+             "rebuild_padding_v2: sequence ",
+             b,
+             " points at token ",
+             rows[b],
+             " of ",
+             token_num,
+             ".");
+  }
+
+  auto out = paddle::empty({bsz, dim_embed}, tmp_out.dtype(), tmp_out.place());
+  LLAMA_INFER_DISPATCH_FLOAT_TYPES(tmp_out.dtype(), "rebuild_padding_v2", [&] {
+    custom_kernel::GatherRowsCompute(bsz,
+                                     dim_embed,
+                                     rows.data(),
+                                     tmp_out.data<data_t>(),
+                                     out.data<data_t>());
+  });
+  return {out};
+}
+
+std::vector<std::vector<int64_t>> RebuildPaddingV2InferShape(
+    const std::vector<int64_t>& tmp_out_shape,
+    const std::vector<int64_t>& cum_offsets_shape,
+    const std::vector<int64_t>& seq_lens_decoder_shape,
+    const std::vector<int64_t>& seq_lens_encoder_shape) {
+  int64_t bsz = cum_offsets_shape[0];
+  int64_t dim_embed = tmp_out_shape.back();
+  return {{bsz, dim_embed}};
+}
+
+std::vector<paddle::DataType> RebuildPaddingV2InferDtype(
+    const paddle::DataType& tmp_out_dtype,
+    const paddle::DataType& cum_offsets_dtype,
+    const paddle::DataType& seq_lens_decoder_dtype,
+    const paddle::DataType& seq_lens_encoder_dtype) {
+  return {tmp_out_dtype};
+}
+
+PD_BUILD_OP(rebuild_padding_v2)
+    .Inputs({"tmp_out", "cum_offsets", "seq_lens_decoder", "seq_lens_encoder"})
+    .Outputs({"out"})
+    .Attrs({"max_input_length: int"})
+    .SetKernelFn(PD_KERNEL(RebuildPaddingV2))
+    .SetInferShapeFn(PD_INFER_SHAPE(RebuildPaddingV2InferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(RebuildPaddingV2InferDtype));
@@ -0,0 +1,65 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <vector>
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+// Records pre_ids_now in pre_ids_all, in place, at step_idx for the running
+// sequences, and passes stop_flags through.
+std::vector<paddle::Tensor> SetValueByFlagsAndIdx(
+    const paddle::Tensor& pre_ids_all,
+    const paddle::Tensor& pre_ids_now,
+    const paddle::Tensor& step_idx,
+    const paddle::Tensor& stop_flags) {
+  WaitForStreamWork(pre_ids_all);
+  custom_kernel::SetValueByFlagsCompute(
+      stop_flags.numel(),
+      pre_ids_all.shape()[1],
+      const_cast<int64_t*>(pre_ids_all.data<int64_t>()),
+      pre_ids_now.data<int64_t>(),
+      nullptr,
+      0,
+      nullptr,
+      nullptr,
+      nullptr,
+      step_idx.data<int64_t>(),
+      stop_flags.data<bool>());
+  return {stop_flags.copy_to(stop_flags.place(), false)};
+}
+
+std::vector<std::vector<int64_t>> SetValueByFlagsAndIdxInferShape(
+    const std::vector<int64_t>& pre_ids_all_shape,
+    const std::vector<int64_t>& pre_ids_now_shape,
+    const std::vector<int64_t>& step_idx_shape,
+    const std::vector<int64_t>& stop_flags_shape) {
+  return {stop_flags_shape};
+}
+
+std::vector<paddle::DataType> SetValueByFlagsAndIdxInferDtype(
+    const paddle::DataType& pre_ids_all_dtype,
+    const paddle::DataType& pre_ids_now_dtype,
+    const paddle::DataType& step_idx_dtype,
+    const paddle::DataType& stop_flags_dtype) {
+  return {stop_flags_dtype};
+}
+
+PD_BUILD_OP(set_value_by_flags_and_idx)
+    .Inputs({"pre_ids_all", "pre_ids_now", "step_idx", "stop_flags"})
+    .Outputs({"stop_flags_out"})
+    .SetKernelFn(PD_KERNEL(SetValueByFlagsAndIdx))
+    .SetInferShapeFn(PD_INFER_SHAPE(SetValueByFlagsAndIdxInferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(SetValueByFlagsAndIdxInferDtype));
@@ -0,0 +1,50 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+void SetValueByFlagsAndIdxV2(const paddle::Tensor& pre_ids_all,
+                             const paddle::Tensor& input_ids,
+                             const paddle::Tensor& seq_lens_this_time,
+                             const paddle::Tensor& seq_lens_encoder,
+                             const paddle::Tensor& seq_lens_decoder,
+                             const paddle::Tensor& step_idx,
+                             const paddle::Tensor& stop_flags) {
+  WaitForStreamWork(pre_ids_all);
+  custom_kernel::SetValueByFlagsCompute(stop_flags.numel(),
+                                        pre_ids_all.shape()[1],
+                                        pre_ids_all.data<int64_t>(),
+                                        nullptr,
+                                        input_ids.data<int64_t>(),
+                                        input_ids.shape()[1],
+                                        seq_lens_this_time.data<int>(),
+                                        seq_lens_encoder.data<int>(),
+                                        seq_lens_decoder.data<int>(),
+                                        step_idx.data<int64_t>(),
+                                        stop_flags.data<bool>());
+}
+
+PD_BUILD_OP(set_value_by_flags_and_idx_v2)
+    .Inputs({"pre_ids_all",
+             "input_ids",
+             "seq_lens_this_time",
+             "seq_lens_encoder",
+             "seq_lens_decoder",
+             "step_idx",
+             "stop_flags"})
+    .Outputs({"pre_ids_all_out"})
+    .SetInplaceMap({{"pre_ids_all", "pre_ids_all_out"}})
+    .SetKernelFn(PD_KERNEL(SetValueByFlagsAndIdxV2));
@@ -0,0 +1,150 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/block_step.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+// The tensors live in host memory on custom_cpu, so the scheduler runs on
+// them in place. Device ports can copy the same tensors to the host, run
+// BlockStep and copy them back, or check their own kernel against it.
+void StepPaddle(const paddle::Tensor& stop_flags,
+                const paddle::Tensor& seq_lens_this_time,
+                const paddle::Tensor& ori_seq_lens_encoder,
+                const paddle::Tensor& seq_lens_encoder,
+                const paddle::Tensor& seq_lens_decoder,
+                const paddle::Tensor& block_tables,  // [bsz, block_num_per_seq]
+                const paddle::Tensor& encoder_block_lens,
+                const paddle::Tensor& is_block_step,
+                const paddle::Tensor& step_block_list,
+                const paddle::Tensor& step_lens,
+                const paddle::Tensor& recover_block_list,
+                const paddle::Tensor& recover_lens,
+                const paddle::Tensor& need_block_list,
+                const paddle::Tensor& need_block_len,
+                const paddle::Tensor& used_list_len,
+                const paddle::Tensor& free_list,
+                const paddle::Tensor& free_list_len,
+                const paddle::Tensor& input_ids,
+                const paddle::Tensor& pre_ids,
+                const paddle::Tensor& step_idx,
+                const paddle::Tensor& next_tokens,
+                const int block_size,
+                const int encoder_decoder_block_num,
+                const int64_t first_token_id) {
+  WaitForStreamWork(stop_flags);
+  PD_CHECK(block_size > 0, "block_size must be positive, got ", block_size);
+  PD_CHECK(block_tables.dtype() == paddle::DataType::INT32 &&
+               free_list.dtype() == paddle::DataType::INT32,
+           "step_paddle expects int32 block tables and free list.");
+  PD_CHECK(input_ids.dtype() == paddle::DataType::INT64 &&
+               pre_ids.dtype() == paddle::DataType::INT64,
+           "step_paddle expects int64 token ids.");
+  const auto& table_shape = block_tables.shape();
+  const auto& pre_ids_shape = pre_ids.shape();
+
+  custom_kernel::BlockStepState state;
+  state.bsz = static_cast<int>(table_shape[0]);
+  state.block_num_per_seq = static_cast<int>(table_shape[1]);
+  state.block_size = block_size;
+  state.max_decoder_block_num =
+      static_cast<int>(pre_ids_shape[1] / block_size) -
+      encoder_decoder_block_num;
+  state.stop_flags = stop_flags.data<bool>();
+  state.seq_lens_this_time = seq_lens_this_time.data<int>();
+  state.ori_seq_lens_encoder = ori_seq_lens_encoder.data<int>();
+  state.seq_lens_encoder = seq_lens_encoder.data<int>();
+  state.seq_lens_decoder = seq_lens_decoder.data<int>();
+  state.block_tables = block_tables.data<int>();
+  state.encoder_block_lens = encoder_block_lens.data<int>();
+  state.is_block_step = is_block_step.data<bool>();
+  state.step_block_list = step_block_list.data<int>();
+  state.step_lens = step_lens.data<int>();
+  state.recover_block_list = recover_block_list.data<int>();
+  state.recover_lens = recover_lens.data<int>();
+  state.need_block_list = need_block_list.data<int>();
+  state.need_block_len = need_block_len.data<int>();
+  state.used_list_len = used_list_len.data<int>();
+  state.free_list = free_list.data<int>();
+  state.free_list_len = free_list_len.data<int>();
+  state.input_ids = input_ids.data<int64_t>();
+  state.input_ids_stride = input_ids.shape()[1];
+  state.pre_ids = pre_ids.data<int64_t>();
+  state.pre_ids_stride = pre_ids_shape[1];
+  state.step_idx = step_idx.data<int64_t>();
+  state.next_tokens = next_tokens.data<int64_t>();
+  state.first_token_id = first_token_id;
+  custom_kernel::BlockStep(state);
+}
+
+PD_BUILD_OP(step_paddle)
+    .Inputs({"stop_flags",
+             "seq_lens_this_time",
+             "ori_seq_lens_encoder",
+             "seq_lens_encoder",
+             "seq_lens_decoder",
+             "block_tables",
+             "encoder_block_lens",
+             "is_block_step",
+             "step_block_list",
+             "step_lens",
+             "recover_block_list",
+             "recover_lens",
+             "need_block_list",
+             "need_block_len",
+             "used_list_len",
+             "free_list",
+             "free_list_len",
+             "input_ids",
+             "pre_ids",
+             "step_idx",
+             "next_tokens"})
+    .Attrs({"block_size: int",
+            "encoder_decoder_block_num: int",
+            "first_token_id: int64_t"})
+    .Outputs({"stop_flags_out",
+              "seq_lens_this_time_out",
+              "seq_lens_encoder_out",
+              "seq_lens_decoder_out",
+              "block_tables_out",
+              "encoder_block_lens_out",
+              "is_block_step_out",
+              "step_block_list_out",
+              "step_lens_out",
+              "recover_block_list_out",
+              "recover_lens_out",
+              "need_block_list_out",
+              "need_block_len_out",
+              "used_list_len_out",
+              "free_list_out",
+              "free_list_len_out",
+              "input_ids_out"})
+    .SetInplaceMap({{"stop_flags", "stop_flags_out"},
+                    {"seq_lens_this_time", "seq_lens_this_time_out"},
+                    {"seq_lens_encoder", "seq_lens_encoder_out"},
+                    {"seq_lens_decoder", "seq_lens_decoder_out"},
+                    {"block_tables", "block_tables_out"},
+                    {"encoder_block_lens", "encoder_block_lens_out"},
+                    {"is_block_step", "is_block_step_out"},
+                    {"step_block_list", "step_block_list_out"},
+                    {"step_lens", "step_lens_out"},
+                    {"recover_block_list", "recover_block_list_out"},
+                    {"recover_lens", "recover_lens_out"},
+                    {"need_block_list", "need_block_list_out"},
+                    {"need_block_len", "need_block_len_out"},
+                    {"used_list_len", "used_list_len_out"},
+                    {"free_list", "free_list_out"},
+                    {"free_list_len", "free_list_len_out"},
+                    {"input_ids", "input_ids_out"}})
+    .SetKernelFn(PD_KERNEL(StepPaddle));
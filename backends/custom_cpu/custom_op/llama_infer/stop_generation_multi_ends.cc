@@ -0,0 +1,60 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <vector>
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+std::vector<paddle::Tensor> GetStopFlagsMulti(const paddle::Tensor& topk_ids,
+                                              const paddle::Tensor& stop_flags,
+                                              const paddle::Tensor& end_ids,
+                                              int64_t mode) {
+  WaitForStreamWork(topk_ids);
+  PD_CHECK(mode == 0 || mode == 1,
+           "set_stop_value_multi_ends expects mode 0 or 1, got ",
+           mode);
+  auto topk_ids_out = topk_ids.copy_to(topk_ids.place(), false);
+  auto stop_flags_out = stop_flags.copy_to(stop_flags.place(), false);
+  custom_kernel::SetStopValueCompute(stop_flags.numel(),
+                                     mode,
+                                     end_ids.data<int64_t>(),
+                                     end_ids.numel(),
+                                     topk_ids_out.data<int64_t>(),
+                                     stop_flags_out.data<bool>());
+  return {topk_ids_out, stop_flags_out};
+}
+
+std::vector<std::vector<int64_t>> GetStopFlagsMultiInferShape(
+    const std::vector<int64_t>& topk_ids_shape,
+    const std::vector<int64_t>& stop_flags_shape,
+    const std::vector<int64_t>& end_ids_shape) {
+  return {topk_ids_shape, stop_flags_shape};
+}
+
+std::vector<paddle::DataType> GetStopFlagsMultiInferDtype(
+    const paddle::DataType& topk_ids_dtype,
+    const paddle::DataType& stop_flags_dtype,
+    const paddle::DataType& end_ids_dtype) {
+  return {topk_ids_dtype, stop_flags_dtype};
+}
+
+PD_BUILD_OP(set_stop_value_multi_ends)
+    .Inputs({"topk_ids", "stop_flags", "end_ids"})
+    .Outputs({"topk_ids_out", "stop_flags_out"})
+    .Attrs({"mode: int64_t"})
+    .SetKernelFn(PD_KERNEL(GetStopFlagsMulti))
+    .SetInferShapeFn(PD_INFER_SHAPE(GetStopFlagsMultiInferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(GetStopFlagsMultiInferDtype));
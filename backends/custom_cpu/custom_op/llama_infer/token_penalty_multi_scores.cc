@@ -0,0 +1,98 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <mutex>
+#include <vector>
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+std::vector<paddle::Tensor> TokenPenaltyMultiScores(
+    const paddle::Tensor& pre_ids,
+    const paddle::Tensor& logits,
+    const paddle::Tensor& penalty_scores,
+    const paddle::Tensor& frequency_scores,
+    const paddle::Tensor& presence_scores,
+    const paddle::Tensor& cur_len,
+    const paddle::Tensor& min_len,
+    const paddle::Tensor& eos_token_id) {
+  WaitForStreamWork(pre_ids);
+  // The repeat counts of every generation loop, by pre_ids buffer, kept
+  // across its steps.
+  static std::mutex mutex;
+  static custom_kernel::TokenCounterPool counters;
+  std::lock_guard<std::mutex> lock(mutex);
+  auto* counter = counters.Get(pre_ids.data<int64_t>());
+  auto logits_out = logits.copy_to(logits.place(), false);
+  LLAMA_INFER_DISPATCH_FLOAT_TYPES(
+      logits.dtype(), "get_token_penalty_multi_scores", [&] {
+        custom_kernel::SparseTokenPenaltyCompute(
+            counter,
+            logits.shape()[0],
+            logits.shape()[1],
+            pre_ids.data<int64_t>(),
+            pre_ids.shape()[1],
+            logits_out.data<data_t>(),
+            penalty_scores.data<data_t>(),
+            frequency_scores.data<data_t>(),
+            presence_scores.data<data_t>(),
+            nullptr,
+            nullptr,
+            0,
+            cur_len.data<int64_t>(),
+            min_len.data<int64_t>(),
+            eos_token_id.data<int64_t>(),
+            eos_token_id.numel());
+      });
+  return {logits_out};
+}
+
+std::vector<std::vector<int64_t>> TokenPenaltyMultiScoresInferShape(
+    const std::vector<int64_t>& pre_ids_shape,
+    const std::vector<int64_t>& logits_shape,
+    const std::vector<int64_t>& penalty_scores_shape,
+    const std::vector<int64_t>& frequency_scores_shape,
+    const std::vector<int64_t>& presence_scores_shape,
+    const std::vector<int64_t>& cur_len_shape,
+    const std::vector<int64_t>& min_len_shape,
+    const std::vector<int64_t>& eos_token_id_shape) {
+  return {logits_shape};
+}
+
+std::vector<paddle::DataType> TokenPenaltyMultiScoresInferDtype(
+    const paddle::DataType& pre_ids_dtype,
+    const paddle::DataType& logits_dtype,
+    const paddle::DataType& penalty_scores_dtype,
+    const paddle::DataType& frequency_scores_dtype,
+    const paddle::DataType& presence_scores_dtype,
+    const paddle::DataType& cur_len_dtype,
+    const paddle::DataType& min_len_dtype,
+    const paddle::DataType& eos_token_id_dtype) {
+  return {logits_dtype};
+}
+
+PD_BUILD_OP(get_token_penalty_multi_scores)
+    .Inputs({"pre_ids",
+             "logits",
+             "penalty_scores",
+             "frequency_scores",
+             "presence_scores",
+             "cur_len",
+             "min_len",
+             "eos_token_id"})
+    .Outputs({"logits_out"})
+    .SetKernelFn(PD_KERNEL(TokenPenaltyMultiScores))
+    .SetInferShapeFn(PD_INFER_SHAPE(TokenPenaltyMultiScoresInferShape))
+    .SetInferDtypeFn(PD_INFER_DTYPE(TokenPenaltyMultiScoresInferDtype));
@@ -0,0 +1,75 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <mutex>
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+void TokenPenaltyMultiScoresV2(const paddle::Tensor& pre_ids,
+                               const paddle::Tensor& logits,
+                               const paddle::Tensor& penalty_scores,
+                               const paddle::Tensor& frequency_scores,
+                               const paddle::Tensor& presence_scores,
+                               const paddle::Tensor& temperatures,
+                               const paddle::Tensor& bad_tokens,
+                               const paddle::Tensor& cur_len,
+                               const paddle::Tensor& min_len,
+                               const paddle::Tensor& eos_token_id) {
+  WaitForStreamWork(pre_ids);
+  PD_CHECK(temperatures.dtype() == paddle::DataType::FLOAT32,
+           "get_token_penalty_multi_scores_v2 expects float32 temperatures.");
+  // The repeat counts of every generation loop, by pre_ids buffer, kept
+  // across its steps.
+  static std::mutex mutex;
+  static custom_kernel::TokenCounterPool counters;
+  std::lock_guard<std::mutex> lock(mutex);
+  auto* counter = counters.Get(pre_ids.data<int64_t>());
+  LLAMA_INFER_DISPATCH_FLOAT_TYPES(
+      logits.dtype(), "get_token_penalty_multi_scores_v2", [&] {
+        custom_kernel::SparseTokenPenaltyCompute(
+            counter,
+            logits.shape()[0],
+            logits.shape()[1],
+            pre_ids.data<int64_t>(),
+            pre_ids.shape()[1],
+            logits.data<data_t>(),
+            penalty_scores.data<data_t>(),
+            frequency_scores.data<data_t>(),
+            presence_scores.data<data_t>(),
+            temperatures.data<float>(),
+            bad_tokens.data<int64_t>(),
+            bad_tokens.numel(),
+            cur_len.data<int64_t>(),
+            min_len.data<int64_t>(),
+            eos_token_id.data<int64_t>(),
+            eos_token_id.numel());
+      });
+}
+
+PD_BUILD_OP(get_token_penalty_multi_scores_v2)
+    .Inputs({"pre_ids",
+             "logits",
+             "penalty_scores",
+             "frequency_scores",
+             "presence_scores",
+             "temperatures",
+             "bad_tokens",
+             "cur_len",
+             "min_len",
+             "eos_token_id"})
+    .Outputs({"logits_out"})
+    .SetInplaceMap({{"logits", "logits_out"}})
+    .SetKernelFn(PD_KERNEL(TokenPenaltyMultiScoresV2));
@@ -0,0 +1,78 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include "kernels/phi_half.h"
+#include "paddle/extension.h"
+#include "runtime/stream.h"
+
+// Calls the lambda in __VA_ARGS__ with data_t set to the type of `TYPE`,
+// float32, float16 or bfloat16, like the PD_DISPATCH_* macros.
+#define LLAMA_INFER_DISPATCH_FLOAT_TYPES(TYPE, NAME, ...)           \
+  [&] {                                                             \
+    switch (TYPE) {                                                 \
+      case paddle::DataType::FLOAT32: {                             \
+        using data_t = float;                                       \
+        return __VA_ARGS__();                                       \
+      }                                                             \
+      case paddle::DataType::FLOAT16: {                             \
+        using data_t = phi::dtype::float16;                         \
+        return __VA_ARGS__();                                       \
+      }                                                             \
+      case paddle::DataType::BFLOAT16: {                            \
+        using data_t = phi::dtype::bfloat16;                        \
+        return __VA_ARGS__();                                       \
+      }                                                             \
+      default:                                                      \
+        PD_THROW(NAME, " supports float32, float16 and bfloat16."); \
+    }                                                               \
+  }()
+
+// Custom ops run on the launching thread like the kernels, so they first
+// wait for the work queued on the stream of their device tensor `x`, async
+// copies into their inputs included. A no-op for CPU tensors.
+inline void WaitForStreamWork(const paddle::Tensor& x) {
+  if (x.place().GetType() == phi::AllocationType::CUSTOM) {
+    auto dev_ctx = static_cast<const phi::CustomContext*>(
+        paddle::experimental::DeviceContextPool::Instance().Get(x.place()));
+    custom_cpu::WaitForStreamWork(dev_ctx->stream());
+  }
+}
+
+// Checks that every sequence fits in its padded row and that the packed
+// token count is the sum of the sequence lengths.
+inline void CheckTokenNum(const int* seq_lens,
+                          int64_t bsz,
+                          int64_t max_seq_len,
+                          int64_t token_num) {
+  int64_t total = 0;
+  for (int64_t b = 0; b < bsz; ++b) {
+    PD_CHECK(seq_lens[b] >= 0 && seq_lens[b] <= max_seq_len,
+             "Sequence ",
+             b,
+             " has length ",
+             seq_lens[b],
+             ", outside [0, ",
+             max_seq_len,
+             "].");
+    total += seq_lens[b];
+  }
+  PD_CHECK(total == token_num,
+           "token_num is ",
+           token_num,
+           " but the sequence lengths add up to ",
+           total,
+           ".");
+}
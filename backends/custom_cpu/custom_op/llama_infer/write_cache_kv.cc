@@ -0,0 +1,56 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/llama_infer.h"
+#include "paddle/extension.h"
+#include "utils.h"  //NOLINT
+
+void WriteCacheKV(const paddle::Tensor& input_k,
+                  const paddle::Tensor& input_v,
+                  const paddle::Tensor& cache_kv,
+                  const paddle::Tensor& sequence_lengths_shape) {
+  WaitForStreamWork(input_k);
+  // input_k, input_v: [bsz, num_head, seq_len, dim_head]
+  // cache_kv: [2, bsz, num_head, max_seq_len, dim_head]
+  const auto& k_shape = input_k.shape();
+  const auto& cache_shape = cache_kv.shape();
+  PD_CHECK(k_shape.size() == 4 && cache_shape.size() == 5,
+           "write_cache_kv expects 4-D inputs and a 5-D cache.");
+  PD_CHECK(cache_shape[1] == k_shape[0] && cache_shape[2] == k_shape[1] &&
+               cache_shape[4] == k_shape[3] && cache_shape[3] >= k_shape[2],
+           "write_cache_kv: the cache does not match the inputs.");
+  const int64_t cache_numel = cache_kv.numel() / 2;
+  LLAMA_INFER_DISPATCH_FLOAT_TYPES(input_k.dtype(), "write_cache_kv", [&] {
+    PD_CHECK(k_shape[3] % (16 / sizeof(data_t)) == 0,
+             "write_cache_kv expects dim_head to be a multiple of ",
+             16 / sizeof(data_t));
+    data_t* cache = cache_kv.data<data_t>();
+    custom_kernel::WriteCacheKVCompute(k_shape[0],
+                                       k_shape[1],
+                                       k_shape[2],
+                                       k_shape[3],
+                                       cache_shape[3],
+                                       input_k.data<data_t>(),
+                                       input_v.data<data_t>(),
+                                       sequence_lengths_shape.data<int>(),
+                                       cache,
+                                       cache + cache_numel);
+  });
+}
+
+PD_BUILD_OP(write_cache_kv)
+    .Inputs({"input_k", "input_v", "cache_kv", "sequence_lengths"})
+    .Outputs({"cache_kv_out"})
+    .SetInplaceMap({{"cache_kv", "cache_kv_out"}})
+    .SetKernelFn(PD_KERNEL(WriteCacheKV));
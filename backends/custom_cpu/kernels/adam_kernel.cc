@@ -0,0 +1,490 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/optimizer.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// Copies src to dst unless dst already shares its memory, as optimizer
+// outputs usually do.
+inline void CopyIfDifferent(const phi::Context& dev_ctx,
+                            const phi::DenseTensor& src,
+                            phi::DenseTensor* dst) {
+  dst->Resize(src.dims());
+  void* dst_data = dev_ctx.Alloc(dst, src.dtype());
+  if (dst_data != src.data()) {
+    memcpy(dst_data, src.data(), src.memory_size());
+  }
+}
+
+// beta_pow_out = beta_pow * beta, kept in the dtype of beta_pow.
+template <typename AccT>
+void UpdateBetaPow(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& beta_pow,
+                   AccT beta,
+                   phi::DenseTensor* beta_pow_out) {
+  const AccT value = ScalarValue<AccT>(beta_pow) * beta;
+  if (beta_pow.dtype() == phi::DataType::FLOAT64) {
+    *dev_ctx.template Alloc<double>(beta_pow_out) = value;
+  } else {
+    *dev_ctx.template Alloc<float>(beta_pow_out) = value;
+  }
+}
+
+// Gathers the buffers and scalars of one parameter for AdamCompute and
+// allocates its outputs. moment2_max and master_param may be null.
+template <typename T, typename MT>
+AdamTensor<T, MT> MakeAdamTensor(const phi::Context& dev_ctx,
+                                 const phi::DenseTensor& param,
+                                 const phi::DenseTensor& grad,
+                                 const phi::DenseTensor& learning_rate,
+                                 const phi::DenseTensor& moment1,
+                                 const phi::DenseTensor& moment2,
+                                 const phi::DenseTensor* moment2_max,
+                                 const phi::DenseTensor& beta1_pow,
+                                 const phi::DenseTensor& beta2_pow,
+                                 const phi::DenseTensor* master_param,
+                                 phi::DenseTensor* param_out,
+                                 phi::DenseTensor* moment1_out,
+                                 phi::DenseTensor* moment2_out,
+                                 phi::DenseTensor* moment2_max_out,
+                                 phi::DenseTensor* master_param_out) {
+  using AccT = AccType<T>;
+  AdamTensor<T, MT> t;
+  t.param = param.data<T>();
+  t.grad = grad.data<T>();
+  t.moment1 = moment1.data<MT>();
+  t.moment2 = moment2.data<MT>();
+  t.moment2_max = moment2_max ? moment2_max->data<MT>() : nullptr;
+  t.master = master_param ? master_param->data<AccT>() : nullptr;
+  t.param_out = dev_ctx.template Alloc<T>(param_out);
+  t.moment1_out = dev_ctx.template Alloc<MT>(moment1_out);
+  t.moment2_out = dev_ctx.template Alloc<MT>(moment2_out);
+  t.moment2_max_out =
+      moment2_max ? dev_ctx.template Alloc<MT>(moment2_max_out) : nullptr;
+  t.master_out =
+      master_param ? dev_ctx.template Alloc<AccT>(master_param_out) : nullptr;
+  t.numel = param.numel();
+  t.lr = ScalarValue<AccT>(learning_rate);
+  t.beta1_pow = ScalarValue<AccT>(beta1_pow);
+  t.beta2_pow = ScalarValue<AccT>(beta2_pow);
+  return t;
+}
+
+template <typename T, typename MT>
+void AdamDenseImpl(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& param,
+                   const phi::DenseTensor& grad,
+                   const phi::DenseTensor& learning_rate,
+                   const phi::DenseTensor& moment1,
+                   const phi::DenseTensor& moment2,
+                   const phi::DenseTensor* moment2_max,
+                   const phi::DenseTensor& beta1_pow,
+                   const phi::DenseTensor& beta2_pow,
+                   const phi::DenseTensor* master_param,
+                   const AdamConfig<AccType<T>>& config,
+                   float lr_ratio,
+                   bool use_global_beta_pow,
+                   phi::DenseTensor* param_out,
+                   phi::DenseTensor* moment1_out,
+                   phi::DenseTensor* moment2_out,
+                   phi::DenseTensor* moment2_max_out,
+                   phi::DenseTensor* beta1_pow_out,
+                   phi::DenseTensor* beta2_pow_out,
+                   phi::DenseTensor* master_param_out) {
+  std::vector<AdamTensor<T, MT>> tensors = {
+      MakeAdamTensor<T, MT>(dev_ctx,
+                            param,
+                            grad,
+                            learning_rate,
+                            moment1,
+                            moment2,
+                            moment2_max,
+                            beta1_pow,
+                            beta2_pow,
+                            master_param,
+                            param_out,
+                            moment1_out,
+                            moment2_out,
+                            moment2_max_out,
+                            master_param_out)};
+  tensors[0].lr *= lr_ratio;
+  AdamCompute(tensors, config);
+  if (!use_global_beta_pow) {
+    UpdateBetaPow(dev_ctx, beta1_pow, config.beta1, beta1_pow_out);
+    UpdateBetaPow(dev_ctx, beta2_pow, config.beta2, beta2_pow_out);
+  }
+}
+
+// Shared by adam and adamw; adam passes lr_ratio 1 and coeff 0.
+template <typename T>
+void AdamDense(const phi::Context& dev_ctx,
+               const phi::DenseTensor& param,
+               const phi::DenseTensor& grad,
+               const phi::DenseTensor& learning_rate,
+               const phi::DenseTensor& moment1,
+               const phi::DenseTensor& moment2,
+               const paddle::optional<phi::DenseTensor>& moment2_max,
+               const phi::DenseTensor& beta1_pow,
+               const phi::DenseTensor& beta2_pow,
+               const paddle::optional<phi::DenseTensor>& master_param,
+               const paddle::optional<phi::DenseTensor>& skip_update,
+               const phi::Scalar& beta1,
+               const phi::Scalar& beta2,
+               const phi::Scalar& epsilon,
+               float lr_ratio,
+               float coeff,
+               bool multi_precision,
+               bool use_global_beta_pow,
+               bool amsgrad,
+               phi::DenseTensor* param_out,
+               phi::DenseTensor* moment1_out,
+               phi::DenseTensor* moment2_out,
+               phi::DenseTensor* moment2_max_out,
+               phi::DenseTensor* beta1_pow_out,
+               phi::DenseTensor* beta2_pow_out,
+               phi::DenseTensor* master_param_out) {
+  using AccT = AccType<T>;
+  const phi::DenseTensor* master =
+      multi_precision && master_param ? master_param.get_ptr() : nullptr;
+  const phi::DenseTensor* max = amsgrad ? moment2_max.get_ptr() : nullptr;
+  PD_CHECK(!amsgrad || max, "Adam with amsgrad needs moment2_max.");
+
+  if (skip_update && *skip_update->data<bool>()) {
+    CopyIfDifferent(dev_ctx, param, param_out);
+    CopyIfDifferent(dev_ctx, moment1, moment1_out);
+    CopyIfDifferent(dev_ctx, moment2, moment2_out);
+    if (max) {
+      CopyIfDifferent(dev_ctx, *max, moment2_max_out);
+    }
+    if (master) {
+      CopyIfDifferent(dev_ctx, *master, master_param_out);
+    }
+    if (!use_global_beta_pow) {
+      CopyIfDifferent(dev_ctx, beta1_pow, beta1_pow_out);
+      CopyIfDifferent(dev_ctx, beta2_pow, beta2_pow_out);
+    }
+    return;
+  }
+
+  AdamConfig<AccT> config;
+  config.beta1 = beta1.to<AccT>();
+  config.beta2 = beta2.to<AccT>();
+  config.epsilon = epsilon.to<AccT>();
+  config.coeff = static_cast<AccT>(coeff);
+  config.amsgrad = amsgrad;
+  // Mixed-precision programs keep the moments of 16-bit parameters in
+  // float32.
+  const bool acc_moments =
+      HalfTraits<T>::kIsHalf && moment1.dtype() == phi::DataType::FLOAT32;
+  auto impl = acc_moments ? AdamDenseImpl<T, AccT> : AdamDenseImpl<T, T>;
+  impl(dev_ctx,
+       param,
+       grad,
+       learning_rate,
+       moment1,
+       moment2,
+       max,
+       beta1_pow,
+       beta2_pow,
+       master,
+       config,
+       lr_ratio,
+       use_global_beta_pow,
+       param_out,
+       moment1_out,
+       moment2_out,
+       moment2_max_out,
+       beta1_pow_out,
+       beta2_pow_out,
+       master_param_out);
+}
+
+template <typename T>
+void AdamDenseKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& param,
+                     const phi::DenseTensor& grad,
+                     const phi::DenseTensor& learning_rate,
+                     const phi::DenseTensor& moment1,
+                     const phi::DenseTensor& moment2,
+                     const paddle::optional<phi::DenseTensor>& moment2_max,
+                     const phi::DenseTensor& beta1_pow,
+                     const phi::DenseTensor& beta2_pow,
+                     const paddle::optional<phi::DenseTensor>& master_param,
+                     const paddle::optional<phi::DenseTensor>& skip_update,
+                     const phi::Scalar& beta1,
+                     const phi::Scalar& beta2,
+                     const phi::Scalar& epsilon,
+                     bool lazy_mode,
+                     int64_t min_row_size_to_use_multithread,
+                     bool multi_precision,
+                     bool use_global_beta_pow,
+                     bool amsgrad,
+                     phi::DenseTensor* param_out,
+                     phi::DenseTensor* moment1_out,
+                     phi::DenseTensor* moment2_out,
+                     phi::DenseTensor* moment2_max_out,
+                     phi::DenseTensor* beta1_pow_out,
+                     phi::DenseTensor* beta2_pow_out,
+                     phi::DenseTensor* master_param_out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  AdamDense<T>(dev_ctx,
+               param,
+               grad,
+               learning_rate,
+               moment1,
+               moment2,
+               moment2_max,
+               beta1_pow,
+               beta2_pow,
+               master_param,
+               skip_update,
+               beta1,
+               beta2,
+               epsilon,
+               1.0f,
+               0.0f,
+               multi_precision,
+               use_global_beta_pow,
+               amsgrad,
+               param_out,
+               moment1_out,
+               moment2_out,
+               moment2_max_out,
+               beta1_pow_out,
+               beta2_pow_out,
+               master_param_out);
+}
+
+template <typename T>
+void AdamwDenseKernel(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& param,
+                      const phi::DenseTensor& grad,
+                      const phi::DenseTensor& learning_rate,
+                      const phi::DenseTensor& moment1,
+                      const phi::DenseTensor& moment2,
+                      const paddle::optional<phi::DenseTensor>& moment2_max,
+                      const phi::DenseTensor& beta1_pow,
+                      const phi::DenseTensor& beta2_pow,
+                      const paddle::optional<phi::DenseTensor>& master_param,
+                      const paddle::optional<phi::DenseTensor>& skip_update,
+                      const phi::Scalar& beta1,
+                      const phi::Scalar& beta2,
+                      const phi::Scalar& epsilon,
+                      float lr_ratio,
+                      float coeff,
+                      bool with_decay,
+                      bool lazy_mode,
+                      int64_t min_row_size_to_use_multithread,
+                      bool multi_precision,
+                      bool use_global_beta_pow,
+                      bool amsgrad,
+                      phi::DenseTensor* param_out,
+                      phi::DenseTensor* moment1_out,
+                      phi::DenseTensor* moment2_out,
+                      phi::DenseTensor* moment2_max_out,
+                      phi::DenseTensor* beta1_pow_out,
+                      phi::DenseTensor* beta2_pow_out,
+                      phi::DenseTensor* master_param_out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  // Without decay adamw is adam, and lr_ratio does not apply either.
+  AdamDense<T>(dev_ctx,
+               param,
+               grad,
+               learning_rate,
+               moment1,
+               moment2,
+               moment2_max,
+               beta1_pow,
+               beta2_pow,
+               master_param,
+               skip_update,
+               beta1,
+               beta2,
+               epsilon,
+               with_decay ? lr_ratio : 1.0f,
+               with_decay ? coeff : 0.0f,
+               multi_precision,
+               use_global_beta_pow,
+               amsgrad,
+               param_out,
+               moment1_out,
+               moment2_out,
+               moment2_max_out,
+               beta1_pow_out,
+               beta2_pow_out,
+               master_param_out);
+}
+
+template <typename T, typename MT>
+void MergedAdamImpl(const phi::Context& dev_ctx,
+                    const std::vector<const phi::DenseTensor*>& param,
+                    const std::vector<const phi::DenseTensor*>& grad,
+                    const std::vector<const phi::DenseTensor*>& learning_rate,
+                    const std::vector<const phi::DenseTensor*>& moment1,
+                    const std::vector<const phi::DenseTensor*>& moment2,
+                    const std::vector<const phi::DenseTensor*>* moment2_max,
+                    const std::vector<const phi::DenseTensor*>& beta1_pow,
+                    const std::vector<const phi::DenseTensor*>& beta2_pow,
+                    const std::vector<const phi::DenseTensor*>* master_param,
+                    const AdamConfig<AccType<T>>& config,
+                    bool use_global_beta_pow,
+                    const std::vector<phi::DenseTensor*>& param_out,
+                    const std::vector<phi::DenseTensor*>& moment1_out,
+                    const std::vector<phi::DenseTensor*>& moment2_out,
+                    const std::vector<phi::DenseTensor*>& moment2_max_out,
+                    const std::vector<phi::DenseTensor*>& beta1_pow_out,
+                    const std::vector<phi::DenseTensor*>& beta2_pow_out,
+                    const std::vector<phi::DenseTensor*>& master_param_out) {
+  const size_t n = param.size();
+  std::vector<AdamTensor<T, MT>> tensors;
+  tensors.reserve(n);
+  for (size_t i = 0; i < n; ++i) {
+    tensors.push_back(
+        MakeAdamTensor<T, MT>(dev_ctx,
+                              *param[i],
+                              *grad[i],
+                              *learning_rate[learning_rate.size() == 1 ? 0 : i],
+                              *moment1[i],
+                              *moment2[i],
+                              moment2_max ? (*moment2_max)[i] : nullptr,
+                              *beta1_pow[i],
+                              *beta2_pow[i],
+                              master_param ? (*master_param)[i] : nullptr,
+                              param_out[i],
+                              moment1_out[i],
+                              moment2_out[i],
+                              moment2_max ? moment2_max_out[i] : nullptr,
+                              master_param ? master_param_out[i] : nullptr));
+  }
+  // All the parameters are updated in one pass over the thread pool.
+  AdamCompute(tensors, config);
+  if (!use_global_beta_pow) {
+    for (size_t i = 0; i < n; ++i) {
+      UpdateBetaPow(dev_ctx, *beta1_pow[i], config.beta1, beta1_pow_out[i]);
+      UpdateBetaPow(dev_ctx, *beta2_pow[i], config.beta2, beta2_pow_out[i]);
+    }
+  }
+}
+
+template <typename T>
+void MergedAdamKernel(
+    const phi::Context& dev_ctx,
+    const std::vector<const phi::DenseTensor*>& param,
+    const std::vector<const phi::DenseTensor*>& grad,
+    const std::vector<const phi::DenseTensor*>& learning_rate,
+    const std::vector<const phi::DenseTensor*>& moment1,
+    const std::vector<const phi::DenseTensor*>& moment2,
+    const paddle::optional<std::vector<const phi::DenseTensor*>>& moment2_max,
+    const std::vector<const phi::DenseTensor*>& beta1_pow,
+    const std::vector<const phi::DenseTensor*>& beta2_pow,
+    const paddle::optional<std::vector<const phi::DenseTensor*>>& master_param,
+    const phi::Scalar& beta1,
+    const phi::Scalar& beta2,
+    const phi::Scalar& epsilon,
+    bool multi_precision,
+    bool use_global_beta_pow,
+    bool amsgrad,
+    std::vector<phi::DenseTensor*> param_out,
+    std::vector<phi::DenseTensor*> moment1_out,
+    std::vector<phi::DenseTensor*> moment2_out,
+    std::vector<phi::DenseTensor*> moment2_max_out,
+    std::vector<phi::DenseTensor*> beta1_pow_out,
+    std::vector<phi::DenseTensor*> beta2_pow_out,
+    std::vector<phi::DenseTensor*> master_param_out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  using AccT = AccType<T>;
+  const size_t n = param.size();
+  PD_CHECK(grad.size() == n && moment1.size() == n && moment2.size() == n &&
+               beta1_pow.size() == n && beta2_pow.size() == n,
+           "merged_adam expects one grad, moment1, moment2, beta1_pow and "
+           "beta2_pow per param.");
+  PD_CHECK(learning_rate.size() == 1 || learning_rate.size() == n,
+           "merged_adam expects one learning_rate, or one per param.");
+  if (n == 0) {
+    return;
+  }
+  const auto* master =
+      multi_precision && master_param ? master_param.get_ptr() : nullptr;
+  const auto* max = amsgrad ? moment2_max.get_ptr() : nullptr;
+  PD_CHECK(!amsgrad || (max && max->size() == n),
+           "merged_adam with amsgrad needs one moment2_max per param.");
+  PD_CHECK(!master || master->size() == n,
+           "merged_adam expects one master_param per param.");
+
+  AdamConfig<AccT> config;
+  config.beta1 = beta1.to<AccT>();
+  config.beta2 = beta2.to<AccT>();
+  config.epsilon = epsilon.to<AccT>();
+  config.coeff = 0;
+  config.amsgrad = amsgrad;
+  const bool acc_moments =
+      HalfTraits<T>::kIsHalf && moment1[0]->dtype() == phi::DataType::FLOAT32;
+  auto impl = acc_moments ? MergedAdamImpl<T, AccT> : MergedAdamImpl<T, T>;
+  impl(dev_ctx,
+       param,
+       grad,
+       learning_rate,
+       moment1,
+       moment2,
+       max,
+       beta1_pow,
+       beta2_pow,
+       master,
+       config,
+       use_global_beta_pow,
+       param_out,
+       moment1_out,
+       moment2_out,
+       moment2_max_out,
+       beta1_pow_out,
+       beta2_pow_out,
+       master_param_out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(adam,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::AdamDenseKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(adamw,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::AdamwDenseKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(merged_adam,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::MergedAdamKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
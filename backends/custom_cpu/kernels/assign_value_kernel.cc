@@ -16,6 +16,8 @@
 
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -25,6 +27,8 @@ void AssignValueKernel(const phi::Context& dev_ctx,
                        phi::DataType dtype,
                        const std::vector<phi::Scalar>& values,
                        phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto template_dtype = phi::capi::CppTypeToPDType<T>::Type();
   PD_CHECK(dtype == template_dtype,
            "Argument dtype mismatch for kernel dtype, "
@@ -42,6 +46,8 @@ template <typename T>
 void AssignKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& x,
                   phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto out_data = dev_ctx.template Alloc<T>(out);
   auto x_data = x.data<T>();
   std::memcpy(out_data, x_data, sizeof(T) * x.numel());
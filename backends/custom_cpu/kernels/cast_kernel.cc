@@ -12,8 +12,11 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/cast.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -22,80 +25,52 @@ void CastKernel(const phi::Context& dev_ctx,
                 const phi::DenseTensor& x,
                 phi::DataType out_dtype,
                 phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto x_data = x.data<T>();
   out->Resize(x.dims());
   auto numel = x.numel();
   switch (out_dtype) {
     case phi::DataType::BFLOAT16: {
-      auto out_data = dev_ctx.template Alloc<phi::dtype::bfloat16>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] =
-            static_cast<phi::dtype::bfloat16>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(
+          x_data, dev_ctx.template Alloc<phi::dtype::bfloat16>(out), numel);
       break;
     }
     case phi::DataType::FLOAT16: {
-      auto out_data = dev_ctx.template Alloc<phi::dtype::float16>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] =
-            static_cast<phi::dtype::float16>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(
+          x_data, dev_ctx.template Alloc<phi::dtype::float16>(out), numel);
       break;
     }
     case phi::DataType::FLOAT32: {
-      auto out_data = dev_ctx.template Alloc<float>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<float>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<float>(out), numel);
       break;
     }
     case phi::DataType::FLOAT64: {
-      auto out_data = dev_ctx.template Alloc<double>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<double>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<double>(out), numel);
       break;
     }
     case phi::DataType::INT8: {
-      auto out_data = dev_ctx.template Alloc<int8_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int8_t>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<int8_t>(out), numel);
       break;
     }
     case phi::DataType::INT16: {
-      auto out_data = dev_ctx.template Alloc<int16_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int16_t>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<int16_t>(out), numel);
       break;
     }
     case phi::DataType::INT32: {
-      auto out_data = dev_ctx.template Alloc<int32_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int32_t>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<int32_t>(out), numel);
       break;
     }
     case phi::DataType::INT64: {
-      auto out_data = dev_ctx.template Alloc<int64_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<int64_t>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<int64_t>(out), numel);
       break;
     }
     case phi::DataType::UINT8: {
-      auto out_data = dev_ctx.template Alloc<uint8_t>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<uint8_t>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<uint8_t>(out), numel);
       break;
     }
     case phi::DataType::BOOL: {
-      auto out_data = dev_ctx.template Alloc<bool>(out);
-      for (auto i = 0; i < numel; ++i) {
-        out_data[i] = static_cast<bool>(static_cast<float>(x_data[i]));
-      }
+      CastCompute(x_data, dev_ctx.template Alloc<bool>(out), numel);
       break;
     }
     default:
@@ -16,35 +16,61 @@
 
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
+template <typename T>
+struct NotEqualFunctor {
+  bool operator()(const T a, const T b) const {
+    if (std::is_floating_point<T>::value) {
+      return static_cast<bool>(fabs(static_cast<double>(a - b)) >= 1e-8);
+    }
+    return a != b;
+  }
+};
+
+template <typename T>
+struct EqualFunctor {
+  bool operator()(const T a, const T b) const {
+    if (std::is_floating_point<T>::value) {
+      return static_cast<bool>(fabs(static_cast<double>(a - b)) < 1e-8);
+    }
+    return a == b;
+  }
+};
+
+template <typename T>
+struct LessThanFunctor {
+  bool operator()(const T a, const T b) const { return a < b; }
+};
+
+template <typename T>
+struct LessEqualFunctor {
+  bool operator()(const T a, const T b) const { return a <= b; }
+};
+
+template <typename T>
+struct GreaterThanFunctor {
+  bool operator()(const T a, const T b) const { return a > b; }
+};
+
+template <typename T>
+struct GreaterEqualFunctor {
+  bool operator()(const T a, const T b) const { return a >= b; }
+};
+
 template <typename T>
 void NotEqualRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    if (std::is_floating_point<T>::value) {
-      out_data[i] = static_cast<bool>(
-          fabs(static_cast<double>(x_data[i] - y_data[i])) >= 1e-8);
-    } else {
-      out_data[i] = x_data[i] != y_data[i];
-    }
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, bool>(
+      dev_ctx, x, y, axis, NotEqualFunctor<T>(), out);
 }
 
 template <typename T>
@@ -52,6 +78,8 @@ void NotEqualKernel(const phi::Context& dev_ctx,
                     const phi::DenseTensor& x,
                     const phi::DenseTensor& y,
                     phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   custom_kernel::NotEqualRawKernel<T>(dev_ctx, x, y, -1, out);
 }
 
@@ -61,26 +89,9 @@ void EqualRawKernel(const phi::Context& dev_ctx,
                     const phi::DenseTensor& y,
                     int axis,
                     phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    if (std::is_floating_point<T>::value) {
-      out_data[i] = static_cast<bool>(
-          fabs(static_cast<double>(x_data[i] - y_data[i])) < 1e-8);
-    } else {
-      out_data[i] = x_data[i] == y_data[i];
-    }
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, bool>(dev_ctx, x, y, axis, EqualFunctor<T>(), out);
 }
 
 template <typename T>
@@ -88,6 +99,8 @@ void EqualKernel(const phi::Context& dev_ctx,
                  const phi::DenseTensor& x,
                  const phi::DenseTensor& y,
                  phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   custom_kernel::EqualRawKernel<T>(dev_ctx, x, y, -1, out);
 }
 
@@ -97,20 +110,10 @@ void LessThanRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] < y_data[i];
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, bool>(
+      dev_ctx, x, y, axis, LessThanFunctor<T>(), out);
 }
 
 template <typename T>
@@ -118,6 +121,8 @@ void LessThanKernel(const phi::Context& dev_ctx,
                     const phi::DenseTensor& x,
                     const phi::DenseTensor& y,
                     phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   custom_kernel::LessThanRawKernel<T>(dev_ctx, x, y, -1, out);
 }
 
@@ -127,20 +132,10 @@ void LessEqualRawKernel(const phi::Context& dev_ctx,
                         const phi::DenseTensor& y,
                         int axis,
                         phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] <= y_data[i];
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, bool>(
+      dev_ctx, x, y, axis, LessEqualFunctor<T>(), out);
 }
 
 template <typename T>
@@ -148,6 +143,8 @@ void LessEqualKernel(const phi::Context& dev_ctx,
                      const phi::DenseTensor& x,
                      const phi::DenseTensor& y,
                      phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   custom_kernel::LessEqualRawKernel<T>(dev_ctx, x, y, -1, out);
 }
 
@@ -157,20 +154,10 @@ void GreaterThanRawKernel(const phi::Context& dev_ctx,
                           const phi::DenseTensor& y,
                           int axis,
                           phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] > y_data[i];
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, bool>(
+      dev_ctx, x, y, axis, GreaterThanFunctor<T>(), out);
 }
 
 template <typename T>
@@ -178,6 +165,8 @@ void GreaterThanKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& y,
                        phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   custom_kernel::GreaterThanRawKernel<T>(dev_ctx, x, y, -1, out);
 }
 
@@ -187,20 +176,10 @@ void GreaterEqualRawKernel(const phi::Context& dev_ctx,
                            const phi::DenseTensor& y,
                            int axis,
                            phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<bool>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] >= y_data[i];
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, bool>(
+      dev_ctx, x, y, axis, GreaterEqualFunctor<T>(), out);
 }
 
 template <typename T>
@@ -208,6 +187,8 @@ void GreaterEqualKernel(const phi::Context& dev_ctx,
                         const phi::DenseTensor& x,
                         const phi::DenseTensor& y,
                         phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   custom_kernel::GreaterEqualRawKernel<T>(dev_ctx, x, y, -1, out);
 }
 
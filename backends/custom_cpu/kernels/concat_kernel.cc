@@ -12,46 +12,213 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/concat.h"
+#include "kernels/funcs/strided_copy.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
+static int64_t ConcatAxis(const phi::Scalar& axis_scalar, int64_t rank) {
+  int64_t axis = axis_scalar.to<int64_t>();
+  PD_CHECK(axis >= -rank && axis < rank,
+           "The axis is expected to be in range of [%d, %d), but got %d.",
+           -rank,
+           rank,
+           axis);
+  return axis < 0 ? axis + rank : axis;
+}
+
+// The dims of the concat of `dims` along axis.
+static std::vector<int64_t> ConcatDims(
+    const std::vector<std::vector<int64_t>>& dims, int64_t axis) {
+  std::vector<int64_t> out_dims = dims[0];
+  for (size_t j = 1; j < dims.size(); ++j) {
+    out_dims[axis] += dims[j][axis];
+  }
+  return out_dims;
+}
+
+// Concatenates x along axis into a new contiguous out, each input viewed
+// with dims[j] and strides[j]. Contiguous inputs go through the concat
+// engine; any other input is copied with its strides into its columns of
+// out.
+template <typename T>
+static void ConcatViews(const phi::Context& dev_ctx,
+                        const std::vector<const phi::DenseTensor*>& x,
+                        const std::vector<std::vector<int64_t>>& dims,
+                        const std::vector<std::vector<int64_t>>& strides,
+                        int64_t axis,
+                        phi::DenseTensor* out) {
+  auto out_dims = ConcatDims(dims, axis);
+  out->Resize(out_dims);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  bool contiguous = true;
+  for (size_t j = 0; j < x.size(); ++j) {
+    contiguous = contiguous && strides[j] == ContiguousStrides(dims[j]);
+  }
+  if (contiguous) {
+    std::vector<int64_t> widths(x.size());
+    std::vector<const T*> inputs(x.size());
+    for (size_t j = 0; j < x.size(); ++j) {
+      widths[j] = ConcatWidth(dims[j], axis);
+      inputs[j] = x[j]->data<T>();
+    }
+    ConcatCompute(ConcatRows(out_dims, axis), widths, inputs, out_data);
+    return;
+  }
+  auto out_strides = ContiguousStrides(out_dims);
+  int64_t start = 0;
+  for (size_t j = 0; j < x.size(); ++j) {
+    StridedCopyCompute(dims[j],
+                       x[j]->data<T>(),
+                       strides[j],
+                       out_data + start * out_strides[axis],
+                       out_strides);
+    start += dims[j][axis];
+  }
+}
+
 template <typename T>
 void ConcatKernel(const phi::Context& dev_ctx,
                   const std::vector<const phi::DenseTensor*>& x,
                   const phi::Scalar& axis_scalar,
                   phi::DenseTensor* out) {
-  int64_t axis = axis_scalar.to<int64_t>();
-  if (axis < 0) {
-    axis = axis + x[0]->dims().size();
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  const int64_t axis = ConcatAxis(axis_scalar, x[0]->dims().size());
+  std::vector<std::vector<int64_t>> dims, strides;
+  for (auto* t : x) {
+    dims.push_back(t->dims());
+    strides.push_back(ContiguousStrides(t->dims()));
+  }
+  ConcatViews<T>(dev_ctx, x, dims, strides, axis, out);
+}
+
+// A single input is returned as a view. Other inputs may have any strides.
+template <typename T>
+void ConcatStridedKernel(const phi::Context& dev_ctx,
+                         const std::vector<const phi::DenseTensor*>& x,
+                         const phi::Scalar& axis_scalar,
+                         phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  const int64_t axis = ConcatAxis(axis_scalar, x[0]->dims().size());
+  if (x.size() == 1) {
+    ShareView<T>(
+        dev_ctx, *x[0], x[0]->dims(), x[0]->strides(), x[0]->offset(), out);
+    return;
   }
-  std::vector<int64_t> out_dims(x[0]->dims().size(), 0);
-  for (auto i = 0; i < x[0]->dims().size(); ++i) {
-    if (axis == i) {
-      for (auto j = 0; j < x.size(); ++j) {
-        out_dims[i] += x[j]->dims()[i];
-      }
-    } else {
-      out_dims[i] = x[0]->dims()[i];
+  std::vector<std::vector<int64_t>> dims, strides;
+  for (auto* t : x) {
+    dims.push_back(t->dims());
+    strides.push_back(t->strides());
+  }
+  ConcatViews<T>(dev_ctx, x, dims, strides, axis, out);
+}
+
+template <typename T>
+void ConcatGradKernel(const phi::Context& dev_ctx,
+                      const std::vector<const phi::DenseTensor*>& x,
+                      const phi::DenseTensor& out_grad,
+                      const phi::Scalar& axis_scalar,
+                      const std::vector<phi::DenseTensor*>& x_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  const int64_t axis = ConcatAxis(axis_scalar, out_grad.dims().size());
+  std::vector<int64_t> widths(x.size());
+  std::vector<T*> outs(x.size(), nullptr);
+  for (size_t j = 0; j < x.size(); ++j) {
+    widths[j] = ConcatWidth(x[j]->dims(), axis);
+    if (j < x_grad.size() && x_grad[j]) {
+      x_grad[j]->Resize(x[j]->dims());
+      outs[j] = dev_ctx.template Alloc<T>(x_grad[j]);
     }
   }
-  out->Resize(out_dims);
-  dev_ctx.template Alloc<T>(out);
-
-  auto M = std::accumulate(
-      out_dims.cbegin(), out_dims.cbegin() + axis, 1, std::multiplies<int>());
-  auto N = std::accumulate(
-      out_dims.cbegin() + axis + 1, out_dims.cend(), 1, std::multiplies<int>());
-  auto out_offset = 0;
-  for (auto i = 0; i < M; ++i) {
-    for (auto j = 0; j < x.size(); ++j) {
-      memcpy(out->data<T>() + out_offset,
-             x[j]->data<T>() + i * N * x[j]->dims()[axis],
-             (N * x[j]->dims()[axis]) * sizeof(T));
-      out_offset += N * x[j]->dims()[axis];
+  SplitCompute(
+      ConcatRows(out_grad.dims(), axis), widths, out_grad.data<T>(), outs);
+}
+
+// stack is a concat of the inputs with a dim of 1 inserted at axis.
+static int64_t StackAxis(int axis, int64_t rank) {
+  PD_CHECK(axis >= -(rank + 1) && axis < rank + 1,
+           "The axis is expected to be in range of [%d, %d), but got %d.",
+           -(rank + 1),
+           rank + 1,
+           axis);
+  return axis < 0 ? axis + rank + 1 : axis;
+}
+
+template <typename T>
+void StackKernel(const phi::Context& dev_ctx,
+                 const std::vector<const phi::DenseTensor*>& x,
+                 int axis,
+                 phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  const int64_t stack_axis = StackAxis(axis, x[0]->dims().size());
+  std::vector<std::vector<int64_t>> dims, strides;
+  for (auto* t : x) {
+    auto d = t->dims();
+    d.insert(d.begin() + stack_axis, 1);
+    dims.push_back(d);
+    strides.push_back(ContiguousStrides(d));
+  }
+  ConcatViews<T>(dev_ctx, x, dims, strides, stack_axis, out);
+}
+
+template <typename T>
+void StackStridedKernel(const phi::Context& dev_ctx,
+                        const std::vector<const phi::DenseTensor*>& x,
+                        int axis,
+                        phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  const int64_t stack_axis = StackAxis(axis, x[0]->dims().size());
+  std::vector<std::vector<int64_t>> dims, strides;
+  for (auto* t : x) {
+    auto d = t->dims();
+    auto s = t->strides();
+    // The new dim steps over the whole of the dims after it, as it would in
+    // a contiguous tensor.
+    s.insert(s.begin() + stack_axis,
+             stack_axis < static_cast<int64_t>(d.size())
+                 ? s[stack_axis] * d[stack_axis]
+                 : 1);
+    d.insert(d.begin() + stack_axis, 1);
+    dims.push_back(d);
+    strides.push_back(s);
+  }
+  if (x.size() == 1) {
+    ShareView<T>(dev_ctx, *x[0], dims[0], strides[0], x[0]->offset(), out);
+    return;
+  }
+  ConcatViews<T>(dev_ctx, x, dims, strides, stack_axis, out);
+}
+
+template <typename T>
+void StackGradKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& out_grad,
+                     int axis,
+                     const std::vector<phi::DenseTensor*>& x_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  auto dims = out_grad.dims();
+  const int64_t stack_axis = StackAxis(axis, dims.size() - 1);
+  const int64_t num = dims[stack_axis];
+  auto x_dims = dims;
+  x_dims.erase(x_dims.begin() + stack_axis);
+  std::vector<int64_t> widths(num, ConcatWidth(dims, stack_axis + 1));
+  std::vector<T*> outs(num, nullptr);
+  for (int64_t j = 0; j < num; ++j) {
+    if (j < static_cast<int64_t>(x_grad.size()) && x_grad[j]) {
+      x_grad[j]->Resize(x_dims);
+      outs[j] = dev_ctx.template Alloc<T>(x_grad[j]);
     }
   }
+  SplitCompute(ConcatRows(dims, stack_axis), widths, out_grad.data<T>(), outs);
 }
 
 }  // namespace custom_kernel
@@ -69,3 +236,73 @@ PD_BUILD_PHI_KERNEL(concat,
                     uint8_t,
                     phi::dtype::float16,
                     phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(concat,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::ConcatStridedKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(concat_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::ConcatGradKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(stack,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::StackKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(stack,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::StackStridedKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(stack_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::StackGradKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
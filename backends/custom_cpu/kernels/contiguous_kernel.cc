@@ -12,8 +12,11 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/strided_copy.h"
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -21,27 +24,15 @@ template <typename T>
 void ContiguousKernel(const phi::Context& dev_ctx,
                       const phi::DenseTensor& input,
                       phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   out->set_strides(phi::CalcStrides(input.dims()));
   out->set_offset(0);
 
   const T* input_data = input.data<T>();
   T* output_data = dev_ctx.template Alloc<T>(out);
-  int rank = input.dims().size();
-  auto dims = input.dims();
-  auto input_stride = input.strides();
-  auto numel = input.numel();
-
-  for (int64_t i = 0; i < numel; i++) {
-    int64_t input_offset = 0;
-    int64_t index_tmp = i;
-    for (int dim = rank - 1; dim >= 0; --dim) {
-      int64_t mod = index_tmp % dims[dim];
-      index_tmp = index_tmp / dims[dim];
-      input_offset += mod * input_stride[dim];
-    }
-
-    output_data[i] = input_data[input_offset];
-  }
+  custom_kernel::StridedCopyCompute(
+      input.dims(), input_data, input.strides(), output_data, out->strides());
 }
 }  // namespace custom_kernel
 
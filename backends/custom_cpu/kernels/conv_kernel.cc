@@ -0,0 +1,218 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/conv.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// The shape of the convolution of input into an output of `out_dims`, with
+// the padding algorithm applied.
+static ConvShape Conv2dShape(const phi::DenseTensor& input,
+                             const phi::DenseTensor& filter,
+                             const std::vector<int64_t>& out_dims,
+                             const std::vector<int>& strides,
+                             const std::vector<int>& paddings,
+                             const std::string& padding_algorithm,
+                             const std::vector<int>& dilations,
+                             int groups,
+                             const std::string& data_format) {
+  auto in_dims = input.dims();
+  auto filter_dims = filter.dims();
+  PD_CHECK(in_dims.size() == 4 && filter_dims.size() == 4,
+           "conv2d expects 4-D input and filter, but received %d-D and %d-D.",
+           in_dims.size(),
+           filter_dims.size());
+  const bool channels_last = data_format == "NHWC";
+  std::vector<int64_t> data_dims =
+      channels_last ? std::vector<int64_t>{in_dims[1], in_dims[2]}
+                    : std::vector<int64_t>{in_dims[2], in_dims[3]};
+  auto pads = paddings;
+  auto dils = dilations;
+  UpdatePaddingAndDilation(&pads,
+                           &dils,
+                           padding_algorithm,
+                           data_dims,
+                           strides,
+                           {filter_dims[2], filter_dims[3]});
+  return MakeConvShape(in_dims,
+                       filter_dims,
+                       out_dims,
+                       strides,
+                       pads,
+                       dils,
+                       groups,
+                       channels_last);
+}
+
+template <typename T>
+void Conv2dKernel(const phi::Context& dev_ctx,
+                  const phi::DenseTensor& input,
+                  const phi::DenseTensor& filter,
+                  const std::vector<int>& strides,
+                  const std::vector<int>& paddings,
+                  const std::string& padding_algorithm,
+                  const std::vector<int>& dilations,
+                  int groups,
+                  const std::string& data_format,
+                  phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  auto shape = Conv2dShape(input,
+                           filter,
+                           out->dims(),
+                           strides,
+                           paddings,
+                           padding_algorithm,
+                           dilations,
+                           groups,
+                           data_format);
+  ConvForward(shape, input.data<T>(), filter.data<T>(), out_data);
+}
+
+template <typename T>
+void Conv2dGradKernel(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& input,
+                      const phi::DenseTensor& filter,
+                      const phi::DenseTensor& out_grad,
+                      const std::vector<int>& strides,
+                      const std::vector<int>& paddings,
+                      const std::string& padding_algorithm,
+                      const std::vector<int>& dilations,
+                      int groups,
+                      const std::string& data_format,
+                      phi::DenseTensor* input_grad,
+                      phi::DenseTensor* filter_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  auto shape = Conv2dShape(input,
+                           filter,
+                           out_grad.dims(),
+                           strides,
+                           paddings,
+                           padding_algorithm,
+                           dilations,
+                           groups,
+                           data_format);
+  if (input_grad) {
+    ConvBackwardData(shape,
+                     filter.data<T>(),
+                     out_grad.data<T>(),
+                     dev_ctx.template Alloc<T>(input_grad));
+  }
+  if (filter_grad) {
+    ConvBackwardFilter(shape,
+                       input.data<T>(),
+                       out_grad.data<T>(),
+                       dev_ctx.template Alloc<T>(filter_grad));
+  }
+}
+
+// depthwise_conv2d takes groups before dilations; the engine picks its
+// direct path from the shape.
+template <typename T>
+void DepthwiseConv2dKernel(const phi::Context& dev_ctx,
+                           const phi::DenseTensor& input,
+                           const phi::DenseTensor& filter,
+                           const std::vector<int>& strides,
+                           const std::vector<int>& paddings,
+                           const std::string& padding_algorithm,
+                           int groups,
+                           const std::vector<int>& dilations,
+                           const std::string& data_format,
+                           phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  Conv2dKernel<T>(dev_ctx,
+                  input,
+                  filter,
+                  strides,
+                  paddings,
+                  padding_algorithm,
+                  dilations,
+                  groups,
+                  data_format,
+                  out);
+}
+
+template <typename T>
+void DepthwiseConv2dGradKernel(const phi::Context& dev_ctx,
+                               const phi::DenseTensor& input,
+                               const phi::DenseTensor& filter,
+                               const phi::DenseTensor& out_grad,
+                               const std::vector<int>& strides,
+                               const std::vector<int>& paddings,
+                               const std::string& padding_algorithm,
+                               int groups,
+                               const std::vector<int>& dilations,
+                               const std::string& data_format,
+                               phi::DenseTensor* input_grad,
+                               phi::DenseTensor* filter_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  Conv2dGradKernel<T>(dev_ctx,
+                      input,
+                      filter,
+                      out_grad,
+                      strides,
+                      paddings,
+                      padding_algorithm,
+                      dilations,
+                      groups,
+                      data_format,
+                      input_grad,
+                      filter_grad);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(conv2d,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(conv2d_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dGradKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(depthwise_conv2d,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DepthwiseConv2dKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(depthwise_conv2d_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DepthwiseConv2dGradKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,167 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/conv.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// conv2d_transpose of x into out is the input gradient of the convolution
+// of out into x, whose filter layout [in_channels, out_channels / groups,
+// kh, kw] the transposed filter already has. This returns the shape of that
+// convolution, with the padding algorithm applied against x.
+static ConvShape Conv2dTransposeShape(const phi::DenseTensor& x,
+                                      const phi::DenseTensor& filter,
+                                      const std::vector<int64_t>& out_dims,
+                                      const std::vector<int>& strides,
+                                      const std::vector<int>& paddings,
+                                      const std::string& padding_algorithm,
+                                      const std::vector<int>& dilations,
+                                      int groups,
+                                      const std::string& data_format) {
+  auto x_dims = x.dims();
+  auto filter_dims = filter.dims();
+  PD_CHECK(x_dims.size() == 4 && filter_dims.size() == 4,
+           "conv2d_transpose expects 4-D input and filter, but received %d-D "
+           "and %d-D.",
+           x_dims.size(),
+           filter_dims.size());
+  const bool channels_last = data_format == "NHWC";
+  std::vector<int64_t> data_dims =
+      channels_last ? std::vector<int64_t>{x_dims[1], x_dims[2]}
+                    : std::vector<int64_t>{x_dims[2], x_dims[3]};
+  auto pads = paddings;
+  auto dils = dilations;
+  UpdatePaddingAndDilation(&pads,
+                           &dils,
+                           padding_algorithm,
+                           data_dims,
+                           strides,
+                           {filter_dims[2], filter_dims[3]});
+  return MakeConvShape(out_dims,
+                       filter_dims,
+                       x_dims,
+                       strides,
+                       pads,
+                       dils,
+                       groups,
+                       channels_last);
+}
+
+template <typename T>
+void Conv2dTransposeKernel(const phi::Context& dev_ctx,
+                           const phi::DenseTensor& x,
+                           const phi::DenseTensor& filter,
+                           const std::vector<int>& strides,
+                           const std::vector<int>& paddings,
+                           const std::vector<int>& output_padding,
+                           const phi::IntArray& output_size,
+                           const std::string& padding_algorithm,
+                           int groups,
+                           const std::vector<int>& dilations,
+                           const std::string& data_format,
+                           phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  auto shape = Conv2dTransposeShape(x,
+                                    filter,
+                                    out->dims(),
+                                    strides,
+                                    paddings,
+                                    padding_algorithm,
+                                    dilations,
+                                    groups,
+                                    data_format);
+  ConvBackwardData(shape, filter.data<T>(), x.data<T>(), out_data);
+}
+
+// The gradients of conv2d_transpose: dx is the convolution of dout, and
+// dfilter is the filter gradient of that convolution.
+template <typename T>
+void Conv2dTransposeGradKernel(const phi::Context& dev_ctx,
+                               const phi::DenseTensor& x,
+                               const phi::DenseTensor& filter,
+                               const phi::DenseTensor& dout,
+                               const std::vector<int>& strides,
+                               const std::vector<int>& paddings,
+                               const std::vector<int>& output_padding,
+                               const phi::IntArray& output_size,
+                               const std::string& padding_algorithm,
+                               int groups,
+                               const std::vector<int>& dilations,
+                               const std::string& data_format,
+                               phi::DenseTensor* dx,
+                               phi::DenseTensor* dfilter) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  auto shape = Conv2dTransposeShape(x,
+                                    filter,
+                                    dout.dims(),
+                                    strides,
+                                    paddings,
+                                    padding_algorithm,
+                                    dilations,
+                                    groups,
+                                    data_format);
+  if (dx) {
+    ConvForward(
+        shape, dout.data<T>(), filter.data<T>(), dev_ctx.template Alloc<T>(dx));
+  }
+  if (dfilter) {
+    ConvBackwardFilter(
+        shape, dout.data<T>(), x.data<T>(), dev_ctx.template Alloc<T>(dfilter));
+  }
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(conv2d_transpose,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dTransposeKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(conv2d_transpose_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dTransposeGradKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(depthwise_conv2d_transpose,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dTransposeKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(depthwise_conv2d_transpose_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::Conv2dTransposeGradKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -13,8 +13,11 @@
 // limitations under the License.
 
 #include "kernels.h"  //NOLINT
+#include "kernels/funcs/softmax.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -155,6 +158,37 @@ void CrossEntropyKernel(const phi::Context& dev_ctx,
   }
 }
 
+template <typename T, typename LabelT>
+void SoftmaxCrossEntropy(const phi::DenseTensor& logits,
+                         const phi::DenseTensor& label,
+                         int ignore_index,
+                         int n,
+                         int axis_dim,
+                         int remain,
+                         T* softmax_data,
+                         T* loss_data) {
+  auto label_data = label.data<LabelT>();
+  for (int64_t i = 0; i < static_cast<int64_t>(n) * remain; ++i) {
+    auto lbl = static_cast<int64_t>(label_data[i]);
+    if (lbl != ignore_index) {
+      PD_CHECK(lbl >= 0 && lbl < axis_dim,
+               "label value should be in [0, %d) when it is not equal to "
+               "ignore_index(%d), but received %ld.",
+               axis_dim,
+               ignore_index,
+               lbl);
+    }
+  }
+  custom_kernel::SoftmaxCrossEntropyCompute(logits.data<T>(),
+                                            label_data,
+                                            softmax_data,
+                                            loss_data,
+                                            n,
+                                            axis_dim,
+                                            remain,
+                                            ignore_index);
+}
+
 template <typename T>
 void CrossEntropyWithSoftmaxKernel(const phi::Context& dev_ctx,
                                    const phi::DenseTensor& logits,
@@ -166,6 +200,8 @@ void CrossEntropyWithSoftmaxKernel(const phi::Context& dev_ctx,
                                    int axis,
                                    phi::DenseTensor* softmax,
                                    phi::DenseTensor* loss) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   // do not with softmax op, and input is softmax
   if (!use_softmax) {
     auto softmax_data = dev_ctx.template Alloc<T>(softmax);
@@ -175,9 +211,80 @@ void CrossEntropyWithSoftmaxKernel(const phi::Context& dev_ctx,
     return;
   }
 
-  custom_kernel::SoftmaxKernel<T>(dev_ctx, logits, axis, softmax);
-  CrossEntropyKernel<T>(
-      dev_ctx, *softmax, label, soft_label, ignore_index, axis, loss);
+  // Softmax and loss are produced together from one read of the logits.
+  auto softmax_data = dev_ctx.template Alloc<T>(softmax);
+  auto loss_data = dev_ctx.template Alloc<T>(loss);
+  if (logits.numel() == 0) {
+    return;
+  }
+  const int rank = logits.dims().size();
+  if (rank == 0) {
+    softmax_data[0] = static_cast<T>(1);
+    loss_data[0] = static_cast<T>(0);
+    return;
+  }
+  const int axis_v = phi::funcs::CanonicalAxis(axis, rank);
+  const int axis_dim = logits.dims()[axis_v];
+  const int n = phi::funcs::SizeToAxis(axis_v, logits.dims());
+  const int d = phi::funcs::SizeFromAxis(axis_v, logits.dims());
+  const int remain = d / axis_dim;
+
+  if (soft_label) {
+    custom_kernel::SoftLabelSoftmaxCrossEntropyCompute(logits.data<T>(),
+                                                       label.data<T>(),
+                                                       softmax_data,
+                                                       loss_data,
+                                                       n,
+                                                       axis_dim,
+                                                       remain);
+  } else if (label.dtype() == phi::DataType::INT32) {
+    SoftmaxCrossEntropy<T, int32_t>(logits,
+                                    label,
+                                    ignore_index,
+                                    n,
+                                    axis_dim,
+                                    remain,
+                                    softmax_data,
+                                    loss_data);
+  } else if (label.dtype() == phi::DataType::INT64) {
+    SoftmaxCrossEntropy<T, int64_t>(logits,
+                                    label,
+                                    ignore_index,
+                                    n,
+                                    axis_dim,
+                                    remain,
+                                    softmax_data,
+                                    loss_data);
+  } else if (label.dtype() == phi::DataType::INT16) {
+    SoftmaxCrossEntropy<T, int16_t>(logits,
+                                    label,
+                                    ignore_index,
+                                    n,
+                                    axis_dim,
+                                    remain,
+                                    softmax_data,
+                                    loss_data);
+  } else if (label.dtype() == phi::DataType::INT8) {
+    SoftmaxCrossEntropy<T, int8_t>(logits,
+                                   label,
+                                   ignore_index,
+                                   n,
+                                   axis_dim,
+                                   remain,
+                                   softmax_data,
+                                   loss_data);
+  } else if (label.dtype() == phi::DataType::UINT8) {
+    SoftmaxCrossEntropy<T, uint8_t>(logits,
+                                    label,
+                                    ignore_index,
+                                    n,
+                                    axis_dim,
+                                    remain,
+                                    softmax_data,
+                                    loss_data);
+  } else {
+    PD_CHECK(false, "The dtype of label must be int.");
+  }
 }
 
 template <typename T, typename LabelT>
@@ -198,10 +305,6 @@ void CrossEntropyWithSoftmaxGradCPUKernel(const phi::Context& dev_ctx,
   auto logits_grad_data = logits_grad->data<T>();
   auto softmax_data = softmax.data<T>();
 
-  if (logit_grad != &softmax || !use_softmax) {
-    memcpy(logits_grad_data, softmax_data, softmax.numel() * sizeof(T));
-  }
-
   const int rank = logit_grad->dims().size();
   const int axis_v = phi::funcs::CanonicalAxis(axis, rank);
   int axis_dim = logit_grad->dims()[axis_v];
@@ -223,6 +326,9 @@ void CrossEntropyWithSoftmaxGradCPUKernel(const phi::Context& dev_ctx,
   auto label_data = label.data<LabelT>();
   auto logit_grad_data = logit_grad->data<T>();
   if (!use_softmax) {
+    if (logits_grad_data != softmax_data) {
+      memcpy(logits_grad_data, softmax_data, softmax.numel() * sizeof(T));
+    }
     // use_softmax step1
     if (soft_label) {
       for (auto i = 0; i < n; ++i) {
@@ -266,67 +372,24 @@ void CrossEntropyWithSoftmaxGradCPUKernel(const phi::Context& dev_ctx,
     }
     return;
   }
-  // for use_softmax=False, continue
-
+  // for use_softmax=True, (softmax - label) * loss_grad in one pass per row
   if (soft_label) {
-    // when soft_label = True, ignore_index is not supported
-    for (auto i = 0; i < n; ++i) {
-      for (auto j = 0; j < axis_dim; ++j) {
-        for (auto k = 0; k < remain; ++k) {
-          auto index = i * d + j * remain + k;
-          auto l_index = i * remain + k;
-          logit_grad_data[index] = out_grad_data[l_index] *
-                                   (logit_grad_data[index] - label_data[index]);
-        }
-      }
-    }
-
-    // for each sample, i is sample id
-    // 1) compute dy/dx by p_j - y_j or P-Y, where j is class id,
-    // P=logit_grad_mat[i] is all class's probs, Y=lbl_mat[i] is
-    // all class's label
-    // 2) compute dy * dy/dx by   Chain rule, dy=out_grad_mat[i]
-    // for high dims, e.g. (n,c) or (n,d1,...,dm, c), compute grad by matrix
-    // operation
-
+    custom_kernel::SoftLabelSoftmaxCrossEntropyGradCompute(softmax_data,
+                                                           label.data<T>(),
+                                                           out_grad_data,
+                                                           logit_grad_data,
+                                                           n,
+                                                           axis_dim,
+                                                           remain);
   } else {
-    for (auto i = 0; i < n; ++i) {
-      for (auto j = 0; j < axis_dim; ++j) {
-        for (auto k = 0; k < remain; ++k) {
-          auto index = i * d + j * remain + k;
-          auto l_index = i * remain + k;
-
-          logit_grad_data[index] =
-              out_grad_data[l_index] * logit_grad_data[index];
-        }
-      }
-    }
-    for (int i = 0; i < n; ++i) {         // for each sample_1_dim
-      for (int j = 0; j < remain; j++) {  // for each sample_other_dims
-        int idx = i * remain + j;  // this sample's label_idx. for 1d case,
-                                   // remain=1 and j=0, so, idx = i
-        auto lbl = static_cast<int64_t>(label_data[idx]);
-        if (lbl == ignore_index) {
-          for (int k = 0; k < axis_dim; ++k) {  // for each class id's label
-            logit_grad_data[i * d + k * remain + j] = 0;
-          }
-        } else {
-          // only for this sample's label_idx, the label is 1, others is 0,
-          // so, only compute this label_idx's class
-          // for 1d case, remain=1 and j=0, so, [i * d + label_data[idx] *
-          // remain + j] = [i * d + label_data[idx]]
-          // let idx_x = i * d + label_data[idx] * remain + j,
-          //   logit_grad_data[idx_x] = logit_grad_data[idx_x] -
-          //   out_grad_data[idx]
-          // note: logit_grad_mat = logit_grad_mat * out_grad_mat
-          // so: logit_grad_data[idx_x] =  (logit_grad_data[idx_x] - 1) *
-          // out_grad_data[idx]
-          // means:           dy/dp * dy=   ( p - y ) * dy
-
-          logit_grad_data[i * d + lbl * remain + j] -= out_grad_data[idx];
-        }
-      }
-    }
+    custom_kernel::SoftmaxCrossEntropyGradCompute(softmax_data,
+                                                  label_data,
+                                                  out_grad_data,
+                                                  logit_grad_data,
+                                                  n,
+                                                  axis_dim,
+                                                  remain,
+                                                  ignore_index);
   }
 }
 
@@ -341,6 +404,8 @@ void CrossEntropyWithSoftmaxGradKernel(const phi::Context& dev_ctx,
                                        int ignore_index,
                                        int axis,
                                        phi::DenseTensor* logits_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   if (soft_label) {
     CrossEntropyWithSoftmaxGradCPUKernel<T, T>(dev_ctx,
                                                label,
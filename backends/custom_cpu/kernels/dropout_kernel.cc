@@ -0,0 +1,130 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/random.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+template <typename T>
+void DropoutRawKernel(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& x,
+                      const paddle::optional<phi::DenseTensor>& seed_tensor,
+                      const phi::Scalar& p,
+                      bool is_test,
+                      const std::string& mode,
+                      int seed,
+                      bool fix_seed,
+                      phi::DenseTensor* out,
+                      phi::DenseTensor* mask) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  using AccT = AccType<T>;
+  const float dropout_prob = p.to<float>();
+  const bool upscale_in_train = mode == "upscale_in_train";
+  const T* x_data = x.data<T>();
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  const int64_t size = x.numel();
+
+  if (!is_test && mask) {
+    uint8_t* mask_data = dev_ctx.template Alloc<uint8_t>(mask);
+    // Same seed precedence as the phi kernels: the seed tensor, then the
+    // op's seed when fixed, then the device generator.
+    int op_seed = fix_seed ? seed : 0;
+    if (seed_tensor) {
+      op_seed = *seed_tensor->data<int>();
+    }
+    DropoutCompute(DrawState(op_seed, size),
+                   x_data,
+                   dropout_prob,
+                   upscale_in_train,
+                   out_data,
+                   mask_data,
+                   size);
+    return;
+  }
+
+  // Inference keeps every value; downgrade_in_infer scales them instead of
+  // the training outputs.
+  const AccT scale =
+      upscale_in_train ? AccT(1) : static_cast<AccT>(1.0f - dropout_prob);
+  ParallelFor(0, size, kElementwiseGrainSize, [&](int64_t b, int64_t e) {
+    for (int64_t i = b; i < e; ++i) {
+      out_data[i] = Convert<T>(Convert<AccT>(x_data[i]) * scale);
+    }
+  });
+}
+
+template <typename T>
+void DropoutGradRawKernel(const phi::Context& dev_ctx,
+                          const phi::DenseTensor& mask,
+                          const phi::DenseTensor& out_grad,
+                          const phi::Scalar& p,
+                          bool is_test,
+                          const std::string& mode,
+                          phi::DenseTensor* x_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  using AccT = AccType<T>;
+  const float dropout_prob = p.to<float>();
+  const bool upscale_in_train = mode == "upscale_in_train";
+  const T* dout = out_grad.data<T>();
+  T* dx = dev_ctx.template Alloc<T>(x_grad);
+  const int64_t size = out_grad.numel();
+
+  if (is_test) {
+    const AccT scale =
+        upscale_in_train ? AccT(1) : static_cast<AccT>(1.0f - dropout_prob);
+    ParallelFor(0, size, kElementwiseGrainSize, [&](int64_t b, int64_t e) {
+      for (int64_t i = b; i < e; ++i) {
+        dx[i] = Convert<T>(Convert<AccT>(dout[i]) * scale);
+      }
+    });
+    return;
+  }
+
+  const AccT scale = upscale_in_train && dropout_prob < 1.0f
+                         ? static_cast<AccT>(1.0 / (1.0 - dropout_prob))
+                         : AccT(1);
+  const uint8_t* mask_data = mask.data<uint8_t>();
+  ParallelFor(0, size, kElementwiseGrainSize, [&](int64_t b, int64_t e) {
+    for (int64_t i = b; i < e; ++i) {
+      dx[i] =
+          Convert<T>(mask_data[i] ? Convert<AccT>(dout[i]) * scale : AccT(0));
+    }
+  });
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(dropout,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DropoutRawKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(dropout_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::DropoutGradRawKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
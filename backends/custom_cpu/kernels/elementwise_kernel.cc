@@ -14,29 +14,36 @@
 
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
+template <typename T>
+struct MultiplyFunctor {
+  T operator()(const T a, const T b) const { return a * b; }
+};
+
+template <typename T>
+struct AddFunctor {
+  T operator()(const T a, const T b) const { return a + b; }
+};
+
+template <typename T>
+struct MaxFunctor {
+  T operator()(const T a, const T b) const { return a > b ? a : b; }
+};
+
 template <typename T>
 void MultiplyRawKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& y,
                        int axis,
                        phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] * y_data[i];
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, T>(
+      dev_ctx, x, y, axis, MultiplyFunctor<AccType<T>>(), out);
 }
 
 template <typename T>
@@ -44,6 +51,8 @@ void MultiplyKernel(const phi::Context& dev_ctx,
                     const phi::DenseTensor& x,
                     const phi::DenseTensor& y,
                     phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   int axis = -1;
   MultiplyRawKernel<T>(dev_ctx, x, y, axis, out);
 }
@@ -54,21 +63,10 @@ void AddRawKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& y,
                   int axis,
                   phi::DenseTensor* out) {
-  dev_ctx.template Alloc<T>(out);
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = x_data[i] + y_data[i];
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, T>(
+      dev_ctx, x, y, axis, AddFunctor<AccType<T>>(), out);
 }
 
 template <typename T>
@@ -76,6 +74,8 @@ void AddKernel(const phi::Context& dev_ctx,
                const phi::DenseTensor& x,
                const phi::DenseTensor& y,
                phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   int axis = -1;
   custom_kernel::AddRawKernel<T>(dev_ctx, x, y, axis, out);
 }
@@ -86,21 +86,10 @@ void MaxRawKernel(const phi::Context& dev_ctx,
                   const phi::DenseTensor& y,
                   int axis,
                   phi::DenseTensor* out) {
-  dev_ctx.template Alloc<T>(out);
-  auto x_dims = x.dims();
-  auto y_dims = y.dims();
-  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
-  phi::DenseTensor tmp_x, tmp_y;
-  phi::BroadcastTo<T>(dev_ctx, x, dst_dims, axis, &tmp_x);
-  phi::BroadcastTo<T>(dev_ctx, y, dst_dims, axis, &tmp_y);
-
-  auto x_data = tmp_x.data<T>();
-  auto y_data = tmp_y.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto numel = out->numel();
-  for (auto i = 0; i < numel; ++i) {
-    out_data[i] = std::max(x_data[i], y_data[i]);
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  phi::ElementwiseCompute<T, T>(
+      dev_ctx, x, y, axis, MaxFunctor<AccType<T>>(), out);
 }
 
 template <typename T>
@@ -108,6 +97,8 @@ void MaxKernel(const phi::Context& dev_ctx,
                const phi::DenseTensor& x,
                const phi::DenseTensor& y,
                phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   int axis = -1;
   custom_kernel::MaxRawKernel<T>(dev_ctx, x, y, axis, out);
 }
@@ -121,7 +112,9 @@ PD_BUILD_PHI_KERNEL(multiply_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(multiply,
                     custom_cpu,
@@ -130,7 +123,9 @@ PD_BUILD_PHI_KERNEL(multiply,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(add_raw,
                     custom_cpu,
@@ -139,7 +134,9 @@ PD_BUILD_PHI_KERNEL(add_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(add,
                     custom_cpu,
@@ -148,7 +145,9 @@ PD_BUILD_PHI_KERNEL(add,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(maximum_raw,
                     custom_cpu,
@@ -157,7 +156,9 @@ PD_BUILD_PHI_KERNEL(maximum_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(maximum,
                     custom_cpu,
@@ -166,4 +167,6 @@ PD_BUILD_PHI_KERNEL(maximum,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
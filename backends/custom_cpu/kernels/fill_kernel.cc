@@ -14,6 +14,8 @@
 
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -21,6 +23,8 @@ template <typename T>
 void FillKernel(const phi::Context& dev_ctx,
                 const phi::Scalar& value,
                 phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   double fill_var = value.to<double>();
   PD_CHECK(std::isnan(fill_var) == false,
            "fill value should not be NaN, but received NaN");
@@ -0,0 +1,184 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/attention.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// The attention of q over k and v, all [batch, seq_len, num_heads, head_dim].
+static AttentionShape FlashAttnShape(const phi::DenseTensor& q,
+                                     const phi::DenseTensor& k,
+                                     const phi::DenseTensor& v,
+                                     bool causal) {
+  auto q_dims = q.dims();
+  auto k_dims = k.dims();
+  PD_CHECK(q_dims.size() == 4 && k_dims.size() == 4,
+           "flash_attn expects q, k and v of [batch_size, seq_len, "
+           "num_heads, head_dim], but received %d-D q and %d-D k.",
+           q_dims.size(),
+           k_dims.size());
+  PD_CHECK(k_dims == v.dims(), "flash_attn expects k and v of one shape.");
+  PD_CHECK(k_dims[0] == q_dims[0] && k_dims[3] == q_dims[3],
+           "flash_attn expects q, k and v of one batch_size and head_dim.");
+  PD_CHECK(k_dims[2] > 0 && q_dims[2] % k_dims[2] == 0,
+           "flash_attn expects num_heads of q (%d) to be a multiple of "
+           "num_heads of k and v (%d).",
+           q_dims[2],
+           k_dims[2]);
+  AttentionShape a;
+  a.batch = q_dims[0];
+  a.seq_q = q_dims[1];
+  a.heads = q_dims[2];
+  a.head_dim = q_dims[3];
+  a.seq_k = k_dims[1];
+  a.kv_heads = k_dims[2];
+  a.scale = 1.0f / std::sqrt(static_cast<float>(a.head_dim));
+  a.causal = causal;
+  return a;
+}
+
+// attn_mask is [batch_size or 1, num_heads or 1, seq_len_q, seq_len_k].
+template <typename T>
+static AttentionMask<T> FlashAttnMask(
+    const AttentionShape& a,
+    const paddle::optional<phi::DenseTensor>& attn_mask) {
+  AttentionMask<T> mask;
+  if (!attn_mask) {
+    return mask;
+  }
+  auto dims = attn_mask->dims();
+  PD_CHECK(dims.size() == 4 && (dims[0] == 1 || dims[0] == a.batch) &&
+               (dims[1] == 1 || dims[1] == a.heads) && dims[2] == a.seq_q &&
+               dims[3] == a.seq_k,
+           "flash_attn expects attn_mask of [batch_size or 1, num_heads or 1, "
+           "seq_len_q, seq_len_k].");
+  mask.data = attn_mask->data<T>();
+  mask.head_stride = dims[1] == 1 ? 0 : a.seq_q * a.seq_k;
+  mask.batch_stride = dims[0] == 1 ? 0 : dims[1] * a.seq_q * a.seq_k;
+  return mask;
+}
+
+template <typename T>
+void FlashAttnKernel(
+    const phi::Context& dev_ctx,
+    const phi::DenseTensor& q,
+    const phi::DenseTensor& k,
+    const phi::DenseTensor& v,
+    const paddle::optional<phi::DenseTensor>& fixed_seed_offset,
+    const paddle::optional<phi::DenseTensor>& attn_mask,
+    float dropout,
+    bool causal,
+    bool return_softmax,
+    bool is_test,
+    const std::string& rng_name,
+    phi::DenseTensor* out,
+    phi::DenseTensor* softmax,
+    phi::DenseTensor* softmax_lse,
+    phi::DenseTensor* seed_offset) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  auto a = FlashAttnShape(q, k, v, causal);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  float* lse = dev_ctx.template Alloc<float>(softmax_lse);
+  T* probs =
+      return_softmax && softmax ? dev_ctx.template Alloc<T>(softmax) : nullptr;
+
+  // seed_offset records the Philox state the dropout drew from, so the
+  // backward pass regenerates its keep decisions.
+  AttentionDropout drop;
+  drop.p = is_test ? 0.0f : dropout;
+  if (fixed_seed_offset) {
+    const int64_t* fixed = fixed_seed_offset->data<int64_t>();
+    drop.state = {static_cast<uint64_t>(fixed[0]),
+                  static_cast<uint64_t>(fixed[1])};
+  } else if (drop.p > 0) {
+    drop.state = DrawState(0, AttentionDropoutCounters(a));
+  }
+  if (seed_offset) {
+    int64_t* state = dev_ctx.template Alloc<int64_t>(seed_offset);
+    state[0] = static_cast<int64_t>(drop.state.seed);
+    state[1] = static_cast<int64_t>(drop.state.offset);
+  }
+
+  FlashAttentionForward(a,
+                        q.data<T>(),
+                        k.data<T>(),
+                        v.data<T>(),
+                        FlashAttnMask<T>(a, attn_mask),
+                        drop,
+                        out_data,
+                        lse,
+                        probs);
+}
+
+template <typename T>
+void FlashAttnGradKernel(const phi::Context& dev_ctx,
+                         const phi::DenseTensor& q,
+                         const phi::DenseTensor& k,
+                         const phi::DenseTensor& v,
+                         const phi::DenseTensor& out,
+                         const phi::DenseTensor& softmax_lse,
+                         const phi::DenseTensor& seed_offset,
+                         const paddle::optional<phi::DenseTensor>& attn_mask,
+                         const phi::DenseTensor& dout,
+                         float dropout,
+                         bool causal,
+                         phi::DenseTensor* dq,
+                         phi::DenseTensor* dk,
+                         phi::DenseTensor* dv) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  auto a = FlashAttnShape(q, k, v, causal);
+  AttentionDropout drop;
+  drop.p = dropout;
+  if (drop.p > 0) {
+    const int64_t* state = seed_offset.data<int64_t>();
+    drop.state = {static_cast<uint64_t>(state[0]),
+                  static_cast<uint64_t>(state[1])};
+  }
+  FlashAttentionBackward(a,
+                         q.data<T>(),
+                         k.data<T>(),
+                         v.data<T>(),
+                         out.data<T>(),
+                         dout.data<T>(),
+                         softmax_lse.data<float>(),
+                         FlashAttnMask<T>(a, attn_mask),
+                         drop,
+                         dev_ctx.template Alloc<T>(dq),
+                         dev_ctx.template Alloc<T>(dk),
+                         dev_ctx.template Alloc<T>(dv));
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(flash_attn,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::FlashAttnKernel,
+                    float,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(flash_attn_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::FlashAttnGradKernel,
+                    float,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
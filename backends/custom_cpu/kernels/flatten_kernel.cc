@@ -0,0 +1,157 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/kernels.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// Merges the dims from start_axis to stop_axis, both included, into one. A
+// 0-D input flattens to shape [1].
+static std::vector<int64_t> FlattenDims(const std::vector<int64_t>& in_dims,
+                                        int start_axis,
+                                        int stop_axis) {
+  const int rank = in_dims.size();
+  if (rank == 0) {
+    return {1};
+  }
+  start_axis = start_axis < 0 ? start_axis + rank : start_axis;
+  stop_axis = stop_axis < 0 ? stop_axis + rank : stop_axis;
+  PD_CHECK(start_axis >= 0 && start_axis <= stop_axis && stop_axis < rank,
+           "flatten expects 0 <= start_axis <= stop_axis < rank (%d), but "
+           "received start_axis = %d, stop_axis = %d.",
+           rank,
+           start_axis,
+           stop_axis);
+  std::vector<int64_t> out_dims(in_dims.begin(), in_dims.begin() + start_axis);
+  int64_t merged = 1;
+  for (int i = start_axis; i <= stop_axis; ++i) {
+    merged *= in_dims[i];
+  }
+  out_dims.push_back(merged);
+  out_dims.insert(
+      out_dims.end(), in_dims.begin() + stop_axis + 1, in_dims.end());
+  return out_dims;
+}
+
+template <typename T>
+void FlattenKernel(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& x,
+                   int start_axis,
+                   int stop_axis,
+                   phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeCopy<T>(dev_ctx, x, FlattenDims(x.dims(), start_axis, stop_axis), out);
+}
+
+template <typename T>
+void FlattenWithXShapeKernel(const phi::Context& dev_ctx,
+                             const phi::DenseTensor& x,
+                             int start_axis,
+                             int stop_axis,
+                             phi::DenseTensor* out,
+                             phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  FlattenKernel<T>(dev_ctx, x, start_axis, stop_axis, out);
+}
+
+template <typename T>
+void FlattenStridedKernel(const phi::Context& dev_ctx,
+                          const phi::DenseTensor& x,
+                          int start_axis,
+                          int stop_axis,
+                          phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeView<T>(dev_ctx, x, FlattenDims(x.dims(), start_axis, stop_axis), out);
+}
+
+template <typename T>
+void FlattenWithXShapeStridedKernel(const phi::Context& dev_ctx,
+                                    const phi::DenseTensor& x,
+                                    int start_axis,
+                                    int stop_axis,
+                                    phi::DenseTensor* out,
+                                    phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  FlattenStridedKernel<T>(dev_ctx, x, start_axis, stop_axis, out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(flatten,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::FlattenKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(flatten_with_xshape,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::FlattenWithXShapeKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(flatten,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::FlattenStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(flatten_with_xshape,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::FlattenWithXShapeStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -13,6 +13,8 @@
 // limitations under the License.
 
 #include "paddle/phi/capi/all.h"
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -32,6 +34,8 @@ void FullKernel(const phi::Context& dev_ctx,
                 const phi::Scalar& val,
                 phi::DataType dtype,
                 phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto int_shape = shape.GetData();
   out->Resize(std::vector<int64_t>(int_shape.cbegin(), int_shape.cend()));
   FullValue<T>(dev_ctx, out, val.to<T>());
@@ -0,0 +1,491 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <limits>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/gemm.h"
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/random.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Query rows per block, the unit of parallel work of the forward pass.
+constexpr int64_t kAttnBlockQ = 64;
+// Keys per block streamed past a query block. A block of K and V, the
+// scores and the output accumulator stay in L2 for head dims up to 256.
+constexpr int64_t kAttnBlockK = 64;
+
+// Attention of q [batch, seq_q, heads, head_dim] over k and v
+// [batch, seq_k, kv_heads, head_dim]. Query head h reads kv head
+// h / (heads / kv_heads). A causal mask is aligned to the bottom right
+// corner: query i sees keys up to i + seq_k - seq_q.
+struct AttentionShape {
+  int64_t batch;
+  int64_t seq_q;
+  int64_t seq_k;
+  int64_t heads;
+  int64_t kv_heads;
+  int64_t head_dim;
+  float scale;
+  bool causal;
+};
+
+// An additive mask of [seq_q, seq_k] per batch and head, broadcast over a
+// dim whose stride is 0.
+template <typename T>
+struct AttentionMask {
+  const T* data = nullptr;
+  int64_t batch_stride = 0;
+  int64_t head_stride = 0;
+};
+
+// Dropout on the attention probabilities. The keep decision of score
+// (b, h, i, j) is word n % 4 of Philox counter state.offset + n / 4, with
+// n the flat index of the score, so the backward pass regenerates it.
+struct AttentionDropout {
+  float p = 0;
+  PhiloxState state = {0, 0};
+};
+
+// Philox counters reserved by a dropout over the scores of `a`.
+inline uint64_t AttentionDropoutCounters(const AttentionShape& a) {
+  return (a.batch * a.heads * a.seq_q * a.seq_k + 3) / 4;
+}
+
+namespace detail {
+
+// A block of rows of q, k, v or dout as AccType<T>, `ld` elements apart.
+template <typename T>
+struct RowBlock {
+  const AccType<T>* data;
+  int64_t ld;
+};
+
+// The GEMM engine reads strided rows, so float and double tensors are used
+// in place. 16-bit rows are converted into `buf` first.
+template <typename T, bool kStaged = !std::is_same<T, AccType<T>>::value>
+struct RowLoader {
+  static RowBlock<T> Load(const T* src,
+                          int64_t stride,
+                          int64_t rows,
+                          int64_t cols,
+                          AccType<T>* buf) {
+    for (int64_t r = 0; r < rows; ++r) {
+      for (int64_t c = 0; c < cols; ++c) {
+        buf[r * cols + c] = Convert<AccType<T>>(src[r * stride + c]);
+      }
+    }
+    return {buf, cols};
+  }
+};
+
+template <typename T>
+struct RowLoader<T, false> {
+  static RowBlock<T> Load(const T* src, int64_t stride, int64_t, int64_t, T*) {
+    return {src, stride};
+  }
+};
+
+template <typename T>
+RowBlock<T> LoadRows(
+    const T* src, int64_t stride, int64_t rows, int64_t cols, AccType<T>* buf) {
+  return RowLoader<T>::Load(src, stride, rows, cols, buf);
+}
+
+// c (M x N, dense) = alpha * a * b + beta * c.
+template <typename AccT>
+void BlockGemm(int64_t M,
+               int64_t N,
+               int64_t K,
+               AccT alpha,
+               const AccT* a,
+               int64_t rs_a,
+               int64_t cs_a,
+               const AccT* b,
+               int64_t rs_b,
+               int64_t cs_b,
+               AccT beta,
+               AccT* c) {
+  gemm::GemmStrided<AccT>(
+      M, N, K, alpha, a, rs_a, cs_a, 0, b, rs_b, cs_b, 0, beta, c, N, 1, 0);
+}
+
+// The end of the keys query i may attend to.
+inline int64_t KeyEnd(const AttentionShape& a, int64_t i) {
+  return a.causal ? std::max<int64_t>(
+                        0, std::min(a.seq_k, i + 1 + a.seq_k - a.seq_q))
+                  : a.seq_k;
+}
+
+// s (br x bc) = scale * q k^T + mask for queries [q0, q0 + br) and keys
+// [k0, k0 + bc) of head h, -inf where the causal mask hides a key.
+template <typename T>
+void ScoreBlock(const AttentionShape& a,
+                const AttentionMask<T>& mask,
+                int64_t b,
+                int64_t h,
+                int64_t q0,
+                int64_t br,
+                int64_t k0,
+                int64_t bc,
+                const RowBlock<T>& q,
+                const RowBlock<T>& k,
+                AccType<T>* s) {
+  using AccT = AccType<T>;
+  BlockGemm<AccT>(
+      br, bc, a.head_dim, a.scale, q.data, q.ld, 1, k.data, 1, k.ld, 0, s);
+  for (int64_t r = 0; r < br; ++r) {
+    AccT* row = s + r * bc;
+    if (mask.data) {
+      const T* m = mask.data + b * mask.batch_stride + h * mask.head_stride +
+                   (q0 + r) * a.seq_k + k0;
+      for (int64_t j = 0; j < bc; ++j) {
+        row[j] += Convert<AccT>(m[j]);
+      }
+    }
+    const int64_t end = KeyEnd(a, q0 + r) - k0;
+    for (int64_t j = std::max<int64_t>(end, 0); j < bc; ++j) {
+      row[j] = -std::numeric_limits<AccT>::infinity();
+    }
+  }
+}
+
+// z (br x bc) = 1 / (1 - p) where the dropout keeps a score, 0 elsewhere.
+template <typename AccT>
+void DropoutBlock(const AttentionShape& a,
+                  const AttentionDropout& dropout,
+                  int64_t b,
+                  int64_t h,
+                  int64_t q0,
+                  int64_t br,
+                  int64_t k0,
+                  int64_t bc,
+                  AccT* z) {
+  const AccT keep_scale = static_cast<AccT>(1.0 / (1.0 - dropout.p));
+  uint32_t r[4];
+  for (int64_t row = 0; row < br; ++row) {
+    const uint64_t first =
+        ((b * a.heads + h) * a.seq_q + q0 + row) * a.seq_k + k0;
+    uint64_t counter = ~uint64_t(0);
+    for (int64_t j = 0; j < bc; ++j) {
+      const uint64_t n = first + j;
+      if (n / 4 != counter) {
+        counter = n / 4;
+        Philox4x32::Generate(
+            dropout.state.seed, dropout.state.offset + counter, r);
+      }
+      z[row * bc + j] =
+          UniformBits<float>::Get(r + n % 4) >= dropout.p ? keep_scale : 0;
+    }
+  }
+}
+
+// p = exp(s - lse) per row, 0 for a row that sees no key.
+template <typename AccT>
+void ProbBlock(int64_t br, int64_t bc, const float* lse, AccT* s) {
+  for (int64_t r = 0; r < br; ++r) {
+    AccT* row = s + r * bc;
+    if (lse[r] == -std::numeric_limits<float>::infinity()) {
+      std::fill(row, row + bc, AccT(0));
+      continue;
+    }
+    const AccT m = lse[r];
+    for (int64_t j = 0; j < bc; ++j) {
+      row[j] = std::exp(row[j] - m);
+    }
+  }
+}
+
+}  // namespace detail
+
+// out = softmax(scale * q k^T + mask) v, streaming blocks of K and V past
+// each block of queries with an online softmax (FlashAttention-2), so
+// scores never exist beyond one block per thread. lse [batch, heads, seq_q]
+// receives the log-sum-exp of every score row, -inf for a row that sees no
+// key, whose output is 0. probs, when given, receives the
+// [batch, heads, seq_q, seq_k] probabilities before dropout.
+template <typename T>
+void FlashAttentionForward(const AttentionShape& a,
+                           const T* q,
+                           const T* k,
+                           const T* v,
+                           const AttentionMask<T>& mask,
+                           const AttentionDropout& dropout,
+                           T* out,
+                           float* lse,
+                           T* probs = nullptr) {
+  using AccT = AccType<T>;
+  constexpr AccT kNegInf = -std::numeric_limits<AccT>::infinity();
+  const int64_t d = a.head_dim;
+  const int64_t group = a.heads / a.kv_heads;
+  const int64_t q_stride = a.heads * d;
+  const int64_t kv_stride = a.kv_heads * d;
+  const int64_t q_blocks = (a.seq_q + kAttnBlockQ - 1) / kAttnBlockQ;
+  ParallelFor(
+      0, a.batch * a.heads * q_blocks, 1, [&](int64_t begin, int64_t end) {
+        std::vector<AccT> q_buf(kAttnBlockQ * d), k_buf(kAttnBlockK * d),
+            v_buf(kAttnBlockK * d), o(kAttnBlockQ * d),
+            s(kAttnBlockQ * kAttnBlockK), z(kAttnBlockQ * kAttnBlockK);
+        std::vector<AccT> m(kAttnBlockQ), l(kAttnBlockQ);
+        for (int64_t task = begin; task < end; ++task) {
+          const int64_t b = task / (a.heads * q_blocks);
+          const int64_t h = task / q_blocks % a.heads;
+          const int64_t q0 = task % q_blocks * kAttnBlockQ;
+          const int64_t br = std::min(kAttnBlockQ, a.seq_q - q0);
+          const T* k_head = k + (b * a.seq_k * a.kv_heads + h / group) * d;
+          const T* v_head = v + (b * a.seq_k * a.kv_heads + h / group) * d;
+          auto qb = detail::LoadRows(q + ((b * a.seq_q + q0) * a.heads + h) * d,
+                                     q_stride,
+                                     br,
+                                     d,
+                                     q_buf.data());
+          std::fill(m.begin(), m.end(), kNegInf);
+          std::fill(l.begin(), l.end(), AccT(0));
+          std::fill(o.begin(), o.end(), AccT(0));
+
+          const int64_t k_end = detail::KeyEnd(a, q0 + br - 1);
+          for (int64_t k0 = 0; k0 < k_end; k0 += kAttnBlockK) {
+            const int64_t bc = std::min(kAttnBlockK, k_end - k0);
+            auto kb = detail::LoadRows(
+                k_head + k0 * kv_stride, kv_stride, bc, d, k_buf.data());
+            auto vb = detail::LoadRows(
+                v_head + k0 * kv_stride, kv_stride, bc, d, v_buf.data());
+            detail::ScoreBlock(a, mask, b, h, q0, br, k0, bc, qb, kb, s.data());
+            if (dropout.p > 0) {
+              detail::DropoutBlock(a, dropout, b, h, q0, br, k0, bc, z.data());
+            }
+            for (int64_t r = 0; r < br; ++r) {
+              AccT* row = s.data() + r * bc;
+              AccT row_max = m[r];
+              for (int64_t j = 0; j < bc; ++j) {
+                row_max = std::max(row_max, row[j]);
+              }
+              if (row_max == kNegInf) {
+                std::fill(row, row + bc, AccT(0));
+                continue;
+              }
+              // Rescale what the row has accumulated to the new maximum.
+              const AccT alpha = std::exp(m[r] - row_max);
+              AccT sum = 0;
+              for (int64_t j = 0; j < bc; ++j) {
+                row[j] = std::exp(row[j] - row_max);
+                sum += row[j];
+              }
+              l[r] = l[r] * alpha + sum;
+              m[r] = row_max;
+              AccT* o_row = o.data() + r * d;
+              for (int64_t c = 0; c < d; ++c) {
+                o_row[c] *= alpha;
+              }
+              if (dropout.p > 0) {
+                const AccT* z_row = z.data() + r * bc;
+                for (int64_t j = 0; j < bc; ++j) {
+                  row[j] *= z_row[j];
+                }
+              }
+            }
+            detail::BlockGemm<AccT>(
+                br, d, bc, 1, s.data(), bc, 1, vb.data, vb.ld, 1, 1, o.data());
+          }
+
+          float* lse_rows = lse + (b * a.heads + h) * a.seq_q + q0;
+          for (int64_t r = 0; r < br; ++r) {
+            T* dst = out + ((b * a.seq_q + q0 + r) * a.heads + h) * d;
+            const AccT inv = l[r] > 0 ? AccT(1) / l[r] : AccT(0);
+            for (int64_t c = 0; c < d; ++c) {
+              dst[c] = Convert<T>(o[r * d + c] * inv);
+            }
+            lse_rows[r] = l[r] > 0 ? static_cast<float>(m[r] + std::log(l[r]))
+                                   : -std::numeric_limits<float>::infinity();
+          }
+
+          if (probs) {
+            T* p_rows = probs + ((b * a.heads + h) * a.seq_q + q0) * a.seq_k;
+            for (int64_t k0 = 0; k0 < a.seq_k; k0 += kAttnBlockK) {
+              const int64_t bc = std::min(kAttnBlockK, a.seq_k - k0);
+              auto kb = detail::LoadRows(
+                  k_head + k0 * kv_stride, kv_stride, bc, d, k_buf.data());
+              detail::ScoreBlock(
+                  a, mask, b, h, q0, br, k0, bc, qb, kb, s.data());
+              detail::ProbBlock(br, bc, lse_rows, s.data());
+              for (int64_t r = 0; r < br; ++r) {
+                for (int64_t j = 0; j < bc; ++j) {
+                  p_rows[r * a.seq_k + k0 + j] = Convert<T>(s[r * bc + j]);
+                }
+              }
+            }
+          }
+        }
+      });
+}
+
+// The gradients of FlashAttentionForward() from dout, its out and its lse.
+// Probabilities are recomputed block by block from lse. A task owns one kv
+// head of one batch: it walks the blocks of every query head that reads the
+// kv head, accumulating dq per block of queries and dk, dv over the whole
+// kv sequence, so no two tasks write the same rows and the result does not
+// depend on the number of threads.
+template <typename T>
+void FlashAttentionBackward(const AttentionShape& a,
+                            const T* q,
+                            const T* k,
+                            const T* v,
+                            const T* out,
+                            const T* dout,
+                            const float* lse,
+                            const AttentionMask<T>& mask,
+                            const AttentionDropout& dropout,
+                            T* dq,
+                            T* dk,
+                            T* dv) {
+  using AccT = AccType<T>;
+  const int64_t d = a.head_dim;
+  const int64_t group = a.heads / a.kv_heads;
+  const int64_t q_stride = a.heads * d;
+  const int64_t kv_stride = a.kv_heads * d;
+  ParallelFor(0, a.batch * a.kv_heads, 1, [&](int64_t begin, int64_t end) {
+    std::vector<AccT> q_buf(kAttnBlockQ * d), do_buf(kAttnBlockQ * d),
+        k_buf(kAttnBlockK * d), v_buf(kAttnBlockK * d), dqs(kAttnBlockQ * d),
+        dks(a.seq_k * d), dvs(a.seq_k * d), p(kAttnBlockQ * kAttnBlockK),
+        dp(kAttnBlockQ * kAttnBlockK), z(kAttnBlockQ * kAttnBlockK),
+        delta(kAttnBlockQ);
+    for (int64_t task = begin; task < end; ++task) {
+      const int64_t b = task / a.kv_heads;
+      const int64_t kvh = task % a.kv_heads;
+      const int64_t kv_offset = (b * a.seq_k * a.kv_heads + kvh) * d;
+      std::fill(dks.begin(), dks.end(), AccT(0));
+      std::fill(dvs.begin(), dvs.end(), AccT(0));
+      for (int64_t h = kvh * group; h < (kvh + 1) * group; ++h) {
+        for (int64_t q0 = 0; q0 < a.seq_q; q0 += kAttnBlockQ) {
+          const int64_t br = std::min(kAttnBlockQ, a.seq_q - q0);
+          const int64_t q_offset = ((b * a.seq_q + q0) * a.heads + h) * d;
+          const float* lse_rows = lse + (b * a.heads + h) * a.seq_q + q0;
+          auto qb =
+              detail::LoadRows(q + q_offset, q_stride, br, d, q_buf.data());
+          auto dob =
+              detail::LoadRows(dout + q_offset, q_stride, br, d, do_buf.data());
+          // delta_i = dout_i . out_i, the row term of the softmax gradient.
+          for (int64_t r = 0; r < br; ++r) {
+            const T* o_row = out + q_offset + r * q_stride;
+            const AccT* do_row = dob.data + r * dob.ld;
+            AccT sum = 0;
+            for (int64_t c = 0; c < d; ++c) {
+              sum += do_row[c] * Convert<AccT>(o_row[c]);
+            }
+            delta[r] = sum;
+          }
+          std::fill(dqs.begin(), dqs.end(), AccT(0));
+
+          const int64_t k_end = detail::KeyEnd(a, q0 + br - 1);
+          for (int64_t k0 = 0; k0 < k_end; k0 += kAttnBlockK) {
+            const int64_t bc = std::min(kAttnBlockK, k_end - k0);
+            auto kb = detail::LoadRows(
+                k + kv_offset + k0 * kv_stride, kv_stride, bc, d, k_buf.data());
+            auto vb = detail::LoadRows(
+                v + kv_offset + k0 * kv_stride, kv_stride, bc, d, v_buf.data());
+            detail::ScoreBlock(a, mask, b, h, q0, br, k0, bc, qb, kb, p.data());
+            detail::ProbBlock(br, bc, lse_rows, p.data());
+            // dp = dout v^T, then ds = p * (dp * z - delta) in place, with z
+            // the dropout factors. p becomes p * z for dv.
+            detail::BlockGemm<AccT>(br,
+                                    bc,
+                                    d,
+                                    1,
+                                    dob.data,
+                                    dob.ld,
+                                    1,
+                                    vb.data,
+                                    1,
+                                    vb.ld,
+                                    0,
+                                    dp.data());
+            if (dropout.p > 0) {
+              detail::DropoutBlock(a, dropout, b, h, q0, br, k0, bc, z.data());
+              for (int64_t i = 0; i < br * bc; ++i) {
+                dp[i] *= z[i];
+              }
+            }
+            for (int64_t r = 0; r < br; ++r) {
+              for (int64_t j = 0; j < bc; ++j) {
+                dp[r * bc + j] = p[r * bc + j] * (dp[r * bc + j] - delta[r]);
+              }
+            }
+            if (dropout.p > 0) {
+              for (int64_t i = 0; i < br * bc; ++i) {
+                p[i] *= z[i];
+              }
+            }
+            detail::BlockGemm<AccT>(bc,
+                                    d,
+                                    br,
+                                    1,
+                                    p.data(),
+                                    1,
+                                    bc,
+                                    dob.data,
+                                    dob.ld,
+                                    1,
+                                    1,
+                                    dvs.data() + k0 * d);
+            detail::BlockGemm<AccT>(bc,
+                                    d,
+                                    br,
+                                    a.scale,
+                                    dp.data(),
+                                    1,
+                                    bc,
+                                    qb.data,
+                                    qb.ld,
+                                    1,
+                                    1,
+                                    dks.data() + k0 * d);
+            detail::BlockGemm<AccT>(br,
+                                    d,
+                                    bc,
+                                    a.scale,
+                                    dp.data(),
+                                    bc,
+                                    1,
+                                    kb.data,
+                                    kb.ld,
+                                    1,
+                                    1,
+                                    dqs.data());
+          }
+          for (int64_t r = 0; r < br; ++r) {
+            for (int64_t c = 0; c < d; ++c) {
+              dq[q_offset + r * q_stride + c] = Convert<T>(dqs[r * d + c]);
+            }
+          }
+        }
+      }
+      for (int64_t j = 0; j < a.seq_k; ++j) {
+        for (int64_t c = 0; c < d; ++c) {
+          dk[kv_offset + j * kv_stride + c] = Convert<T>(dks[j * d + c]);
+          dv[kv_offset + j * kv_stride + c] = Convert<T>(dvs[j * d + c]);
+        }
+      }
+    }
+  });
+}
+
+}  // namespace custom_kernel
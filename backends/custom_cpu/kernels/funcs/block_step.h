@@ -0,0 +1,250 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstdint>
+
+namespace custom_kernel {
+
+// The scheduling state of a batch of sequences whose KV cache lives in a
+// pool of fixed-size blocks, as step_paddle keeps it between decode steps.
+// Arrays are per sequence, [bsz], unless noted; the `*_len` counters are
+// single ints.
+//
+// A sequence's row of `block_tables` lists its encoder blocks first, then
+// its decoder blocks. Encoder blocks come from a pool the host manages: it
+// fills them in and sets `encoder_block_lens` when it inserts a sequence,
+// and frees them when the sequence ends. Decoder blocks come from
+// `free_list`, a stack of block ids, and are owned by the step: it hands
+// one out whenever a sequence crosses into an unallocated block and takes
+// all of them back when the sequence stops or is preempted. The host reuses
+// the slot of a stopped sequence only after a step has run on it.
+struct BlockStepState {
+  int bsz;
+  int block_num_per_seq;
+  int block_size;
+  // Decoder blocks a sequence may hold. A preempted sequence is recovered
+  // with one block more than it had, up to this bound.
+  int max_decoder_block_num;
+
+  bool* stop_flags;
+  int* seq_lens_this_time;
+  const int* ori_seq_lens_encoder;
+  int* seq_lens_encoder;
+  int* seq_lens_decoder;
+  int* block_tables;  // [bsz, block_num_per_seq], -1 where unallocated
+  int* encoder_block_lens;
+  bool* is_block_step;
+  // Preempted sequences waiting for blocks, a stack of `step_lens` entries.
+  int* step_block_list;
+  int* step_lens;
+  // Sequences recovered by the current step, cleared before it returns.
+  int* recover_block_list;
+  int* recover_lens;
+  // Sequences that need a block this step, `need_block_len` entries.
+  int* need_block_list;
+  int* need_block_len;
+  // Decoder blocks held by each sequence, kept across a preemption.
+  int* used_list_len;
+  int* free_list;
+  int* free_list_len;
+
+  // Token ids a recovered sequence is prefilled with again.
+  int64_t* input_ids;  // [bsz, input_ids_stride]
+  int64_t input_ids_stride;
+  const int64_t* pre_ids;  // [bsz, pre_ids_stride], pre_ids[0] unused
+  int64_t pre_ids_stride;
+  const int64_t* step_idx;
+  const int64_t* next_tokens;
+  int64_t first_token_id;
+};
+
+// What a step did, for callers that track the scheduler.
+struct BlockStepStats {
+  int freed = 0;
+  int allocated = 0;
+  int preempted = 0;
+  int recovered = 0;
+};
+
+namespace detail {
+
+inline int* BlockRow(const BlockStepState& s, int i) {
+  return s.block_tables + static_cast<int64_t>(i) * s.block_num_per_seq;
+}
+
+// Pushes the decoder blocks of sequence i back onto the free list.
+inline int ReleaseDecoderBlocks(const BlockStepState& s, int i) {
+  int* row = BlockRow(s, i);
+  const int first = s.encoder_block_lens[i];
+  const int used = s.used_list_len[i];
+  for (int j = 0; j < used; ++j) {
+    s.free_list[(*s.free_list_len)++] = row[first + j];
+    row[first + j] = -1;
+  }
+  return used;
+}
+
+inline bool NeedsBlock(const BlockStepState& s, int i) {
+  for (int j = 0; j < *s.need_block_len; ++j) {
+    if (s.need_block_list[j] == i) {
+      return true;
+    }
+  }
+  return false;
+}
+
+// The running sequence to preempt: the one holding the most decoder blocks,
+// the lowest index on ties. A sequence in its last block is about to finish
+// and is only taken when nothing else helps, and one holding no block only
+// helps by dropping its own request. Returns -1 when no sequence helps.
+inline int PreemptCandidate(const BlockStepState& s) {
+  int best = -1;
+  int best_key = -1;
+  for (int i = 0; i < s.bsz; ++i) {
+    if (s.stop_flags[i] || s.is_block_step[i] ||
+        (s.used_list_len[i] == 0 && !NeedsBlock(s, i))) {
+      continue;
+    }
+    const int used = s.used_list_len[i];
+    const int key =
+        used < s.max_decoder_block_num ? s.max_decoder_block_num + used : used;
+    if (key > best_key) {
+      best = i;
+      best_key = key;
+    }
+  }
+  return best;
+}
+
+inline void RemoveNeed(const BlockStepState& s, int i) {
+  for (int j = 0; j < *s.need_block_len; ++j) {
+    if (s.need_block_list[j] == i) {
+      s.need_block_list[j] = s.need_block_list[--*s.need_block_len];
+      s.need_block_list[*s.need_block_len] = -1;
+      return;
+    }
+  }
+}
+
+// Puts preempted sequence i back in the batch: it is prefilled again with
+// its prompt and the tokens it generated, into `used_list_len` fresh
+// decoder blocks.
+inline void RecoverSequence(const BlockStepState& s, int i) {
+  const int ori_len = s.ori_seq_lens_encoder[i];
+  const int64_t steps = s.step_idx[i];
+  const int seq_len = ori_len + static_cast<int>(steps);
+  s.seq_lens_this_time[i] = seq_len;
+  s.seq_lens_encoder[i] = seq_len;
+  s.stop_flags[i] = false;
+
+  int64_t* ids = s.input_ids + i * s.input_ids_stride;
+  const int64_t* pre = s.pre_ids + i * s.pre_ids_stride;
+  ids[0] = s.first_token_id;
+  for (int64_t j = 0; j + 1 < steps; ++j) {
+    ids[ori_len + j] = pre[j + 1];
+  }
+  ids[ori_len + steps - 1] = s.next_tokens[i];
+
+  int* row = BlockRow(s, i);
+  const int first = s.encoder_block_lens[i];
+  for (int j = 0; j < s.used_list_len[i]; ++j) {
+    row[first + j] = s.free_list[--*s.free_list_len];
+  }
+}
+
+}  // namespace detail
+
+// One scheduling step, run between two decode steps of the model:
+//  1. sequences that stopped give their decoder blocks back, and running
+//     sequences whose next token falls in an unallocated block are listed
+//     as needing one;
+//  2. while more blocks are needed than are free, the longest running
+//     sequence is preempted: its decoder blocks are freed and it waits on
+//     the step list, stopped, with its block count kept;
+//  3. every sequence still needing a block pops one off the free list;
+//  4. preempted sequences are recovered, last preempted first, while the
+//     free list holds the blocks they had plus one for the next token.
+// The batch is small and every phase depends on the one before, so the
+// step runs on the calling thread.
+inline BlockStepStats BlockStep(const BlockStepState& s) {
+  BlockStepStats stats;
+  for (int i = 0; i < s.bsz; ++i) {
+    int* row = detail::BlockRow(s, i);
+    if (s.stop_flags[i] && !s.is_block_step[i]) {
+      if (s.used_list_len[i] > 0) {
+        stats.freed += detail::ReleaseDecoderBlocks(s, i);
+        s.used_list_len[i] = 0;
+        s.encoder_block_lens[i] = 0;
+      }
+    } else if (!s.stop_flags[i] && s.seq_lens_this_time[i] > 0) {
+      const int next_block = s.seq_lens_decoder[i] / s.block_size;
+      // A sequence at the end of its table gets nothing; the host stops
+      // sequences at their maximum length before that.
+      if (next_block < s.block_num_per_seq && row[next_block] == -1) {
+        s.need_block_list[(*s.need_block_len)++] = i;
+      }
+    }
+  }
+
+  while (*s.need_block_len > *s.free_list_len) {
+    const int i = detail::PreemptCandidate(s);
+    if (i < 0) {
+      break;
+    }
+    stats.freed += detail::ReleaseDecoderBlocks(s, i);
+    s.step_block_list[(*s.step_lens)++] = i;
+    s.stop_flags[i] = true;
+    s.is_block_step[i] = true;
+    s.seq_lens_this_time[i] = 0;
+    s.seq_lens_decoder[i] = 0;
+    detail::RemoveNeed(s, i);
+    ++stats.preempted;
+  }
+
+  for (int j = 0; j < *s.need_block_len; ++j) {
+    const int i = s.need_block_list[j];
+    s.need_block_list[j] = -1;
+    int* row = detail::BlockRow(s, i);
+    row[s.seq_lens_decoder[i] / s.block_size] = s.free_list[--*s.free_list_len];
+    ++s.used_list_len[i];
+    ++stats.allocated;
+  }
+  *s.need_block_len = 0;
+
+  int free_len = *s.free_list_len;
+  while (*s.step_lens > 0) {
+    const int i = s.step_block_list[*s.step_lens - 1];
+    const int used = s.used_list_len[i];
+    const int want = used < s.max_decoder_block_num ? used + 1 : used;
+    if (want > free_len) {
+      break;
+    }
+    free_len -= want;
+    s.step_block_list[--*s.step_lens] = -1;
+    s.recover_block_list[(*s.recover_lens)++] = i;
+    s.is_block_step[i] = false;
+    s.used_list_len[i] = want;
+  }
+  for (int j = 0; j < *s.recover_lens; ++j) {
+    detail::RecoverSequence(s, s.recover_block_list[j]);
+    s.recover_block_list[j] = -1;
+    ++stats.recovered;
+  }
+  *s.recover_lens = 0;
+  return stats;
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,319 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <array>
+#include <cstdint>
+#include <cstdlib>
+#include <tuple>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of output elements handed to one thread.
+constexpr int64_t kBroadcastGrainSize = 32768;
+
+// Walks an elementwise operation over a broadcast output shape without
+// materializing the broadcast inputs. Every input is addressed through its own
+// strides, which are 0 on the dims it is broadcast along. Size-1 dims are
+// dropped and adjacent dims that are contiguous for every operand are merged,
+// so the loop nest becomes `outer_size()` rows of `inner_size()` elements.
+// After merging, each input's stride along the innermost dim is 0 or 1.
+template <int kArity>
+class BroadcastIndexer {
+ public:
+  // `axis` follows the elementwise-op convention: an input of lower rank is
+  // aligned to output dim `axis`, or to the trailing dims when axis == -1.
+  BroadcastIndexer(const std::vector<int64_t>& out_dims,
+                   const std::array<std::vector<int64_t>, kArity>& in_dims,
+                   int axis) {
+    const int out_rank = static_cast<int>(out_dims.size());
+    numel_ = 1;
+    for (auto d : out_dims) {
+      numel_ *= d;
+    }
+
+    // Per-input strides over the full output rank.
+    std::array<std::vector<int64_t>, kArity> full_strides;
+    for (int k = 0; k < kArity; ++k) {
+      const auto& dims = in_dims[k];
+      const int in_rank = static_cast<int>(dims.size());
+      int offset = (axis == -1 || in_rank == out_rank)
+                       ? out_rank - in_rank
+                       : std::min(axis, out_rank - in_rank);
+      full_strides[k].assign(out_rank, 0);
+      int64_t stride = 1;
+      for (int i = in_rank - 1; i >= 0; --i) {
+        if (dims[i] != 1) {
+          full_strides[k][i + offset] = stride;
+        }
+        stride *= dims[i];
+      }
+    }
+
+    // Drop size-1 dims, then merge dims that are contiguous for everyone.
+    for (int i = 0; i < out_rank; ++i) {
+      if (out_dims[i] == 1) {
+        continue;
+      }
+      bool mergeable = !shape_.empty();
+      for (int k = 0; k < kArity && mergeable; ++k) {
+        mergeable = strides_[k].back() == full_strides[k][i] * out_dims[i];
+      }
+      if (mergeable) {
+        shape_.back() *= out_dims[i];
+        for (int k = 0; k < kArity; ++k) {
+          strides_[k].back() = full_strides[k][i];
+        }
+      } else {
+        shape_.push_back(out_dims[i]);
+        for (int k = 0; k < kArity; ++k) {
+          strides_[k].push_back(full_strides[k][i]);
+        }
+      }
+    }
+    if (shape_.empty()) {
+      shape_.push_back(1);
+      for (int k = 0; k < kArity; ++k) {
+        strides_[k].push_back(0);
+      }
+    }
+    for (int k = 0; k < kArity; ++k) {
+      inner_strides_[k] = strides_[k].back();
+    }
+  }
+
+  int64_t numel() const { return numel_; }
+  int rank() const { return static_cast<int>(shape_.size()); }
+  int64_t inner_size() const { return shape_.back(); }
+  int64_t outer_size() const { return numel_ / shape_.back(); }
+  const std::vector<int64_t>& shape() const { return shape_; }
+  const std::vector<int64_t>& strides(int k) const { return strides_[k]; }
+  const std::array<int64_t, kArity>& inner_strides() const {
+    return inner_strides_;
+  }
+
+  // Element offsets of every input at the start of outer row `row`.
+  std::array<int64_t, kArity> RowOffsets(int64_t row) const {
+    std::array<int64_t, kArity> offsets;
+    offsets.fill(0);
+    for (int i = rank() - 2; i >= 0; --i) {
+      int64_t idx = row % shape_[i];
+      row /= shape_[i];
+      for (int k = 0; k < kArity; ++k) {
+        offsets[k] += idx * strides_[k][i];
+      }
+    }
+    return offsets;
+  }
+
+ private:
+  int64_t numel_;
+  std::vector<int64_t> shape_;
+  std::array<std::vector<int64_t>, kArity> strides_;
+  std::array<int64_t, kArity> inner_strides_;
+};
+
+namespace detail {
+
+template <typename OutT, typename Functor, typename... InTs, size_t... I>
+inline void BroadcastRow(int64_t n,
+                         OutT* out,
+                         const std::array<int64_t, sizeof...(InTs)>& strides,
+                         Functor func,
+                         std::index_sequence<I...>,
+                         const InTs*... ins) {
+  bool contiguous = true;
+  for (auto s : strides) {
+    contiguous = contiguous && s == 1;
+  }
+  if (contiguous) {
+    for (int64_t j = 0; j < n; ++j) {
+      out[j] = func(ins[j]...);
+    }
+  } else {
+    for (int64_t j = 0; j < n; ++j) {
+      out[j] = func(ins[j * strides[I]]...);
+    }
+  }
+}
+
+// Binary rows where one side is a scalar are the common bias/scale case; keep
+// the scalar in a register instead of re-reading it through a zero stride.
+template <typename OutT, typename Functor, typename XT, typename YT>
+inline void BroadcastRow(int64_t n,
+                         OutT* out,
+                         const std::array<int64_t, 2>& strides,
+                         Functor func,
+                         std::index_sequence<0, 1>,
+                         const XT* x,
+                         const YT* y) {
+  if (strides[0] == 1 && strides[1] == 1) {
+    for (int64_t j = 0; j < n; ++j) {
+      out[j] = func(x[j], y[j]);
+    }
+  } else if (strides[0] == 1) {
+    const YT y_val = *y;
+    for (int64_t j = 0; j < n; ++j) {
+      out[j] = func(x[j], y_val);
+    }
+  } else if (strides[1] == 1) {
+    const XT x_val = *x;
+    for (int64_t j = 0; j < n; ++j) {
+      out[j] = func(x_val, y[j]);
+    }
+  } else {
+    const auto val = func(*x, *y);
+    for (int64_t j = 0; j < n; ++j) {
+      out[j] = val;
+    }
+  }
+}
+
+template <typename... Ts>
+struct AnyHalf : std::false_type {};
+
+template <typename T, typename... Ts>
+struct AnyHalf<T, Ts...>
+    : std::integral_constant<bool,
+                             HalfTraits<T>::kIsHalf || AnyHalf<Ts...>::value> {
+};
+
+// Converts n elements read with stride 0 or 1 to the compute type.
+template <typename T, typename AccT>
+inline void LoadBlock(const T* src, int64_t stride, AccT* dst, int64_t n) {
+  if (stride == 0) {
+    std::fill(dst, dst + n, Convert<AccT>(*src));
+  } else {
+    ConvertBlock(src, dst, n);
+  }
+}
+
+// Rows with a 16-bit operand are computed kHalfBlockSize elements at a time:
+// every input block is converted to its compute type, func runs on those
+// and the results are rounded to OutT in one pass.
+template <typename OutT, typename Functor, typename... InTs, size_t... I>
+inline void BroadcastRowStaged(
+    int64_t n,
+    OutT* out,
+    const std::array<int64_t, sizeof...(InTs)>& strides,
+    Functor func,
+    std::index_sequence<I...>,
+    const InTs*... ins) {
+  std::tuple<std::array<AccType<InTs>, kHalfBlockSize>...> in_blocks;
+  std::array<AccType<OutT>, kHalfBlockSize> out_block;
+  for (int64_t j0 = 0; j0 < n; j0 += kHalfBlockSize) {
+    const int64_t len = std::min(kHalfBlockSize, n - j0);
+    int expand[] = {(LoadBlock(ins + j0 * strides[I],
+                               strides[I],
+                               std::get<I>(in_blocks).data(),
+                               len),
+                     0)...};
+    (void)expand;
+    for (int64_t j = 0; j < len; ++j) {
+      out_block[j] =
+          static_cast<AccType<OutT>>(func(std::get<I>(in_blocks)[j]...));
+    }
+    ConvertBlock(out_block.data(), out + j0, len);
+  }
+}
+
+template <typename OutT, typename Functor, typename... InTs, size_t... I>
+inline void ComputeRow(std::false_type,
+                       int64_t n,
+                       OutT* out,
+                       const std::array<int64_t, sizeof...(InTs)>& strides,
+                       Functor func,
+                       std::index_sequence<I...> seq,
+                       const InTs*... ins) {
+  BroadcastRow(n, out, strides, func, seq, ins...);
+}
+
+template <typename OutT, typename Functor, typename... InTs, size_t... I>
+inline void ComputeRow(std::true_type,
+                       int64_t n,
+                       OutT* out,
+                       const std::array<int64_t, sizeof...(InTs)>& strides,
+                       Functor func,
+                       std::index_sequence<I...> seq,
+                       const InTs*... ins) {
+  BroadcastRowStaged(n, out, strides, func, seq, ins...);
+}
+
+template <typename OutT, typename Functor, typename... InTs, size_t... I>
+void BroadcastLaunch(const BroadcastIndexer<sizeof...(InTs)>& indexer,
+                     OutT* out,
+                     Functor func,
+                     std::index_sequence<I...> seq,
+                     const InTs*... ins) {
+  const int64_t inner = indexer.inner_size();
+  const int64_t outer = indexer.outer_size();
+  const auto& inner_strides = indexer.inner_strides();
+  const AnyHalf<OutT, InTs...> staged{};
+
+  if (outer == 1) {
+    // Everything collapsed into one run: split the run itself.
+    ParallelFor(0, inner, kBroadcastGrainSize, [&](int64_t begin, int64_t end) {
+      ComputeRow(staged,
+                 end - begin,
+                 out + begin,
+                 inner_strides,
+                 func,
+                 seq,
+                 (ins + begin * inner_strides[I])...);
+    });
+    return;
+  }
+
+  const int64_t grain =
+      std::max<int64_t>(1, kBroadcastGrainSize / std::max<int64_t>(inner, 1));
+  ParallelFor(0, outer, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t row = begin; row < end; ++row) {
+      auto offsets = indexer.RowOffsets(row);
+      ComputeRow(staged,
+                 inner,
+                 out + row * inner,
+                 inner_strides,
+                 func,
+                 seq,
+                 (ins + offsets[I])...);
+    }
+  });
+}
+
+}  // namespace detail
+
+// out[i] = func(ins[i]...) over the broadcast output described by `indexer`.
+// `out` is dense in the output shape. When any operand has a 16-bit type,
+// func is called with AccType values and its result is rounded to OutT.
+template <typename OutT, typename Functor, typename... InTs>
+void BroadcastCompute(const BroadcastIndexer<sizeof...(InTs)>& indexer,
+                      OutT* out,
+                      Functor func,
+                      const InTs*... ins) {
+  if (indexer.numel() <= 0) {
+    return;
+  }
+  detail::BroadcastLaunch(
+      indexer, out, func, std::index_sequence_for<InTs...>(), ins...);
+}
+
+}  // namespace custom_kernel
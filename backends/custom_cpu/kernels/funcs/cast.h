@@ -0,0 +1,100 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread.
+constexpr int64_t kCastGrainSize = 32768;
+
+namespace detail {
+
+// How a (From, To) pair is cast.
+enum class CastPath {
+  // Same type: a memcpy.
+  kCopy,
+  // One conversion per element. float <-> 16-bit pairs take the vectorized
+  // block converters of half.h, the others a plain static_cast, so integers
+  // and doubles keep their precision.
+  kDirect,
+  // A 16-bit type on one side and neither side float, e.g. float16 <->
+  // bfloat16 or int64 -> float16. Blocks are staged through a float buffer
+  // so that both halves run on the block converters.
+  kStaged,
+};
+
+template <typename To, typename From>
+using CastPathOf = std::integral_constant<
+    CastPath,
+    std::is_same<To, From>::value ? CastPath::kCopy
+    : (HalfTraits<To>::kIsHalf || HalfTraits<From>::kIsHalf) &&
+            !std::is_same<To, float>::value && !std::is_same<From, float>::value
+        ? CastPath::kStaged
+        : CastPath::kDirect>;
+
+template <typename To, typename From>
+void CastRange(const From* src,
+               To* dst,
+               int64_t n,
+               std::integral_constant<CastPath, CastPath::kCopy>) {
+  std::memcpy(dst, src, n * sizeof(To));
+}
+
+template <typename To, typename From>
+void CastRange(const From* src,
+               To* dst,
+               int64_t n,
+               std::integral_constant<CastPath, CastPath::kDirect>) {
+  ConvertBlock(src, dst, n);
+}
+
+template <typename To, typename From>
+void CastRange(const From* src,
+               To* dst,
+               int64_t n,
+               std::integral_constant<CastPath, CastPath::kStaged>) {
+  float staged[kHalfBlockSize];
+  for (int64_t i = 0; i < n; i += kHalfBlockSize) {
+    const int64_t len = std::min(kHalfBlockSize, n - i);
+    ConvertBlock(src + i, staged, len);
+    ConvertBlock(staged, dst + i, len);
+  }
+}
+
+}  // namespace detail
+
+// out[i] = x[i] converted to To, for i < numel. Each type pair gets its own
+// loop (see detail::CastPath) and large tensors are split across the thread
+// pool.
+template <typename From, typename To>
+void CastCompute(const From* x, To* out, int64_t numel) {
+  if (numel <= 0) {
+    return;
+  }
+  ParallelFor(0, numel, kCastGrainSize, [&](int64_t begin, int64_t end) {
+    detail::CastRange(
+        x + begin, out + begin, end - begin, detail::CastPathOf<To, From>());
+  });
+}
+
+}  // namespace custom_kernel
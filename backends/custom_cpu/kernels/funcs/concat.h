@@ -0,0 +1,120 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread.
+constexpr int64_t kConcatGrainSize = 32768;
+
+// Elements of `dims` before `axis`: the rows of a concat along it.
+inline int64_t ConcatRows(const std::vector<int64_t>& dims, int64_t axis) {
+  int64_t rows = 1;
+  for (int64_t i = 0; i < axis; ++i) {
+    rows *= dims[i];
+  }
+  return rows;
+}
+
+// Elements of `dims` from `axis` on: the width of a row of a concat.
+inline int64_t ConcatWidth(const std::vector<int64_t>& dims, int64_t axis) {
+  int64_t width = 1;
+  for (size_t i = axis; i < dims.size(); ++i) {
+    width *= dims[i];
+  }
+  return width;
+}
+
+namespace detail {
+
+// Moves data between `rows` rows of a whole tensor and its parts: row i of
+// the whole is row i of every part, part j being `widths[j]` elements wide,
+// laid end to end. The whole is cut into equal chunks of elements whatever
+// the row count, so a concat along axis 0 (a single row) is still one
+// memcpy per part split across threads, and many narrow rows are batched
+// into one task. A null part is skipped.
+template <typename T, bool kGather>
+void ConcatParts(int64_t rows,
+                 const std::vector<int64_t>& widths,
+                 const std::vector<T*>& parts,
+                 T* whole) {
+  std::vector<int64_t> offsets(widths.size() + 1, 0);
+  for (size_t j = 0; j < widths.size(); ++j) {
+    offsets[j + 1] = offsets[j] + widths[j];
+  }
+  const int64_t row_size = offsets.back();
+  if (rows == 0 || row_size == 0) {
+    return;
+  }
+  ParallelFor(
+      0, rows * row_size, kConcatGrainSize, [&](int64_t begin, int64_t end) {
+        for (int64_t row = begin / row_size; row * row_size < end; ++row) {
+          const int64_t base = row * row_size;
+          const int64_t first = std::max(begin, base) - base;
+          const int64_t last = std::min(end, base + row_size) - base;
+          size_t j = first == 0 ? 0
+                                : std::upper_bound(
+                                      offsets.begin(), offsets.end(), first) -
+                                      offsets.begin() - 1;
+          for (int64_t col = first; col < last; ++j) {
+            const int64_t n = std::min(last, offsets[j + 1]) - col;
+            if (parts[j] && n > 0) {
+              T* part = parts[j] + row * widths[j] + col - offsets[j];
+              if (kGather) {
+                std::memcpy(whole + base + col, part, n * sizeof(T));
+              } else {
+                std::memcpy(part, whole + base + col, n * sizeof(T));
+              }
+            }
+            col += n;
+          }
+        }
+      });
+}
+
+}  // namespace detail
+
+// out [rows, sum(widths)] = the rows of inputs [rows, widths[j]] laid end
+// to end.
+template <typename T>
+void ConcatCompute(int64_t rows,
+                   const std::vector<int64_t>& widths,
+                   const std::vector<const T*>& inputs,
+                   T* out) {
+  std::vector<T*> parts(inputs.size());
+  for (size_t j = 0; j < inputs.size(); ++j) {
+    parts[j] = const_cast<T*>(inputs[j]);
+  }
+  detail::ConcatParts<T, true>(rows, widths, parts, out);
+}
+
+// The inverse of ConcatCompute(): outs [rows, widths[j]] receive their
+// columns of x. A null output is skipped.
+template <typename T>
+void SplitCompute(int64_t rows,
+                  const std::vector<int64_t>& widths,
+                  const T* x,
+                  const std::vector<T*>& outs) {
+  detail::ConcatParts<T, false>(rows, widths, outs, const_cast<T*>(x));
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,1219 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/gemm.h"
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of output elements handed to one thread by the direct
+// loops.
+constexpr int64_t kConvGrainSize = 16384;
+// Winograd F(2x2, 3x3) pays for its transforms once both channel counts
+// reach this; thinner layers go through im2col + GEMM.
+constexpr int64_t kWinogradMinChannels = 16;
+// Winograd also needs this many 2x2 output tiles per image. Below it the
+// per-image GEMMs are too narrow to amortize the filter transform.
+constexpr int64_t kWinogradMinTiles = 64;
+
+// A 2-D convolution. Images are [batch, channels, height, width] (NCHW) or
+// [batch, height, width, channels] (NHWC); filters are always
+// [out_channels, in_channels / groups, kernel_h, kernel_w]. pad_h and pad_w
+// are the top and left padding, the bottom and right padding follow from
+// the output size.
+struct ConvShape {
+  int64_t batch;
+  int64_t in_channels;
+  int64_t in_h;
+  int64_t in_w;
+  int64_t out_channels;
+  int64_t out_h;
+  int64_t out_w;
+  int64_t kernel_h;
+  int64_t kernel_w;
+  int64_t stride_h;
+  int64_t stride_w;
+  int64_t pad_h;
+  int64_t pad_w;
+  int64_t dilation_h;
+  int64_t dilation_w;
+  int64_t groups;
+  bool channels_last;
+
+  int64_t InGroupChannels() const { return in_channels / groups; }
+  int64_t OutGroupChannels() const { return out_channels / groups; }
+  // Rows of the im2col matrix of one group: the GEMM's reduction size.
+  int64_t PatchSize() const { return InGroupChannels() * kernel_h * kernel_w; }
+  int64_t InPlane() const { return in_h * in_w; }
+  int64_t OutPlane() const { return out_h * out_w; }
+};
+
+// The convolution of 4-D images of `in_dims` into `out_dims` through
+// filters of `filter_dims`. `paddings` holds the top, bottom, left and
+// right padding.
+inline ConvShape MakeConvShape(const std::vector<int64_t>& in_dims,
+                               const std::vector<int64_t>& filter_dims,
+                               const std::vector<int64_t>& out_dims,
+                               const std::vector<int>& strides,
+                               const std::vector<int>& paddings,
+                               const std::vector<int>& dilations,
+                               int groups,
+                               bool channels_last) {
+  const int c = channels_last ? 3 : 1;
+  const int h = channels_last ? 1 : 2;
+  ConvShape s;
+  s.batch = in_dims[0];
+  s.in_channels = in_dims[c];
+  s.in_h = in_dims[h];
+  s.in_w = in_dims[h + 1];
+  s.out_channels = out_dims[c];
+  s.out_h = out_dims[h];
+  s.out_w = out_dims[h + 1];
+  s.kernel_h = filter_dims[2];
+  s.kernel_w = filter_dims[3];
+  s.stride_h = strides[0];
+  s.stride_w = strides[1];
+  s.pad_h = paddings[0];
+  s.pad_w = paddings[2];
+  s.dilation_h = dilations[0];
+  s.dilation_w = dilations[1];
+  s.groups = groups;
+  s.channels_last = channels_last;
+  return s;
+}
+
+namespace detail {
+
+inline bool IsPointwise(const ConvShape& s) {
+  return s.kernel_h == 1 && s.kernel_w == 1 && s.stride_h == 1 &&
+         s.stride_w == 1 && s.pad_h == 0 && s.pad_w == 0 && s.in_h == s.out_h &&
+         s.in_w == s.out_w;
+}
+
+// One filter per input channel, possibly several output channels each.
+inline bool IsDepthwise(const ConvShape& s) {
+  return s.groups > 1 && s.groups == s.in_channels &&
+         s.out_channels % s.in_channels == 0;
+}
+
+inline bool UseWinograd(const ConvShape& s) {
+  return s.groups == 1 && s.kernel_h == 3 && s.kernel_w == 3 &&
+         s.stride_h == 1 && s.stride_w == 1 && s.dilation_h == 1 &&
+         s.dilation_w == 1 && s.in_channels >= kWinogradMinChannels &&
+         s.out_channels >= kWinogradMinChannels &&
+         (s.out_h + 1) / 2 * ((s.out_w + 1) / 2) >= kWinogradMinTiles;
+}
+
+// The output positions [begin, end) of one dim whose input index
+// o * stride - pad + k * dilation falls inside [0, size).
+inline void ValidRange(int64_t size,
+                       int64_t out_size,
+                       int64_t stride,
+                       int64_t offset,
+                       int64_t* begin,
+                       int64_t* end) {
+  // offset = k * dilation - pad; need 0 <= o * stride + offset < size.
+  int64_t lo = offset >= 0 ? 0 : (-offset + stride - 1) / stride;
+  int64_t hi = size - offset <= 0 ? 0 : (size - offset + stride - 1) / stride;
+  *begin = std::min(lo, out_size);
+  *end = std::max(*begin, std::min(hi, out_size));
+}
+
+// The output index o that reads input index i through tap k, i.e.
+// o * stride == i + pad - k * dilation, or -1 when there is none.
+inline int64_t SourceIndex(int64_t i,
+                           int64_t k,
+                           int64_t pad,
+                           int64_t dilation,
+                           int64_t stride,
+                           int64_t out_size) {
+  int64_t t = i + pad - k * dilation;
+  if (t < 0 || t % stride != 0 || t / stride >= out_size) {
+    return -1;
+  }
+  return t / stride;
+}
+
+// Filters of [out_channels, group_channels, kh, kw] as
+// [out_channels, kh, kw, group_channels], the patch order of NHWC im2col.
+template <typename T>
+std::vector<T> FilterToHWC(const ConvShape& s, const T* w) {
+  const int64_t cg = s.InGroupChannels();
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  std::vector<T> out(s.out_channels * cg * taps);
+  for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+    for (int64_t c = 0; c < cg; ++c) {
+      for (int64_t t = 0; t < taps; ++t) {
+        out[(oc * taps + t) * cg + c] = w[(oc * cg + c) * taps + t];
+      }
+    }
+  }
+  return out;
+}
+
+template <typename T>
+void FilterFromHWC(const ConvShape& s, const T* hwc, T* w) {
+  const int64_t cg = s.InGroupChannels();
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+    for (int64_t c = 0; c < cg; ++c) {
+      for (int64_t t = 0; t < taps; ++t) {
+        w[(oc * cg + c) * taps + t] = hwc[(oc * taps + t) * cg + c];
+      }
+    }
+  }
+}
+
+// Unfolds the patches of group g of one image x into col: PatchSize() x
+// OutPlane() with rows ordered (c, kh, kw) for NCHW, OutPlane() x
+// PatchSize() with columns ordered (kh, kw, c) for NHWC. Taps in the
+// padding read 0.
+template <typename T>
+void Im2Col(const ConvShape& s, const T* x, int64_t g, T* col) {
+  const T zero = Convert<T>(AccType<T>(0));
+  const int64_t cg = s.InGroupChannels();
+  const int64_t out_plane = s.OutPlane();
+  if (!s.channels_last) {
+    const int64_t taps = s.kernel_h * s.kernel_w;
+    const T* src = x + g * cg * s.InPlane();
+    ParallelFor(0,
+                s.PatchSize(),
+                std::max<int64_t>(1, kConvGrainSize / out_plane),
+                [&](int64_t b, int64_t e) {
+                  for (int64_t r = b; r < e; ++r) {
+                    const int64_t c = r / taps;
+                    const int64_t kh = (r % taps) / s.kernel_w;
+                    const int64_t kw = r % s.kernel_w;
+                    const T* plane = src + c * s.InPlane();
+                    T* dst = col + r * out_plane;
+                    int64_t ow_begin, ow_end;
+                    ValidRange(s.in_w,
+                               s.out_w,
+                               s.stride_w,
+                               kw * s.dilation_w - s.pad_w,
+                               &ow_begin,
+                               &ow_end);
+                    for (int64_t oh = 0; oh < s.out_h; ++oh) {
+                      T* row = dst + oh * s.out_w;
+                      const int64_t ih =
+                          oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+                      if (ih < 0 || ih >= s.in_h) {
+                        std::fill(row, row + s.out_w, zero);
+                        continue;
+                      }
+                      const T* in_row =
+                          plane + ih * s.in_w + kw * s.dilation_w - s.pad_w;
+                      std::fill(row, row + ow_begin, zero);
+                      for (int64_t ow = ow_begin; ow < ow_end; ++ow) {
+                        row[ow] = in_row[ow * s.stride_w];
+                      }
+                      std::fill(row + ow_end, row + s.out_w, zero);
+                    }
+                  }
+                });
+    return;
+  }
+  const int64_t patch = s.PatchSize();
+  ParallelFor(
+      0,
+      out_plane,
+      std::max<int64_t>(1, kConvGrainSize / patch),
+      [&](int64_t b, int64_t e) {
+        for (int64_t p = b; p < e; ++p) {
+          const int64_t oh = p / s.out_w;
+          const int64_t ow = p % s.out_w;
+          T* dst = col + p * patch;
+          for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+            const int64_t ih = oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+            for (int64_t kw = 0; kw < s.kernel_w; ++kw, dst += cg) {
+              const int64_t iw = ow * s.stride_w - s.pad_w + kw * s.dilation_w;
+              if (ih < 0 || ih >= s.in_h || iw < 0 || iw >= s.in_w) {
+                std::fill(dst, dst + cg, zero);
+              } else {
+                std::memcpy(dst,
+                            x + (ih * s.in_w + iw) * s.in_channels + g * cg,
+                            cg * sizeof(T));
+              }
+            }
+          }
+        }
+      });
+}
+
+// Folds col, laid out as Im2Col() writes it, back into group g of one
+// image dx, summing the taps that read the same input element. Each dx
+// element gathers its own taps, so the loop splits without races.
+template <typename T>
+void Col2Im(const ConvShape& s, const T* col, int64_t g, T* dx) {
+  using AccT = AccType<T>;
+  const int64_t cg = s.InGroupChannels();
+  const int64_t out_plane = s.OutPlane();
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  if (!s.channels_last) {
+    T* dst = dx + g * cg * s.InPlane();
+    ParallelFor(
+        0,
+        cg * s.in_h,
+        std::max<int64_t>(1, kConvGrainSize / (s.in_w * taps)),
+        [&](int64_t b, int64_t e) {
+          for (int64_t row = b; row < e; ++row) {
+            const int64_t c = row / s.in_h;
+            const int64_t ih = row % s.in_h;
+            for (int64_t iw = 0; iw < s.in_w; ++iw) {
+              AccT sum = 0;
+              for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+                int64_t oh = SourceIndex(
+                    ih, kh, s.pad_h, s.dilation_h, s.stride_h, s.out_h);
+                if (oh < 0) {
+                  continue;
+                }
+                for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                  int64_t ow = SourceIndex(
+                      iw, kw, s.pad_w, s.dilation_w, s.stride_w, s.out_w);
+                  if (ow >= 0) {
+                    sum += Convert<AccT>(
+                        col[((c * s.kernel_h + kh) * s.kernel_w + kw) *
+                                out_plane +
+                            oh * s.out_w + ow]);
+                  }
+                }
+              }
+              dst[(c * s.in_h + ih) * s.in_w + iw] = Convert<T>(sum);
+            }
+          }
+        });
+    return;
+  }
+  const int64_t patch = s.PatchSize();
+  ParallelFor(0,
+              s.InPlane(),
+              std::max<int64_t>(1, kConvGrainSize / (cg * taps)),
+              [&](int64_t b, int64_t e) {
+                std::vector<AccT> sum(cg);
+                for (int64_t pos = b; pos < e; ++pos) {
+                  const int64_t ih = pos / s.in_w;
+                  const int64_t iw = pos % s.in_w;
+                  std::fill(sum.begin(), sum.end(), AccT(0));
+                  for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+                    int64_t oh = SourceIndex(
+                        ih, kh, s.pad_h, s.dilation_h, s.stride_h, s.out_h);
+                    if (oh < 0) {
+                      continue;
+                    }
+                    for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                      int64_t ow = SourceIndex(
+                          iw, kw, s.pad_w, s.dilation_w, s.stride_w, s.out_w);
+                      if (ow < 0) {
+                        continue;
+                      }
+                      const T* src = col + (oh * s.out_w + ow) * patch +
+                                     (kh * s.kernel_w + kw) * cg;
+                      for (int64_t c = 0; c < cg; ++c) {
+                        sum[c] += Convert<AccT>(src[c]);
+                      }
+                    }
+                  }
+                  T* dst = dx + pos * s.in_channels + g * cg;
+                  for (int64_t c = 0; c < cg; ++c) {
+                    dst[c] = Convert<T>(sum[c]);
+                  }
+                }
+              });
+}
+
+// Depthwise convolution, computed directly: output channel oc reads input
+// channel oc / multiplier through its own filter. NCHW accumulates a row of
+// outputs per tap, NHWC a pixel of all channels per tap, so the inner loop
+// is unit-stride in both layouts.
+template <typename T>
+void DepthwiseForward(const ConvShape& s, const T* x, const T* w, T* out) {
+  using AccT = AccType<T>;
+  const int64_t mult = s.out_channels / s.in_channels;
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  if (!s.channels_last) {
+    ParallelFor(
+        0,
+        s.batch * s.out_channels,
+        std::max<int64_t>(1, kConvGrainSize / (s.OutPlane() * taps)),
+        [&](int64_t b, int64_t e) {
+          std::vector<AccT> row(s.out_w);
+          for (int64_t plane = b; plane < e; ++plane) {
+            const int64_t n = plane / s.out_channels;
+            const int64_t oc = plane % s.out_channels;
+            const T* src = x + (n * s.in_channels + oc / mult) * s.InPlane();
+            const T* wk = w + oc * taps;
+            T* dst = out + plane * s.OutPlane();
+            for (int64_t oh = 0; oh < s.out_h; ++oh) {
+              std::fill(row.begin(), row.end(), AccT(0));
+              for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+                const int64_t ih =
+                    oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+                if (ih < 0 || ih >= s.in_h) {
+                  continue;
+                }
+                for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                  const int64_t offset = kw * s.dilation_w - s.pad_w;
+                  const AccT wv = Convert<AccT>(wk[kh * s.kernel_w + kw]);
+                  const T* in = src + ih * s.in_w + offset;
+                  int64_t ow_begin, ow_end;
+                  ValidRange(
+                      s.in_w, s.out_w, s.stride_w, offset, &ow_begin, &ow_end);
+                  for (int64_t ow = ow_begin; ow < ow_end; ++ow) {
+                    row[ow] += wv * Convert<AccT>(in[ow * s.stride_w]);
+                  }
+                }
+              }
+              for (int64_t ow = 0; ow < s.out_w; ++ow) {
+                dst[oh * s.out_w + ow] = Convert<T>(row[ow]);
+              }
+            }
+          }
+        });
+    return;
+  }
+  // Filters as [kh, kw, out_channels], one contiguous vector per tap.
+  std::vector<AccT> wt(taps * s.out_channels);
+  for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+    for (int64_t t = 0; t < taps; ++t) {
+      wt[t * s.out_channels + oc] = Convert<AccT>(w[oc * taps + t]);
+    }
+  }
+  ParallelFor(
+      0,
+      s.batch * s.out_h,
+      std::max<int64_t>(1, kConvGrainSize / (s.out_w * s.out_channels * taps)),
+      [&](int64_t b, int64_t e) {
+        std::vector<AccT> acc(s.out_channels);
+        for (int64_t row = b; row < e; ++row) {
+          const int64_t n = row / s.out_h;
+          const int64_t oh = row % s.out_h;
+          for (int64_t ow = 0; ow < s.out_w; ++ow) {
+            std::fill(acc.begin(), acc.end(), AccT(0));
+            for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+              const int64_t ih = oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+              if (ih < 0 || ih >= s.in_h) {
+                continue;
+              }
+              for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                const int64_t iw =
+                    ow * s.stride_w - s.pad_w + kw * s.dilation_w;
+                if (iw < 0 || iw >= s.in_w) {
+                  continue;
+                }
+                const T* src =
+                    x + ((n * s.in_h + ih) * s.in_w + iw) * s.in_channels;
+                const AccT* wv =
+                    wt.data() + (kh * s.kernel_w + kw) * s.out_channels;
+                if (mult == 1) {
+                  for (int64_t c = 0; c < s.out_channels; ++c) {
+                    acc[c] += Convert<AccT>(src[c]) * wv[c];
+                  }
+                } else {
+                  for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+                    acc[oc] += Convert<AccT>(src[oc / mult]) * wv[oc];
+                  }
+                }
+              }
+            }
+            T* dst = out + (row * s.out_w + ow) * s.out_channels;
+            for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+              dst[oc] = Convert<T>(acc[oc]);
+            }
+          }
+        }
+      });
+}
+
+// The input gradient of DepthwiseForward(). NCHW scatters the output rows of
+// an input channel into a plane the thread owns; NHWC gathers the taps of
+// every input pixel.
+template <typename T>
+void DepthwiseBackwardData(const ConvShape& s,
+                           const T* w,
+                           const T* dout,
+                           T* dx) {
+  using AccT = AccType<T>;
+  const int64_t mult = s.out_channels / s.in_channels;
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  if (!s.channels_last) {
+    ParallelFor(
+        0,
+        s.batch * s.in_channels,
+        std::max<int64_t>(1, kConvGrainSize / (s.OutPlane() * taps * mult)),
+        [&](int64_t b, int64_t e) {
+          std::vector<AccT> acc(s.InPlane());
+          for (int64_t plane = b; plane < e; ++plane) {
+            const int64_t n = plane / s.in_channels;
+            const int64_t c = plane % s.in_channels;
+            std::fill(acc.begin(), acc.end(), AccT(0));
+            for (int64_t m = 0; m < mult; ++m) {
+              const int64_t oc = c * mult + m;
+              const T* src = dout + (n * s.out_channels + oc) * s.OutPlane();
+              const T* wk = w + oc * taps;
+              for (int64_t oh = 0; oh < s.out_h; ++oh) {
+                for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+                  const int64_t ih =
+                      oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+                  if (ih < 0 || ih >= s.in_h) {
+                    continue;
+                  }
+                  for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                    const int64_t offset = kw * s.dilation_w - s.pad_w;
+                    const AccT wv = Convert<AccT>(wk[kh * s.kernel_w + kw]);
+                    AccT* row = acc.data() + ih * s.in_w + offset;
+                    int64_t ow_begin, ow_end;
+                    ValidRange(s.in_w,
+                               s.out_w,
+                               s.stride_w,
+                               offset,
+                               &ow_begin,
+                               &ow_end);
+                    for (int64_t ow = ow_begin; ow < ow_end; ++ow) {
+                      row[ow * s.stride_w] +=
+                          wv * Convert<AccT>(src[oh * s.out_w + ow]);
+                    }
+                  }
+                }
+              }
+            }
+            T* dst = dx + plane * s.InPlane();
+            for (int64_t i = 0; i < s.InPlane(); ++i) {
+              dst[i] = Convert<T>(acc[i]);
+            }
+          }
+        });
+    return;
+  }
+  std::vector<AccT> wt(taps * s.out_channels);
+  for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+    for (int64_t t = 0; t < taps; ++t) {
+      wt[t * s.out_channels + oc] = Convert<AccT>(w[oc * taps + t]);
+    }
+  }
+  ParallelFor(
+      0,
+      s.batch * s.in_h,
+      std::max<int64_t>(1, kConvGrainSize / (s.in_w * s.out_channels * taps)),
+      [&](int64_t b, int64_t e) {
+        std::vector<AccT> acc(s.in_channels);
+        for (int64_t row = b; row < e; ++row) {
+          const int64_t n = row / s.in_h;
+          const int64_t ih = row % s.in_h;
+          for (int64_t iw = 0; iw < s.in_w; ++iw) {
+            std::fill(acc.begin(), acc.end(), AccT(0));
+            for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+              const int64_t oh = SourceIndex(
+                  ih, kh, s.pad_h, s.dilation_h, s.stride_h, s.out_h);
+              if (oh < 0) {
+                continue;
+              }
+              for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                const int64_t ow = SourceIndex(
+                    iw, kw, s.pad_w, s.dilation_w, s.stride_w, s.out_w);
+                if (ow < 0) {
+                  continue;
+                }
+                const T* src =
+                    dout + ((n * s.out_h + oh) * s.out_w + ow) * s.out_channels;
+                const AccT* wv =
+                    wt.data() + (kh * s.kernel_w + kw) * s.out_channels;
+                if (mult == 1) {
+                  for (int64_t c = 0; c < s.in_channels; ++c) {
+                    acc[c] += Convert<AccT>(src[c]) * wv[c];
+                  }
+                } else {
+                  for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+                    acc[oc / mult] += Convert<AccT>(src[oc]) * wv[oc];
+                  }
+                }
+              }
+            }
+            T* dst = dx + (row * s.in_w + iw) * s.in_channels;
+            for (int64_t c = 0; c < s.in_channels; ++c) {
+              dst[c] = Convert<T>(acc[c]);
+            }
+          }
+        }
+      });
+}
+
+// The filter gradient of DepthwiseForward(), summed over the batch. NCHW
+// splits the work by output channel, NHWC by tap.
+template <typename T>
+void DepthwiseBackwardFilter(const ConvShape& s,
+                             const T* x,
+                             const T* dout,
+                             T* dw) {
+  using AccT = AccType<T>;
+  const int64_t mult = s.out_channels / s.in_channels;
+  const int64_t taps = s.kernel_h * s.kernel_w;
+  if (!s.channels_last) {
+    ParallelFor(0, s.out_channels, 1, [&](int64_t b, int64_t e) {
+      std::vector<AccT> acc(taps);
+      for (int64_t oc = b; oc < e; ++oc) {
+        std::fill(acc.begin(), acc.end(), AccT(0));
+        for (int64_t n = 0; n < s.batch; ++n) {
+          const T* src = x + (n * s.in_channels + oc / mult) * s.InPlane();
+          const T* grad = dout + (n * s.out_channels + oc) * s.OutPlane();
+          for (int64_t oh = 0; oh < s.out_h; ++oh) {
+            const T* grad_row = grad + oh * s.out_w;
+            for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+              const int64_t ih = oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+              if (ih < 0 || ih >= s.in_h) {
+                continue;
+              }
+              for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                const int64_t offset = kw * s.dilation_w - s.pad_w;
+                const T* in = src + ih * s.in_w + offset;
+                int64_t ow_begin, ow_end;
+                ValidRange(
+                    s.in_w, s.out_w, s.stride_w, offset, &ow_begin, &ow_end);
+                AccT sum = 0;
+                for (int64_t ow = ow_begin; ow < ow_end; ++ow) {
+                  sum += Convert<AccT>(grad_row[ow]) *
+                         Convert<AccT>(in[ow * s.stride_w]);
+                }
+                acc[kh * s.kernel_w + kw] += sum;
+              }
+            }
+          }
+        }
+        for (int64_t t = 0; t < taps; ++t) {
+          dw[oc * taps + t] = Convert<T>(acc[t]);
+        }
+      }
+    });
+    return;
+  }
+  ParallelFor(0, taps, 1, [&](int64_t b, int64_t e) {
+    std::vector<AccT> acc(s.out_channels);
+    for (int64_t t = b; t < e; ++t) {
+      const int64_t kh = t / s.kernel_w;
+      const int64_t kw = t % s.kernel_w;
+      std::fill(acc.begin(), acc.end(), AccT(0));
+      for (int64_t n = 0; n < s.batch; ++n) {
+        for (int64_t oh = 0; oh < s.out_h; ++oh) {
+          const int64_t ih = oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+          if (ih < 0 || ih >= s.in_h) {
+            continue;
+          }
+          for (int64_t ow = 0; ow < s.out_w; ++ow) {
+            const int64_t iw = ow * s.stride_w - s.pad_w + kw * s.dilation_w;
+            if (iw < 0 || iw >= s.in_w) {
+              continue;
+            }
+            const T* src =
+                x + ((n * s.in_h + ih) * s.in_w + iw) * s.in_channels;
+            const T* grad =
+                dout + ((n * s.out_h + oh) * s.out_w + ow) * s.out_channels;
+            if (mult == 1) {
+              for (int64_t c = 0; c < s.out_channels; ++c) {
+                acc[c] += Convert<AccT>(grad[c]) * Convert<AccT>(src[c]);
+              }
+            } else {
+              for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+                acc[oc] +=
+                    Convert<AccT>(grad[oc]) * Convert<AccT>(src[oc / mult]);
+              }
+            }
+          }
+        }
+      }
+      for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+        dw[oc * taps + t] = Convert<T>(acc[oc]);
+      }
+    }
+  });
+}
+
+// Winograd F(2x2, 3x3): a 4x4 input tile d gives the 2x2 output tile
+// A^T [(G g G^T) . (B^T d B)] A, 16 multiplies instead of 36. Summed over
+// the input channels, the 16 element-wise products of all tiles become 16
+// independent GEMMs of [out_channels x in_channels] x [in_channels x tiles].
+template <typename T>
+void WinogradForward(const ConvShape& s, const T* x, const T* w, T* out) {
+  using AccT = AccType<T>;
+  const int64_t C = s.in_channels;
+  const int64_t OC = s.out_channels;
+  const int64_t tiles_h = (s.out_h + 1) / 2;
+  const int64_t tiles_w = (s.out_w + 1) / 2;
+  const int64_t tiles = tiles_h * tiles_w;
+
+  // u[k][oc][c] = (G g G^T)[k] with G = [1 0 0; .5 .5 .5; .5 -.5 .5; 0 0 1].
+  std::vector<AccT> u(16 * OC * C);
+  ParallelFor(0, OC * C, 1024, [&](int64_t b, int64_t e) {
+    for (int64_t i = b; i < e; ++i) {
+      const T* g = w + i * 9;
+      AccT gg[4][3];
+      for (int j = 0; j < 3; ++j) {
+        AccT g0 = Convert<AccT>(g[j]);
+        AccT g1 = Convert<AccT>(g[3 + j]);
+        AccT g2 = Convert<AccT>(g[6 + j]);
+        gg[0][j] = g0;
+        gg[1][j] = (g0 + g1 + g2) / 2;
+        gg[2][j] = (g0 - g1 + g2) / 2;
+        gg[3][j] = g2;
+      }
+      for (int r = 0; r < 4; ++r) {
+        AccT g0 = gg[r][0], g1 = gg[r][1], g2 = gg[r][2];
+        AccT* dst = u.data() + r * 4 * OC * C + i;
+        dst[0] = g0;
+        dst[OC * C] = (g0 + g1 + g2) / 2;
+        dst[2 * OC * C] = (g0 - g1 + g2) / 2;
+        dst[3 * OC * C] = g2;
+      }
+    }
+  });
+
+  std::vector<AccT> v(16 * C * tiles);
+  std::vector<AccT> m(16 * OC * tiles);
+  // v[k][c][tile] = (B^T d B)[k] with B^T = [1 0 -1 0; 0 1 1 0; 0 -1 1 0;
+  // 0 1 0 -1].
+  auto input_tile = [&](const AccT(&d)[4][4], int64_t c, int64_t tile) {
+    AccT t[4][4];
+    for (int j = 0; j < 4; ++j) {
+      t[0][j] = d[0][j] - d[2][j];
+      t[1][j] = d[1][j] + d[2][j];
+      t[2][j] = d[2][j] - d[1][j];
+      t[3][j] = d[1][j] - d[3][j];
+    }
+    AccT* dst = v.data() + c * tiles + tile;
+    const int64_t step = C * tiles;
+    for (int i = 0; i < 4; ++i) {
+      dst[(i * 4 + 0) * step] = t[i][0] - t[i][2];
+      dst[(i * 4 + 1) * step] = t[i][1] + t[i][2];
+      dst[(i * 4 + 2) * step] = t[i][2] - t[i][1];
+      dst[(i * 4 + 3) * step] = t[i][1] - t[i][3];
+    }
+  };
+  // The 2x2 output tile A^T m A with A^T = [1 1 1 0; 0 1 -1 -1].
+  auto output_tile = [&](int64_t oc, int64_t tile, AccT(&y)[2][2]) {
+    const AccT* src = m.data() + oc * tiles + tile;
+    const int64_t step = OC * tiles;
+    AccT t[2][4];
+    for (int j = 0; j < 4; ++j) {
+      AccT m0 = src[j * step], m1 = src[(4 + j) * step];
+      AccT m2 = src[(8 + j) * step], m3 = src[(12 + j) * step];
+      t[0][j] = m0 + m1 + m2;
+      t[1][j] = m1 - m2 - m3;
+    }
+    for (int i = 0; i < 2; ++i) {
+      y[i][0] = t[i][0] + t[i][1] + t[i][2];
+      y[i][1] = t[i][1] - t[i][2] - t[i][3];
+    }
+  };
+
+  for (int64_t n = 0; n < s.batch; ++n) {
+    const T* xn = x + n * C * s.InPlane();
+    T* on = out + n * OC * s.OutPlane();
+    if (!s.channels_last) {
+      ParallelFor(0,
+                  C * tiles_h,
+                  std::max<int64_t>(1, kConvGrainSize / (tiles_w * 16)),
+                  [&](int64_t b, int64_t e) {
+                    AccT d[4][4];
+                    for (int64_t r = b; r < e; ++r) {
+                      const int64_t c = r / tiles_h;
+                      const int64_t th = r % tiles_h;
+                      const T* plane = xn + c * s.InPlane();
+                      for (int64_t tw = 0; tw < tiles_w; ++tw) {
+                        for (int i = 0; i < 4; ++i) {
+                          const int64_t ih = th * 2 - s.pad_h + i;
+                          for (int j = 0; j < 4; ++j) {
+                            const int64_t iw = tw * 2 - s.pad_w + j;
+                            d[i][j] =
+                                ih >= 0 && ih < s.in_h && iw >= 0 && iw < s.in_w
+                                    ? Convert<AccT>(plane[ih * s.in_w + iw])
+                                    : AccT(0);
+                          }
+                        }
+                        input_tile(d, c, th * tiles_w + tw);
+                      }
+                    }
+                  });
+    } else {
+      ParallelFor(
+          0,
+          tiles,
+          std::max<int64_t>(1, kConvGrainSize / (C * 16)),
+          [&](int64_t b, int64_t e) {
+            AccT d[4][4];
+            const T* pixel[4][4];
+            for (int64_t tile = b; tile < e; ++tile) {
+              const int64_t th = tile / tiles_w;
+              const int64_t tw = tile % tiles_w;
+              for (int i = 0; i < 4; ++i) {
+                const int64_t ih = th * 2 - s.pad_h + i;
+                for (int j = 0; j < 4; ++j) {
+                  const int64_t iw = tw * 2 - s.pad_w + j;
+                  pixel[i][j] = ih >= 0 && ih < s.in_h && iw >= 0 && iw < s.in_w
+                                    ? xn + (ih * s.in_w + iw) * C
+                                    : nullptr;
+                }
+              }
+              for (int64_t c = 0; c < C; ++c) {
+                for (int i = 0; i < 4; ++i) {
+                  for (int j = 0; j < 4; ++j) {
+                    d[i][j] =
+                        pixel[i][j] ? Convert<AccT>(pixel[i][j][c]) : AccT(0);
+                  }
+                }
+                input_tile(d, c, tile);
+              }
+            }
+          });
+    }
+
+    gemm::BatchedGemm<AccT>(false,
+                            false,
+                            false,
+                            OC,
+                            tiles,
+                            C,
+                            1,
+                            u.data(),
+                            OC * C,
+                            v.data(),
+                            C * tiles,
+                            0,
+                            m.data(),
+                            OC * tiles,
+                            16);
+
+    if (!s.channels_last) {
+      ParallelFor(0,
+                  OC * tiles_h,
+                  std::max<int64_t>(1, kConvGrainSize / (tiles_w * 16)),
+                  [&](int64_t b, int64_t e) {
+                    AccT y[2][2];
+                    for (int64_t r = b; r < e; ++r) {
+                      const int64_t oc = r / tiles_h;
+                      const int64_t th = r % tiles_h;
+                      T* plane = on + oc * s.OutPlane();
+                      for (int64_t tw = 0; tw < tiles_w; ++tw) {
+                        output_tile(oc, th * tiles_w + tw, y);
+                        for (int i = 0; i < 2 && th * 2 + i < s.out_h; ++i) {
+                          for (int j = 0; j < 2 && tw * 2 + j < s.out_w; ++j) {
+                            plane[(th * 2 + i) * s.out_w + tw * 2 + j] =
+                                Convert<T>(y[i][j]);
+                          }
+                        }
+                      }
+                    }
+                  });
+    } else {
+      ParallelFor(
+          0,
+          tiles,
+          std::max<int64_t>(1, kConvGrainSize / (OC * 16)),
+          [&](int64_t b, int64_t e) {
+            AccT y[2][2];
+            for (int64_t tile = b; tile < e; ++tile) {
+              const int64_t th = tile / tiles_w;
+              const int64_t tw = tile % tiles_w;
+              for (int64_t oc = 0; oc < OC; ++oc) {
+                output_tile(oc, tile, y);
+                for (int i = 0; i < 2 && th * 2 + i < s.out_h; ++i) {
+                  for (int j = 0; j < 2 && tw * 2 + j < s.out_w; ++j) {
+                    on[((th * 2 + i) * s.out_w + tw * 2 + j) * OC + oc] =
+                        Convert<T>(y[i][j]);
+                  }
+                }
+              }
+            }
+          });
+    }
+  }
+}
+
+// Convolution as GEMMs over the im2col matrix of every image and group:
+// NCHW computes out = W * col, NHWC out = col * W^T with the filter in
+// (kh, kw, c) order, which writes the channels-last output in place. A
+// 1x1 stride-1 convolution is already a GEMM on the input and skips the
+// im2col.
+template <typename T>
+void Im2ColForward(const ConvShape& s, const T* x, const T* w, T* out) {
+  const int64_t cg = s.InGroupChannels();
+  const int64_t ocg = s.OutGroupChannels();
+  const int64_t C = s.in_channels;
+  const int64_t OC = s.out_channels;
+  const int64_t plane = s.OutPlane();
+  if (IsPointwise(s)) {
+    for (int64_t g = 0; g < s.groups; ++g) {
+      if (!s.channels_last) {
+        gemm::GemmStrided<T>(ocg,
+                             plane,
+                             cg,
+                             1,
+                             w + g * ocg * cg,
+                             cg,
+                             1,
+                             0,
+                             x + g * cg * plane,
+                             plane,
+                             1,
+                             C * plane,
+                             0,
+                             out + g * ocg * plane,
+                             plane,
+                             1,
+                             OC * plane,
+                             s.batch);
+      } else {
+        gemm::GemmStrided<T>(s.batch * plane,
+                             ocg,
+                             cg,
+                             1,
+                             x + g * cg,
+                             C,
+                             1,
+                             0,
+                             w + g * ocg * cg,
+                             1,
+                             cg,
+                             0,
+                             0,
+                             out + g * ocg,
+                             OC,
+                             1,
+                             0);
+      }
+    }
+    return;
+  }
+  const int64_t patch = s.PatchSize();
+  std::vector<T> w_hwc;
+  if (s.channels_last) {
+    w_hwc = FilterToHWC(s, w);
+  }
+  std::vector<T> col(patch * plane);
+  for (int64_t n = 0; n < s.batch; ++n) {
+    for (int64_t g = 0; g < s.groups; ++g) {
+      Im2Col(s, x + n * C * s.InPlane(), g, col.data());
+      if (!s.channels_last) {
+        gemm::GemmStrided<T>(ocg,
+                             plane,
+                             patch,
+                             1,
+                             w + g * ocg * patch,
+                             patch,
+                             1,
+                             0,
+                             col.data(),
+                             plane,
+                             1,
+                             0,
+                             0,
+                             out + (n * OC + g * ocg) * plane,
+                             plane,
+                             1,
+                             0);
+      } else {
+        gemm::GemmStrided<T>(plane,
+                             ocg,
+                             patch,
+                             1,
+                             col.data(),
+                             patch,
+                             1,
+                             0,
+                             w_hwc.data() + g * ocg * patch,
+                             1,
+                             patch,
+                             0,
+                             0,
+                             out + n * plane * OC + g * ocg,
+                             OC,
+                             1,
+                             0);
+      }
+    }
+  }
+}
+
+// dx = col2im(W^T * dout) per image and group.
+template <typename T>
+void Im2ColBackwardData(const ConvShape& s, const T* w, const T* dout, T* dx) {
+  const int64_t cg = s.InGroupChannels();
+  const int64_t ocg = s.OutGroupChannels();
+  const int64_t C = s.in_channels;
+  const int64_t OC = s.out_channels;
+  const int64_t plane = s.OutPlane();
+  if (IsPointwise(s)) {
+    for (int64_t g = 0; g < s.groups; ++g) {
+      if (!s.channels_last) {
+        gemm::GemmStrided<T>(cg,
+                             plane,
+                             ocg,
+                             1,
+                             w + g * ocg * cg,
+                             1,
+                             cg,
+                             0,
+                             dout + g * ocg * plane,
+                             plane,
+                             1,
+                             OC * plane,
+                             0,
+                             dx + g * cg * plane,
+                             plane,
+                             1,
+                             C * plane,
+                             s.batch);
+      } else {
+        gemm::GemmStrided<T>(s.batch * plane,
+                             cg,
+                             ocg,
+                             1,
+                             dout + g * ocg,
+                             OC,
+                             1,
+                             0,
+                             w + g * ocg * cg,
+                             cg,
+                             1,
+                             0,
+                             0,
+                             dx + g * cg,
+                             C,
+                             1,
+                             0);
+      }
+    }
+    return;
+  }
+  const int64_t patch = s.PatchSize();
+  std::vector<T> w_hwc;
+  if (s.channels_last) {
+    w_hwc = FilterToHWC(s, w);
+  }
+  std::vector<T> col(patch * plane);
+  for (int64_t n = 0; n < s.batch; ++n) {
+    for (int64_t g = 0; g < s.groups; ++g) {
+      if (!s.channels_last) {
+        gemm::GemmStrided<T>(patch,
+                             plane,
+                             ocg,
+                             1,
+                             w + g * ocg * patch,
+                             1,
+                             patch,
+                             0,
+                             dout + (n * OC + g * ocg) * plane,
+                             plane,
+                             1,
+                             0,
+                             0,
+                             col.data(),
+                             plane,
+                             1,
+                             0);
+      } else {
+        gemm::GemmStrided<T>(plane,
+                             patch,
+                             ocg,
+                             1,
+                             dout + n * plane * OC + g * ocg,
+                             OC,
+                             1,
+                             0,
+                             w_hwc.data() + g * ocg * patch,
+                             patch,
+                             1,
+                             0,
+                             0,
+                             col.data(),
+                             patch,
+                             1,
+                             0);
+      }
+      Col2Im(s, col.data(), g, dx + n * C * s.InPlane());
+    }
+  }
+}
+
+// dW = sum over images of dout * col^T, per group.
+template <typename T>
+void Im2ColBackwardFilter(const ConvShape& s,
+                          const T* x,
+                          const T* dout,
+                          T* dw) {
+  const int64_t cg = s.InGroupChannels();
+  const int64_t ocg = s.OutGroupChannels();
+  const int64_t C = s.in_channels;
+  const int64_t OC = s.out_channels;
+  const int64_t plane = s.OutPlane();
+  if (IsPointwise(s)) {
+    for (int64_t g = 0; g < s.groups; ++g) {
+      if (!s.channels_last) {
+        // A zero batch stride of C sums the images' products.
+        gemm::GemmStrided<T>(ocg,
+                             cg,
+                             plane,
+                             1,
+                             dout + g * ocg * plane,
+                             plane,
+                             1,
+                             OC * plane,
+                             x + g * cg * plane,
+                             1,
+                             plane,
+                             C * plane,
+                             0,
+                             dw + g * ocg * cg,
+                             cg,
+                             1,
+                             0,
+                             s.batch);
+      } else {
+        gemm::GemmStrided<T>(ocg,
+                             cg,
+                             s.batch * plane,
+                             1,
+                             dout + g * ocg,
+                             1,
+                             OC,
+                             0,
+                             x + g * cg,
+                             C,
+                             1,
+                             0,
+                             0,
+                             dw + g * ocg * cg,
+                             cg,
+                             1,
+                             0);
+      }
+    }
+    return;
+  }
+  const int64_t patch = s.PatchSize();
+  std::vector<T> dw_hwc;
+  if (s.channels_last) {
+    dw_hwc.resize(OC * patch);
+  }
+  T* dst = s.channels_last ? dw_hwc.data() : dw;
+  std::vector<T> col(patch * plane);
+  for (int64_t n = 0; n < s.batch; ++n) {
+    const AccType<T> beta = n == 0 ? 0 : 1;
+    for (int64_t g = 0; g < s.groups; ++g) {
+      Im2Col(s, x + n * C * s.InPlane(), g, col.data());
+      if (!s.channels_last) {
+        gemm::GemmStrided<T>(ocg,
+                             patch,
+                             plane,
+                             1,
+                             dout + (n * OC + g * ocg) * plane,
+                             plane,
+                             1,
+                             0,
+                             col.data(),
+                             1,
+                             plane,
+                             0,
+                             beta,
+                             dst + g * ocg * patch,
+                             patch,
+                             1,
+                             0);
+      } else {
+        gemm::GemmStrided<T>(ocg,
+                             patch,
+                             plane,
+                             1,
+                             dout + n * plane * OC + g * ocg,
+                             1,
+                             OC,
+                             0,
+                             col.data(),
+                             patch,
+                             1,
+                             0,
+                             beta,
+                             dst + g * ocg * patch,
+                             patch,
+                             1,
+                             0);
+      }
+    }
+  }
+  if (s.channels_last) {
+    FilterFromHWC(s, dw_hwc.data(), dw);
+  }
+}
+
+template <typename T>
+void FillZero(T* dst, int64_t n) {
+  std::fill(dst, dst + n, Convert<T>(AccType<T>(0)));
+}
+
+}  // namespace detail
+
+// out = conv2d(x, w). Depthwise convolutions run directly, 3x3 stride-1
+// ones with enough channels through Winograd F(2x2, 3x3), the rest through
+// im2col + GEMM.
+template <typename T>
+void ConvForward(const ConvShape& s, const T* x, const T* w, T* out) {
+  if (s.batch * s.out_channels * s.OutPlane() == 0) {
+    return;
+  }
+  if (detail::IsDepthwise(s)) {
+    detail::DepthwiseForward(s, x, w, out);
+  } else if (detail::UseWinograd(s)) {
+    detail::WinogradForward(s, x, w, out);
+  } else {
+    detail::Im2ColForward(s, x, w, out);
+  }
+}
+
+// dx, the gradient of ConvForward() with respect to x, given dout.
+template <typename T>
+void ConvBackwardData(const ConvShape& s, const T* w, const T* dout, T* dx) {
+  if (s.batch * s.in_channels * s.InPlane() == 0) {
+    return;
+  }
+  if (s.out_channels * s.OutPlane() == 0) {
+    detail::FillZero(dx, s.batch * s.in_channels * s.InPlane());
+  } else if (detail::IsDepthwise(s)) {
+    detail::DepthwiseBackwardData(s, w, dout, dx);
+  } else {
+    detail::Im2ColBackwardData(s, w, dout, dx);
+  }
+}
+
+// dw, the gradient of ConvForward() with respect to w, summed over the
+// batch.
+template <typename T>
+void ConvBackwardFilter(const ConvShape& s, const T* x, const T* dout, T* dw) {
+  if (s.out_channels * s.PatchSize() == 0) {
+    return;
+  }
+  if (s.batch * s.OutPlane() == 0) {
+    detail::FillZero(dw, s.out_channels * s.PatchSize());
+  } else if (detail::IsDepthwise(s)) {
+    detail::DepthwiseBackwardFilter(s, x, dout, dw);
+  } else {
+    detail::Im2ColBackwardFilter(s, x, dout, dw);
+  }
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,424 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+namespace gemm {
+
+// Register tile (MR x NR) and cache block (MC x KC x NC) sizes. A packed KC x
+// NR panel of B stays in L1 while the MC x KC block of A lives in L2.
+template <typename T>
+struct GemmBlocking {
+  static constexpr int kMR = 4;
+  static constexpr int kNR = 8;
+  static constexpr int64_t kMC = 128;
+  static constexpr int64_t kKC = 256;
+  static constexpr int64_t kNC = 1024;
+};
+
+template <>
+struct GemmBlocking<double> {
+  static constexpr int kMR = 4;
+  static constexpr int kNR = 4;
+  static constexpr int64_t kMC = 96;
+  static constexpr int64_t kKC = 256;
+  static constexpr int64_t kNC = 512;
+};
+
+// Below this many multiply-adds a problem is computed on the calling thread.
+constexpr int64_t kParallelMinFlops = 64 * 64 * 64;
+
+// Strided view of a matrix: element (i, j) lives at data[i * rs + j * cs].
+template <typename T>
+struct MatrixRef {
+  T* data;
+  int64_t rs;
+  int64_t cs;
+
+  T& operator()(int64_t i, int64_t j) const { return data[i * rs + j * cs]; }
+};
+
+// Packs rows [m0, m0 + mc) and columns [k0, k0 + kc) of A into MR-row panels.
+// Each panel stores MR consecutive values per k; rows past mc are zero.
+// Values are converted to the compute type AccT on the way.
+template <typename T, typename AccT, int MR>
+void PackA(const MatrixRef<const T>& a,
+           int64_t m0,
+           int64_t mc,
+           int64_t k0,
+           int64_t kc,
+           AccT* packed) {
+  for (int64_t p = 0; p < mc; p += MR) {
+    int64_t rows = std::min<int64_t>(MR, mc - p);
+    const T* src = a.data + (m0 + p) * a.rs + k0 * a.cs;
+    if (HalfTraits<T>::kIsHalf && a.cs == 1) {
+      // 16-bit rows are converted a block at a time and then interleaved.
+      AccT row[kHalfBlockSize];
+      for (int64_t k1 = 0; k1 < kc; k1 += kHalfBlockSize) {
+        const int64_t len = std::min(kHalfBlockSize, kc - k1);
+        for (int i = 0; i < MR; ++i) {
+          if (i < rows) {
+            ConvertBlock(src + i * a.rs + k1, row, len);
+          } else {
+            std::fill(row, row + len, AccT(0));
+          }
+          for (int64_t k = 0; k < len; ++k) {
+            packed[(k1 + k) * MR + i] = row[k];
+          }
+        }
+      }
+      packed += kc * MR;
+    } else if (rows == MR) {
+      for (int64_t k = 0; k < kc; ++k) {
+        const T* col = src + k * a.cs;
+        for (int i = 0; i < MR; ++i) {
+          packed[i] = Convert<AccT>(col[i * a.rs]);
+        }
+        packed += MR;
+      }
+    } else {
+      for (int64_t k = 0; k < kc; ++k) {
+        const T* col = src + k * a.cs;
+        for (int i = 0; i < MR; ++i) {
+          packed[i] = i < rows ? Convert<AccT>(col[i * a.rs]) : AccT(0);
+        }
+        packed += MR;
+      }
+    }
+  }
+}
+
+// Packs rows [k0, k0 + kc) and columns [n0, n0 + nc) of B into NR-column
+// panels. Each panel stores NR consecutive values per k; columns past nc are
+// zero.
+template <typename T, typename AccT, int NR>
+void PackB(const MatrixRef<const T>& b,
+           int64_t k0,
+           int64_t kc,
+           int64_t n0,
+           int64_t nc,
+           AccT* packed) {
+  for (int64_t p = 0; p < nc; p += NR) {
+    int64_t cols = std::min<int64_t>(NR, nc - p);
+    const T* src = b.data + k0 * b.rs + (n0 + p) * b.cs;
+    if (cols == NR && b.cs == 1 && std::is_same<T, AccT>::value) {
+      for (int64_t k = 0; k < kc; ++k) {
+        std::memcpy(packed, src + k * b.rs, NR * sizeof(T));
+        packed += NR;
+      }
+    } else if (cols == NR && b.cs == 1) {
+      for (int64_t k = 0; k < kc; ++k) {
+        ConvertBlock(src + k * b.rs, packed, NR);
+        packed += NR;
+      }
+    } else {
+      for (int64_t k = 0; k < kc; ++k) {
+        const T* row = src + k * b.rs;
+        for (int j = 0; j < NR; ++j) {
+          packed[j] = j < cols ? Convert<AccT>(row[j * b.cs]) : AccT(0);
+        }
+        packed += NR;
+      }
+    }
+  }
+}
+
+// Computes the MR x NR product of one packed A panel and one packed B panel
+// over kc and merges it into C as C = alpha * AB + beta * C. Only the leading
+// rows x cols corner is written back.
+template <typename CT, typename AccT, int MR, int NR>
+inline void MicroKernel(int64_t kc,
+                        const AccT* pa,
+                        const AccT* pb,
+                        AccT alpha,
+                        AccT beta,
+                        const MatrixRef<CT>& c,
+                        int64_t rows,
+                        int64_t cols) {
+  AccT acc[MR][NR];
+  for (int i = 0; i < MR; ++i) {
+    for (int j = 0; j < NR; ++j) {
+      acc[i][j] = AccT(0);
+    }
+  }
+  for (int64_t k = 0; k < kc; ++k) {
+    for (int i = 0; i < MR; ++i) {
+      const AccT a_val = pa[i];
+      for (int j = 0; j < NR; ++j) {
+        acc[i][j] += a_val * pb[j];
+      }
+    }
+    pa += MR;
+    pb += NR;
+  }
+
+  // beta == 0 must not read C, which may hold uninitialized memory.
+  const bool zero_beta = beta == AccT(0);
+  for (int64_t i = 0; i < rows; ++i) {
+    for (int64_t j = 0; j < cols; ++j) {
+      CT& dst = c(i, j);
+      dst = Convert<CT>(zero_beta
+                            ? alpha * acc[i][j]
+                            : alpha * acc[i][j] + beta * Convert<AccT>(dst));
+    }
+  }
+}
+
+// Multiplies the mc x kc block packed in `pa` with the kc x nc block packed in
+// `pb` and merges the result into the mc x nc block of C.
+template <typename CT, typename AccT, int MR, int NR>
+void MacroKernel(int64_t mc,
+                 int64_t nc,
+                 int64_t kc,
+                 const AccT* pa,
+                 const AccT* pb,
+                 AccT alpha,
+                 AccT beta,
+                 const MatrixRef<CT>& c) {
+  for (int64_t jr = 0; jr < nc; jr += NR) {
+    int64_t cols = std::min<int64_t>(NR, nc - jr);
+    const AccT* pb_panel = pb + jr * kc;
+    for (int64_t ir = 0; ir < mc; ir += MR) {
+      int64_t rows = std::min<int64_t>(MR, mc - ir);
+      MatrixRef<CT> c_tile{c.data + ir * c.rs + jr * c.cs, c.rs, c.cs};
+      MicroKernel<CT, AccT, MR, NR>(
+          kc, pa + ir * kc, pb_panel, alpha, beta, c_tile, rows, cols);
+    }
+  }
+}
+
+template <typename T>
+void ScaleMatrix(int64_t M, int64_t N, AccType<T> beta, const MatrixRef<T>& c) {
+  for (int64_t i = 0; i < M; ++i) {
+    for (int64_t j = 0; j < N; ++j) {
+      c(i, j) = Convert<T>(beta == AccType<T>(0)
+                               ? AccType<T>(0)
+                               : beta * Convert<AccType<T>>(c(i, j)));
+    }
+  }
+}
+
+// Batched strided GEMM:
+//   C_b = alpha * A_b * B_b + beta * C_b,  b in [0, batch)
+// where A_b is M x K, B_b is K x N and C_b is M x N, each addressed through
+// row/column strides plus a per-batch stride. A batch stride of 0 broadcasts
+// that operand over the batch. batch_stride_c == 0 with batch > 1 accumulates
+// all products into a single C (C = alpha * sum_b A_b * B_b + beta * C).
+//
+// Work is split over MC x NC tiles of C and over the batch. Every task packs
+// its own A and B blocks, so tasks never share writable state.
+//
+// 16-bit types are computed in float: the packed panels hold floats and a
+// tile of C is accumulated in a float buffer over all of K before it is
+// rounded to T once.
+template <typename T>
+void GemmStrided(int64_t M,
+                 int64_t N,
+                 int64_t K,
+                 AccType<T> alpha,
+                 const T* a,
+                 int64_t rs_a,
+                 int64_t cs_a,
+                 int64_t batch_stride_a,
+                 const T* b,
+                 int64_t rs_b,
+                 int64_t cs_b,
+                 int64_t batch_stride_b,
+                 AccType<T> beta,
+                 T* c,
+                 int64_t rs_c,
+                 int64_t cs_c,
+                 int64_t batch_stride_c,
+                 int64_t batch = 1) {
+  using AccT = AccType<T>;
+  using Blocking = GemmBlocking<AccT>;
+  constexpr bool kStaged = !std::is_same<T, AccT>::value;
+  constexpr int MR = Blocking::kMR;
+  constexpr int NR = Blocking::kNR;
+  if (M <= 0 || N <= 0 || batch <= 0) {
+    return;
+  }
+
+  const bool reduce_batch = batch_stride_c == 0 && batch > 1;
+  if (K <= 0) {
+    int64_t c_batches = reduce_batch ? 1 : batch;
+    for (int64_t bs = 0; bs < c_batches; ++bs) {
+      ScaleMatrix(
+          M, N, beta, MatrixRef<T>{c + bs * batch_stride_c, rs_c, cs_c});
+    }
+    return;
+  }
+
+  int64_t mc = std::min<int64_t>(Blocking::kMC, (M + MR - 1) / MR * MR);
+  int64_t nc = std::min<int64_t>(Blocking::kNC, (N + NR - 1) / NR * NR);
+  const int64_t kc_max = std::min<int64_t>(Blocking::kKC, K);
+  const int64_t batch_tasks = reduce_batch ? 1 : batch;
+
+  // Shrink the tiles until every thread has some work.
+  const int64_t num_threads = ThreadPool::Instance().NumThreads();
+  auto count_tasks = [&]() {
+    return batch_tasks * ((M + mc - 1) / mc) * ((N + nc - 1) / nc);
+  };
+  while (count_tasks() < num_threads && nc > 4 * NR) {
+    nc = (nc / 2 + NR - 1) / NR * NR;
+  }
+  while (count_tasks() < num_threads && mc > 4 * MR) {
+    mc = (mc / 2 + MR - 1) / MR * MR;
+  }
+
+  const int64_t m_tiles = (M + mc - 1) / mc;
+  const int64_t n_tiles = (N + nc - 1) / nc;
+  const int64_t tiles_per_batch = m_tiles * n_tiles;
+  const int64_t total_tasks = batch_tasks * tiles_per_batch;
+  const int64_t flops_per_task = mc * nc * K * (reduce_batch ? batch : 1);
+  const int64_t grain = std::max<int64_t>(
+      1, kParallelMinFlops / std::max<int64_t>(1, flops_per_task));
+
+  ParallelFor(0, total_tasks, grain, [&](int64_t task_begin, int64_t task_end) {
+    thread_local std::vector<AccT> packed_a;
+    thread_local std::vector<AccT> packed_b;
+    thread_local std::vector<AccT> staged_c;
+    packed_a.resize(mc * kc_max);
+    packed_b.resize(nc * kc_max);
+    if (kStaged) {
+      staged_c.resize(mc * nc);
+    }
+
+    for (int64_t task = task_begin; task < task_end; ++task) {
+      int64_t tile = task % tiles_per_batch;
+      int64_t m0 = (tile / n_tiles) * mc;
+      int64_t n0 = (tile % n_tiles) * nc;
+      int64_t cur_mc = std::min(mc, M - m0);
+      int64_t cur_nc = std::min(nc, N - n0);
+      int64_t bs_begin = reduce_batch ? 0 : task / tiles_per_batch;
+      int64_t bs_end = reduce_batch ? batch : bs_begin + 1;
+
+      MatrixRef<T> c_block{c + (reduce_batch ? 0 : bs_begin * batch_stride_c) +
+                               m0 * rs_c + n0 * cs_c,
+                           rs_c,
+                           cs_c};
+      MatrixRef<AccT> staged_block{staged_c.data(), cur_nc, 1};
+      bool first = true;
+      for (int64_t bs = bs_begin; bs < bs_end; ++bs) {
+        MatrixRef<const T> a_mat{a + bs * batch_stride_a, rs_a, cs_a};
+        MatrixRef<const T> b_mat{b + bs * batch_stride_b, rs_b, cs_b};
+        for (int64_t k0 = 0; k0 < K; k0 += kc_max) {
+          int64_t kc = std::min(kc_max, K - k0);
+          PackB<T, AccT, NR>(b_mat, k0, kc, n0, cur_nc, packed_b.data());
+          PackA<T, AccT, MR>(a_mat, m0, cur_mc, k0, kc, packed_a.data());
+          if (kStaged) {
+            MacroKernel<AccT, AccT, MR, NR>(cur_mc,
+                                            cur_nc,
+                                            kc,
+                                            packed_a.data(),
+                                            packed_b.data(),
+                                            alpha,
+                                            AccT(first ? 0 : 1),
+                                            staged_block);
+          } else {
+            MacroKernel<T, AccT, MR, NR>(cur_mc,
+                                         cur_nc,
+                                         kc,
+                                         packed_a.data(),
+                                         packed_b.data(),
+                                         alpha,
+                                         first ? beta : AccT(1),
+                                         c_block);
+          }
+          first = false;
+        }
+      }
+      if (kStaged) {
+        const bool zero_beta = beta == AccT(0);
+        for (int64_t i = 0; i < cur_mc; ++i) {
+          for (int64_t j = 0; j < cur_nc; ++j) {
+            T& dst = c_block(i, j);
+            AccT sum = staged_block(i, j);
+            dst = Convert<T>(zero_beta ? sum : sum + beta * Convert<AccT>(dst));
+          }
+        }
+      }
+    }
+  });
+}
+
+// Batched GEMM on dense row-major buffers. op(A) is M x K, op(B) is K x N:
+//   trans_a: A is stored as K x M, otherwise M x K.
+//   trans_b: B is stored as N x K, otherwise K x N.
+//   trans_c: C is stored as N x M, otherwise M x N.
+// The batch strides follow GemmStrided().
+template <typename T>
+void BatchedGemm(bool trans_a,
+                 bool trans_b,
+                 bool trans_c,
+                 int64_t M,
+                 int64_t N,
+                 int64_t K,
+                 AccType<T> alpha,
+                 const T* a,
+                 int64_t batch_stride_a,
+                 const T* b,
+                 int64_t batch_stride_b,
+                 AccType<T> beta,
+                 T* c,
+                 int64_t batch_stride_c,
+                 int64_t batch) {
+  GemmStrided<T>(M,
+                 N,
+                 K,
+                 alpha,
+                 a,
+                 trans_a ? 1 : K,
+                 trans_a ? M : 1,
+                 batch_stride_a,
+                 b,
+                 trans_b ? 1 : N,
+                 trans_b ? K : 1,
+                 batch_stride_b,
+                 beta,
+                 c,
+                 trans_c ? 1 : N,
+                 trans_c ? M : 1,
+                 batch_stride_c,
+                 batch);
+}
+
+template <typename T>
+void Gemm(bool trans_a,
+          bool trans_b,
+          bool trans_c,
+          int64_t M,
+          int64_t N,
+          int64_t K,
+          AccType<T> alpha,
+          const T* a,
+          const T* b,
+          AccType<T> beta,
+          T* c) {
+  BatchedGemm<T>(
+      trans_a, trans_b, trans_c, M, N, K, alpha, a, 0, b, 0, beta, c, 0, 1);
+}
+
+}  // namespace gemm
+}  // namespace custom_kernel
@@ -0,0 +1,213 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/half.h"
+
+#if defined(__x86_64__) && (defined(__GNUC__) || defined(__clang__))
+#include <immintrin.h>
+// Blocks are converted with F16C (float16) and AVX2 (bfloat16) intrinsics
+// when the CPU has them. The bit manipulation of the portable loops costs
+// more than the float math it feeds, which made the 16-bit types slower
+// than float32.
+#define CUSTOM_CPU_HALF_X86 1
+#endif
+
+#if defined(__has_attribute)
+#if __has_attribute(target_clones) && defined(__x86_64__) && defined(__linux__)
+// One copy for the baseline ISA and one for AVX2, chosen through an ifunc
+// when the library is loaded.
+#define CUSTOM_CPU_HALF_TARGETS \
+  __attribute__((target_clones("avx2", "default")))
+#endif
+#endif
+
+#ifndef CUSTOM_CPU_HALF_TARGETS
+#define CUSTOM_CPU_HALF_TARGETS
+#endif
+
+namespace custom_kernel {
+namespace detail {
+
+namespace {
+
+CUSTOM_CPU_HALF_TARGETS
+void Float16ToFloatPortable(const uint16_t* __restrict src,
+                            float* __restrict dst,
+                            int64_t n) {
+  for (int64_t i = 0; i < n; ++i) {
+    dst[i] = Float16BitsToFloat(src[i]);
+  }
+}
+
+CUSTOM_CPU_HALF_TARGETS
+void FloatToFloat16Portable(const float* __restrict src,
+                            uint16_t* __restrict dst,
+                            int64_t n) {
+  for (int64_t i = 0; i < n; ++i) {
+    dst[i] = FloatToFloat16Bits(src[i]);
+  }
+}
+
+CUSTOM_CPU_HALF_TARGETS
+void BFloat16ToFloatPortable(const uint16_t* __restrict src,
+                             float* __restrict dst,
+                             int64_t n) {
+  for (int64_t i = 0; i < n; ++i) {
+    dst[i] = BFloat16BitsToFloat(src[i]);
+  }
+}
+
+CUSTOM_CPU_HALF_TARGETS
+void FloatToBFloat16Portable(const float* __restrict src,
+                             uint16_t* __restrict dst,
+                             int64_t n) {
+  for (int64_t i = 0; i < n; ++i) {
+    dst[i] = FloatToBFloat16Bits(src[i]);
+  }
+}
+
+#ifdef CUSTOM_CPU_HALF_X86
+
+__attribute__((target("avx,f16c"))) void Float16ToFloatF16C(
+    const uint16_t* __restrict src, float* __restrict dst, int64_t n) {
+  int64_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    __m128i h = _mm_loadu_si128(reinterpret_cast<const __m128i*>(src + i));
+    _mm256_storeu_ps(dst + i, _mm256_cvtph_ps(h));
+  }
+  for (; i < n; ++i) {
+    dst[i] = Float16BitsToFloat(src[i]);
+  }
+}
+
+// Rounds to nearest even like FloatToFloat16Bits. NaNs keep their payload's
+// top bits rather than becoming the canonical quiet NaN.
+__attribute__((target("avx,f16c"))) void FloatToFloat16F16C(
+    const float* __restrict src, uint16_t* __restrict dst, int64_t n) {
+  int64_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    __m128i h =
+        _mm256_cvtps_ph(_mm256_loadu_ps(src + i), _MM_FROUND_TO_NEAREST_INT);
+    _mm_storeu_si128(reinterpret_cast<__m128i*>(dst + i), h);
+  }
+  for (; i < n; ++i) {
+    dst[i] = FloatToFloat16Bits(src[i]);
+  }
+}
+
+// GCC does not vectorize the bfloat16 loops above, so they are written out
+// for AVX2 as well.
+__attribute__((target("avx2"))) void BFloat16ToFloatAVX2(
+    const uint16_t* __restrict src, float* __restrict dst, int64_t n) {
+  int64_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    __m128i h = _mm_loadu_si128(reinterpret_cast<const __m128i*>(src + i));
+    __m256i bits = _mm256_slli_epi32(_mm256_cvtepu16_epi32(h), 16);
+    _mm256_storeu_ps(dst + i, _mm256_castsi256_ps(bits));
+  }
+  for (; i < n; ++i) {
+    dst[i] = BFloat16BitsToFloat(src[i]);
+  }
+}
+
+// The eight results of FloatToBFloat16Bits, one per 32-bit lane.
+__attribute__((target("avx2"))) inline __m256i FloatToBFloat16AVX2(
+    const float* src) {
+  const __m256i bits = _mm256_castps_si256(_mm256_loadu_ps(src));
+  const __m256i odd =
+      _mm256_and_si256(_mm256_srli_epi32(bits, 16), _mm256_set1_epi32(1));
+  const __m256i rounded = _mm256_srli_epi32(
+      _mm256_add_epi32(_mm256_add_epi32(bits, _mm256_set1_epi32(0x7fff)), odd),
+      16);
+  const __m256i nan =
+      _mm256_cmpgt_epi32(_mm256_and_si256(bits, _mm256_set1_epi32(0x7fffffff)),
+                         _mm256_set1_epi32(0x7f800000));
+  const __m256i quiet =
+      _mm256_or_si256(_mm256_srli_epi32(bits, 16), _mm256_set1_epi32(0x40));
+  return _mm256_blendv_epi8(rounded, quiet, nan);
+}
+
+__attribute__((target("avx2"))) void FloatToBFloat16AVX2(
+    const float* __restrict src, uint16_t* __restrict dst, int64_t n) {
+  int64_t i = 0;
+  for (; i + 16 <= n; i += 16) {
+    // packus interleaves the 128-bit lanes of its operands; the permute
+    // puts them back in order.
+    __m256i h = _mm256_packus_epi32(FloatToBFloat16AVX2(src + i),
+                                    FloatToBFloat16AVX2(src + i + 8));
+    h = _mm256_permute4x64_epi64(h, 0xd8);
+    _mm256_storeu_si256(reinterpret_cast<__m256i*>(dst + i), h);
+  }
+  for (; i < n; ++i) {
+    dst[i] = FloatToBFloat16Bits(src[i]);
+  }
+}
+
+bool HasF16C() {
+  static const bool has =
+      __builtin_cpu_supports("avx") && __builtin_cpu_supports("f16c");
+  return has;
+}
+
+bool HasAVX2() {
+  static const bool has = __builtin_cpu_supports("avx2");
+  return has;
+}
+
+#endif
+
+}  // namespace
+
+void Float16ToFloat(const uint16_t* src, float* dst, int64_t n) {
+#ifdef CUSTOM_CPU_HALF_X86
+  if (HasF16C()) {
+    Float16ToFloatF16C(src, dst, n);
+    return;
+  }
+#endif
+  Float16ToFloatPortable(src, dst, n);
+}
+
+void FloatToFloat16(const float* src, uint16_t* dst, int64_t n) {
+#ifdef CUSTOM_CPU_HALF_X86
+  if (HasF16C()) {
+    FloatToFloat16F16C(src, dst, n);
+    return;
+  }
+#endif
+  FloatToFloat16Portable(src, dst, n);
+}
+
+void BFloat16ToFloat(const uint16_t* src, float* dst, int64_t n) {
+#ifdef CUSTOM_CPU_HALF_X86
+  if (HasAVX2()) {
+    BFloat16ToFloatAVX2(src, dst, n);
+    return;
+  }
+#endif
+  BFloat16ToFloatPortable(src, dst, n);
+}
+
+void FloatToBFloat16(const float* src, uint16_t* dst, int64_t n) {
+#ifdef CUSTOM_CPU_HALF_X86
+  if (HasAVX2()) {
+    FloatToBFloat16AVX2(src, dst, n);
+    return;
+  }
+#endif
+  FloatToBFloat16Portable(src, dst, n);
+}
+
+}  // namespace detail
+}  // namespace custom_kernel
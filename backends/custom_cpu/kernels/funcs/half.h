@@ -0,0 +1,232 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+
+namespace custom_kernel {
+
+// Elements converted at a time by engines that stage 16-bit rows in float.
+// A block of every operand fits in L1 next to the float copies.
+constexpr int64_t kHalfBlockSize = 256;
+
+// Bit layouts of the 16-bit floating point types.
+enum class HalfFormat { kFloat16, kBFloat16 };
+
+namespace detail {
+
+inline uint32_t FloatBits(float f) {
+  uint32_t u;
+  std::memcpy(&u, &f, sizeof(u));
+  return u;
+}
+
+inline float BitsFloat(uint32_t u) {
+  float f;
+  std::memcpy(&f, &u, sizeof(f));
+  return f;
+}
+
+// All ones when `cond` holds, zero otherwise. The special cases of the
+// conversions below are blended through masks rather than written as ?:,
+// which GCC turns back into branches that stop loops from vectorizing.
+inline uint32_t Mask(bool cond) { return 0u - static_cast<uint32_t>(cond); }
+
+inline uint32_t Select(uint32_t mask, uint32_t a, uint32_t b) {
+  return (a & mask) | (b & ~mask);
+}
+
+// IEEE binary16 to float, exact for every input including subnormals, infs
+// and NaNs.
+inline float Float16BitsToFloat(uint16_t h) {
+  constexpr uint32_t kExpMask = 0x7c00u << 13;
+  const uint32_t sign = static_cast<uint32_t>(h & 0x8000u) << 16;
+  uint32_t bits = static_cast<uint32_t>(h & 0x7fffu) << 13;
+  const uint32_t exp = bits & kExpMask;
+  bits += (127 - 15) << 23;
+  // Inf and NaN keep an all-ones exponent.
+  bits += Mask(exp == kExpMask) & ((128 - 16) << 23);
+  // Subnormals are renormalized by a float subtraction.
+  const uint32_t sub =
+      FloatBits(BitsFloat(bits + (1 << 23)) - BitsFloat(113u << 23));
+  bits = Select(Mask(exp == 0), sub, bits);
+  return BitsFloat(bits | sign);
+}
+
+// Float to IEEE binary16 with round-to-nearest-even. Overflow gives inf and
+// NaNs stay quiet NaNs.
+inline uint16_t FloatToFloat16Bits(float f) {
+  constexpr uint32_t kInf = 255u << 23;
+  constexpr uint32_t kHalfOverflow = (127u + 16) << 23;
+  constexpr uint32_t kDenormMagic = ((127u - 15) + (23 - 10) + 1) << 23;
+  uint32_t bits = FloatBits(f);
+  const uint32_t sign = bits & 0x80000000u;
+  bits ^= sign;
+  // Results below the smallest normal half are rounded by the float adder.
+  const uint32_t denorm =
+      FloatBits(BitsFloat(bits) + BitsFloat(kDenormMagic)) - kDenormMagic;
+  const uint32_t mant_odd = (bits >> 13) & 1;
+  const uint32_t normal = (bits + ((15u - 127) << 23) + 0xfff + mant_odd) >> 13;
+  uint32_t h = Select(Mask(bits < (113u << 23)), denorm, normal);
+  const uint32_t special = 0x7c00u | (Mask(bits > kInf) & 0x0200u);
+  h = Select(Mask(bits >= kHalfOverflow), special, h);
+  return static_cast<uint16_t>(h | (sign >> 16));
+}
+
+inline float BFloat16BitsToFloat(uint16_t h) {
+  return BitsFloat(static_cast<uint32_t>(h) << 16);
+}
+
+// Float to bfloat16 with round-to-nearest-even; NaNs stay quiet NaNs.
+inline uint16_t FloatToBFloat16Bits(float f) {
+  const uint32_t bits = FloatBits(f);
+  const uint32_t rounded = (bits + 0x7fffu + ((bits >> 16) & 1)) >> 16;
+  const uint32_t nan = Mask((bits & 0x7fffffffu) > 0x7f800000u);
+  return static_cast<uint16_t>(Select(nan, (bits >> 16) | 0x40, rounded));
+}
+
+}  // namespace detail
+
+// Describes a 16-bit floating point storage type to the engines. The phi
+// types are registered in kernels/phi_half.h; any trivially copyable type
+// holding the 16 bits of the format can be registered the same way.
+template <typename T>
+struct HalfTraits {
+  static constexpr bool kIsHalf = false;
+};
+
+template <typename T, HalfFormat kFormat>
+struct HalfTraitsBase {
+  static_assert(sizeof(T) == 2, "16-bit storage type expected");
+  static constexpr bool kIsHalf = true;
+  static constexpr HalfFormat kHalfFormat = kFormat;
+
+  static float ToFloat(T v) {
+    uint16_t h;
+    std::memcpy(&h, &v, sizeof(h));
+    return kFormat == HalfFormat::kFloat16 ? detail::Float16BitsToFloat(h)
+                                           : detail::BFloat16BitsToFloat(h);
+  }
+
+  static T FromFloat(float f) {
+    uint16_t h = kFormat == HalfFormat::kFloat16
+                     ? detail::FloatToFloat16Bits(f)
+                     : detail::FloatToBFloat16Bits(f);
+    T v;
+    std::memcpy(&v, &h, sizeof(h));
+    return v;
+  }
+};
+
+// The type a kernel computes and accumulates T in: float for the 16-bit
+// types, T itself otherwise.
+template <typename T>
+using AccType =
+    typename std::conditional<HalfTraits<T>::kIsHalf, float, T>::type;
+
+namespace detail {
+
+// Block conversions between the 16-bit formats and float, defined in
+// half.cc. On x86-64 they use F16C and AVX2 when the CPU has them, which
+// makes them several times faster than the portable loops.
+void Float16ToFloat(const uint16_t* src, float* dst, int64_t n);
+void FloatToFloat16(const float* src, uint16_t* dst, int64_t n);
+void BFloat16ToFloat(const uint16_t* src, float* dst, int64_t n);
+void FloatToBFloat16(const float* src, uint16_t* dst, int64_t n);
+
+template <typename To,
+          typename From,
+          bool kFromHalf = HalfTraits<From>::kIsHalf,
+          bool kToHalf = HalfTraits<To>::kIsHalf>
+struct Converter {
+  static To Apply(From v) { return static_cast<To>(v); }
+};
+
+template <typename To, typename From>
+struct Converter<To, From, true, false> {
+  static To Apply(From v) {
+    return static_cast<To>(HalfTraits<From>::ToFloat(v));
+  }
+};
+
+template <typename To, typename From>
+struct Converter<To, From, false, true> {
+  static To Apply(From v) {
+    return HalfTraits<To>::FromFloat(static_cast<float>(v));
+  }
+};
+
+template <typename To, typename From>
+struct Converter<To, From, true, true> {
+  static To Apply(From v) {
+    return HalfTraits<To>::FromFloat(HalfTraits<From>::ToFloat(v));
+  }
+};
+
+template <typename To, typename From, typename Enable = void>
+struct BlockConverter {
+  static void Apply(const From* src, To* dst, int64_t n) {
+    for (int64_t i = 0; i < n; ++i) {
+      dst[i] = Converter<To, From>::Apply(src[i]);
+    }
+  }
+};
+
+template <typename From>
+struct BlockConverter<
+    float,
+    From,
+    typename std::enable_if<HalfTraits<From>::kIsHalf>::type> {
+  static void Apply(const From* src, float* dst, int64_t n) {
+    auto bits = reinterpret_cast<const uint16_t*>(src);
+    if (HalfTraits<From>::kHalfFormat == HalfFormat::kFloat16) {
+      Float16ToFloat(bits, dst, n);
+    } else {
+      BFloat16ToFloat(bits, dst, n);
+    }
+  }
+};
+
+template <typename To>
+struct BlockConverter<To,
+                      float,
+                      typename std::enable_if<HalfTraits<To>::kIsHalf>::type> {
+  static void Apply(const float* src, To* dst, int64_t n) {
+    auto bits = reinterpret_cast<uint16_t*>(dst);
+    if (HalfTraits<To>::kHalfFormat == HalfFormat::kFloat16) {
+      FloatToFloat16(src, bits, n);
+    } else {
+      FloatToBFloat16(src, bits, n);
+    }
+  }
+};
+
+}  // namespace detail
+
+// static_cast that goes through float, bit by bit, for the 16-bit types.
+template <typename To, typename From>
+inline To Convert(From v) {
+  return detail::Converter<To, From>::Apply(v);
+}
+
+// dst[i] = Convert<To>(src[i]) for i < n.
+template <typename To, typename From>
+inline void ConvertBlock(const From* src, To* dst, int64_t n) {
+  detail::BlockConverter<To, From>::Apply(src, dst, n);
+}
+
+}  // namespace custom_kernel
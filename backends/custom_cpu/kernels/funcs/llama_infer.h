@@ -0,0 +1,513 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <list>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+// The per-step helpers of the llama serving loop in custom_op/llama_infer:
+// padding removal and restoration, token bookkeeping, stop conditions and
+// logit penalties. Sequences are independent, so every helper splits the
+// batch over the thread pool, handing each thread enough rows to cover
+// kElementwiseGrainSize elements of work.
+
+namespace custom_kernel {
+
+// Logit given to tokens that must not be sampled.
+constexpr float kBannedLogit = -1e10f;
+
+namespace detail {
+
+inline int64_t RowGrain(int64_t row_work) {
+  return std::max<int64_t>(
+      1, kElementwiseGrainSize / std::max<int64_t>(1, row_work));
+}
+
+inline bool IsEndId(int64_t id, const int64_t* end_ids, int64_t end_len) {
+  return std::find(end_ids, end_ids + end_len, id) != end_ids + end_len;
+}
+
+// Sets the logits of the `len` ids that are in the vocab to kBannedLogit.
+template <typename T>
+void BanTokens(T* row, int64_t vocab, const int64_t* ids, int64_t len) {
+  for (int64_t i = 0; i < len; ++i) {
+    if (ids[i] >= 0 && ids[i] < vocab) {
+      row[ids[i]] = Convert<T>(kBannedLogit);
+    }
+  }
+}
+
+// The repetition penalty of a logit whose token occurred `count` times.
+inline float PenalizeLogit(
+    float logit, int count, float alpha, float beta, float gamma) {
+  logit = logit < 0 ? logit * alpha : logit / alpha;
+  return logit - (count * beta + gamma);
+}
+
+}  // namespace detail
+
+// Packs the `seq_lens[b]` leading tokens of every row of the padded
+// [bsz, max_seq_len] input_ids into x_remove_padding. `cum_offsets` holds
+// the inclusive prefix sum of the padding of each row; cum_offsets_out gets
+// the exclusive one, and padding_offset the padding before each packed
+// token. cu_seqlens_q and cu_seqlens_k, when given, get the [bsz + 1]
+// offsets of every sequence in the packed tokens.
+inline void GetPaddingOffsetCompute(int64_t bsz,
+                                    int64_t max_seq_len,
+                                    const int64_t* input_ids,
+                                    const int* cum_offsets,
+                                    const int* seq_lens,
+                                    int64_t* x_remove_padding,
+                                    int* cum_offsets_out,
+                                    int* padding_offset,
+                                    int* cu_seqlens_q,
+                                    int* cu_seqlens_k) {
+  ParallelFor(
+      0, bsz, detail::RowGrain(max_seq_len), [&](int64_t begin, int64_t end) {
+        for (int64_t b = begin; b < end; ++b) {
+          const int cum_offset = b == 0 ? 0 : cum_offsets[b - 1];
+          const int64_t base = b * max_seq_len - cum_offset;
+          cum_offsets_out[b] = cum_offset;
+          std::memcpy(x_remove_padding + base,
+                      input_ids + b * max_seq_len,
+                      seq_lens[b] * sizeof(int64_t));
+          std::fill_n(padding_offset + base, seq_lens[b], cum_offset);
+          if (cu_seqlens_q) {
+            const int total = (b + 1) * max_seq_len - cum_offsets[b];
+            cu_seqlens_q[b + 1] = total;
+            cu_seqlens_k[b + 1] = total;
+          }
+        }
+      });
+  if (cu_seqlens_q) {
+    cu_seqlens_q[0] = 0;
+    cu_seqlens_k[0] = 0;
+  }
+}
+
+// out[b] = x[rows[b]] for rows of `dim` elements, or zeros where rows[b] is
+// negative.
+template <typename T>
+void GatherRowsCompute(
+    int64_t bsz, int64_t dim, const int64_t* rows, const T* x, T* out) {
+  ParallelFor(0, bsz, detail::RowGrain(dim), [&](int64_t begin, int64_t end) {
+    for (int64_t b = begin; b < end; ++b) {
+      if (rows[b] < 0) {
+        std::fill_n(out + b * dim, dim, Convert<T>(0.0f));
+      } else {
+        std::memcpy(out + b * dim, x + rows[b] * dim, dim * sizeof(T));
+      }
+    }
+  });
+}
+
+// Records the tokens of this step in pre_ids_all [bsz, length] at step_idx
+// for the running sequences: pre_ids_now[b] (v1), or for v2 the last prompt
+// token of a sequence in prefill and the first input token of one in decode.
+// `input_ids` is null for v1.
+inline void SetValueByFlagsCompute(int64_t bsz,
+                                   int64_t length,
+                                   int64_t* pre_ids_all,
+                                   const int64_t* pre_ids_now,
+                                   const int64_t* input_ids,
+                                   int64_t input_ids_stride,
+                                   const int* seq_lens_this_time,
+                                   const int* seq_lens_encoder,
+                                   const int* seq_lens_decoder,
+                                   const int64_t* step_idx,
+                                   const bool* stop_flags) {
+  ParallelFor(0, bsz, detail::RowGrain(1), [&](int64_t begin, int64_t end) {
+    for (int64_t b = begin; b < end; ++b) {
+      const int64_t step = step_idx[b];
+      if (stop_flags[b] || step < 0 || step >= length) {
+        continue;
+      }
+      if (!input_ids) {
+        pre_ids_all[b * length + step] = pre_ids_now[b];
+        continue;
+      }
+      const int encoder = seq_lens_encoder[b];
+      const int decoder = seq_lens_decoder[b];
+      if (seq_lens_this_time[b] == 0 || (encoder == 0 && decoder == 0)) {
+        continue;
+      }
+      const int64_t* ids = input_ids + b * input_ids_stride;
+      pre_ids_all[b * length + step] = decoder == 0 ? ids[encoder - 1] : ids[0];
+    }
+  });
+}
+
+// v1 stop check: a stopped sequence emits end_ids[0] (mode 0) or -1
+// (mode 1), and a sequence whose token is an end id stops.
+inline void SetStopValueCompute(int64_t bsz,
+                                int64_t mode,
+                                const int64_t* end_ids,
+                                int64_t end_len,
+                                int64_t* topk_ids,
+                                bool* stop_flags) {
+  ParallelFor(
+      0, bsz, detail::RowGrain(end_len), [&](int64_t begin, int64_t end) {
+        for (int64_t b = begin; b < end; ++b) {
+          if (stop_flags[b]) {
+            topk_ids[b] = mode == 0 ? end_ids[0] : -1;
+          } else if (detail::IsEndId(topk_ids[b], end_ids, end_len)) {
+            stop_flags[b] = true;
+          }
+        }
+      });
+}
+
+// v2 stop check: a stopped sequence emits end_ids[0], or -1 once it has no
+// tokens left; a running one passes its token on to next_tokens and stops
+// on an end id.
+inline void SetStopValueV2Compute(int64_t bsz,
+                                  const int* seq_lens,
+                                  const int64_t* end_ids,
+                                  int64_t end_len,
+                                  int64_t* topk_ids,
+                                  bool* stop_flags,
+                                  int64_t* next_tokens) {
+  ParallelFor(
+      0, bsz, detail::RowGrain(end_len), [&](int64_t begin, int64_t end) {
+        for (int64_t b = begin; b < end; ++b) {
+          if (stop_flags[b]) {
+            if (seq_lens[b] == 0) {
+              topk_ids[b] = -1;
+            } else {
+              topk_ids[b] = end_ids[0];
+              next_tokens[b] = end_ids[0];
+            }
+          } else {
+            next_tokens[b] = topk_ids[b];
+            if (detail::IsEndId(topk_ids[b], end_ids, end_len)) {
+              stop_flags[b] = true;
+            }
+          }
+        }
+      });
+}
+
+// Moves every sequence of a [bsz] batch to its next decode step: a running
+// sequence decodes one token at the position after its prompt or its last
+// token, and takes next_tokens[b] as its input; a stopped one is emptied.
+// Returns whether generation goes on: slots up to `max_bsz` that are
+// stopped, other than preempted ones waiting for blocks, are fewer than
+// `stop_num`. The batch is small and the count is a reduction, so this runs
+// on the calling thread.
+inline bool UpdateInputsCompute(int64_t bsz,
+                                int64_t max_bsz,
+                                const bool* stop_flags,
+                                const bool* is_block_step,
+                                int* seq_lens_this_time,
+                                int* seq_lens_encoder,
+                                int* seq_lens_decoder,
+                                int64_t* input_ids,
+                                int64_t input_ids_stride,
+                                const int64_t* next_tokens,
+                                int64_t stop_num) {
+  int64_t stopped = max_bsz - bsz;
+  for (int64_t b = 0; b < bsz; ++b) {
+    const bool stop = stop_flags[b];
+    stopped += stop && !is_block_step[b];
+    const int decoder = seq_lens_decoder[b];
+    seq_lens_decoder[b] =
+        stop ? 0 : (decoder == 0 ? seq_lens_encoder[b] : decoder + 1);
+    seq_lens_this_time[b] = stop ? 0 : 1;
+    seq_lens_encoder[b] = 0;
+    input_ids[b * input_ids_stride] = next_tokens[b];
+  }
+  return stopped < stop_num;
+}
+
+// Applies the sampling penalties to logits [bsz, vocab] in place. For a
+// sequence with cur_len[b] >= 0:
+//  - before min_len[b] tokens, the end tokens are banned;
+//  - every token that occurs n > 0 times in its pre_ids row (read up to the
+//    first negative id) is divided by penalty_scores[b] when positive and
+//    multiplied by it when negative, then lowered by
+//    n * frequency_scores[b] + presence_scores[b];
+//  - with temperatures, every logit is divided by temperatures[b];
+//  - the `bad_len` bad_tokens are banned.
+// Each thread counts occurrences in a vocab-sized scratch of its own.
+template <typename T>
+void TokenPenaltyCompute(int64_t bsz,
+                         int64_t vocab,
+                         const int64_t* pre_ids,
+                         int64_t pre_len,
+                         T* logits,
+                         const T* penalty_scores,
+                         const T* frequency_scores,
+                         const T* presence_scores,
+                         const float* temperatures,
+                         const int64_t* bad_tokens,
+                         int64_t bad_len,
+                         const int64_t* cur_len,
+                         const int64_t* min_len,
+                         const int64_t* eos_token_id,
+                         int64_t eos_len) {
+  ParallelFor(0, bsz, detail::RowGrain(vocab), [&](int64_t begin, int64_t end) {
+    std::vector<int> repeat(vocab);
+    for (int64_t b = begin; b < end; ++b) {
+      if (cur_len[b] < 0) {
+        continue;
+      }
+      T* row = logits + b * vocab;
+      if (cur_len[b] < min_len[b]) {
+        detail::BanTokens(row, vocab, eos_token_id, eos_len);
+      }
+      std::fill(repeat.begin(), repeat.end(), 0);
+      const int64_t* ids = pre_ids + b * pre_len;
+      for (int64_t i = 0; i < pre_len && ids[i] >= 0; ++i) {
+        if (ids[i] < vocab) {
+          ++repeat[ids[i]];
+        }
+      }
+      const float alpha = Convert<float>(penalty_scores[b]);
+      const float beta = Convert<float>(frequency_scores[b]);
+      const float gamma = Convert<float>(presence_scores[b]);
+      const float scale = temperatures ? 1.0f / temperatures[b] : 1.0f;
+      for (int64_t i = 0; i < vocab; ++i) {
+        float logit = Convert<float>(row[i]);
+        if (repeat[i] != 0) {
+          logit = detail::PenalizeLogit(logit, repeat[i], alpha, beta, gamma);
+        } else if (!temperatures) {
+          continue;
+        }
+        row[i] = Convert<T>(logit * scale);
+      }
+      detail::BanTokens(row, vocab, bad_tokens, bad_len);
+    }
+  });
+}
+
+// Occurrence counts of the tokens in the pre_ids rows of a batch, kept
+// from one decode step to the next. A step only reads the ids appended to
+// each row since the previous one, so keeping the counts current costs one
+// hash update per generated token instead of a pass over the row.
+class TokenCounter {
+ public:
+  // The distinct tokens of one sequence, in order of first occurrence.
+  struct Counts {
+    std::vector<int64_t> tokens;
+    std::vector<int> counts;
+    std::unordered_map<int64_t, int> index;  // token -> position
+    int64_t counted = 0;                     // ids of the row read so far
+    int64_t first_id = -1;
+    int64_t last_id = -1;
+    int64_t cur_len = -1;
+  };
+
+  // Binds the counter to a [bsz, pre_len] pre_ids buffer. Another buffer,
+  // shape or vocab drops every count.
+  void Bind(const int64_t* pre_ids,
+            int64_t bsz,
+            int64_t pre_len,
+            int64_t vocab) {
+    if (pre_ids != pre_ids_ || pre_len != pre_len_ || vocab != vocab_ ||
+        bsz != static_cast<int64_t>(seqs_.size())) {
+      pre_ids_ = pre_ids;
+      pre_len_ = pre_len;
+      vocab_ = vocab;
+      seqs_.assign(bsz, Counts());
+    }
+  }
+
+  // Brings the counts of sequence b up to date with its pre_ids row, read
+  // up to the first negative id. The row must continue the ids counted so
+  // far and have grown by as many ids as cur_len advanced; otherwise it
+  // holds a new sequence, or the buffer was reused for another generation
+  // at the same address, and is counted from its start. Different
+  // sequences may be updated from different threads.
+  const Counts& Update(int64_t b, int64_t cur_len) {
+    Counts& seq = seqs_[b];
+    const int64_t* ids = pre_ids_ + b * pre_len_;
+    int64_t end = seq.counted;
+    while (end < pre_len_ && ids[end] >= 0) {
+      ++end;
+    }
+    if (seq.counted > 0 &&
+        (cur_len - seq.cur_len != end - seq.counted || ids[0] != seq.first_id ||
+         ids[seq.counted - 1] != seq.last_id)) {
+      seq.tokens.clear();
+      seq.counts.clear();
+      seq.index.clear();
+      seq.counted = 0;
+    }
+    seq.cur_len = cur_len;
+    for (; seq.counted < pre_len_ && ids[seq.counted] >= 0; ++seq.counted) {
+      const int64_t id = ids[seq.counted];
+      if (id >= vocab_) {
+        continue;
+      }
+      auto it = seq.index.emplace(id, static_cast<int>(seq.tokens.size()));
+      if (it.second) {
+        seq.tokens.push_back(id);
+        seq.counts.push_back(1);
+      } else {
+        ++seq.counts[it.first->second];
+      }
+    }
+    if (seq.counted > 0) {
+      seq.first_id = ids[0];
+      seq.last_id = ids[seq.counted - 1];
+    }
+    return seq;
+  }
+
+ private:
+  const int64_t* pre_ids_ = nullptr;
+  int64_t pre_len_ = 0;
+  int64_t vocab_ = 0;
+  std::vector<Counts> seqs_;
+};
+
+// The TokenCounters of the pre_ids buffers seen last, one per buffer, so
+// that generation loops with buffers of their own keep their own counts.
+// Beyond kMaxBuffers buffers the least recently used counter is dropped.
+class TokenCounterPool {
+ public:
+  static constexpr size_t kMaxBuffers = 8;
+
+  TokenCounter* Get(const int64_t* pre_ids) {
+    for (auto it = counters_.begin(); it != counters_.end(); ++it) {
+      if (it->first == pre_ids) {
+        counters_.splice(counters_.begin(), counters_, it);
+        return &counters_.front().second;
+      }
+    }
+    counters_.emplace_front(pre_ids, TokenCounter());
+    if (counters_.size() > kMaxBuffers) {
+      counters_.pop_back();
+    }
+    return &counters_.front().second;
+  }
+
+ private:
+  std::list<std::pair<const int64_t*, TokenCounter>> counters_;
+};
+
+// TokenPenaltyCompute on the counts of `counter`, which is bound to
+// pre_ids here and must be passed again with the same buffer on the next
+// step. Only the logits of generated, end and bad tokens are touched, so
+// a step costs the tokens generated rather than the vocab; a temperature
+// other than 1 still scales the whole row.
+template <typename T>
+void SparseTokenPenaltyCompute(TokenCounter* counter,
+                               int64_t bsz,
+                               int64_t vocab,
+                               const int64_t* pre_ids,
+                               int64_t pre_len,
+                               T* logits,
+                               const T* penalty_scores,
+                               const T* frequency_scores,
+                               const T* presence_scores,
+                               const float* temperatures,
+                               const int64_t* bad_tokens,
+                               int64_t bad_len,
+                               const int64_t* cur_len,
+                               const int64_t* min_len,
+                               const int64_t* eos_token_id,
+                               int64_t eos_len) {
+  counter->Bind(pre_ids, bsz, pre_len, vocab);
+  const int64_t row_work = temperatures ? vocab : pre_len;
+  ParallelFor(
+      0, bsz, detail::RowGrain(row_work), [&](int64_t begin, int64_t end) {
+        std::vector<float> penalized;
+        for (int64_t b = begin; b < end; ++b) {
+          if (cur_len[b] < 0) {
+            continue;
+          }
+          T* row = logits + b * vocab;
+          if (cur_len[b] < min_len[b]) {
+            detail::BanTokens(row, vocab, eos_token_id, eos_len);
+          }
+          const auto& seq = counter->Update(b, cur_len[b]);
+          const float alpha = Convert<float>(penalty_scores[b]);
+          const float beta = Convert<float>(frequency_scores[b]);
+          const float gamma = Convert<float>(presence_scores[b]);
+          penalized.resize(seq.tokens.size());
+          for (size_t i = 0; i < seq.tokens.size(); ++i) {
+            penalized[i] =
+                detail::PenalizeLogit(Convert<float>(row[seq.tokens[i]]),
+                                      seq.counts[i],
+                                      alpha,
+                                      beta,
+                                      gamma);
+          }
+          // The penalized logits are scaled before they are rounded, as
+          // in the dense version.
+          float scale = 1.0f;
+          if (temperatures && temperatures[b] != 1.0f) {
+            scale = 1.0f / temperatures[b];
+            for (int64_t i = 0; i < vocab; ++i) {
+              row[i] = Convert<T>(Convert<float>(row[i]) * scale);
+            }
+          }
+          for (size_t i = 0; i < seq.tokens.size(); ++i) {
+            row[seq.tokens[i]] = Convert<T>(penalized[i] * scale);
+          }
+          detail::BanTokens(row, vocab, bad_tokens, bad_len);
+        }
+      });
+}
+
+// Writes the first seq_lens[b] positions of k and v, [bsz, heads, seq_len,
+// dim], into the KV cache of fused_multi_transformer: the key cache is
+// [bsz, heads, dim / x, max_seq_len, x] with x elements in 16 bytes, and
+// the value cache [bsz, heads, max_seq_len, dim].
+template <typename T>
+void WriteCacheKVCompute(int64_t bsz,
+                         int64_t heads,
+                         int64_t seq_len,
+                         int64_t dim,
+                         int64_t max_seq_len,
+                         const T* k,
+                         const T* v,
+                         const int* seq_lens,
+                         T* cache_k,
+                         T* cache_v) {
+  constexpr int64_t x = 16 / sizeof(T);
+  ParallelFor(
+      0,
+      bsz * heads,
+      detail::RowGrain(seq_len * dim),
+      [&](int64_t begin, int64_t end) {
+        for (int64_t bh = begin; bh < end; ++bh) {
+          const int64_t len = std::min<int64_t>(seq_lens[bh / heads], seq_len);
+          const T* k_src = k + bh * seq_len * dim;
+          const T* v_src = v + bh * seq_len * dim;
+          T* k_dst = cache_k + bh * max_seq_len * dim;
+          std::memcpy(
+              cache_v + bh * max_seq_len * dim, v_src, len * dim * sizeof(T));
+          for (int64_t chunk = 0; chunk < dim / x; ++chunk) {
+            T* dst = k_dst + chunk * max_seq_len * x;
+            for (int64_t s = 0; s < len; ++s) {
+              std::memcpy(
+                  dst + s * x, k_src + s * dim + chunk * x, x * sizeof(T));
+            }
+          }
+        }
+      });
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,326 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <vector>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread.
+constexpr int64_t kNormGrainSize = 32768;
+
+// The inputs of a normalization over the last `cols` elements of `rows`
+// rows. The row normalized is x + bias + residual_alpha * residual, with
+// bias [cols] and residual [rows, cols] both optional. weight and
+// norm_bias [cols], also optional, scale and shift the normalized row.
+// Parameters are given in the accumulation type of T whatever their
+// tensor's dtype.
+template <typename T>
+struct NormInputs {
+  const T* x;
+  const T* residual = nullptr;
+  AccType<T> residual_alpha = 1;
+  const AccType<T>* bias = nullptr;
+  const AccType<T>* weight = nullptr;
+  const AccType<T>* norm_bias = nullptr;
+};
+
+// Gradients of the parameters of a normalization, each optional.
+template <typename AccT>
+struct NormParamGrads {
+  AccT* weight = nullptr;
+  AccT* norm_bias = nullptr;
+};
+
+namespace detail {
+
+// y = x + bias + residual_alpha * residual for row r, also stored to
+// residual_out when given. Returns the sum of y and the sum of its squares.
+template <typename T>
+void FusedRow(const NormInputs<T>& in,
+              int64_t r,
+              int64_t cols,
+              AccType<T>* y,
+              T* residual_out,
+              AccType<T>* sum,
+              AccType<T>* square_sum) {
+  using AccT = AccType<T>;
+  const T* x = in.x + r * cols;
+  for (int64_t j = 0; j < cols; ++j) {
+    y[j] = Convert<AccT>(x[j]);
+  }
+  if (in.bias) {
+    for (int64_t j = 0; j < cols; ++j) {
+      y[j] += in.bias[j];
+    }
+  }
+  if (in.residual) {
+    const T* res = in.residual + r * cols;
+    for (int64_t j = 0; j < cols; ++j) {
+      y[j] += in.residual_alpha * Convert<AccT>(res[j]);
+    }
+  }
+  if (residual_out) {
+    T* dst = residual_out + r * cols;
+    for (int64_t j = 0; j < cols; ++j) {
+      dst[j] = Convert<T>(y[j]);
+    }
+  }
+  AccT s = 0, sq = 0;
+  for (int64_t j = 0; j < cols; ++j) {
+    s += y[j];
+    sq += y[j] * y[j];
+  }
+  *sum = s;
+  *square_sum = sq;
+}
+
+// out = (y - mean) * rstd * weight + norm_bias for one row.
+template <typename T>
+void NormalizeRow(const NormInputs<T>& in,
+                  int64_t cols,
+                  const AccType<T>* y,
+                  AccType<T> mean,
+                  AccType<T> rstd,
+                  T* out) {
+  for (int64_t j = 0; j < cols; ++j) {
+    AccType<T> v = (y[j] - mean) * rstd;
+    if (in.weight) {
+      v *= in.weight[j];
+    }
+    if (in.norm_bias) {
+      v += in.norm_bias[j];
+    }
+    out[j] = Convert<T>(v);
+  }
+}
+
+// The row gradient of a normalization y_hat = (y - mean) * rstd, where
+// center says whether the mean was subtracted:
+//   dy = rstd * (g - mean(g) - y_hat * mean(g * y_hat)), g = dout * weight
+// and without centering the mean(g) term drops out. The parameter grads
+// of the row are added to the accumulators.
+template <typename T>
+void NormGradRow(const NormInputs<T>& in,
+                 int64_t cols,
+                 bool center,
+                 const AccType<T>* y,
+                 const T* dout,
+                 AccType<T> mean,
+                 AccType<T> rstd,
+                 T* dx,
+                 AccType<T>* dweight,
+                 AccType<T>* dnorm_bias) {
+  using AccT = AccType<T>;
+  AccT g_sum = 0, gy_sum = 0;
+  for (int64_t j = 0; j < cols; ++j) {
+    const AccT d = Convert<AccT>(dout[j]);
+    const AccT y_hat = (y[j] - mean) * rstd;
+    const AccT g = in.weight ? d * in.weight[j] : d;
+    g_sum += g;
+    gy_sum += g * y_hat;
+    if (dweight) {
+      dweight[j] += d * y_hat;
+    }
+    if (dnorm_bias) {
+      dnorm_bias[j] += d;
+    }
+  }
+  const AccT g_mean = center ? g_sum / cols : AccT(0);
+  const AccT gy_mean = gy_sum / cols;
+  for (int64_t j = 0; j < cols; ++j) {
+    const AccT d = Convert<AccT>(dout[j]);
+    const AccT g = in.weight ? d * in.weight[j] : d;
+    const AccT y_hat = (y[j] - mean) * rstd;
+    dx[j] = Convert<T>(rstd * (g - g_mean - y_hat * gy_mean));
+  }
+}
+
+template <typename T>
+void NormBackward(int64_t rows,
+                  int64_t cols,
+                  bool center,
+                  const NormInputs<T>& in,
+                  const AccType<T>* mean,
+                  const AccType<T>* rstd,
+                  const T* dout,
+                  T* dx,
+                  const NormParamGrads<AccType<T>>& grads) {
+  using AccT = AccType<T>;
+  const bool weight_grad = grads.weight != nullptr;
+  const bool bias_grad = grads.norm_bias != nullptr;
+  const int64_t grain = std::max<int64_t>(1, kNormGrainSize / cols);
+  // Parameter grads are summed per chunk of rows and the chunks combined
+  // in order, so they do not depend on the number of threads.
+  auto partial = ParallelReduce(
+      0,
+      rows,
+      grain,
+      std::vector<AccT>(),
+      [&](int64_t begin, int64_t end) {
+        std::vector<AccT> acc((weight_grad + bias_grad) * cols, AccT(0));
+        AccT* dw = weight_grad ? acc.data() : nullptr;
+        AccT* db = bias_grad ? acc.data() + weight_grad * cols : nullptr;
+        std::vector<AccT> y(cols);
+        for (int64_t r = begin; r < end; ++r) {
+          AccT sum, square_sum;
+          FusedRow<T>(in, r, cols, y.data(), nullptr, &sum, &square_sum);
+          NormGradRow(in,
+                      cols,
+                      center,
+                      y.data(),
+                      dout + r * cols,
+                      center ? mean[r] : AccT(0),
+                      rstd[r],
+                      dx + r * cols,
+                      dw,
+                      db);
+        }
+        return acc;
+      },
+      [](std::vector<AccT> a, const std::vector<AccT>& b) {
+        if (a.empty()) {
+          return b;
+        }
+        for (size_t i = 0; i < a.size(); ++i) {
+          a[i] += b[i];
+        }
+        return a;
+      });
+  partial.resize((weight_grad + bias_grad) * cols, AccT(0));
+  if (weight_grad) {
+    std::copy(partial.begin(), partial.begin() + cols, grads.weight);
+  }
+  if (bias_grad) {
+    std::copy(partial.begin() + weight_grad * cols,
+              partial.begin() + (weight_grad + 1) * cols,
+              grads.norm_bias);
+  }
+}
+
+}  // namespace detail
+
+// RMS normalization of each row in one read of its inputs:
+//   out = y / sqrt(mean(y^2) + epsilon) * weight + norm_bias
+// with y the fused row of `in`. residual_out, when given, receives y and
+// inv_rms receives 1 / sqrt(mean(y^2) + epsilon) per row.
+template <typename T>
+void RmsNormForward(int64_t rows,
+                    int64_t cols,
+                    const NormInputs<T>& in,
+                    float epsilon,
+                    T* out,
+                    T* residual_out,
+                    AccType<T>* inv_rms) {
+  using AccT = AccType<T>;
+  const int64_t grain = std::max<int64_t>(1, kNormGrainSize / cols);
+  ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    std::vector<AccT> y(cols);
+    for (int64_t r = begin; r < end; ++r) {
+      AccT sum, square_sum;
+      detail::FusedRow(in, r, cols, y.data(), residual_out, &sum, &square_sum);
+      const AccT rstd = AccT(1) / std::sqrt(square_sum / cols + epsilon);
+      detail::NormalizeRow(in, cols, y.data(), AccT(0), rstd, out + r * cols);
+      if (inv_rms) {
+        inv_rms[r] = rstd;
+      }
+    }
+  });
+}
+
+// Layer normalization of each row in one read of its inputs:
+//   out = (y - mean(y)) / sqrt(var(y) + epsilon) * weight + norm_bias
+// with y the fused row of `in`. residual_out, mean and variance receive y
+// and its statistics when given. The variance is computed around the mean
+// from the row kept in cache, not from the sum of squares.
+template <typename T>
+void LayerNormForward(int64_t rows,
+                      int64_t cols,
+                      const NormInputs<T>& in,
+                      float epsilon,
+                      T* out,
+                      T* residual_out,
+                      AccType<T>* mean,
+                      AccType<T>* variance) {
+  using AccT = AccType<T>;
+  const int64_t grain = std::max<int64_t>(1, kNormGrainSize / cols);
+  ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    std::vector<AccT> y(cols);
+    for (int64_t r = begin; r < end; ++r) {
+      AccT sum, square_sum;
+      detail::FusedRow(in, r, cols, y.data(), residual_out, &sum, &square_sum);
+      const AccT m = sum / cols;
+      AccT var = 0;
+      for (int64_t j = 0; j < cols; ++j) {
+        var += (y[j] - m) * (y[j] - m);
+      }
+      var /= cols;
+      detail::NormalizeRow(in,
+                           cols,
+                           y.data(),
+                           m,
+                           AccT(1) / std::sqrt(var + epsilon),
+                           out + r * cols);
+      if (mean) {
+        mean[r] = m;
+      }
+      if (variance) {
+        variance[r] = var;
+      }
+    }
+  });
+}
+
+// Gradients of RmsNormForward() from dout and its inv_rms. dx is the grad
+// of the fused row, which is also that of x and of residual.
+template <typename T>
+void RmsNormBackward(int64_t rows,
+                     int64_t cols,
+                     const NormInputs<T>& in,
+                     const AccType<T>* inv_rms,
+                     const T* dout,
+                     T* dx,
+                     const NormParamGrads<AccType<T>>& grads) {
+  detail::NormBackward(
+      rows, cols, false, in, nullptr, inv_rms, dout, dx, grads);
+}
+
+// Gradients of LayerNormForward() from dout, its mean and its variance.
+template <typename T>
+void LayerNormBackward(int64_t rows,
+                       int64_t cols,
+                       const NormInputs<T>& in,
+                       float epsilon,
+                       const AccType<T>* mean,
+                       const AccType<T>* variance,
+                       const T* dout,
+                       T* dx,
+                       const NormParamGrads<AccType<T>>& grads) {
+  using AccT = AccType<T>;
+  std::vector<AccT> rstd(rows);
+  for (int64_t r = 0; r < rows; ++r) {
+    rstd[r] = AccT(1) / std::sqrt(variance[r] + epsilon);
+  }
+  detail::NormBackward(
+      rows, cols, true, in, mean, rstd.data(), dout, dx, grads);
+}
+
+}  // namespace custom_kernel
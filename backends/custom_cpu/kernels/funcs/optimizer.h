@@ -0,0 +1,255 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <vector>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread. An optimizer step reads
+// and writes four to six arrays per element.
+constexpr int64_t kOptimizerGrainSize = 16384;
+
+// Runs fn(tensor, begin, end) over every element of a list of tensors as if
+// they were one flat buffer, so a group of small parameters is split across
+// the thread pool in a single pass instead of one parallel loop each. A
+// chunk that straddles tensors calls fn once per tensor it covers.
+template <typename Tensor, typename Fn>
+void ForEachTensorChunk(const std::vector<Tensor>& tensors,
+                        int64_t grain,
+                        const Fn& fn) {
+  std::vector<int64_t> offsets(tensors.size() + 1, 0);
+  for (size_t i = 0; i < tensors.size(); ++i) {
+    offsets[i + 1] = offsets[i] + tensors[i].numel;
+  }
+  ParallelFor(0, offsets.back(), grain, [&](int64_t begin, int64_t end) {
+    size_t i = std::upper_bound(offsets.begin(), offsets.end(), begin) -
+               offsets.begin() - 1;
+    for (; begin < end; ++i) {
+      const int64_t stop = std::min(end, offsets[i + 1]);
+      if (stop > begin) {
+        fn(tensors[i], begin - offsets[i], stop - offsets[i]);
+      }
+      begin = stop;
+    }
+  });
+}
+
+// Settings shared by every parameter of an Adam or AdamW step.
+template <typename AccT>
+struct AdamConfig {
+  AccT beta1;
+  AccT beta2;
+  AccT epsilon;
+  // Decoupled weight decay of AdamW, scaled by the learning rate. 0 for
+  // Adam.
+  AccT coeff;
+  bool amsgrad;
+};
+
+// The buffers of one parameter of an Adam step. T is the parameter type and
+// MT the type its moments are kept in: AccType<T> for mixed precision, T
+// otherwise. master and master_out are set only when a float32 master copy
+// takes the update; moment2_max and moment2_max_out only for AMSGrad.
+template <typename T, typename MT>
+struct AdamTensor {
+  using AccT = AccType<T>;
+
+  const T* param;
+  const T* grad;
+  const MT* moment1;
+  const MT* moment2;
+  const MT* moment2_max;
+  const AccT* master;
+  T* param_out;
+  MT* moment1_out;
+  MT* moment2_out;
+  MT* moment2_max_out;
+  AccT* master_out;
+  int64_t numel;
+  AccT lr;
+  AccT beta1_pow;
+  AccT beta2_pow;
+};
+
+namespace detail {
+
+// The Adam update of elements [begin, end) of one tensor. The optional
+// buffers are template flags so that each variant is a branch-free loop.
+template <bool kMaster, bool kAmsgrad, typename T, typename MT>
+void AdamRange(const AdamTensor<T, MT>& t,
+               const AdamConfig<AccType<T>>& config,
+               int64_t begin,
+               int64_t end) {
+  using AccT = AccType<T>;
+  const AccT beta1 = config.beta1;
+  const AccT beta2 = config.beta2;
+  const AccT sqrt_bias2 = std::sqrt(1 - t.beta2_pow);
+  const AccT step = t.lr * sqrt_bias2 / (1 - t.beta1_pow);
+  const AccT eps = config.epsilon * sqrt_bias2;
+  const AccT decay = 1 - t.lr * config.coeff;
+  // Locals, so that the stores below cannot alias them.
+  const T* param = t.param;
+  const T* grad = t.grad;
+  const MT* moment1 = t.moment1;
+  const MT* moment2 = t.moment2;
+  const MT* moment2_max = t.moment2_max;
+  const AccT* master = t.master;
+  T* param_out = t.param_out;
+  MT* moment1_out = t.moment1_out;
+  MT* moment2_out = t.moment2_out;
+  MT* moment2_max_out = t.moment2_max_out;
+  AccT* master_out = t.master_out;
+  for (int64_t i = begin; i < end; ++i) {
+    const AccT g = Convert<AccT>(grad[i]);
+    const AccT m1 = beta1 * Convert<AccT>(moment1[i]) + (1 - beta1) * g;
+    AccT m2 = beta2 * Convert<AccT>(moment2[i]) + (1 - beta2) * g * g;
+    moment1_out[i] = Convert<MT>(m1);
+    moment2_out[i] = Convert<MT>(m2);
+    if (kAmsgrad) {
+      m2 = std::max(m2, Convert<AccT>(moment2_max[i]));
+      moment2_max_out[i] = Convert<MT>(m2);
+    }
+    AccT p = kMaster ? master[i] : Convert<AccT>(param[i]);
+    p = p * decay - step * m1 / (std::sqrt(m2) + eps);
+    if (kMaster) {
+      master_out[i] = p;
+    }
+    param_out[i] = Convert<T>(p);
+  }
+}
+
+}  // namespace detail
+
+// One Adam/AdamW step over all the tensors, computed in AccType<T>:
+//   m1 = beta1 * m1 + (1 - beta1) * g
+//   m2 = beta2 * m2 + (1 - beta2) * g * g
+//   p = p * (1 - lr * coeff) - lr_t * m1 / (sqrt(m2) + eps_t)
+// with lr_t = lr * sqrt(1 - beta2_pow) / (1 - beta1_pow) and
+// eps_t = epsilon * sqrt(1 - beta2_pow). AMSGrad divides by the running
+// maximum of m2 instead.
+template <typename T, typename MT>
+void AdamCompute(const std::vector<AdamTensor<T, MT>>& tensors,
+                 const AdamConfig<AccType<T>>& config) {
+  ForEachTensorChunk(
+      tensors,
+      kOptimizerGrainSize,
+      [&](const AdamTensor<T, MT>& t, int64_t begin, int64_t end) {
+        if (t.master) {
+          config.amsgrad
+              ? detail::AdamRange<true, true>(t, config, begin, end)
+              : detail::AdamRange<true, false>(t, config, begin, end);
+        } else {
+          config.amsgrad
+              ? detail::AdamRange<false, true>(t, config, begin, end)
+              : detail::AdamRange<false, false>(t, config, begin, end);
+        }
+      });
+}
+
+// Settings shared by every parameter of a momentum step.
+template <typename AccT>
+struct MomentumConfig {
+  AccT mu;
+  bool use_nesterov;
+  AccT rescale_grad;
+};
+
+// The buffers of one parameter of a momentum step, laid out as AdamTensor.
+// MT is the velocity type.
+template <typename T, typename MT>
+struct MomentumTensor {
+  using AccT = AccType<T>;
+
+  const T* param;
+  const T* grad;
+  const MT* velocity;
+  const AccT* master;
+  T* param_out;
+  MT* velocity_out;
+  AccT* master_out;
+  int64_t numel;
+  AccT lr;
+  // Coefficient of L2 decay added to the gradient, 0 for none.
+  AccT l2_coeff;
+};
+
+namespace detail {
+
+// The momentum update of elements [begin, end) of one tensor, unswitched as
+// AdamRange.
+template <bool kMaster, bool kNesterov, typename T, typename MT>
+void MomentumRange(const MomentumTensor<T, MT>& t,
+                   const MomentumConfig<AccType<T>>& config,
+                   int64_t begin,
+                   int64_t end) {
+  using AccT = AccType<T>;
+  const AccT mu = config.mu;
+  const AccT rescale_grad = config.rescale_grad;
+  const AccT lr = t.lr;
+  const AccT l2_coeff = t.l2_coeff;
+  const T* param = t.param;
+  const T* grad = t.grad;
+  const MT* velocity = t.velocity;
+  const AccT* master = t.master;
+  T* param_out = t.param_out;
+  MT* velocity_out = t.velocity_out;
+  AccT* master_out = t.master_out;
+  for (int64_t i = begin; i < end; ++i) {
+    AccT p = kMaster ? master[i] : Convert<AccT>(param[i]);
+    const AccT g = rescale_grad * Convert<AccT>(grad[i]) + l2_coeff * p;
+    const AccT v = mu * Convert<AccT>(velocity[i]) + g;
+    velocity_out[i] = Convert<MT>(v);
+    p -= kNesterov ? lr * (g + mu * v) : lr * v;
+    if (kMaster) {
+      master_out[i] = p;
+    }
+    param_out[i] = Convert<T>(p);
+  }
+}
+
+}  // namespace detail
+
+// One momentum step over all the tensors, computed in AccType<T>:
+//   g = rescale_grad * g + l2_coeff * p
+//   v = mu * v + g
+//   p = p - lr * (g + mu * v)   with Nesterov,
+//   p = p - lr * v              otherwise.
+template <typename T, typename MT>
+void MomentumCompute(const std::vector<MomentumTensor<T, MT>>& tensors,
+                     const MomentumConfig<AccType<T>>& config) {
+  ForEachTensorChunk(
+      tensors,
+      kOptimizerGrainSize,
+      [&](const MomentumTensor<T, MT>& t, int64_t begin, int64_t end) {
+        if (t.master) {
+          config.use_nesterov
+              ? detail::MomentumRange<true, true>(t, config, begin, end)
+              : detail::MomentumRange<true, false>(t, config, begin, end);
+        } else {
+          config.use_nesterov
+              ? detail::MomentumRange<false, true>(t, config, begin, end)
+              : detail::MomentumRange<false, false>(t, config, begin, end);
+        }
+      });
+}
+
+}  // namespace custom_kernel
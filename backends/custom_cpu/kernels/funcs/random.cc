@@ -0,0 +1,86 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/random.h"
+
+#include <atomic>
+#include <random>
+
+#include "runtime/flags.h"
+
+namespace custom_kernel {
+
+namespace {
+
+std::atomic<int> current_device{0};
+
+constexpr int kMaxDevices = 64;
+
+// Generators are created once per device and never destroyed, as the
+// thread pools are.
+std::atomic<Generator*> device_generators[kMaxDevices];
+std::mutex device_generators_mutex;
+
+uint64_t SeedFromEnv() {
+  if (getenv("FLAGS_custom_cpu_seed")) {
+    return EnvToUInt("FLAGS_custom_cpu_seed", 0);
+  }
+  std::random_device device;
+  return (static_cast<uint64_t>(device()) << 32) | device();
+}
+
+}  // namespace
+
+Generator& Generator::Instance() {
+  return ForDevice(current_device.load(std::memory_order_relaxed));
+}
+
+Generator& Generator::ForDevice(int device_id) {
+  auto& slot =
+      device_generators[std::min(std::max(device_id, 0), kMaxDevices - 1)];
+  Generator* generator = slot.load(std::memory_order_acquire);
+  if (!generator) {
+    std::lock_guard<std::mutex> lock(device_generators_mutex);
+    generator = slot.load(std::memory_order_relaxed);
+    if (!generator) {
+      generator = new Generator(SeedFromEnv());
+      slot.store(generator, std::memory_order_release);
+    }
+  }
+  return *generator;
+}
+
+void Generator::SetCurrentDevice(int device_id) {
+  current_device.store(device_id, std::memory_order_relaxed);
+}
+
+void Generator::SetSeed(uint64_t seed) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  seed_ = seed;
+  offset_ = 0;
+}
+
+uint64_t Generator::Seed() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  return seed_;
+}
+
+PhiloxState Generator::Reserve(uint64_t n) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  PhiloxState state = {seed_, offset_};
+  offset_ += n;
+  return state;
+}
+
+}  // namespace custom_kernel
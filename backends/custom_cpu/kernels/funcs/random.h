@@ -0,0 +1,234 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <mutex>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of generated values handed to one thread.
+constexpr int64_t kRandomGrainSize = 16384;
+
+// Philox4x32-10 (Salmon et al., "Parallel random numbers: as easy as 1, 2,
+// 3"): four 32-bit random words are a pure function of a 64-bit key and a
+// 128-bit counter, so any element of a stream can be generated on its own.
+struct Philox4x32 {
+  static void Generate(uint64_t key, uint64_t counter, uint32_t out[4]) {
+    constexpr uint32_t kM0 = 0xD2511F53;
+    constexpr uint32_t kM1 = 0xCD9E8D57;
+    constexpr uint32_t kW0 = 0x9E3779B9;
+    constexpr uint32_t kW1 = 0xBB67AE85;
+    uint32_t c0 = static_cast<uint32_t>(counter);
+    uint32_t c1 = static_cast<uint32_t>(counter >> 32);
+    uint32_t c2 = 0;
+    uint32_t c3 = 0;
+    uint32_t k0 = static_cast<uint32_t>(key);
+    uint32_t k1 = static_cast<uint32_t>(key >> 32);
+    for (int round = 0; round < 10; ++round) {
+      uint64_t p0 = static_cast<uint64_t>(kM0) * c0;
+      uint64_t p1 = static_cast<uint64_t>(kM1) * c2;
+      uint32_t n0 = static_cast<uint32_t>(p1 >> 32) ^ c1 ^ k0;
+      uint32_t n2 = static_cast<uint32_t>(p0 >> 32) ^ c3 ^ k1;
+      c1 = static_cast<uint32_t>(p1);
+      c3 = static_cast<uint32_t>(p0);
+      c0 = n0;
+      c2 = n2;
+      k0 += kW0;
+      k1 += kW1;
+    }
+    out[0] = c0;
+    out[1] = c1;
+    out[2] = c2;
+    out[3] = c3;
+  }
+};
+
+// Where a kernel reads the Philox stream: the key, and the counter of its
+// first element.
+struct PhiloxState {
+  uint64_t seed;
+  uint64_t offset;
+};
+
+// The random state of a device. Each draw reserves a range of counters, so
+// consecutive kernels read disjoint parts of the stream and a run is
+// reproducible from its seed whatever the number of threads.
+//
+// Every device has its own generator, seeded on first use from
+// FLAGS_custom_cpu_seed, or from std::random_device when it is unset.
+class Generator {
+ public:
+  // The generator of the current device.
+  static Generator& Instance();
+  static Generator& ForDevice(int device_id);
+  // Called by the runtime when the current device changes.
+  static void SetCurrentDevice(int device_id);
+
+  explicit Generator(uint64_t seed) : seed_(seed) {}
+
+  Generator(const Generator&) = delete;
+  Generator& operator=(const Generator&) = delete;
+
+  // Restarts the stream at counter 0 of `seed`.
+  void SetSeed(uint64_t seed);
+  uint64_t Seed();
+
+  // The state for a kernel drawing from `n` counters.
+  PhiloxState Reserve(uint64_t n);
+
+ private:
+  std::mutex mutex_;
+  uint64_t seed_;
+  uint64_t offset_ = 0;
+};
+
+// The state a kernel draws from: a fresh stream of the op's own `seed`
+// when it is set, otherwise `n` counters of the device generator.
+inline PhiloxState DrawState(int seed, uint64_t n) {
+  if (seed != 0) {
+    return {static_cast<uint64_t>(seed), 0};
+  }
+  return Generator::Instance().Reserve(n);
+}
+
+namespace detail {
+
+// Uniform in [0, 1) of T from the leading words of r: the top 24 bits of
+// one word for float, the top 53 bits of two for double.
+template <typename T>
+struct UniformBits;
+
+template <>
+struct UniformBits<float> {
+  static constexpr int kWords = 1;
+  static float Get(const uint32_t* r) {
+    return static_cast<float>(r[0] >> 8) * (1.0f / 16777216.0f);
+  }
+};
+
+template <>
+struct UniformBits<double> {
+  static constexpr int kWords = 2;
+  static double Get(const uint32_t* r) {
+    uint64_t bits = (static_cast<uint64_t>(r[0]) << 32) | r[1];
+    return static_cast<double>(bits >> 11) * (1.0 / 9007199254740992.0);
+  }
+};
+
+// Calls fn(r, i, count) with the four words of counter state.offset + c for
+// the c-th group of kPerCounter elements, [i, i + count), of a tensor of n.
+// The value of an element depends only on the state and its position.
+template <int kPerCounter, typename Fn>
+void PhiloxFill(PhiloxState state, int64_t n, const Fn& fn) {
+  const int64_t counters = (n + kPerCounter - 1) / kPerCounter;
+  ParallelFor(
+      0,
+      counters,
+      std::max<int64_t>(1, kRandomGrainSize / kPerCounter),
+      [&](int64_t begin, int64_t end) {
+        uint32_t r[4];
+        for (int64_t c = begin; c < end; ++c) {
+          Philox4x32::Generate(state.seed, state.offset + c, r);
+          const int64_t i = c * kPerCounter;
+          fn(r, i, static_cast<int>(std::min<int64_t>(kPerCounter, n - i)));
+        }
+      });
+}
+
+}  // namespace detail
+
+// out[i] uniform in [min, max), computed in AccType<T>.
+template <typename T>
+void UniformFill(PhiloxState state, float min, float max, T* out, int64_t n) {
+  using AccT = AccType<T>;
+  using Bits = detail::UniformBits<AccT>;
+  const AccT lo = static_cast<AccT>(min);
+  const AccT range = static_cast<AccT>(max) - lo;
+  detail::PhiloxFill<4 / Bits::kWords>(
+      state, n, [&](const uint32_t* r, int64_t i, int count) {
+        for (int j = 0; j < count; ++j) {
+          out[i + j] = Convert<T>(lo + range * Bits::Get(r + j * Bits::kWords));
+        }
+      });
+}
+
+// out[i] normal with `mean` and `std`, by the Box-Muller transform of pairs
+// of uniforms.
+template <typename T>
+void GaussianFill(PhiloxState state, float mean, float std, T* out, int64_t n) {
+  using AccT = AccType<T>;
+  using Bits = detail::UniformBits<AccT>;
+  constexpr AccT kTwoPi = static_cast<AccT>(6.283185307179586);
+  const AccT mu = static_cast<AccT>(mean);
+  const AccT sigma = static_cast<AccT>(std);
+  detail::PhiloxFill<4 / Bits::kWords>(
+      state, n, [&](const uint32_t* r, int64_t i, int count) {
+        for (int j = 0; j < count; j += 2) {
+          // 1 - u1 is in (0, 1], away from log(0).
+          AccT u1 = Bits::Get(r + j * Bits::kWords);
+          AccT u2 = Bits::Get(r + (j + 1) * Bits::kWords);
+          AccT radius = sigma * std::sqrt(AccT(-2) * std::log(AccT(1) - u1));
+          out[i + j] = Convert<T>(mu + radius * std::cos(kTwoPi * u2));
+          if (j + 1 < count) {
+            out[i + j + 1] = Convert<T>(mu + radius * std::sin(kTwoPi * u2));
+          }
+        }
+      });
+}
+
+// out[i] uniform among the integers of [low, high), from 64 random bits
+// each.
+template <typename T>
+void RandintFill(
+    PhiloxState state, int64_t low, int64_t high, T* out, int64_t n) {
+  const uint64_t range = static_cast<uint64_t>(high - low);
+  detail::PhiloxFill<2>(state, n, [&](const uint32_t* r, int64_t i, int count) {
+    for (int j = 0; j < count; ++j) {
+      uint64_t v = (static_cast<uint64_t>(r[2 * j]) << 32) | r[2 * j + 1];
+      out[i + j] = static_cast<T>(low + static_cast<int64_t>(v % range));
+    }
+  });
+}
+
+// Zeroes each x[i] with probability p and records the kept ones in mask.
+// Kept values are scaled by 1 / (1 - p) when `upscale` is set, which is the
+// upscale_in_train mode.
+template <typename T>
+void DropoutCompute(PhiloxState state,
+                    const T* x,
+                    float p,
+                    bool upscale,
+                    T* out,
+                    uint8_t* mask,
+                    int64_t n) {
+  using AccT = AccType<T>;
+  const AccT scale =
+      upscale && p < 1.0f ? static_cast<AccT>(1.0 / (1.0 - p)) : AccT(1);
+  detail::PhiloxFill<4>(state, n, [&](const uint32_t* r, int64_t i, int count) {
+    for (int j = 0; j < count; ++j) {
+      const bool keep = detail::UniformBits<float>::Get(r + j) >= p;
+      mask[i + j] = keep;
+      out[i + j] = Convert<T>(keep ? Convert<AccT>(x[i + j]) * scale : AccT(0));
+    }
+  });
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,470 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of input elements handed to one thread.
+constexpr int64_t kReduceGrainSize = 32768;
+// Columns reduced together by the strided strategy.
+constexpr int64_t kReduceTileWidth = 256;
+// Below this many independent outputs (or column tiles) the reduced extent
+// itself is split across threads. The split depends on the shape only, so
+// results do not change with the number of threads.
+constexpr int64_t kReduceMinTasks = 16;
+
+// A reducer combines accumulators of type T. kCompensated asks the strided
+// strategy for Kahan summation; the contiguous strategy always sums
+// pairwise. Finalize maps the accumulator of `n` reduced elements to the
+// result.
+template <typename T>
+struct SumReducer {
+  static constexpr bool kCompensated = std::is_floating_point<T>::value;
+  T Identity() const { return T(0); }
+  T operator()(T a, T b) const { return a + b; }
+  T Finalize(T acc, int64_t n) const { return acc; }
+};
+
+template <typename T>
+struct MeanReducer : public SumReducer<T> {
+  T Finalize(T acc, int64_t n) const { return acc / static_cast<T>(n); }
+};
+
+// Identities of max and min. For floating types these are the infinities,
+// not the finite extremes, or a row of -inf would reduce to -FLT_MAX.
+template <typename T>
+T LowestValue() {
+  return std::numeric_limits<T>::has_infinity
+             ? -std::numeric_limits<T>::infinity()
+             : std::numeric_limits<T>::lowest();
+}
+
+template <typename T>
+T HighestValue() {
+  return std::numeric_limits<T>::has_infinity
+             ? std::numeric_limits<T>::infinity()
+             : std::numeric_limits<T>::max();
+}
+
+template <typename T>
+struct MaxReducer {
+  static constexpr bool kCompensated = false;
+  T Identity() const { return LowestValue<T>(); }
+  T operator()(T a, T b) const { return a < b ? b : a; }
+  T Finalize(T acc, int64_t n) const { return acc; }
+};
+
+template <typename T>
+struct MinReducer {
+  static constexpr bool kCompensated = false;
+  T Identity() const { return HighestValue<T>(); }
+  T operator()(T a, T b) const { return b < a ? b : a; }
+  T Finalize(T acc, int64_t n) const { return acc; }
+};
+
+template <typename T>
+struct ProdReducer {
+  static constexpr bool kCompensated = false;
+  T Identity() const { return T(1); }
+  T operator()(T a, T b) const { return a * b; }
+  T Finalize(T acc, int64_t n) const { return acc; }
+};
+
+// Canonical form of a reduction: size-1 dims are dropped and adjacent dims
+// that are both reduced or both kept are merged. A single reduced group is
+// one (outer, reduce, inner) problem; reducing non-adjacent dims takes one
+// pass per reduced group, innermost first.
+class ReducePlan {
+ public:
+  // Negative entries of `reduce_dims` count from the back.
+  ReducePlan(const std::vector<int64_t>& dims,
+             const std::vector<int64_t>& reduce_dims) {
+    const int rank = static_cast<int>(dims.size());
+    std::vector<bool> is_reduced(rank, false);
+    for (auto d : reduce_dims) {
+      is_reduced[d < 0 ? d + rank : d] = true;
+    }
+    reduce_numel_ = 1;
+    out_numel_ = 1;
+    for (int i = 0; i < rank; ++i) {
+      if (is_reduced[i]) {
+        reduce_numel_ *= dims[i];
+      } else {
+        out_numel_ *= dims[i];
+      }
+      if (dims[i] == 1) {
+        continue;
+      }
+      if (!shape_.empty() && reduced_.back() == is_reduced[i]) {
+        shape_.back() *= dims[i];
+      } else {
+        shape_.push_back(dims[i]);
+        reduced_.push_back(is_reduced[i]);
+      }
+    }
+  }
+
+  // Number of input elements folded into each output element.
+  int64_t reduce_numel() const { return reduce_numel_; }
+  int64_t out_numel() const { return out_numel_; }
+  const std::vector<int64_t>& shape() const { return shape_; }
+  const std::vector<bool>& reduced() const { return reduced_; }
+
+ private:
+  int64_t reduce_numel_;
+  int64_t out_numel_;
+  std::vector<int64_t> shape_;
+  std::vector<bool> reduced_;
+};
+
+namespace detail {
+
+constexpr int64_t kPairwiseBlock = 128;
+constexpr int kReduceLanes = 8;
+
+// Hands the reduction loops up to kMax elements of a row. 16-bit rows are
+// converted to float in one block first, since converting them element by
+// element in the loops keeps those from vectorizing.
+template <typename AccT,
+          typename SrcT,
+          int64_t kMax,
+          bool kStaged = HalfTraits<SrcT>::kIsHalf>
+struct RowLoader {
+  const SrcT* operator()(const SrcT* row, int64_t) { return row; }
+};
+
+template <typename AccT, typename SrcT, int64_t kMax>
+struct RowLoader<AccT, SrcT, kMax, true> {
+  AccT block[kMax];
+
+  const AccT* operator()(const SrcT* row, int64_t n) {
+    ConvertBlock(row, block, n);
+    return block;
+  }
+};
+
+// Reduces n contiguous elements. Independent lanes let the compiler
+// vectorize the inner loop, and the pairwise split keeps the rounding error
+// of a float sum at O(log n) rather than O(n).
+template <typename AccT, typename SrcT, typename Reducer>
+AccT ReduceRun(const SrcT* src, int64_t n, const Reducer& reducer) {
+  if (n > kPairwiseBlock) {
+    int64_t half = n / 2 / kReduceLanes * kReduceLanes;
+    return reducer(ReduceRun<AccT>(src, half, reducer),
+                   ReduceRun<AccT>(src + half, n - half, reducer));
+  }
+  RowLoader<AccT, SrcT, kPairwiseBlock> load;
+  const auto* x = load(src, n);
+  AccT lanes[kReduceLanes];
+  for (int l = 0; l < kReduceLanes; ++l) {
+    lanes[l] = reducer.Identity();
+  }
+  int64_t i = 0;
+  for (; i + kReduceLanes <= n; i += kReduceLanes) {
+    for (int l = 0; l < kReduceLanes; ++l) {
+      lanes[l] = reducer(lanes[l], Convert<AccT>(x[i + l]));
+    }
+  }
+  AccT acc = reducer.Identity();
+  for (int l = 0; l < kReduceLanes; ++l) {
+    acc = reducer(acc, lanes[l]);
+  }
+  for (; i < n; ++i) {
+    acc = reducer(acc, Convert<AccT>(x[i]));
+  }
+  return acc;
+}
+
+// acc[j] = reduction of x[r * stride + j] over r in [0, rows), j < width.
+// The accumulators are local so that the compiler knows they do not alias
+// the input and can vectorize across columns.
+template <typename AccT, typename SrcT, typename Reducer>
+void ReduceColumns(const SrcT* x,
+                   int64_t rows,
+                   int64_t stride,
+                   int64_t width,
+                   AccT* acc,
+                   const Reducer& reducer) {
+  AccT sum[kReduceTileWidth];
+  AccT comp[kReduceTileWidth];
+  for (int64_t j = 0; j < width; ++j) {
+    sum[j] = reducer.Identity();
+    comp[j] = AccT(0);
+  }
+  // Fixed-length inner loops over kReduceLanes columns vectorize; the tail
+  // of the tile is done one column at a time.
+  const int64_t full = width / kReduceLanes * kReduceLanes;
+  RowLoader<AccT, SrcT, kReduceTileWidth> load;
+  if (Reducer::kCompensated) {
+    auto kahan = [&](int64_t j, AccT value) {
+      AccT y = value - comp[j];
+      AccT t = sum[j] + y;
+      comp[j] = (t - sum[j]) - y;
+      sum[j] = t;
+    };
+    for (int64_t r = 0; r < rows; ++r) {
+      const auto* row = load(x + r * stride, width);
+      for (int64_t j = 0; j < full; j += kReduceLanes) {
+        for (int l = 0; l < kReduceLanes; ++l) {
+          kahan(j + l, Convert<AccT>(row[j + l]));
+        }
+      }
+      for (int64_t j = full; j < width; ++j) {
+        kahan(j, Convert<AccT>(row[j]));
+      }
+    }
+  } else {
+    for (int64_t r = 0; r < rows; ++r) {
+      const auto* row = load(x + r * stride, width);
+      for (int64_t j = 0; j < full; j += kReduceLanes) {
+        for (int l = 0; l < kReduceLanes; ++l) {
+          sum[j + l] = reducer(sum[j + l], Convert<AccT>(row[j + l]));
+        }
+      }
+      for (int64_t j = full; j < width; ++j) {
+        sum[j] = reducer(sum[j], Convert<AccT>(row[j]));
+      }
+    }
+  }
+  std::copy(sum, sum + width, acc);
+}
+
+// `finalize_n` is the element count handed to Reducer::Finalize on the last
+// pass, 0 on intermediate passes.
+template <typename AccT, typename SrcT, typename DstT, typename Reducer>
+DstT Store(AccT acc, const Reducer& reducer, int64_t finalize_n) {
+  return Convert<DstT>(finalize_n > 0 ? reducer.Finalize(acc, finalize_n)
+                                      : acc);
+}
+
+// inner == 1: every output is a contiguous run of `reduce` elements.
+template <typename AccT, typename SrcT, typename DstT, typename Reducer>
+void ReduceContiguous(const SrcT* src,
+                      int64_t outer,
+                      int64_t reduce,
+                      DstT* dst,
+                      const Reducer& reducer,
+                      int64_t finalize_n) {
+  if (outer >= kReduceMinTasks || reduce <= kReduceGrainSize) {
+    int64_t grain = std::max<int64_t>(1, kReduceGrainSize / reduce);
+    ParallelFor(0, outer, grain, [&](int64_t begin, int64_t end) {
+      for (int64_t o = begin; o < end; ++o) {
+        dst[o] = Store<AccT, SrcT, DstT>(
+            ReduceRun<AccT>(src + o * reduce, reduce, reducer),
+            reducer,
+            finalize_n);
+      }
+    });
+    return;
+  }
+  // Few long rows: reduce fixed-size blocks in parallel, then the partials.
+  int64_t blocks = (reduce + kReduceGrainSize - 1) / kReduceGrainSize;
+  std::vector<AccT> partials(blocks);
+  for (int64_t o = 0; o < outer; ++o) {
+    const SrcT* row = src + o * reduce;
+    ParallelFor(0, blocks, 1, [&](int64_t begin, int64_t end) {
+      for (int64_t b = begin; b < end; ++b) {
+        int64_t start = b * kReduceGrainSize;
+        partials[b] = ReduceRun<AccT>(
+            row + start, std::min(kReduceGrainSize, reduce - start), reducer);
+      }
+    });
+    dst[o] = Store<AccT, SrcT, DstT>(
+        ReduceRun<AccT>(partials.data(), blocks, reducer), reducer, finalize_n);
+  }
+}
+
+// inner > 1: rows of `inner` elements are folded into each other, a tile of
+// columns at a time so that the accumulators stay in cache.
+template <typename AccT, typename SrcT, typename DstT, typename Reducer>
+void ReduceStrided(const SrcT* src,
+                   int64_t outer,
+                   int64_t reduce,
+                   int64_t inner,
+                   DstT* dst,
+                   const Reducer& reducer,
+                   int64_t finalize_n) {
+  const int64_t width = std::min(inner, kReduceTileWidth);
+  const int64_t tiles = (inner + width - 1) / width;
+  const int64_t tasks = outer * tiles;
+  int64_t rows_per_block = reduce;
+  if (tasks < kReduceMinTasks) {
+    rows_per_block =
+        std::min(reduce, std::max<int64_t>(1, kReduceGrainSize / width));
+  }
+  const int64_t blocks = (reduce + rows_per_block - 1) / rows_per_block;
+
+  auto tile_at = [&](int64_t task, int64_t* base, int64_t* cols) {
+    int64_t o = task / tiles;
+    int64_t col = task % tiles * width;
+    *base = o * inner + col;
+    *cols = std::min(width, inner - col);
+  };
+
+  if (blocks == 1) {
+    int64_t grain = std::max<int64_t>(1, kReduceGrainSize / (reduce * width));
+    ParallelFor(0, tasks, grain, [&](int64_t begin, int64_t end) {
+      AccT acc[kReduceTileWidth];
+      for (int64_t t = begin; t < end; ++t) {
+        int64_t base, cols;
+        tile_at(t, &base, &cols);
+        int64_t o = base / inner;
+        ReduceColumns(src + o * reduce * inner + base % inner,
+                      reduce,
+                      inner,
+                      cols,
+                      acc,
+                      reducer);
+        for (int64_t j = 0; j < cols; ++j) {
+          dst[base + j] = Store<AccT, SrcT, DstT>(acc[j], reducer, finalize_n);
+        }
+      }
+    });
+    return;
+  }
+
+  // Too few tiles to keep the threads busy: split the rows into blocks,
+  // reduce every (tile, block) pair in parallel and fold the blocks in order.
+  std::vector<AccT> partials(tasks * blocks * width);
+  ParallelFor(0, tasks * blocks, 1, [&](int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; ++i) {
+      int64_t base, cols;
+      tile_at(i / blocks, &base, &cols);
+      int64_t o = base / inner;
+      int64_t row = i % blocks * rows_per_block;
+      ReduceColumns(src + (o * reduce + row) * inner + base % inner,
+                    std::min(rows_per_block, reduce - row),
+                    inner,
+                    cols,
+                    partials.data() + i * width,
+                    reducer);
+    }
+  });
+  for (int64_t t = 0; t < tasks; ++t) {
+    int64_t base, cols;
+    tile_at(t, &base, &cols);
+    const AccT* first = partials.data() + t * blocks * width;
+    for (int64_t j = 0; j < cols; ++j) {
+      AccT acc = first[j];
+      for (int64_t b = 1; b < blocks; ++b) {
+        acc = reducer(acc, first[b * width + j]);
+      }
+      dst[base + j] = Store<AccT, SrcT, DstT>(acc, reducer, finalize_n);
+    }
+  }
+}
+
+template <typename AccT, typename SrcT, typename DstT, typename Reducer>
+void ReducePass(const SrcT* src,
+                int64_t outer,
+                int64_t reduce,
+                int64_t inner,
+                DstT* dst,
+                const Reducer& reducer,
+                int64_t finalize_n) {
+  if (inner == 1) {
+    ReduceContiguous<AccT>(src, outer, reduce, dst, reducer, finalize_n);
+  } else {
+    ReduceStrided<AccT>(src, outer, reduce, inner, dst, reducer, finalize_n);
+  }
+}
+
+}  // namespace detail
+
+// Reduces `in` of shape `dims` over `reduce_dims` into `out`, which holds
+// the kept dims in order. Elements are converted to AccT before they are
+// combined and the finalized accumulator is converted to OutT.
+template <typename InT, typename AccT, typename OutT, typename Reducer>
+void ReduceCompute(const std::vector<int64_t>& dims,
+                   const std::vector<int64_t>& reduce_dims,
+                   const InT* in,
+                   OutT* out,
+                   const Reducer& reducer) {
+  ReducePlan plan(dims, reduce_dims);
+  std::vector<int64_t> shape = plan.shape();
+  std::vector<bool> reduced = plan.reduced();
+  const int64_t finalize_n = plan.reduce_numel();
+
+  if (finalize_n == 0) {
+    // Empty reduction: every output is the identity.
+    for (int64_t i = 0; i < plan.out_numel(); ++i) {
+      out[i] = Convert<OutT>(reducer.Finalize(reducer.Identity(), 0));
+    }
+    return;
+  }
+  if (plan.out_numel() == 0) {
+    return;
+  }
+  int num_groups =
+      static_cast<int>(std::count(reduced.begin(), reduced.end(), true));
+  if (num_groups == 0) {
+    // Only size-1 dims are reduced.
+    detail::ReducePass<AccT>(
+        in, plan.out_numel(), 1, 1, out, reducer, finalize_n);
+    return;
+  }
+
+  std::vector<AccT> buffers[2];
+  const AccT* src = nullptr;
+  for (int pass = 0; pass < num_groups; ++pass) {
+    int g = static_cast<int>(shape.size()) - 1;
+    while (!reduced[g]) {
+      --g;
+    }
+    int64_t outer = 1, inner = 1;
+    for (int i = 0; i < g; ++i) {
+      outer *= shape[i];
+    }
+    for (size_t i = g + 1; i < shape.size(); ++i) {
+      inner *= shape[i];
+    }
+    int64_t reduce = shape[g];
+    shape.erase(shape.begin() + g);
+    reduced.erase(reduced.begin() + g);
+
+    bool last = pass + 1 == num_groups;
+    if (last) {
+      if (pass == 0) {
+        detail::ReducePass<AccT>(
+            in, outer, reduce, inner, out, reducer, finalize_n);
+      } else {
+        detail::ReducePass<AccT>(
+            src, outer, reduce, inner, out, reducer, finalize_n);
+      }
+    } else {
+      auto& dst = buffers[pass % 2];
+      dst.resize(outer * inner);
+      if (pass == 0) {
+        detail::ReducePass<AccT>(
+            in, outer, reduce, inner, dst.data(), reducer, 0);
+      } else {
+        detail::ReducePass<AccT>(
+            src, outer, reduce, inner, dst.data(), reducer, 0);
+      }
+      src = dst.data();
+    }
+  }
+}
+
+}  // namespace custom_kernel
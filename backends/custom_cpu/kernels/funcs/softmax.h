@@ -0,0 +1,451 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <array>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <limits>
+#include <type_traits>
+#include <vector>
+
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread.
+constexpr int64_t kSoftmaxGrainSize = 32768;
+// Elements per block of the online softmax. A block is read twice, for its
+// maximum and for its exponentials, while it is still in L1.
+constexpr int64_t kSoftmaxBlockSize = 512;
+// Blocks per row; longer rows use proportionally larger blocks.
+constexpr int64_t kSoftmaxMaxBlocks = 64;
+// exp(x - max) is clipped at exp(-64), as the reference softmax does.
+constexpr double kSoftmaxClip = -64.0;
+
+namespace detail {
+
+constexpr int kSoftmaxLanes = 8;
+
+// exp(x) for float x in [-87.3, 88.3] through range reduction to
+// [-ln2/2, ln2/2] and a degree-6 polynomial (the Cephes expf coefficients),
+// accurate to 2 ulp. Unlike std::exp it has no call or branch, so loops over
+// it vectorize.
+inline float ExpInRange(float x) {
+  constexpr float kRound = 12582912.f;  // 1.5 * 2^23
+  float t = x * 1.44269504088896341f + kRound;
+  float n = t - kRound;
+  int32_t e;
+  std::memcpy(&e, &t, sizeof(e));
+  e = (e - 0x4B400000 + 127) << 23;
+  float scale;
+  std::memcpy(&scale, &e, sizeof(scale));
+  float r = x - n * 0.693359375f;
+  r = r - n * -2.12194440e-4f;
+  float p = 1.9875691500e-4f;
+  p = p * r + 1.3981999507e-3f;
+  p = p * r + 8.3334519073e-3f;
+  p = p * r + 4.1665795894e-2f;
+  p = p * r + 1.6666665459e-1f;
+  p = p * r + 5.0000001201e-1f;
+  return (p * r * r + r + 1.f) * scale;
+}
+
+inline double ExpInRange(double x) { return std::exp(x); }
+
+inline float Exp(float x) {
+  return ExpInRange(x < -87.3f ? -87.3f : (x > 88.3f ? 88.3f : x));
+}
+
+inline double Exp(double x) { return std::exp(x); }
+
+template <typename T>
+T RowMax(const T* x, int64_t n) {
+  T lanes[kSoftmaxLanes];
+  std::fill(lanes, lanes + kSoftmaxLanes, -std::numeric_limits<T>::infinity());
+  int64_t i = 0;
+  for (; i + kSoftmaxLanes <= n; i += kSoftmaxLanes) {
+    for (int l = 0; l < kSoftmaxLanes; ++l) {
+      lanes[l] = lanes[l] < x[i + l] ? x[i + l] : lanes[l];
+    }
+  }
+  for (; i < n; ++i) {
+    lanes[0] = lanes[0] < x[i] ? x[i] : lanes[0];
+  }
+  T m = lanes[0];
+  for (int l = 1; l < kSoftmaxLanes; ++l) {
+    m = m < lanes[l] ? lanes[l] : m;
+  }
+  return m;
+}
+
+// y[i] = exp(max(x[i] - m, clip)) for x[i] <= m; returns the sum of y.
+// The clip is applied to x against the runtime bound m + clip: a constant
+// bound lets the compiler fold exp(clip) into a separate branch, which stops
+// the loop from vectorizing.
+template <typename T>
+T ExpSum(const T* x, T m, T* y, int64_t n) {
+  const T lo = m + static_cast<T>(kSoftmaxClip);
+  T lanes[kSoftmaxLanes] = {};
+  int64_t i = 0;
+  for (; i + kSoftmaxLanes <= n; i += kSoftmaxLanes) {
+    for (int l = 0; l < kSoftmaxLanes; ++l) {
+      T v = x[i + l] < lo ? lo : x[i + l];
+      v = ExpInRange(v - m);
+      y[i + l] = v;
+      lanes[l] += v;
+    }
+  }
+  for (; i < n; ++i) {
+    T v = x[i] < lo ? lo : x[i];
+    v = ExpInRange(v - m);
+    y[i] = v;
+    lanes[0] += v;
+  }
+  T s = 0;
+  for (int l = 0; l < kSoftmaxLanes; ++l) {
+    s += lanes[l];
+  }
+  return s;
+}
+
+template <typename T>
+T Dot(const T* a, const T* b, int64_t n) {
+  T lanes[kSoftmaxLanes] = {};
+  int64_t i = 0;
+  for (; i + kSoftmaxLanes <= n; i += kSoftmaxLanes) {
+    for (int l = 0; l < kSoftmaxLanes; ++l) {
+      lanes[l] += a[i + l] * b[i + l];
+    }
+  }
+  for (; i < n; ++i) {
+    lanes[0] += a[i] * b[i];
+  }
+  T s = 0;
+  for (int l = 0; l < kSoftmaxLanes; ++l) {
+    s += lanes[l];
+  }
+  return s;
+}
+
+// Running maximum and normalizer of a softmax row.
+template <typename T>
+struct SoftmaxStats {
+  T max;
+  T sum;
+};
+
+// Online softmax of one contiguous row: a single read of x keeps a running
+// maximum and sum block by block. Each block's exponentials are written
+// against the maximum seen so far and rescaled once at the end, so x is
+// never read again and exp is evaluated once per element.
+template <typename T>
+SoftmaxStats<T> SoftmaxRow(const T* x, T* y, int64_t n) {
+  int64_t block = std::max(
+      kSoftmaxBlockSize,
+      (n + kSoftmaxMaxBlocks - 1) / kSoftmaxMaxBlocks + kSoftmaxLanes - 1);
+  block = block / kSoftmaxLanes * kSoftmaxLanes;
+  T block_max[kSoftmaxMaxBlocks];
+  T m = -std::numeric_limits<T>::infinity();
+  T s = 0;
+  int64_t num_blocks = 0;
+  for (int64_t b = 0; b < n; b += block, ++num_blocks) {
+    int64_t len = std::min(block, n - b);
+    T bm = RowMax(x + b, len);
+    if (bm > m) {
+      s *= Exp(m - bm);
+      m = bm;
+    }
+    s += ExpSum(x + b, m, y + b, len);
+    block_max[num_blocks] = m;
+  }
+  // A value clipped against an earlier, smaller maximum is raised back to
+  // the clip against the final one.
+  T inv = T(1) / s;
+  T floor = Exp(static_cast<T>(kSoftmaxClip)) * inv;
+  for (int64_t k = 0; k < num_blocks; ++k) {
+    T* row = y + k * block;
+    int64_t len = std::min(block, n - k * block);
+    if (block_max[k] == m) {
+      for (int64_t i = 0; i < len; ++i) {
+        row[i] *= inv;
+      }
+      continue;
+    }
+    T scale = Exp(block_max[k] - m) * inv;
+    for (int64_t i = 0; i < len; ++i) {
+      T v = row[i] * scale;
+      row[i] = v < floor ? floor : v;
+    }
+  }
+  return {m, s};
+}
+
+// log(softmax(x)[j]) given the row maximum and log of the row sum, clipped
+// like the softmax.
+template <typename T>
+T LogSoftmax(T x, T max, T log_sum) {
+  T v = x - max;
+  return (v < static_cast<T>(kSoftmaxClip) ? static_cast<T>(kSoftmaxClip) : v) -
+         log_sum;
+}
+
+// Rows of a float or double tensor with inner == 1 are handed to fn in
+// place. Returns false when the rows have to be staged instead.
+template <typename T, size_t kIn, typename Fn>
+bool ForEachRowInPlace(std::false_type,
+                       const std::array<const T*, kIn>&,
+                       T*,
+                       int64_t,
+                       int64_t,
+                       int64_t,
+                       const Fn&) {
+  return false;
+}
+
+template <typename T, size_t kIn, typename Fn>
+bool ForEachRowInPlace(std::true_type,
+                       const std::array<const T*, kIn>& in,
+                       T* out,
+                       int64_t rows,
+                       int64_t axis_dim,
+                       int64_t inner,
+                       const Fn& fn) {
+  if (inner != 1) {
+    return false;
+  }
+  int64_t grain = std::max<int64_t>(1, kSoftmaxGrainSize / axis_dim);
+  ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    std::array<const T*, kIn> row_in;
+    for (int64_t r = begin; r < end; ++r) {
+      for (size_t k = 0; k < kIn; ++k) {
+        row_in[k] = in[k] + r * axis_dim;
+      }
+      fn(row_in, out + r * axis_dim, r);
+    }
+  });
+  return true;
+}
+
+// Calls fn(in_rows, out_row, row) for every softmax row of an
+// (outer, axis_dim, inner) layout; `row` is o * inner + k and indexes the
+// per-row tensors such as labels and losses. fn only ever sees contiguous
+// rows of AccType<T>: rows with inner > 1, and every row of a 16-bit
+// tensor, are gathered to scratch in the compute type and the output is
+// converted and scattered back.
+template <typename T, size_t kIn, typename Fn>
+void ForEachRow(const std::array<const T*, kIn>& in,
+                T* out,
+                int64_t outer,
+                int64_t axis_dim,
+                int64_t inner,
+                const Fn& fn) {
+  using AccT = AccType<T>;
+  int64_t rows = outer * inner;
+  if (ForEachRowInPlace(
+          std::is_same<T, AccT>(), in, out, rows, axis_dim, inner, fn)) {
+    return;
+  }
+  int64_t grain = std::max<int64_t>(1, kSoftmaxGrainSize / axis_dim);
+  ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    std::vector<AccT> scratch((kIn + 1) * axis_dim);
+    std::array<const AccT*, kIn> row_in;
+    AccT* row_out = scratch.data() + kIn * axis_dim;
+    for (int64_t r = begin; r < end; ++r) {
+      int64_t base = r / inner * axis_dim * inner + r % inner;
+      for (size_t k = 0; k < kIn; ++k) {
+        AccT* row = scratch.data() + k * axis_dim;
+        if (inner == 1) {
+          ConvertBlock(in[k] + base, row, axis_dim);
+        } else {
+          for (int64_t j = 0; j < axis_dim; ++j) {
+            row[j] = Convert<AccT>(in[k][base + j * inner]);
+          }
+        }
+        row_in[k] = row;
+      }
+      fn(row_in, row_out, r);
+      if (inner == 1) {
+        ConvertBlock(row_out, out + base, axis_dim);
+      } else {
+        for (int64_t j = 0; j < axis_dim; ++j) {
+          out[base + j * inner] = Convert<T>(row_out[j]);
+        }
+      }
+    }
+  });
+}
+
+}  // namespace detail
+
+// Softmax over the middle dim of an (outer, axis_dim, inner) tensor.
+template <typename T>
+void SoftmaxCompute(
+    const T* x, T* y, int64_t outer, int64_t axis_dim, int64_t inner) {
+  using AccT = AccType<T>;
+  detail::ForEachRow<T, 1>(
+      {x},
+      y,
+      outer,
+      axis_dim,
+      inner,
+      [&](const std::array<const AccT*, 1>& in, AccT* out, int64_t) {
+        detail::SoftmaxRow(in[0], out, axis_dim);
+      });
+}
+
+// dx = (dy - sum(dy * y)) * y along the softmax axis.
+template <typename T>
+void SoftmaxGradCompute(const T* y,
+                        const T* dy,
+                        T* dx,
+                        int64_t outer,
+                        int64_t axis_dim,
+                        int64_t inner) {
+  using AccT = AccType<T>;
+  detail::ForEachRow<T, 2>(
+      {y, dy},
+      dx,
+      outer,
+      axis_dim,
+      inner,
+      [&](const std::array<const AccT*, 2>& in, AccT* out, int64_t) {
+        AccT dot = detail::Dot(in[0], in[1], axis_dim);
+        for (int64_t j = 0; j < axis_dim; ++j) {
+          out[j] = (in[1][j] - dot) * in[0][j];
+        }
+      });
+}
+
+// Softmax and cross-entropy loss against hard labels in one read of the
+// logits. `label` and `loss` hold one entry per row; rows whose label is
+// `ignore_index` get a zero loss. Labels must already be in range.
+template <typename T, typename LabelT>
+void SoftmaxCrossEntropyCompute(const T* logits,
+                                const LabelT* label,
+                                T* softmax,
+                                T* loss,
+                                int64_t outer,
+                                int64_t axis_dim,
+                                int64_t inner,
+                                int64_t ignore_index) {
+  using AccT = AccType<T>;
+  detail::ForEachRow<T, 1>(
+      {logits},
+      softmax,
+      outer,
+      axis_dim,
+      inner,
+      [&](const std::array<const AccT*, 1>& in, AccT* out, int64_t r) {
+        auto stats = detail::SoftmaxRow(in[0], out, axis_dim);
+        auto lbl = static_cast<int64_t>(label[r]);
+        loss[r] =
+            Convert<T>(lbl == ignore_index
+                           ? AccT(0)
+                           : -detail::LogSoftmax(
+                                 in[0][lbl], stats.max, std::log(stats.sum)));
+      });
+}
+
+// Softmax and cross-entropy loss against soft labels, which have the shape
+// of the logits.
+template <typename T>
+void SoftLabelSoftmaxCrossEntropyCompute(const T* logits,
+                                         const T* label,
+                                         T* softmax,
+                                         T* loss,
+                                         int64_t outer,
+                                         int64_t axis_dim,
+                                         int64_t inner) {
+  using AccT = AccType<T>;
+  detail::ForEachRow<T, 2>(
+      {logits, label},
+      softmax,
+      outer,
+      axis_dim,
+      inner,
+      [&](const std::array<const AccT*, 2>& in, AccT* out, int64_t r) {
+        auto stats = detail::SoftmaxRow(in[0], out, axis_dim);
+        AccT log_sum = std::log(stats.sum);
+        AccT sum = 0;
+        for (int64_t j = 0; j < axis_dim; ++j) {
+          if (in[1][j] != AccT(0)) {
+            sum -= in[1][j] * detail::LogSoftmax(in[0][j], stats.max, log_sum);
+          }
+        }
+        loss[r] = Convert<T>(sum);
+      });
+}
+
+// logits_grad = (softmax - onehot(label)) * loss_grad in one pass per row;
+// ignored rows get a zero gradient.
+template <typename T, typename LabelT>
+void SoftmaxCrossEntropyGradCompute(const T* softmax,
+                                    const LabelT* label,
+                                    const T* loss_grad,
+                                    T* logits_grad,
+                                    int64_t outer,
+                                    int64_t axis_dim,
+                                    int64_t inner,
+                                    int64_t ignore_index) {
+  using AccT = AccType<T>;
+  detail::ForEachRow<T, 1>(
+      {softmax},
+      logits_grad,
+      outer,
+      axis_dim,
+      inner,
+      [&](const std::array<const AccT*, 1>& in, AccT* out, int64_t r) {
+        auto lbl = static_cast<int64_t>(label[r]);
+        if (lbl == ignore_index) {
+          std::fill(out, out + axis_dim, AccT(0));
+          return;
+        }
+        AccT dy = Convert<AccT>(loss_grad[r]);
+        for (int64_t j = 0; j < axis_dim; ++j) {
+          out[j] = in[0][j] * dy;
+        }
+        out[lbl] -= dy;
+      });
+}
+
+// logits_grad = (softmax - label) * loss_grad for soft labels.
+template <typename T>
+void SoftLabelSoftmaxCrossEntropyGradCompute(const T* softmax,
+                                             const T* label,
+                                             const T* loss_grad,
+                                             T* logits_grad,
+                                             int64_t outer,
+                                             int64_t axis_dim,
+                                             int64_t inner) {
+  using AccT = AccType<T>;
+  detail::ForEachRow<T, 2>(
+      {softmax, label},
+      logits_grad,
+      outer,
+      axis_dim,
+      inner,
+      [&](const std::array<const AccT*, 2>& in, AccT* out, int64_t r) {
+        AccT dy = Convert<AccT>(loss_grad[r]);
+        for (int64_t j = 0; j < axis_dim; ++j) {
+          out[j] = (in[0][j] - in[1][j]) * dy;
+        }
+      });
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,245 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+#include <utility>
+#include <vector>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread. Rows are never split.
+constexpr int64_t kSortGrainSize = 32768;
+// Rows shorter than this are sorted by comparison; radix sort passes cost
+// more than they save on them.
+constexpr int64_t kRadixSortMinWidth = 512;
+// top_k keeps a heap of the best k while k is at most width / this, and
+// partitions the whole row with nth_element above it.
+constexpr int64_t kTopKHeapRatio = 64;
+
+namespace detail {
+
+// Maps T to an unsigned key whose ascending order is the ascending order
+// of the values. NaNs get the largest key, so they sort last ascending and
+// first descending, and -0.0 the key of 0.0.
+template <typename T, typename Enable = void>
+struct SortKey;
+
+template <typename T>
+struct SortKey<T, typename std::enable_if<std::is_integral<T>::value>::type> {
+  using Key = typename std::make_unsigned<T>::type;
+  static Key Of(T v) {
+    return static_cast<Key>(v) ^ (Key(1) << (sizeof(T) * 8 - 1));
+  }
+};
+
+template <typename T>
+struct SortKey<
+    T,
+    typename std::enable_if<std::is_floating_point<T>::value>::type> {
+  using Key =
+      typename std::conditional<sizeof(T) == 4, uint32_t, uint64_t>::type;
+  static Key Of(T v) {
+    constexpr Key kSign = Key(1) << (sizeof(T) * 8 - 1);
+    if (std::isnan(v)) {
+      return ~Key(0);
+    }
+    Key bits = 0;
+    if (v != T(0)) {
+      std::memcpy(&bits, &v, sizeof(T));
+    }
+    return (bits & kSign) ? ~bits : bits | kSign;
+  }
+};
+
+// A key and the position of its value in the row. Ordered by key, then by
+// position, which makes every sort below stable.
+template <typename Key>
+struct KeyIndex {
+  Key key;
+  int64_t index;
+
+  bool operator<(const KeyIndex& other) const {
+    return key < other.key || (key == other.key && index < other.index);
+  }
+};
+
+// Least-significant-digit radix sort of `items` by key, one byte per pass.
+// The histograms of all passes are taken in one read, and passes in which
+// every key has the same digit are skipped.
+template <typename Key>
+void RadixSort(std::vector<KeyIndex<Key>>* items,
+               std::vector<KeyIndex<Key>>* scratch) {
+  constexpr int kPasses = sizeof(Key);
+  const int64_t n = items->size();
+  int64_t counts[kPasses][256] = {};
+  for (const auto& item : *items) {
+    for (int p = 0; p < kPasses; ++p) {
+      ++counts[p][(item.key >> (p * 8)) & 0xFF];
+    }
+  }
+  scratch->resize(n);
+  auto* src = items->data();
+  auto* dst = scratch->data();
+  for (int p = 0; p < kPasses; ++p) {
+    int64_t* count = counts[p];
+    if (count[(src[0].key >> (p * 8)) & 0xFF] == n) {
+      continue;
+    }
+    int64_t offset = 0;
+    for (int d = 0; d < 256; ++d) {
+      int64_t c = count[d];
+      count[d] = offset;
+      offset += c;
+    }
+    for (int64_t i = 0; i < n; ++i) {
+      dst[count[(src[i].key >> (p * 8)) & 0xFF]++] = src[i];
+    }
+    std::swap(src, dst);
+  }
+  if (src != items->data()) {
+    std::copy(src, src + n, items->data());
+  }
+}
+
+// Keys of one row; `invert` reverses their order.
+template <typename T, typename Key>
+void MakeKeys(const T* row,
+              int64_t width,
+              bool invert,
+              std::vector<KeyIndex<Key>>* items) {
+  items->resize(width);
+  const Key mask = invert ? ~Key(0) : Key(0);
+  for (int64_t j = 0; j < width; ++j) {
+    (*items)[j] = {SortKey<T>::Of(row[j]) ^ mask, j};
+  }
+}
+
+template <typename T, typename Key>
+void WriteRow(const T* row,
+              const KeyIndex<Key>* items,
+              int64_t n,
+              T* out,
+              int64_t* indices) {
+  for (int64_t j = 0; j < n; ++j) {
+    out[j] = row[items[j].index];
+    indices[j] = items[j].index;
+  }
+}
+
+// The k items of smallest key in ascending order, through a max-heap of
+// the best k seen so far. Most items are rejected by one compare against
+// the top of the heap.
+template <typename T, typename Key>
+void HeapSelect(const T* row,
+                int64_t width,
+                int64_t k,
+                bool invert,
+                std::vector<KeyIndex<Key>>* heap) {
+  const Key mask = invert ? ~Key(0) : Key(0);
+  heap->resize(k);
+  for (int64_t j = 0; j < k; ++j) {
+    (*heap)[j] = {SortKey<T>::Of(row[j]) ^ mask, j};
+  }
+  std::make_heap(heap->begin(), heap->end());
+  for (int64_t j = k; j < width; ++j) {
+    Key key = SortKey<T>::Of(row[j]) ^ mask;
+    // Ties lose against the earlier position already in the heap.
+    if (key < heap->front().key) {
+      std::pop_heap(heap->begin(), heap->end());
+      heap->back() = {key, j};
+      std::push_heap(heap->begin(), heap->end());
+    }
+  }
+  std::sort_heap(heap->begin(), heap->end());
+}
+
+inline int64_t RowsPerChunk(int64_t width) {
+  return std::max<int64_t>(1, kSortGrainSize / std::max<int64_t>(width, 1));
+}
+
+}  // namespace detail
+
+// Sorts each of the `height` contiguous rows of `width` elements of x,
+// writing the sorted values to out and their positions in the row to
+// indices. Equal values keep their order, NaNs sort last ascending and
+// first descending. Rows are spread over the thread pool; long rows are
+// radix sorted on their keys and short ones sorted by comparison.
+template <typename T>
+void SortRows(const T* x,
+              int64_t height,
+              int64_t width,
+              bool descending,
+              T* out,
+              int64_t* indices) {
+  using Key = typename detail::SortKey<T>::Key;
+  ParallelFor(
+      0, height, detail::RowsPerChunk(width), [&](int64_t b, int64_t e) {
+        std::vector<detail::KeyIndex<Key>> items, scratch;
+        for (int64_t i = b; i < e; ++i) {
+          const T* row = x + i * width;
+          detail::MakeKeys(row, width, descending, &items);
+          if (width < kRadixSortMinWidth) {
+            std::sort(items.begin(), items.end());
+          } else {
+            detail::RadixSort(&items, &scratch);
+          }
+          detail::WriteRow(
+              row, items.data(), width, out + i * width, indices + i * width);
+        }
+      });
+}
+
+// Writes the k largest (or smallest) values of each row of x, best first,
+// to the rows of k elements of out, and their positions to indices. Ties
+// go to the earlier position and NaNs count as the largest values. Small
+// k keep a heap of the best k, larger k partition the row around its k-th
+// value with nth_element.
+template <typename T>
+void TopKRows(const T* x,
+              int64_t height,
+              int64_t width,
+              int64_t k,
+              bool largest,
+              T* out,
+              int64_t* indices) {
+  using Key = typename detail::SortKey<T>::Key;
+  if (k == 0) {
+    return;
+  }
+  ParallelFor(
+      0, height, detail::RowsPerChunk(width), [&](int64_t b, int64_t e) {
+        std::vector<detail::KeyIndex<Key>> items;
+        for (int64_t i = b; i < e; ++i) {
+          const T* row = x + i * width;
+          if (k * kTopKHeapRatio <= width) {
+            detail::HeapSelect(row, width, k, largest, &items);
+          } else {
+            detail::MakeKeys(row, width, largest, &items);
+            std::nth_element(items.begin(), items.begin() + k - 1, items.end());
+            std::sort(items.begin(), items.begin() + k);
+          }
+          detail::WriteRow(row, items.data(), k, out + i * k, indices + i * k);
+        }
+      });
+}
+
+}  // namespace custom_kernel
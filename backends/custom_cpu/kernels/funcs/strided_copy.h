@@ -0,0 +1,318 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/thread_pool.h"
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread.
+constexpr int64_t kStridedCopyGrainSize = 32768;
+// Side of the square tiles a transposed plane is copied in. Rows of a tile
+// span a couple of cache lines in both the source and the destination.
+constexpr int64_t kTransposeTileSize = 32;
+
+// One dim of a copy: its extent and its stride, in elements, in the source
+// and in the destination view.
+struct CopyDim {
+  int64_t size;
+  int64_t src_stride;
+  int64_t dst_stride;
+};
+
+// Reduces a strided copy to the fewest dims that describe it. Size-1 dims
+// are dropped, the rest are ordered by decreasing destination stride and
+// adjacent dims that are contiguous in both views are merged. An empty plan
+// copies a single element.
+inline std::vector<CopyDim> CopyPlan(const std::vector<int64_t>& dims,
+                                     const std::vector<int64_t>& src_strides,
+                                     const std::vector<int64_t>& dst_strides) {
+  std::vector<CopyDim> sorted;
+  for (size_t i = 0; i < dims.size(); ++i) {
+    if (dims[i] != 1) {
+      sorted.push_back({dims[i], src_strides[i], dst_strides[i]});
+    }
+  }
+  std::stable_sort(
+      sorted.begin(), sorted.end(), [](const CopyDim& a, const CopyDim& b) {
+        return a.dst_stride > b.dst_stride;
+      });
+  std::vector<CopyDim> plan;
+  for (const auto& dim : sorted) {
+    if (!plan.empty() && plan.back().src_stride == dim.src_stride * dim.size &&
+        plan.back().dst_stride == dim.dst_stride * dim.size) {
+      plan.back().size *= dim.size;
+      plan.back().src_stride = dim.src_stride;
+      plan.back().dst_stride = dim.dst_stride;
+    } else {
+      plan.push_back(dim);
+    }
+  }
+  return plan;
+}
+
+namespace detail {
+
+// Walks the first `rank` dims of a plan in row-major order and tracks the
+// source and destination offsets, so only the starting index of a chunk
+// pays for a div/mod chain.
+class CopyCounter {
+ public:
+  CopyCounter(const std::vector<CopyDim>& plan, size_t rank, int64_t index)
+      : plan_(plan), index_(rank) {
+    for (size_t i = rank; i-- > 0;) {
+      index_[i] = index % plan[i].size;
+      index /= plan[i].size;
+      src_ += index_[i] * plan[i].src_stride;
+      dst_ += index_[i] * plan[i].dst_stride;
+    }
+  }
+
+  int64_t src() const { return src_; }
+  int64_t dst() const { return dst_; }
+
+  void Next() {
+    for (size_t i = index_.size(); i-- > 0;) {
+      const auto& dim = plan_[i];
+      src_ += dim.src_stride;
+      dst_ += dim.dst_stride;
+      if (++index_[i] < dim.size) {
+        return;
+      }
+      index_[i] = 0;
+      src_ -= dim.src_stride * dim.size;
+      dst_ -= dim.dst_stride * dim.size;
+    }
+  }
+
+ private:
+  const std::vector<CopyDim>& plan_;
+  std::vector<int64_t> index_;
+  int64_t src_ = 0;
+  int64_t dst_ = 0;
+};
+
+template <typename T>
+inline void CopyRun(
+    const T* src, int64_t src_stride, T* dst, int64_t dst_stride, int64_t n) {
+  if (src_stride == 1 && dst_stride == 1) {
+    std::memcpy(dst, src, n * sizeof(T));
+  } else if (dst_stride == 1) {
+    for (int64_t i = 0; i < n; ++i) {
+      dst[i] = src[i * src_stride];
+    }
+  } else {
+    for (int64_t i = 0; i < n; ++i) {
+      dst[i * dst_stride] = src[i * src_stride];
+    }
+  }
+}
+
+// Copies the plan row by row along its innermost dim. A single-dim plan is
+// split along that dim instead.
+template <typename T>
+void CopyRows(const std::vector<CopyDim>& plan, const T* src, T* dst) {
+  const CopyDim inner = plan.back();
+  if (plan.size() == 1) {
+    ParallelFor(
+        0, inner.size, kStridedCopyGrainSize, [&](int64_t begin, int64_t end) {
+          CopyRun(src + begin * inner.src_stride,
+                  inner.src_stride,
+                  dst + begin * inner.dst_stride,
+                  inner.dst_stride,
+                  end - begin);
+        });
+    return;
+  }
+  const size_t outer_rank = plan.size() - 1;
+  int64_t rows = 1;
+  for (size_t i = 0; i < outer_rank; ++i) {
+    rows *= plan[i].size;
+  }
+  int64_t grain = std::max<int64_t>(1, kStridedCopyGrainSize / inner.size);
+  ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    CopyCounter counter(plan, outer_rank, begin);
+    for (int64_t r = begin; r < end; ++r, counter.Next()) {
+      CopyRun(src + counter.src(),
+              inner.src_stride,
+              dst + counter.dst(),
+              inner.dst_stride,
+              inner.size);
+    }
+  });
+}
+
+// The last two dims of the plan form a transposed plane: dim `a` is
+// contiguous in the source and dim `b` in the destination. Every plane is
+// copied in tiles small enough that the strided side of the copy stays in
+// cache. A short dim widens the tile along the other one.
+template <typename T>
+void CopyTiles(const std::vector<CopyDim>& plan, const T* src, T* dst) {
+  const size_t outer_rank = plan.size() - 2;
+  const CopyDim a = plan[outer_rank];
+  const CopyDim b = plan[outer_rank + 1];
+  constexpr int64_t kTileArea = kTransposeTileSize * kTransposeTileSize;
+  int64_t tile_b = std::min(b.size, kTransposeTileSize);
+  int64_t tile_a = std::min(a.size, kTileArea / tile_b);
+  tile_b = std::min(b.size, kTileArea / tile_a);
+
+  int64_t outer = 1;
+  for (size_t i = 0; i < outer_rank; ++i) {
+    outer *= plan[i].size;
+  }
+  int64_t tiles_a = (a.size + tile_a - 1) / tile_a;
+  int64_t tiles_b = (b.size + tile_b - 1) / tile_b;
+  int64_t tiles_per_plane = tiles_a * tiles_b;
+  int64_t grain = std::max<int64_t>(1, kStridedCopyGrainSize / kTileArea);
+
+  ParallelFor(
+      0, outer * tiles_per_plane, grain, [&](int64_t begin, int64_t end) {
+        int64_t plane = begin / tiles_per_plane;
+        CopyCounter counter(plan, outer_rank, plane);
+        for (int64_t t = begin; t < end; ++t) {
+          if (t / tiles_per_plane != plane) {
+            ++plane;
+            counter.Next();
+          }
+          int64_t a0 = t % tiles_per_plane / tiles_b * tile_a;
+          int64_t b0 = t % tiles_b * tile_b;
+          int64_t na = std::min(tile_a, a.size - a0);
+          int64_t nb = std::min(tile_b, b.size - b0);
+          const T* s = src + counter.src() + a0 + b0 * b.src_stride;
+          T* d = dst + counter.dst() + a0 * a.dst_stride + b0;
+          for (int64_t i = 0; i < na; ++i) {
+            for (int64_t j = 0; j < nb; ++j) {
+              d[i * a.dst_stride + j] = s[i + j * b.src_stride];
+            }
+          }
+        }
+      });
+}
+
+}  // namespace detail
+
+// Copies the `dims`-shaped view of `src` with `src_strides` into the view of
+// `dst` with `dst_strides`. Strides are in elements and the views must not
+// overlap.
+template <typename T>
+void StridedCopyCompute(const std::vector<int64_t>& dims,
+                        const T* src,
+                        const std::vector<int64_t>& src_strides,
+                        T* dst,
+                        const std::vector<int64_t>& dst_strides) {
+  for (auto d : dims) {
+    if (d == 0) {
+      return;
+    }
+  }
+  auto plan = CopyPlan(dims, src_strides, dst_strides);
+  if (plan.empty()) {
+    *dst = *src;
+    return;
+  }
+  const size_t rank = plan.size();
+  if (rank >= 2 && plan.back().dst_stride == 1 && plan.back().src_stride != 1) {
+    for (size_t j = 0; j + 1 < rank; ++j) {
+      if (plan[j].src_stride == 1) {
+        // Only the iteration order changes, so the source-contiguous dim can
+        // be moved next to the destination-contiguous one.
+        std::rotate(plan.begin() + j, plan.begin() + j + 1, plan.end() - 1);
+        detail::CopyTiles(plan, src, dst);
+        return;
+      }
+    }
+  }
+  detail::CopyRows(plan, src, dst);
+}
+
+// Contiguous strides of `dims`, in elements.
+inline std::vector<int64_t> ContiguousStrides(
+    const std::vector<int64_t>& dims) {
+  std::vector<int64_t> strides(dims.size(), 1);
+  for (size_t i = dims.size(); i-- > 1;) {
+    strides[i - 1] = strides[i] * dims[i];
+  }
+  return strides;
+}
+
+// Strides, in elements, that view the memory of a tensor of `dims` and
+// `strides` as `new_dims`. Returns false when no such strides exist, e.g.
+// when merging dims that a transpose has made non-adjacent, and the reshape
+// has to copy. Dims are matched in chunks of the input that are contiguous
+// among themselves.
+inline bool ReshapeStrides(const std::vector<int64_t>& dims,
+                           const std::vector<int64_t>& strides,
+                           const std::vector<int64_t>& new_dims,
+                           std::vector<int64_t>* new_strides) {
+  new_strides->assign(new_dims.size(), 1);
+  int64_t numel = 1;
+  for (auto d : dims) {
+    numel *= d;
+  }
+  if (numel == 0 || dims.empty()) {
+    *new_strides = ContiguousStrides(new_dims);
+    return true;
+  }
+  int64_t view_d = static_cast<int64_t>(new_dims.size()) - 1;
+  int64_t chunk_base_stride = strides.back();
+  int64_t chunk_numel = 1;
+  int64_t view_numel = 1;
+  for (int64_t d = static_cast<int64_t>(dims.size()) - 1; d >= 0; --d) {
+    chunk_numel *= dims[d];
+    // A chunk ends where the next outer dim does not continue it.
+    if (d == 0 || (dims[d - 1] != 1 &&
+                   strides[d - 1] != chunk_numel * chunk_base_stride)) {
+      while (view_d >= 0 &&
+             (view_numel < chunk_numel || new_dims[view_d] == 1)) {
+        (*new_strides)[view_d] = view_numel * chunk_base_stride;
+        view_numel *= new_dims[view_d];
+        --view_d;
+      }
+      if (view_numel != chunk_numel) {
+        return false;
+      }
+      if (d > 0) {
+        chunk_base_stride = strides[d - 1];
+        chunk_numel = 1;
+        view_numel = 1;
+      }
+    }
+  }
+  return view_d == -1;
+}
+
+// out[i0, ..., in] = x[j0, ..., jn] where j[axis[k]] = i[k]; both tensors
+// are contiguous and `x_dims` is the shape of x.
+template <typename T>
+void TransposeCompute(const std::vector<int64_t>& x_dims,
+                      const std::vector<int>& axis,
+                      const T* x,
+                      T* out) {
+  auto x_strides = ContiguousStrides(x_dims);
+  std::vector<int64_t> out_dims(axis.size()), src_strides(axis.size());
+  for (size_t i = 0; i < axis.size(); ++i) {
+    out_dims[i] = x_dims[axis[i]];
+    src_strides[i] = x_strides[axis[i]];
+  }
+  StridedCopyCompute(
+      out_dims, x, src_strides, out, ContiguousStrides(out_dims));
+}
+
+}  // namespace custom_kernel
@@ -0,0 +1,243 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/thread_pool.h"
+
+#include <algorithm>
+#include <utility>
+
+#include "runtime/flags.h"
+
+namespace custom_kernel {
+
+namespace {
+
+// Set on pool workers and on a caller while it executes chunks, so that a
+// ParallelFor issued from inside a chunk runs inline instead of waiting on
+// workers that are already busy.
+thread_local bool tls_in_parallel_region = false;
+
+// Marks the calling thread as inside a parallel region while in scope, also
+// when a chunk throws.
+class ParallelRegionScope {
+ public:
+  ParallelRegionScope() : previous_(tls_in_parallel_region) {
+    tls_in_parallel_region = true;
+  }
+  ~ParallelRegionScope() { tls_in_parallel_region = previous_; }
+
+  ParallelRegionScope(const ParallelRegionScope&) = delete;
+  ParallelRegionScope& operator=(const ParallelRegionScope&) = delete;
+
+ private:
+  bool previous_;
+};
+
+thread_local ThreadPool* tls_scoped_pool = nullptr;
+
+std::atomic<int> current_device{0};
+
+constexpr int kMaxDevices = 64;
+
+// Pools are created once per device and never destroyed: kernels may still
+// run during static destruction.
+std::atomic<ThreadPool*> device_pools[kMaxDevices];
+std::mutex device_pools_mutex;
+
+int NumThreadsFromEnv() {
+  int num_threads = EnvToInt("FLAGS_custom_cpu_num_threads", 0);
+  if (num_threads <= 0) {
+    num_threads = static_cast<int>(std::thread::hardware_concurrency());
+  }
+  return std::max(1, num_threads);
+}
+
+}  // namespace
+
+ThreadPool& ThreadPool::Instance() {
+  if (tls_scoped_pool) {
+    return *tls_scoped_pool;
+  }
+  return ForDevice(current_device.load(std::memory_order_relaxed));
+}
+
+ThreadPool& ThreadPool::ForDevice(int device_id) {
+  auto& slot = device_pools[std::min(std::max(device_id, 0), kMaxDevices - 1)];
+  ThreadPool* pool = slot.load(std::memory_order_acquire);
+  if (!pool) {
+    std::lock_guard<std::mutex> lock(device_pools_mutex);
+    pool = slot.load(std::memory_order_relaxed);
+    if (!pool) {
+      pool = new ThreadPool(NumThreadsFromEnv(),
+                            EnvToBool("FLAGS_custom_cpu_deterministic", false));
+      slot.store(pool, std::memory_order_release);
+    }
+  }
+  return *pool;
+}
+
+void ThreadPool::SetCurrentDevice(int device_id) {
+  current_device.store(device_id, std::memory_order_relaxed);
+}
+
+ThreadPool::ThreadPool(int num_threads, bool deterministic)
+    : num_threads_(std::max(1, num_threads)), deterministic_(deterministic) {
+  workers_.reserve(num_threads_ - 1);
+  for (int i = 0; i < num_threads_ - 1; ++i) {
+    workers_.emplace_back([this] { WorkerLoop(); });
+  }
+}
+
+ThreadPool::~ThreadPool() {
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    stop_ = true;
+  }
+  work_cv_.notify_all();
+  for (auto& worker : workers_) {
+    worker.join();
+  }
+}
+
+void ThreadPool::RunChunks(const std::function<void(int64_t, int64_t)>& fn) {
+  while (true) {
+    int64_t chunk = next_chunk_.fetch_add(1, std::memory_order_relaxed);
+    if (chunk >= num_chunks_) {
+      return;
+    }
+    int64_t chunk_begin = begin_ + chunk * chunk_size_;
+    int64_t chunk_end = std::min(end_, chunk_begin + chunk_size_);
+    // Chunks still count down after a failure, so the caller's wait ends.
+    if (!failed_.load(std::memory_order_relaxed)) {
+      try {
+        fn(chunk_begin, chunk_end);
+      } catch (...) {
+        std::lock_guard<std::mutex> lock(mutex_);
+        if (!error_) {
+          error_ = std::current_exception();
+        }
+        failed_.store(true, std::memory_order_relaxed);
+      }
+    }
+    if (remaining_chunks_.fetch_sub(1, std::memory_order_acq_rel) == 1) {
+      std::lock_guard<std::mutex> lock(mutex_);
+      done_cv_.notify_all();
+    }
+  }
+}
+
+void ThreadPool::WorkerLoop() {
+  tls_in_parallel_region = true;
+  uint64_t seen_generation = 0;
+  while (true) {
+    const std::function<void(int64_t, int64_t)>* fn = nullptr;
+    {
+      std::unique_lock<std::mutex> lock(mutex_);
+      work_cv_.wait(lock,
+                    [&] { return stop_ || generation_ != seen_generation; });
+      if (stop_) {
+        return;
+      }
+      seen_generation = generation_;
+      if (!job_open_) {
+        continue;
+      }
+      fn = fn_;
+      ++busy_workers_;
+    }
+    RunChunks(*fn);
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      --busy_workers_;
+    }
+    done_cv_.notify_all();
+  }
+}
+
+int64_t ThreadPool::ChunkSize(int64_t range, int64_t grain) const {
+  grain = std::max<int64_t>(grain, 1);
+  if (deterministic_) {
+    return grain;
+  }
+  int64_t max_chunks = std::min<int64_t>((range + grain - 1) / grain,
+                                         static_cast<int64_t>(num_threads_));
+  return (range + max_chunks - 1) / std::max<int64_t>(max_chunks, 1);
+}
+
+void ThreadPool::ParallelFor(int64_t begin,
+                             int64_t end,
+                             int64_t grain,
+                             const std::function<void(int64_t, int64_t)>& fn) {
+  if (begin >= end) {
+    return;
+  }
+  int64_t range = end - begin;
+  int64_t chunk_size = ChunkSize(range, grain);
+  if (num_threads_ == 1 || range <= chunk_size || tls_in_parallel_region) {
+    // A deterministic pool still hands out its fixed chunks, so that work
+    // depending on chunk boundaries matches a run on more threads.
+    for (int64_t b = begin; deterministic_ && b < end; b += chunk_size) {
+      fn(b, std::min(end, b + chunk_size));
+    }
+    if (!deterministic_) {
+      fn(begin, end);
+    }
+    return;
+  }
+
+  std::lock_guard<std::mutex> submit_lock(submit_mutex_);
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    fn_ = &fn;
+    begin_ = begin;
+    end_ = end;
+    chunk_size_ = chunk_size;
+    num_chunks_ = (range + chunk_size - 1) / chunk_size;
+    next_chunk_.store(0, std::memory_order_relaxed);
+    remaining_chunks_.store(num_chunks_, std::memory_order_relaxed);
+    failed_.store(false, std::memory_order_relaxed);
+    job_open_ = true;
+    ++generation_;
+  }
+  work_cv_.notify_all();
+
+  {
+    ParallelRegionScope region;
+    RunChunks(fn);
+  }
+
+  std::exception_ptr error;
+  {
+    std::unique_lock<std::mutex> lock(mutex_);
+    done_cv_.wait(lock, [this] {
+      return remaining_chunks_.load(std::memory_order_acquire) == 0 &&
+             busy_workers_ == 0;
+    });
+    job_open_ = false;
+    fn_ = nullptr;
+    std::swap(error, error_);
+  }
+  if (error) {
+    std::rethrow_exception(error);
+  }
+}
+
+ScopedThreadPool::ScopedThreadPool(ThreadPool* pool)
+    : previous_(tls_scoped_pool) {
+  tls_scoped_pool = pool;
+}
+
+ScopedThreadPool::~ScopedThreadPool() { tls_scoped_pool = previous_; }
+
+}  // namespace custom_kernel
@@ -0,0 +1,158 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <cstdint>
+#include <exception>
+#include <functional>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+namespace custom_kernel {
+
+// Minimum number of elements handed to one thread by plain per-element
+// loops in the kernels.
+constexpr int64_t kElementwiseGrainSize = 32768;
+
+// A fixed-size pool of worker threads used to split a kernel's iteration
+// space across host cores. The calling thread always takes part in the work,
+// so a pool of N threads owns N - 1 workers.
+//
+// Every device has its own pool, created on first use with
+// FLAGS_custom_cpu_num_threads threads (all hardware threads when unset or
+// 0). With FLAGS_custom_cpu_deterministic set, chunk boundaries depend only
+// on the range and the grain, never on the number of threads, so reductions
+// over per-chunk partials give the same result on any pool size.
+class ThreadPool {
+ public:
+  // The pool installed by a ScopedThreadPool on this thread, otherwise the
+  // pool of the current device.
+  static ThreadPool& Instance();
+  static ThreadPool& ForDevice(int device_id);
+  // Called by the runtime when the current device changes.
+  static void SetCurrentDevice(int device_id);
+
+  explicit ThreadPool(int num_threads, bool deterministic = false);
+  ~ThreadPool();
+
+  ThreadPool(const ThreadPool&) = delete;
+  ThreadPool& operator=(const ThreadPool&) = delete;
+
+  int NumThreads() const { return num_threads_; }
+  bool Deterministic() const { return deterministic_; }
+
+  // Size of the chunks [begin, end) is split into.
+  int64_t ChunkSize(int64_t range, int64_t grain) const;
+
+  // Calls fn(chunk_begin, chunk_end) over disjoint chunks covering
+  // [begin, end). Chunks hold at least `grain` iterations. Returns once every
+  // chunk has run. Calls made from inside a chunk, on this or any other
+  // pool, run serially so nested kernels never oversubscribe the host. If a
+  // chunk throws, the chunks not yet started are skipped and the first
+  // exception is rethrown on the calling thread.
+  void ParallelFor(int64_t begin,
+                   int64_t end,
+                   int64_t grain,
+                   const std::function<void(int64_t, int64_t)>& fn);
+
+ private:
+  void WorkerLoop();
+  void RunChunks(const std::function<void(int64_t, int64_t)>& fn);
+
+  int num_threads_;
+  bool deterministic_;
+  std::vector<std::thread> workers_;
+
+  // Serializes job submission from concurrent callers.
+  std::mutex submit_mutex_;
+
+  std::mutex mutex_;
+  std::condition_variable work_cv_;
+  std::condition_variable done_cv_;
+  uint64_t generation_ = 0;
+  bool job_open_ = false;
+  bool stop_ = false;
+  int busy_workers_ = 0;
+
+  // The job currently being executed, guarded by `job_open_`.
+  const std::function<void(int64_t, int64_t)>* fn_ = nullptr;
+  int64_t begin_ = 0;
+  int64_t end_ = 0;
+  int64_t chunk_size_ = 0;
+  int64_t num_chunks_ = 0;
+  std::atomic<int64_t> next_chunk_{0};
+  std::atomic<int64_t> remaining_chunks_{0};
+  // The first exception thrown by a chunk of the current job.
+  std::atomic<bool> failed_{false};
+  std::exception_ptr error_;
+};
+
+// Routes the ParallelFor calls of the constructing thread to `pool` while in
+// scope.
+class ScopedThreadPool {
+ public:
+  explicit ScopedThreadPool(ThreadPool* pool);
+  ~ScopedThreadPool();
+
+  ScopedThreadPool(const ScopedThreadPool&) = delete;
+  ScopedThreadPool& operator=(const ScopedThreadPool&) = delete;
+
+ private:
+  ThreadPool* previous_;
+};
+
+// Shorthand for ThreadPool::Instance().ParallelFor(...).
+inline void ParallelFor(int64_t begin,
+                        int64_t end,
+                        int64_t grain,
+                        const std::function<void(int64_t, int64_t)>& fn) {
+  ThreadPool::Instance().ParallelFor(begin, end, grain, fn);
+}
+
+// Folds map(chunk_begin, chunk_end) over the chunks of [begin, end) with
+// `combine`, in chunk order. The result is reproducible across pool sizes
+// when the pool is deterministic.
+template <typename T, typename MapFn, typename CombineFn>
+T ParallelReduce(int64_t begin,
+                 int64_t end,
+                 int64_t grain,
+                 T identity,
+                 const MapFn& map,
+                 const CombineFn& combine) {
+  if (begin >= end) {
+    return identity;
+  }
+  auto& pool = ThreadPool::Instance();
+  int64_t chunk = pool.ChunkSize(end - begin, grain);
+  int64_t num_chunks = (end - begin + chunk - 1) / chunk;
+  std::vector<T> partials(num_chunks, identity);
+  pool.ParallelFor(0, num_chunks, 1, [&](int64_t first, int64_t last) {
+    for (int64_t c = first; c < last; ++c) {
+      int64_t chunk_begin = begin + c * chunk;
+      partials[c] = map(chunk_begin, std::min(end, chunk_begin + chunk));
+    }
+  });
+  T result = identity;
+  for (const auto& partial : partials) {
+    result = combine(result, partial);
+  }
+  return result;
+}
+
+}  // namespace custom_kernel
@@ -23,6 +23,21 @@ void TransposeKernel(const phi::Context& ctx,
                      const std::vector<int>& axis,
                      phi::DenseTensor* out);
 
+// Copies x into out, contiguous, with the shape `out_dims`.
+template <typename T>
+void ReshapeCopy(const phi::Context& dev_ctx,
+                 const phi::DenseTensor& x,
+                 const std::vector<int64_t>& out_dims,
+                 phi::DenseTensor* out);
+
+// Makes out a view of x with the shape `out_dims`, or a contiguous copy when
+// the strides of x can't express that shape.
+template <typename T>
+void ReshapeView(const phi::Context& dev_ctx,
+                 const phi::DenseTensor& x,
+                 const std::vector<int64_t>& out_dims,
+                 phi::DenseTensor* out);
+
 template <typename T>
 void SoftmaxKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& x,
@@ -12,8 +12,11 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/reduce.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -21,15 +24,11 @@ template <typename T>
 void MeanAllKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& x,
                    phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto out_data = dev_ctx.template Alloc<T>(out);
-  auto x_data = x.data<T>();
-  auto numel = x.numel();
-
-  *out_data = 0;
-  for (auto i = 0; i < numel; ++i) {
-    *out_data += x_data[i];
-  }
-  *out_data /= static_cast<T>(numel);
+  ReduceCompute<T, AccType<T>, T>(
+      {x.numel()}, {0}, x.data<T>(), out_data, MeanReducer<AccType<T>>());
 }
 
 template <typename T>
@@ -37,6 +36,8 @@ void MeanAllGradKernel(const phi::Context& dev_ctx,
                        const phi::DenseTensor& x,
                        const phi::DenseTensor& out_grad,
                        phi::DenseTensor* x_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   PD_CHECK(out_grad.numel() == 1UL,
            "Mean Gradient should be scalar. But received "
            "Out@Grad's elements num is %d.",
@@ -44,9 +45,10 @@ void MeanAllGradKernel(const phi::Context& dev_ctx,
   auto x_grad_data = dev_ctx.template Alloc<T>(x_grad);
   auto out_grad_data = out_grad.data<T>();
   auto numel = x_grad->numel();
-  for (auto i = 0; i < numel; ++i) {
-    x_grad_data[i] = *out_grad_data / static_cast<T>(numel);
-  }
+  std::fill(x_grad_data,
+            x_grad_data + numel,
+            Convert<T>(Convert<AccType<T>>(*out_grad_data) /
+                       static_cast<AccType<T>>(numel)));
 }
 
 }  // namespace custom_kernel
@@ -56,11 +58,15 @@ PD_BUILD_PHI_KERNEL(mean_all,
                     ALL_LAYOUT,
                     custom_kernel::MeanAllKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(mean_all_grad,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::MeanAllGradKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
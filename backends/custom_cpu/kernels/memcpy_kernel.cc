@@ -14,6 +14,8 @@
 
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -22,6 +24,8 @@ void MemcpyD2HKernel(const phi::Context& dev_ctx,
                      const phi::DenseTensor& x,
                      int dst_place_type,
                      phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto out_data = dev_ctx.HostAlloc<T>(out);
   auto x_data = x.data<T>();
   memcpy(out_data, x_data, x.memory_size());
@@ -32,6 +36,8 @@ void MemcpyH2DKernel(const phi::Context& dev_ctx,
                      const phi::DenseTensor& x,
                      int dst_place_type,
                      phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto out_data = dev_ctx.Alloc<T>(out);
   auto x_data = x.data<T>();
   memcpy(out_data, x_data, x.memory_size());
@@ -0,0 +1,235 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/optimizer.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// Gathers the buffers and scalars of one parameter for MomentumCompute and
+// allocates its outputs. master_param may be null.
+template <typename T, typename MT>
+MomentumTensor<T, MT> MakeMomentumTensor(
+    const phi::Context& dev_ctx,
+    const phi::DenseTensor& param,
+    const phi::DenseTensor& grad,
+    const phi::DenseTensor& velocity,
+    const phi::DenseTensor& learning_rate,
+    const phi::DenseTensor* master_param,
+    const std::string& regularization_method,
+    float regularization_coeff,
+    phi::DenseTensor* param_out,
+    phi::DenseTensor* velocity_out,
+    phi::DenseTensor* master_param_out) {
+  using AccT = AccType<T>;
+  MomentumTensor<T, MT> t;
+  t.param = param.data<T>();
+  t.grad = grad.data<T>();
+  t.velocity = velocity.data<MT>();
+  t.master = master_param ? master_param->data<AccT>() : nullptr;
+  t.param_out = dev_ctx.template Alloc<T>(param_out);
+  t.velocity_out = dev_ctx.template Alloc<MT>(velocity_out);
+  t.master_out =
+      master_param ? dev_ctx.template Alloc<AccT>(master_param_out) : nullptr;
+  t.numel = param.numel();
+  t.lr = ScalarValue<AccT>(learning_rate);
+  t.l2_coeff = regularization_method == "l2_decay"
+                   ? static_cast<AccT>(regularization_coeff)
+                   : AccT(0);
+  return t;
+}
+
+template <typename T, typename MT>
+void MomentumImpl(const phi::Context& dev_ctx,
+                  const std::vector<const phi::DenseTensor*>& param,
+                  const std::vector<const phi::DenseTensor*>& grad,
+                  const std::vector<const phi::DenseTensor*>& velocity,
+                  const std::vector<const phi::DenseTensor*>& learning_rate,
+                  const std::vector<const phi::DenseTensor*>* master_param,
+                  const std::vector<std::string>& regularization_method,
+                  const std::vector<float>& regularization_coeff,
+                  const MomentumConfig<AccType<T>>& config,
+                  const std::vector<phi::DenseTensor*>& param_out,
+                  const std::vector<phi::DenseTensor*>& velocity_out,
+                  const std::vector<phi::DenseTensor*>& master_param_out) {
+  const size_t n = param.size();
+  std::vector<MomentumTensor<T, MT>> tensors;
+  tensors.reserve(n);
+  for (size_t i = 0; i < n; ++i) {
+    const bool has_reg = !regularization_method.empty();
+    tensors.push_back(MakeMomentumTensor<T, MT>(
+        dev_ctx,
+        *param[i],
+        *grad[i],
+        *velocity[i],
+        *learning_rate[learning_rate.size() == 1 ? 0 : i],
+        master_param ? (*master_param)[i] : nullptr,
+        has_reg ? regularization_method[i] : std::string(),
+        has_reg ? regularization_coeff[i] : 0.0f,
+        param_out[i],
+        velocity_out[i],
+        master_param ? master_param_out[i] : nullptr));
+  }
+  MomentumCompute(tensors, config);
+}
+
+// Dispatches on the velocity dtype: mixed-precision programs keep the
+// velocity of 16-bit parameters in float32.
+template <typename T>
+void MomentumDispatch(const phi::Context& dev_ctx,
+                      const std::vector<const phi::DenseTensor*>& param,
+                      const std::vector<const phi::DenseTensor*>& grad,
+                      const std::vector<const phi::DenseTensor*>& velocity,
+                      const std::vector<const phi::DenseTensor*>& learning_rate,
+                      const std::vector<const phi::DenseTensor*>* master_param,
+                      float mu,
+                      bool use_nesterov,
+                      const std::vector<std::string>& regularization_method,
+                      const std::vector<float>& regularization_coeff,
+                      float rescale_grad,
+                      const std::vector<phi::DenseTensor*>& param_out,
+                      const std::vector<phi::DenseTensor*>& velocity_out,
+                      const std::vector<phi::DenseTensor*>& master_param_out) {
+  using AccT = AccType<T>;
+  MomentumConfig<AccT> config;
+  config.mu = static_cast<AccT>(mu);
+  config.use_nesterov = use_nesterov;
+  config.rescale_grad = static_cast<AccT>(rescale_grad);
+  const bool acc_velocity =
+      HalfTraits<T>::kIsHalf && velocity[0]->dtype() == phi::DataType::FLOAT32;
+  auto impl = acc_velocity ? MomentumImpl<T, AccT> : MomentumImpl<T, T>;
+  impl(dev_ctx,
+       param,
+       grad,
+       velocity,
+       learning_rate,
+       master_param,
+       regularization_method,
+       regularization_coeff,
+       config,
+       param_out,
+       velocity_out,
+       master_param_out);
+}
+
+template <typename T>
+void MomentumDenseKernel(const phi::Context& dev_ctx,
+                         const phi::DenseTensor& param,
+                         const phi::DenseTensor& grad,
+                         const phi::DenseTensor& velocity,
+                         const phi::DenseTensor& learning_rate,
+                         const paddle::optional<phi::DenseTensor>& master_param,
+                         float mu,
+                         bool use_nesterov,
+                         const std::string& regularization_method,
+                         float regularization_coeff,
+                         bool multi_precision,
+                         float rescale_grad,
+                         phi::DenseTensor* param_out,
+                         phi::DenseTensor* velocity_out,
+                         phi::DenseTensor* master_param_out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  const std::vector<const phi::DenseTensor*> master = {
+      multi_precision && master_param ? master_param.get_ptr() : nullptr};
+  MomentumDispatch<T>(dev_ctx,
+                      {&param},
+                      {&grad},
+                      {&velocity},
+                      {&learning_rate},
+                      master[0] ? &master : nullptr,
+                      mu,
+                      use_nesterov,
+                      {regularization_method},
+                      {regularization_coeff},
+                      rescale_grad,
+                      {param_out},
+                      {velocity_out},
+                      {master_param_out});
+}
+
+template <typename T>
+void MergedMomentumKernel(
+    const phi::Context& dev_ctx,
+    const std::vector<const phi::DenseTensor*>& param,
+    const std::vector<const phi::DenseTensor*>& grad,
+    const std::vector<const phi::DenseTensor*>& velocity,
+    const std::vector<const phi::DenseTensor*>& learning_rate,
+    const paddle::optional<std::vector<const phi::DenseTensor*>>& master_param,
+    float mu,
+    bool use_nesterov,
+    const std::vector<std::string>& regularization_method,
+    const std::vector<float>& regularization_coeff,
+    bool multi_precision,
+    float rescale_grad,
+    std::vector<phi::DenseTensor*> param_out,
+    std::vector<phi::DenseTensor*> velocity_out,
+    std::vector<phi::DenseTensor*> master_param_out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  const size_t n = param.size();
+  PD_CHECK(grad.size() == n && velocity.size() == n,
+           "merged_momentum expects one grad and velocity per param.");
+  PD_CHECK(learning_rate.size() == 1 || learning_rate.size() == n,
+           "merged_momentum expects one learning_rate, or one per param.");
+  PD_CHECK(
+      regularization_method.empty() || (regularization_method.size() == n &&
+                                        regularization_coeff.size() == n),
+      "merged_momentum expects one regularization per param, or none.");
+  if (n == 0) {
+    return;
+  }
+  const auto* master =
+      multi_precision && master_param ? master_param.get_ptr() : nullptr;
+  PD_CHECK(!master || master->size() == n,
+           "merged_momentum expects one master_param per param.");
+  // All the parameters are updated in one pass over the thread pool.
+  MomentumDispatch<T>(dev_ctx,
+                      param,
+                      grad,
+                      velocity,
+                      learning_rate,
+                      master,
+                      mu,
+                      use_nesterov,
+                      regularization_method,
+                      regularization_coeff,
+                      rescale_grad,
+                      param_out,
+                      velocity_out,
+                      master_param_out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(momentum,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::MomentumDenseKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(merged_momentum,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::MergedMomentumKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,359 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/norm.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// Splits x into rows of the dims from begin_norm_axis on.
+static void NormRowsCols(const phi::DenseTensor& x,
+                         int begin_norm_axis,
+                         int64_t* rows,
+                         int64_t* cols) {
+  auto dims = x.dims();
+  const int rank = dims.size();
+  const int axis =
+      begin_norm_axis < 0 ? begin_norm_axis + rank : begin_norm_axis;
+  PD_CHECK(axis >= 0 && axis < rank,
+           "begin_norm_axis must be in [%d, %d), but received %d.",
+           -rank,
+           rank,
+           begin_norm_axis);
+  *rows = 1;
+  *cols = 1;
+  for (int i = 0; i < rank; ++i) {
+    (i < axis ? *rows : *cols) *= dims[i];
+  }
+}
+
+// A [cols] parameter in the accumulation type of T, empty when absent.
+// Parameters of 16-bit inputs may be kept in float32.
+template <typename T>
+static std::vector<AccType<T>> NormParam(const phi::DenseTensor* param) {
+  using AccT = AccType<T>;
+  std::vector<AccT> values;
+  if (!param) {
+    return values;
+  }
+  values.resize(param->numel());
+  if (param->dtype() == phi::DataType::FLOAT32) {
+    const float* data = param->data<float>();
+    for (size_t i = 0; i < values.size(); ++i) {
+      values[i] = static_cast<AccT>(data[i]);
+    }
+  } else {
+    const T* data = param->data<T>();
+    for (size_t i = 0; i < values.size(); ++i) {
+      values[i] = Convert<AccT>(data[i]);
+    }
+  }
+  return values;
+}
+
+// Stores the grad of a parameter in the parameter's dtype.
+template <typename T>
+static void StoreParamGrad(const phi::Context& dev_ctx,
+                           const std::vector<AccType<T>>& grad,
+                           const phi::DenseTensor* param,
+                           phi::DenseTensor* param_grad) {
+  if (!param || !param_grad) {
+    return;
+  }
+  if (param->dtype() == phi::DataType::FLOAT32) {
+    float* data = dev_ctx.template Alloc<float>(param_grad);
+    for (size_t i = 0; i < grad.size(); ++i) {
+      data[i] = static_cast<float>(grad[i]);
+    }
+  } else {
+    T* data = dev_ctx.template Alloc<T>(param_grad);
+    for (size_t i = 0; i < grad.size(); ++i) {
+      data[i] = Convert<T>(grad[i]);
+    }
+  }
+}
+
+template <typename T>
+static const T* OptionalData(const std::vector<T>& v) {
+  return v.empty() ? nullptr : v.data();
+}
+
+template <typename T>
+static const T* OptionalData(const paddle::optional<phi::DenseTensor>& t) {
+  return t ? t->data<T>() : nullptr;
+}
+
+template <typename T>
+void RmsNormKernel(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& x,
+                   const paddle::optional<phi::DenseTensor>& bias,
+                   const paddle::optional<phi::DenseTensor>& residual,
+                   const phi::DenseTensor& norm_weight,
+                   const paddle::optional<phi::DenseTensor>& norm_bias,
+                   float epsilon,
+                   int begin_norm_axis,
+                   float quant_scale,
+                   int quant_round_type,
+                   float quant_max_bound,
+                   float quant_min_bound,
+                   phi::DenseTensor* out,
+                   phi::DenseTensor* residual_out,
+                   phi::DenseTensor* inv_var) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  PD_CHECK(quant_scale <= 0,
+           "rms_norm with an int8 output (quant_scale > 0) is not supported "
+           "on custom_cpu.");
+  int64_t rows, cols;
+  NormRowsCols(x, begin_norm_axis, &rows, &cols);
+  auto bias_values = NormParam<T>(bias.get_ptr());
+  auto weight_values = NormParam<T>(&norm_weight);
+  auto norm_bias_values = NormParam<T>(norm_bias.get_ptr());
+  NormInputs<T> in;
+  in.x = x.data<T>();
+  in.residual = OptionalData<T>(residual);
+  in.bias = OptionalData(bias_values);
+  in.weight = weight_values.data();
+  in.norm_bias = OptionalData(norm_bias_values);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  // The fused input is only worth keeping when something was added to x.
+  T* residual_out_data = residual_out && (bias || residual)
+                             ? dev_ctx.template Alloc<T>(residual_out)
+                             : nullptr;
+  float* inv_var_data =
+      inv_var ? dev_ctx.template Alloc<float>(inv_var) : nullptr;
+  RmsNormForward(
+      rows, cols, in, epsilon, out_data, residual_out_data, inv_var_data);
+}
+
+template <typename T>
+void RmsNormGradKernel(const phi::Context& dev_ctx,
+                       const phi::DenseTensor& x,
+                       const paddle::optional<phi::DenseTensor>& bias,
+                       const paddle::optional<phi::DenseTensor>& residual,
+                       const phi::DenseTensor& norm_weight,
+                       const paddle::optional<phi::DenseTensor>& norm_bias,
+                       const phi::DenseTensor& inv_var,
+                       const phi::DenseTensor& out_grad,
+                       float epsilon,
+                       int begin_norm_axis,
+                       float quant_scale,
+                       phi::DenseTensor* x_grad,
+                       phi::DenseTensor* norm_weight_grad,
+                       phi::DenseTensor* norm_bias_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  using AccT = AccType<T>;
+  int64_t rows, cols;
+  NormRowsCols(x, begin_norm_axis, &rows, &cols);
+  auto bias_values = NormParam<T>(bias.get_ptr());
+  auto weight_values = NormParam<T>(&norm_weight);
+  NormInputs<T> in;
+  in.x = x.data<T>();
+  in.residual = OptionalData<T>(residual);
+  in.bias = OptionalData(bias_values);
+  in.weight = weight_values.data();
+  std::vector<AccT> dweight(norm_weight_grad ? cols : 0);
+  std::vector<AccT> dnorm_bias(norm_bias && norm_bias_grad ? cols : 0);
+  NormParamGrads<AccT> grads;
+  grads.weight = norm_weight_grad ? dweight.data() : nullptr;
+  grads.norm_bias = dnorm_bias.empty() ? nullptr : dnorm_bias.data();
+  RmsNormBackward(rows,
+                  cols,
+                  in,
+                  inv_var.data<float>(),
+                  out_grad.data<T>(),
+                  dev_ctx.template Alloc<T>(x_grad),
+                  grads);
+  StoreParamGrad<T>(dev_ctx, dweight, &norm_weight, norm_weight_grad);
+  StoreParamGrad<T>(dev_ctx, dnorm_bias, norm_bias.get_ptr(), norm_bias_grad);
+}
+
+template <typename T>
+void LayerNormKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& x,
+                     const paddle::optional<phi::DenseTensor>& scale,
+                     const paddle::optional<phi::DenseTensor>& bias,
+                     float epsilon,
+                     int begin_norm_axis,
+                     phi::DenseTensor* out,
+                     phi::DenseTensor* mean,
+                     phi::DenseTensor* variance) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  using AccT = AccType<T>;
+  int64_t rows, cols;
+  NormRowsCols(x, begin_norm_axis, &rows, &cols);
+  auto scale_values = NormParam<T>(scale.get_ptr());
+  auto bias_values = NormParam<T>(bias.get_ptr());
+  NormInputs<T> in;
+  in.x = x.data<T>();
+  in.weight = OptionalData(scale_values);
+  in.norm_bias = OptionalData(bias_values);
+  LayerNormForward(rows,
+                   cols,
+                   in,
+                   epsilon,
+                   dev_ctx.template Alloc<T>(out),
+                   static_cast<T*>(nullptr),
+                   mean ? dev_ctx.template Alloc<AccT>(mean) : nullptr,
+                   variance ? dev_ctx.template Alloc<AccT>(variance) : nullptr);
+}
+
+template <typename T>
+void LayerNormGradKernel(const phi::Context& dev_ctx,
+                         const phi::DenseTensor& x,
+                         const paddle::optional<phi::DenseTensor>& scale,
+                         const paddle::optional<phi::DenseTensor>& bias,
+                         const phi::DenseTensor& mean,
+                         const phi::DenseTensor& variance,
+                         const phi::DenseTensor& out_grad,
+                         float epsilon,
+                         int begin_norm_axis,
+                         phi::DenseTensor* x_grad,
+                         phi::DenseTensor* scale_grad,
+                         phi::DenseTensor* bias_grad) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  using AccT = AccType<T>;
+  int64_t rows, cols;
+  NormRowsCols(x, begin_norm_axis, &rows, &cols);
+  auto scale_values = NormParam<T>(scale.get_ptr());
+  NormInputs<T> in;
+  in.x = x.data<T>();
+  in.weight = OptionalData(scale_values);
+  std::vector<AccT> dscale(scale && scale_grad ? cols : 0);
+  std::vector<AccT> dbias(bias && bias_grad ? cols : 0);
+  NormParamGrads<AccT> grads;
+  grads.weight = dscale.empty() ? nullptr : dscale.data();
+  grads.norm_bias = dbias.empty() ? nullptr : dbias.data();
+  // x_grad is still computed when only the parameters need a grad; the
+  // row gradient is a by-product of theirs.
+  std::vector<T> dx_buffer;
+  T* dx = nullptr;
+  if (x_grad) {
+    dx = dev_ctx.template Alloc<T>(x_grad);
+  } else {
+    dx_buffer.resize(rows * cols);
+    dx = dx_buffer.data();
+  }
+  LayerNormBackward(rows,
+                    cols,
+                    in,
+                    epsilon,
+                    mean.data<AccT>(),
+                    variance.data<AccT>(),
+                    out_grad.data<T>(),
+                    dx,
+                    grads);
+  StoreParamGrad<T>(dev_ctx, dscale, scale.get_ptr(), scale_grad);
+  StoreParamGrad<T>(dev_ctx, dbias, bias.get_ptr(), bias_grad);
+}
+
+template <typename T>
+void FusedBiasResidualLayerNormKernel(
+    const phi::Context& dev_ctx,
+    const phi::DenseTensor& x,
+    const paddle::optional<phi::DenseTensor>& bias,
+    const paddle::optional<phi::DenseTensor>& residual,
+    const paddle::optional<phi::DenseTensor>& norm_weight,
+    const paddle::optional<phi::DenseTensor>& norm_bias,
+    float epsilon,
+    float residual_alpha,
+    int begin_norm_axis,
+    float quant_scale,
+    int quant_round_type,
+    float quant_max_bound,
+    float quant_min_bound,
+    phi::DenseTensor* out,
+    phi::DenseTensor* residual_out,
+    phi::DenseTensor* mean,
+    phi::DenseTensor* variance) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  PD_CHECK(quant_scale <= 0,
+           "fused_bias_residual_layernorm with an int8 output (quant_scale > "
+           "0) is not supported on custom_cpu.");
+  int64_t rows, cols;
+  NormRowsCols(x, begin_norm_axis, &rows, &cols);
+  auto bias_values = NormParam<T>(bias.get_ptr());
+  auto weight_values = NormParam<T>(norm_weight.get_ptr());
+  auto norm_bias_values = NormParam<T>(norm_bias.get_ptr());
+  NormInputs<T> in;
+  in.x = x.data<T>();
+  in.residual = OptionalData<T>(residual);
+  in.residual_alpha = residual_alpha;
+  in.bias = OptionalData(bias_values);
+  in.weight = OptionalData(weight_values);
+  in.norm_bias = OptionalData(norm_bias_values);
+  T* residual_out_data = residual_out && (bias || residual)
+                             ? dev_ctx.template Alloc<T>(residual_out)
+                             : nullptr;
+  LayerNormForward(
+      rows,
+      cols,
+      in,
+      epsilon,
+      dev_ctx.template Alloc<T>(out),
+      residual_out_data,
+      mean ? dev_ctx.template Alloc<float>(mean) : nullptr,
+      variance ? dev_ctx.template Alloc<float>(variance) : nullptr);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(rms_norm,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::RmsNormKernel,
+                    float,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(rms_norm_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::RmsNormGradKernel,
+                    float,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(layer_norm,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::LayerNormKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(layer_norm_grad,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::LayerNormGradKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(fused_bias_residual_layernorm,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::FusedBiasResidualLayerNormKernel,
+                    float,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -19,8 +19,90 @@
 #include <numeric>
 #include <sstream>
 
+#include "kernels/funcs/broadcast.h"
+#include "kernels/funcs/half.h"
+#include "kernels/phi_half.h"
 #include "paddle/phi/capi/all.h"
 
+namespace custom_kernel {
+
+// Reads the single value of a floating point tensor as T, whatever its
+// dtype. Learning rates and beta powers stay in float32 in mixed-precision
+// programs while the parameters they update are 16-bit.
+template <typename T>
+T ScalarValue(const phi::DenseTensor& x) {
+  switch (x.dtype()) {
+    case phi::DataType::FLOAT64:
+      return static_cast<T>(*x.data<double>());
+    case phi::DataType::FLOAT16:
+      return Convert<T>(*x.data<phi::dtype::float16>());
+    case phi::DataType::BFLOAT16:
+      return Convert<T>(*x.data<phi::dtype::bfloat16>());
+    default:
+      PD_CHECK(x.dtype() == phi::DataType::FLOAT32,
+               "Expected a floating point scalar tensor.");
+      return static_cast<T>(*x.data<float>());
+  }
+}
+
+// Makes `out` a view of the allocation of `x` with `dims`, `strides` in
+// elements and `offset` in bytes. An empty `x` has no allocation to share,
+// so `out` gets its own.
+template <typename T>
+void ShareView(const phi::Context& dev_ctx,
+               const phi::DenseTensor& x,
+               const std::vector<int64_t>& dims,
+               const std::vector<int64_t>& strides,
+               int64_t offset,
+               phi::DenseTensor* out) {
+  if (x.numel() == 0) {
+    out->Resize(dims);
+    dev_ctx.template Alloc<T>(out);
+    return;
+  }
+  out->ShareDataWith(x);
+  out->Resize(dims);
+  out->set_strides(strides);
+  out->set_offset(offset);
+}
+
+// Expands `paddings` of a convolution over `data_dims` to a before and
+// after pair per dim and applies `padding_algorithm`: "SAME" pads so the
+// output has ceil(size / stride) elements and resets the dilations, "VALID"
+// drops the padding.
+inline void UpdatePaddingAndDilation(std::vector<int>* paddings,
+                                     std::vector<int>* dilations,
+                                     const std::string& padding_algorithm,
+                                     const std::vector<int64_t>& data_dims,
+                                     const std::vector<int>& strides,
+                                     const std::vector<int64_t>& ksize) {
+  const size_t rank = data_dims.size();
+  if (paddings->size() == rank) {
+    for (size_t i = 0; i < rank; ++i) {
+      paddings->insert(paddings->begin() + 2 * i + 1, (*paddings)[2 * i]);
+    }
+  }
+  PD_CHECK(paddings->size() == 2 * rank,
+           "The size of paddings should be %d or %d, but received %d.",
+           rank,
+           2 * rank,
+           paddings->size());
+  if (padding_algorithm == "SAME") {
+    for (size_t i = 0; i < rank; ++i) {
+      int64_t out_size = (data_dims[i] + strides[i] - 1) / strides[i];
+      int64_t pad_sum = std::max<int64_t>(
+          (out_size - 1) * strides[i] + ksize[i] - data_dims[i], 0);
+      (*paddings)[2 * i] = pad_sum / 2;
+      (*paddings)[2 * i + 1] = pad_sum - pad_sum / 2;
+      (*dilations)[i] = 1;
+    }
+  } else if (padding_algorithm == "VALID") {
+    std::fill(paddings->begin(), paddings->end(), 0);
+  }
+}
+
+}  // namespace custom_kernel
+
 namespace phi {
 
 template <typename T>
@@ -48,6 +130,10 @@ inline std::string to_string<phi::DataType>(const phi::DataType& val) {
     return "int32";
   } else if (val == phi::DataType::INT64) {
     return "int64";
+  } else if (val == phi::DataType::FLOAT16) {
+    return "float16";
+  } else if (val == phi::DataType::BFLOAT16) {
+    return "bfloat16";
   } else {
     return "undefined";
   }
@@ -258,80 +344,6 @@ inline std::vector<int64_t> GetDecreasedDims(
 
 }  // namespace funcs
 
-template <typename T>
-static inline void BroadcastTo(const phi::Context& dev_ctx,
-                               const phi::DenseTensor& in,
-                               std::vector<int64_t> out_dims,
-                               int axis,
-                               phi::DenseTensor* out) {
-  auto in_dims = in.dims();
-
-  if (in_dims.size() == out_dims.size()) {
-    bool broadcast = false;
-    for (auto i = 0; i < in_dims.size(); ++i) {
-      if (in_dims[i] != out_dims[i]) {
-        broadcast = true;
-        break;
-      }
-    }
-    if (!broadcast) {
-      out->ShareDataWith(in);
-      return;
-    }
-  }
-
-  out->Resize(out_dims);
-  auto out_data = dev_ctx.template Alloc<T>(out);
-  auto in_data = in.data<T>();
-
-  axis = axis == -1 ? std::abs(static_cast<int>(in_dims.size()) -
-                               static_cast<int>(out_dims.size()))
-                    : axis;
-  auto retain = static_cast<int>(out_dims.size()) - axis -
-                static_cast<int>(in_dims.size());
-  std::vector<size_t> tmp_dims;
-  for (auto i = 0; i < axis; ++i) {
-    tmp_dims.push_back(1);
-  }
-  tmp_dims.insert(tmp_dims.end(), in_dims.cbegin(), in_dims.cend());
-  for (auto i = 0; i < retain; ++i) {
-    tmp_dims.push_back(1);
-  }
-
-  auto numel = out->numel();
-  std::vector<size_t> index(out_dims.size(), 0);
-  std::vector<size_t> in_step(tmp_dims.size(), 1);
-  std::vector<size_t> out_step(out_dims.size(), 1);
-  for (auto i = tmp_dims.size() - 1; i > 0; --i) {
-    in_step[i - 1] = in_step[i] * tmp_dims[i];
-  }
-  for (auto i = out_dims.size() - 1; i > 0; --i) {
-    out_step[i - 1] = out_step[i] * out_dims[i];
-  }
-
-  for (auto i = 0; i < numel; ++i) {
-    auto src_index = index;
-    for (auto j = 0; j < tmp_dims.size(); ++j) {
-      if (tmp_dims[j] == 1) {
-        src_index[j] = 0;
-      }
-    }
-
-    out_data[phi::vec_product(index, out_step)] =
-        in_data[phi::vec_product(src_index, in_step)];
-
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= out_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
-}
-
 static inline std::vector<int64_t> BroadcastDims(
     int axis,
     const std::vector<int64_t>& x_dims,
@@ -359,6 +371,26 @@ static inline std::vector<int64_t> BroadcastDims(
   return dst_dims;
 }
 
+// Computes out = func(x, y) with x and y broadcast against each other. The
+// operands are read in place through zero strides instead of being expanded
+// to the output shape first.
+template <typename InT, typename OutT, typename Functor>
+static inline void ElementwiseCompute(const phi::Context& dev_ctx,
+                                      const phi::DenseTensor& x,
+                                      const phi::DenseTensor& y,
+                                      int axis,
+                                      Functor func,
+                                      phi::DenseTensor* out) {
+  auto x_dims = x.dims();
+  auto y_dims = y.dims();
+  auto dst_dims = phi::BroadcastDims(axis, x_dims, y_dims);
+  custom_kernel::BroadcastIndexer<2> indexer(dst_dims, {x_dims, y_dims}, axis);
+
+  auto out_data = dev_ctx.template Alloc<OutT>(out);
+  custom_kernel::BroadcastCompute(
+      indexer, out_data, func, x.data<InT>(), y.data<InT>());
+}
+
 static inline std::vector<int64_t> CalcStrides(
     const std::vector<int64_t>& dims) {
   int64_t product_dims = 1;
@@ -0,0 +1,34 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include "kernels/funcs/half.h"
+#include "paddle/phi/common/bfloat16.h"
+#include "paddle/phi/common/float16.h"
+
+namespace custom_kernel {
+
+// Registers the phi 16-bit types with the conversion engine. Shared by the
+// kernels (through phi_funcs.h) and the custom ops, which see the same types
+// through paddle/extension.h.
+template <>
+struct HalfTraits<phi::dtype::float16>
+    : HalfTraitsBase<phi::dtype::float16, HalfFormat::kFloat16> {};
+
+template <>
+struct HalfTraits<phi::dtype::bfloat16>
+    : HalfTraitsBase<phi::dtype::bfloat16, HalfFormat::kBFloat16> {};
+
+}  // namespace custom_kernel
@@ -0,0 +1,49 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/random.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+template <typename T>
+void RandintKernel(const phi::Context& dev_ctx,
+                   int low,
+                   int high,
+                   const phi::IntArray& shape,
+                   phi::DataType dtype,
+                   phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  PD_CHECK(low < high,
+           "randint expects low < high, but received low = %d, high = %d.",
+           low,
+           high);
+  out->Resize(shape.GetData());
+  T* data = dev_ctx.template Alloc<T>(out);
+  auto size = out->numel();
+  RandintFill(DrawState(0, size), low, high, data, size);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(randint,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::RandintKernel,
+                    int,
+                    int64_t) {}
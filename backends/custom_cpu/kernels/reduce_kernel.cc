@@ -12,13 +12,34 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
-#include <cmath>
+#include <numeric>
 
+#include "kernels/funcs/reduce.h"
 #include "kernels/phi_funcs.h"
 #include "paddle/phi/capi/all.h"
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
+template <typename T, typename OutT, typename Reducer>
+void ReduceImpl(const phi::Context& dev_ctx,
+                const phi::DenseTensor& x,
+                const phi::IntArray& dims,
+                bool reduce_all,
+                const Reducer& reducer,
+                phi::DenseTensor* out) {
+  auto x_dims = x.dims();
+  std::vector<int64_t> reduce_dims = dims.GetData();
+  if (reduce_all || reduce_dims.empty()) {
+    reduce_dims.resize(x_dims.size());
+    std::iota(reduce_dims.begin(), reduce_dims.end(), 0);
+  }
+  auto out_data = dev_ctx.template Alloc<OutT>(out);
+  ReduceCompute<T, AccType<OutT>, OutT>(
+      x_dims, reduce_dims, x.data<T>(), out_data, reducer);
+}
+
 template <typename T>
 void MeanRawKernel(const phi::Context& dev_ctx,
                    const phi::DenseTensor& x,
@@ -26,56 +47,10 @@ void MeanRawKernel(const phi::Context& dev_ctx,
                    bool keep_dim,
                    bool reduce_all,
                    phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  memset(out_data, 0, sizeof(T) * out->numel());
-  size_t reduce_numel = 1;
-  for (auto d : reduce_dims) {
-    reduce_numel *= x_dims[d];
-  }
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] +=
-        x_data[phi::vec_product(step, index)] / reduce_numel;
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReduceImpl<T, T>(
+      dev_ctx, x, dims, reduce_all, MeanReducer<AccType<T>>(), out);
 }
 
 template <typename T>
@@ -84,6 +59,8 @@ void MeanKernel(const phi::Context& dev_ctx,
                 const phi::IntArray& dims,
                 bool keep_dim,
                 phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   bool reduce_all = false;
   if (dims.size() == 0) {
     reduce_all = true;
@@ -99,56 +76,34 @@ void SumRawKernel(const phi::Context& dev_ctx,
                   bool reduce_all,
                   phi::DataType out_dtype,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_dims.size() == 0) {
-    reduce_all = true;
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  // Without an explicit out_dtype the output keeps the dtype set by
+  // InferMeta, which promotes int32 sums to int64.
+  if (out_dtype == phi::DataType::UNDEFINED) {
+    out_dtype = out->dtype();
   }
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-
-  memset(out_data, 0, sizeof(T) * out->numel());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] +=
-        x_data[phi::vec_product(step, index)];
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
+  switch (out_dtype) {
+    case phi::DataType::FLOAT32:
+      ReduceImpl<T, float>(
+          dev_ctx, x, dims, reduce_all, SumReducer<float>(), out);
+      break;
+    case phi::DataType::FLOAT64:
+      ReduceImpl<T, double>(
+          dev_ctx, x, dims, reduce_all, SumReducer<double>(), out);
+      break;
+    case phi::DataType::INT32:
+      ReduceImpl<T, int32_t>(
+          dev_ctx, x, dims, reduce_all, SumReducer<int32_t>(), out);
+      break;
+    case phi::DataType::INT64:
+      ReduceImpl<T, int64_t>(
+          dev_ctx, x, dims, reduce_all, SumReducer<int64_t>(), out);
+      break;
+    default:
+      ReduceImpl<T, T>(
+          dev_ctx, x, dims, reduce_all, SumReducer<AccType<T>>(), out);
+      break;
   }
 }
 
@@ -159,6 +114,8 @@ void SumKernel(const phi::Context& dev_ctx,
                phi::DataType out_dtype,
                bool keep_dim,
                phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   bool reduce_all = false;
   if (dims.size() == 0) {
     reduce_all = true;
@@ -173,57 +130,9 @@ void MinRawKernel(const phi::Context& dev_ctx,
                   bool keep_dim,
                   bool reduce_all,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_dims.size() == 0) {
-    reduce_all = true;
-  }
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  std::fill(out_data, out_data + out->numel(), std::numeric_limits<T>::max());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] =
-        std::min(out_data[phi::vec_product(dst_step, index)],
-                 x_data[phi::vec_product(step, index)]);
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReduceImpl<T, T>(dev_ctx, x, dims, reduce_all, MinReducer<AccType<T>>(), out);
 }
 
 template <typename T>
@@ -232,6 +141,8 @@ void MinKernel(const phi::Context& dev_ctx,
                const phi::IntArray& dims,
                bool keep_dim,
                phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   bool reduce_all = false;
   if (dims.size() == 0) {
     reduce_all = true;
@@ -246,54 +157,9 @@ void MaxRawKernel(const phi::Context& dev_ctx,
                   bool keep_dim,
                   bool reduce_all,
                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto reduce_dims = dims.GetData();
-  if (reduce_all) {
-    reduce_dims.clear();
-    for (auto i = 0; i < x_dims.size(); ++i) {
-      reduce_dims.push_back(i);
-    }
-  }
-  for (auto& d : reduce_dims) {
-    // handle negative dims, f.e. "-1" means rightmost dimension
-    if (d < 0) {
-      d = d + x_dims.size();
-    }
-  }
-  auto x_data = x.data<T>();
-  auto out_data = dev_ctx.template Alloc<T>(out);
-
-  auto numel = x.numel();
-  auto out_dims(x_dims);
-  for (auto d : reduce_dims) {
-    out_dims[d] = 1;
-  }
-  std::vector<size_t> index(x_dims.size(), 0);
-  std::vector<size_t> step(x_dims.size(), 1);
-  std::vector<size_t> dst_step = step;
-  for (auto i = x_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * x_dims[i];
-    dst_step[i - 1] = dst_step[i] * out_dims[i];
-  }
-  for (auto d : reduce_dims) {
-    dst_step[d] = 0;
-  }
-  std::fill(
-      out_data, out_data + out->numel(), std::numeric_limits<T>::lowest());
-  for (auto i = 0; i < numel; ++i) {
-    out_data[phi::vec_product(dst_step, index)] =
-        std::max(out_data[phi::vec_product(dst_step, index)],
-                 x_data[phi::vec_product(step, index)]);
-    index.back()++;
-    for (auto j = index.size() - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j] = 0;
-        index[j - 1]++;
-      } else {
-        break;
-      }
-    }
-  }
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReduceImpl<T, T>(dev_ctx, x, dims, reduce_all, MaxReducer<AccType<T>>(), out);
 }
 
 template <typename T>
@@ -302,6 +168,8 @@ void MaxKernel(const phi::Context& dev_ctx,
                const phi::IntArray& dims,
                bool keep_dim,
                phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   bool reduce_all = false;
   if (dims.size() == 0) {
     reduce_all = true;
@@ -309,6 +177,34 @@ void MaxKernel(const phi::Context& dev_ctx,
   MaxRawKernel<T>(dev_ctx, x, dims, keep_dim, reduce_all, out);
 }
 
+template <typename T>
+void ProdKernel(const phi::Context& dev_ctx,
+                const phi::DenseTensor& x,
+                const phi::IntArray& dims,
+                bool keep_dim,
+                bool reduce_all,
+                phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReduceImpl<T, T>(
+      dev_ctx, x, dims, reduce_all, ProdReducer<AccType<T>>(), out);
+}
+
+template <typename T>
+void ProdInferKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& x,
+                     const phi::IntArray& dims,
+                     bool keep_dim,
+                     phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  bool reduce_all = false;
+  if (dims.size() == 0) {
+    reduce_all = true;
+  }
+  ProdKernel<T>(dev_ctx, x, dims, keep_dim, reduce_all, out);
+}
+
 }  // namespace custom_kernel
 
 PD_BUILD_PHI_KERNEL(mean_raw,
@@ -316,20 +212,40 @@ PD_BUILD_PHI_KERNEL(mean_raw,
                     ALL_LAYOUT,
                     custom_kernel::MeanRawKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
-PD_BUILD_PHI_KERNEL(
-    mean, custom_cpu, ALL_LAYOUT, custom_kernel::MeanKernel, float, double) {}
+PD_BUILD_PHI_KERNEL(mean,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::MeanKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(sum_raw,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::SumRawKernel,
+                    int32_t,
+                    int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
-PD_BUILD_PHI_KERNEL(
-    sum, custom_cpu, ALL_LAYOUT, custom_kernel::SumKernel, float, double) {}
+PD_BUILD_PHI_KERNEL(sum,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::SumKernel,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(min_raw,
                     custom_cpu,
@@ -338,7 +254,9 @@ PD_BUILD_PHI_KERNEL(min_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(min,
                     custom_cpu,
@@ -347,7 +265,9 @@ PD_BUILD_PHI_KERNEL(min,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(max_raw,
                     custom_cpu,
@@ -356,7 +276,9 @@ PD_BUILD_PHI_KERNEL(max_raw,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(max,
                     custom_cpu,
@@ -365,4 +287,28 @@ PD_BUILD_PHI_KERNEL(max,
                     int32_t,
                     int64_t,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(prod,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::ProdKernel,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(prod_infer,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::ProdInferKernel,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
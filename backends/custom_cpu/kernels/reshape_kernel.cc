@@ -14,8 +14,12 @@
 
 #include <cstring>
 
+#include "kernels/funcs/strided_copy.h"
+#include "kernels/kernels.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -122,65 +126,152 @@ static std::vector<int64_t> ValidateShape(const std::vector<int64_t> shape,
 }
 
 template <typename T>
-void ReshapeKernel(const phi::Context& dev_ctx,
-                   const phi::DenseTensor& x,
-                   const phi::IntArray& shape,
-                   phi::DenseTensor* out) {
-  auto x_dims = x.dims();
-  auto out_dims = ValidateShape(shape.GetData(), x_dims);
+void ReshapeCopy(const phi::Context& dev_ctx,
+                 const phi::DenseTensor& x,
+                 const std::vector<int64_t>& out_dims,
+                 phi::DenseTensor* out) {
   out->Resize(out_dims);
   out->set_dtype(x.dtype());
   out->set_layout(x.layout());
-  if (x.dims()[0] == out->dims()[0]) {
+  if (!x.dims().empty() && !out_dims.empty() && x.dims()[0] == out_dims[0]) {
     out->share_lod(x);
   }
 
   dev_ctx.Alloc(out, x.dtype());
   if (!(x.initialized() && x.Holder() == out->Holder())) {
-    dev_ctx.Alloc(out, x.dtype());
-    auto dims = out->dims();
     auto x_data = x.data<T>();
     auto out_data = out->data<T>();
 
     memcpy(out_data, x_data, x.numel() * sizeof(T));
-    out->Resize(dims);
+    out->Resize(out_dims);
     out->ResetLoD(x.lod());
   }
 }
 
+template <typename T>
+void ReshapeView(const phi::Context& dev_ctx,
+                 const phi::DenseTensor& x,
+                 const std::vector<int64_t>& out_dims,
+                 phi::DenseTensor* out) {
+  std::vector<int64_t> out_strides;
+  if (ReshapeStrides(x.dims(), x.strides(), out_dims, &out_strides)) {
+    ShareView<T>(dev_ctx, x, out_dims, out_strides, x.offset(), out);
+    return;
+  }
+  // The strides of x can't express the new shape: materialize it. The copy
+  // goes through a temporary as out may be x itself.
+  phi::DenseTensor tmp;
+  tmp.Resize(out_dims);
+  tmp.set_dtype(x.dtype());
+  T* tmp_data = dev_ctx.template Alloc<T>(&tmp);
+  StridedCopyCompute(x.dims(),
+                     x.data<T>(),
+                     x.strides(),
+                     tmp_data,
+                     ContiguousStrides(x.dims()));
+  ShareView<T>(dev_ctx, tmp, out_dims, ContiguousStrides(out_dims), 0, out);
+}
+
+template <typename T>
+void ReshapeKernel(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& x,
+                   const phi::IntArray& shape,
+                   phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeCopy<T>(dev_ctx, x, ValidateShape(shape.GetData(), x.dims()), out);
+}
+
 template <typename T>
 void ReshapeWithXShapeKernel(const phi::Context& dev_ctx,
                              const phi::DenseTensor& x,
                              const phi::IntArray& shape,
                              phi::DenseTensor* out,
                              phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   ReshapeKernel<T>(dev_ctx, x, shape, out);
 }
 
+template <typename T>
+void ReshapeStridedKernel(const phi::Context& dev_ctx,
+                          const phi::DenseTensor& x,
+                          const phi::IntArray& shape,
+                          phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeView<T>(dev_ctx, x, ValidateShape(shape.GetData(), x.dims()), out);
+}
+
+template <typename T>
+void ReshapeWithXShapeStridedKernel(const phi::Context& dev_ctx,
+                                    const phi::DenseTensor& x,
+                                    const phi::IntArray& shape,
+                                    phi::DenseTensor* out,
+                                    phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeStridedKernel<T>(dev_ctx, x, shape, out);
+}
+
 }  // namespace custom_kernel
 
 PD_BUILD_PHI_KERNEL(reshape,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::ReshapeKernel,
-                    float,
-                    double,
+                    bool,
+                    uint8_t,
                     int8_t,
                     int16_t,
                     int32_t,
                     int64_t,
-                    uint8_t,
-                    bool) {}
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(reshape_with_xshape,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::ReshapeWithXShapeKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
                     float,
                     double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(reshape,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::ReshapeStridedKernel,
+                    bool,
+                    uint8_t,
                     int8_t,
                     int16_t,
                     int32_t,
                     int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(reshape_with_xshape,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::ReshapeWithXShapeStridedKernel,
+                    bool,
                     uint8_t,
-                    bool) {}
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
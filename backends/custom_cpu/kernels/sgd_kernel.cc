@@ -12,7 +12,11 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/thread_pool.h"
 #include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -20,16 +24,37 @@ template <typename T>
 void sgd_dense_param_dense_grad_impl(const phi::DenseTensor& param,
                                      const phi::DenseTensor& learning_rate,
                                      const phi::DenseTensor& grad,
-                                     phi::DenseTensor* param_out) {
+                                     const phi::DenseTensor* master_param,
+                                     phi::DenseTensor* param_out,
+                                     phi::DenseTensor* master_param_out) {
+  using AccT = AccType<T>;
   const auto sz = param_out->numel();
-  const T* lr = learning_rate.data<T>();
-  const T* param_data = param.data<T>();
+  const AccT lr = ScalarValue<AccT>(learning_rate);
   const T* grad_data = grad.data<T>();
   T* out_data = param_out->data<T>();
 
-  for (auto i = 0; i < sz; ++i) {
-    out_data[i] = param_data[i] - *lr * grad_data[i];
+  if (master_param) {
+    // The float32 master copy takes the update and the parameter is its
+    // rounded value.
+    const AccT* master_data = master_param->data<AccT>();
+    AccT* master_out_data = master_param_out->data<AccT>();
+    ParallelFor(0, sz, kElementwiseGrainSize, [&](int64_t begin, int64_t end) {
+      for (int64_t i = begin; i < end; ++i) {
+        AccT value = master_data[i] - lr * Convert<AccT>(grad_data[i]);
+        master_out_data[i] = value;
+        out_data[i] = Convert<T>(value);
+      }
+    });
+    return;
   }
+
+  const T* param_data = param.data<T>();
+  ParallelFor(0, sz, kElementwiseGrainSize, [&](int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; ++i) {
+      out_data[i] = Convert<T>(Convert<AccT>(param_data[i]) -
+                               lr * Convert<AccT>(grad_data[i]));
+    }
+  });
 }
 
 template <typename T>
@@ -41,11 +66,24 @@ void SGDDenseKernel(const phi::Context& dev_ctx,
                     bool multi_precision,
                     phi::DenseTensor* param_out,
                     phi::DenseTensor* master_param_out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   dev_ctx.template Alloc<T>(param_out);
-  sgd_dense_param_dense_grad_impl<T>(param, learning_rate, grad, param_out);
+  const phi::DenseTensor* master =
+      multi_precision && master_param ? master_param.get_ptr() : nullptr;
+  if (master) {
+    dev_ctx.template Alloc<AccType<T>>(master_param_out);
+  }
+  sgd_dense_param_dense_grad_impl<T>(
+      param, learning_rate, grad, master, param_out, master_param_out);
 }
 }  // namespace custom_kernel
 
-PD_BUILD_PHI_KERNEL(
-    sgd, custom_cpu, ALL_LAYOUT, custom_kernel::SGDDenseKernel, float, double) {
-}
+PD_BUILD_PHI_KERNEL(sgd,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::SGDDenseKernel,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -12,11 +12,41 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/strided_copy.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
+// Resolves starts and ends against the input dims and returns the dims of
+// the slice before decrease_axis is applied.
+static std::vector<int64_t> SliceDims(const std::vector<int64_t>& in_dims,
+                                      const std::vector<int64_t>& axes,
+                                      const std::vector<int64_t>& infer_flags,
+                                      const std::vector<int64_t>& decrease_axis,
+                                      std::vector<int64_t>* starts,
+                                      std::vector<int64_t>* ends) {
+  PD_CHECK(starts->size() == axes.size(),
+           "The size of starts must be equal to the size of axes.");
+  PD_CHECK(ends->size() == axes.size(),
+           "The size of ends must be equal to the size of axes.");
+  for (size_t i = 0; i < axes.size(); ++i) {
+    // when start == -1 && end == start+1
+    if ((*starts)[i] == -1 && (*ends)[i] == 0 && infer_flags[i] == -1) {
+      auto ret = std::find(decrease_axis.begin(), decrease_axis.end(), axes[i]);
+      if (ret != decrease_axis.end()) {
+        (*ends)[i] = in_dims[axes[i]];
+      }
+    }
+  }
+
+  phi::funcs::CheckAndUpdateSliceAttrs<int64_t>(in_dims, axes, starts, ends);
+  return phi::funcs::GetSliceDims<int64_t>(
+      in_dims, axes, *starts, *ends, nullptr, nullptr);
+}
+
 template <typename T>
 void SliceRawKernel(const phi::Context& ctx,
                     const phi::DenseTensor& input,
@@ -26,76 +56,74 @@ void SliceRawKernel(const phi::Context& ctx,
                     const std::vector<int64_t>& infer_flags,
                     const std::vector<int64_t>& decrease_axis,
                     phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(ctx);
   // Step 1: Get the accurate attribute value of starts and ends
   auto starts = starts_arr.GetData();
   auto ends = ends_arr.GetData();
-  PD_CHECK(starts.size() == axes.size(),
-           "The size of starts must be equal to the size of axes.");
-  PD_CHECK(ends.size() == axes.size(),
-           "The size of ends must be equal to the size of axes.");
-
-  // Step 2: Compute output
-  auto in = &input;
-  auto in_data = input.data<T>();
-  int rank = input.dims().size();
-
-  auto in_dims = in->dims();
-  auto out_dims = out->dims();
-  auto slice_dims = out_dims;
-
-  // 2.1 Infer output dims
-  for (size_t i = 0; i < axes.size(); ++i) {
-    // when start == -1 && end == start+1
-    if (starts[i] == -1 && ends[i] == 0 && infer_flags[i] == -1) {
-      auto ret = std::find(decrease_axis.begin(), decrease_axis.end(), axes[i]);
-      if (ret != decrease_axis.end()) {
-        ends[i] = in_dims[axes[i]];
-      }
-    }
-  }
+  auto in_dims = input.dims();
+  auto slice_dims =
+      SliceDims(in_dims, axes, infer_flags, decrease_axis, &starts, &ends);
+  auto out_dims =
+      phi::funcs::GetDecreasedDims<int64_t>(slice_dims, decrease_axis);
 
-  phi::funcs::CheckAndUpdateSliceAttrs<int64_t>(in_dims, axes, &starts, &ends);
-  slice_dims = phi::funcs::GetSliceDims<int64_t>(
-      in_dims, axes, starts, ends, nullptr, nullptr);
-  out_dims = phi::funcs::GetDecreasedDims<int64_t>(slice_dims, decrease_axis);
-
-  // 2.2 Get output
-  auto offsets = std::vector<size_t>(rank);
-  auto extents = std::vector<size_t>(rank);
-
-  for (size_t i = 0; i < rank; ++i) {
-    offsets[i] = 0;
-    extents[i] = slice_dims[i];
-  }
+  // Step 2: Compute output: copy the view of the input at `offset` with the
+  // input's strides.
+  auto in_strides = ContiguousStrides(in_dims);
+  int64_t offset = 0;
   for (size_t i = 0; i < axes.size(); ++i) {
-    offsets[axes[i]] = starts[i];
+    offset += starts[i] * in_strides[axes[i]];
   }
 
   out->Resize(slice_dims);
   auto out_data = ctx.template Alloc<T>(out);
+  StridedCopyCompute(slice_dims,
+                     input.data<T>() + offset,
+                     in_strides,
+                     out_data,
+                     ContiguousStrides(slice_dims));
+  out->Resize(out_dims);
+}
 
-  std::vector<size_t> in_step(rank, 1);
-  for (auto i = rank - 1; i > 0; --i) {
-    in_step[i - 1] = in_step[i] * in_dims[i];
-  }
+template <typename T>
+void SliceStridedKernel(const phi::Context& ctx,
+                        const phi::DenseTensor& input,
+                        const std::vector<int64_t>& axes,
+                        const phi::IntArray& starts_arr,
+                        const phi::IntArray& ends_arr,
+                        const std::vector<int64_t>& infer_flags,
+                        const std::vector<int64_t>& decrease_axis,
+                        phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(ctx);
+  auto starts = starts_arr.GetData();
+  auto ends = ends_arr.GetData();
+  auto in_dims = input.dims();
+  auto slice_dims =
+      SliceDims(in_dims, axes, infer_flags, decrease_axis, &starts, &ends);
+  auto out_dims =
+      phi::funcs::GetDecreasedDims<int64_t>(slice_dims, decrease_axis);
 
-  auto numel = phi::product(slice_dims);
-  auto index = std::vector<size_t>(offsets.cbegin(), offsets.cend());
-  for (auto i = 0; i < numel; i += slice_dims.back()) {
-    memcpy(out_data + i,
-           in_data + phi::vec_product(index, in_step),
-           sizeof(T) * slice_dims.back());
-    index[index.size() - 2]++;
-    for (auto j = index.size() - 2; j > 0; --j) {
-      if (index[j] >= offsets[j] + extents[j]) {
-        index[j] = offsets[j];
-        index[j - 1] += 1;
-      } else {
-        break;
-      }
+  // The slice keeps the strides of the input and starts `offset` bytes
+  // further into its allocation.
+  auto in_strides = input.strides();
+  int64_t offset = input.offset();
+  for (size_t i = 0; i < axes.size(); ++i) {
+    offset += starts[i] * in_strides[axes[i]] * sizeof(T);
+  }
+  std::vector<int64_t> out_strides;
+  for (size_t i = 0; i < slice_dims.size(); ++i) {
+    if (std::find(decrease_axis.begin(),
+                  decrease_axis.end(),
+                  static_cast<int64_t>(i)) == decrease_axis.end()) {
+      out_strides.push_back(in_strides[i]);
     }
   }
-  out->Resize(out_dims);
+  if (out_strides.size() != out_dims.size()) {
+    // Every axis was decreased into a single element of shape [1].
+    out_strides.assign(out_dims.size(), 1);
+  }
+  ShareView<T>(ctx, input, out_dims, out_strides, offset, out);
 }
 
 }  // namespace custom_kernel
@@ -112,3 +140,18 @@ PD_BUILD_PHI_KERNEL(slice,
                     uint8_t,
                     float,
                     double) {}
+
+PD_BUILD_PHI_KERNEL(slice,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::SliceStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,166 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/concat.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+static int64_t SplitAxis(const phi::Scalar& axis_scalar, int64_t rank) {
+  int64_t axis = axis_scalar.to<int64_t>();
+  PD_CHECK(axis >= -rank && axis < rank,
+           "The axis is expected to be in range of [%d, %d), but got %d.",
+           -rank,
+           rank,
+           axis);
+  return axis < 0 ? axis + rank : axis;
+}
+
+// Infer meta has already resolved the sections into the dims of `outs`.
+template <typename T>
+static void SplitOuts(const phi::Context& dev_ctx,
+                      const phi::DenseTensor& x,
+                      const phi::Scalar& axis_scalar,
+                      const std::vector<phi::DenseTensor*>& outs) {
+  auto dims = x.dims();
+  const int64_t axis = SplitAxis(axis_scalar, dims.size());
+  std::vector<int64_t> widths(outs.size());
+  std::vector<T*> out_data(outs.size(), nullptr);
+  for (size_t j = 0; j < outs.size(); ++j) {
+    widths[j] = ConcatWidth(outs[j]->dims(), axis);
+    out_data[j] = dev_ctx.template Alloc<T>(outs[j]);
+  }
+  SplitCompute(ConcatRows(dims, axis), widths, x.data<T>(), out_data);
+}
+
+// Every output is a view of its section of x.
+template <typename T>
+static void SplitViews(const phi::Context& dev_ctx,
+                       const phi::DenseTensor& x,
+                       const phi::Scalar& axis_scalar,
+                       const std::vector<phi::DenseTensor*>& outs) {
+  const int64_t axis = SplitAxis(axis_scalar, x.dims().size());
+  auto strides = x.strides();
+  int64_t offset = x.offset();
+  for (auto* out : outs) {
+    auto out_dims = out->dims();
+    ShareView<T>(dev_ctx, x, out_dims, strides, offset, out);
+    offset += out_dims[axis] * strides[axis] * sizeof(T);
+  }
+}
+
+template <typename T>
+void SplitKernel(const phi::Context& dev_ctx,
+                 const phi::DenseTensor& x,
+                 const phi::IntArray& sections,
+                 const phi::Scalar& axis_scalar,
+                 const std::vector<phi::DenseTensor*>& outs) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  SplitOuts<T>(dev_ctx, x, axis_scalar, outs);
+}
+
+template <typename T>
+void SplitWithNumKernel(const phi::Context& dev_ctx,
+                        const phi::DenseTensor& x,
+                        int num,
+                        const phi::Scalar& axis_scalar,
+                        const std::vector<phi::DenseTensor*>& outs) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  SplitOuts<T>(dev_ctx, x, axis_scalar, outs);
+}
+
+template <typename T>
+void SplitStridedKernel(const phi::Context& dev_ctx,
+                        const phi::DenseTensor& x,
+                        const phi::IntArray& sections,
+                        const phi::Scalar& axis_scalar,
+                        const std::vector<phi::DenseTensor*>& outs) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  SplitViews<T>(dev_ctx, x, axis_scalar, outs);
+}
+
+template <typename T>
+void SplitWithNumStridedKernel(const phi::Context& dev_ctx,
+                               const phi::DenseTensor& x,
+                               int num,
+                               const phi::Scalar& axis_scalar,
+                               const std::vector<phi::DenseTensor*>& outs) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  SplitViews<T>(dev_ctx, x, axis_scalar, outs);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(split,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::SplitKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(split,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::SplitStridedKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(split_with_num,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::SplitWithNumKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(split_with_num,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::SplitWithNumStridedKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t,
+                    bool,
+                    int8_t,
+                    uint8_t,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
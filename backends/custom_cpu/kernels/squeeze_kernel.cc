@@ -0,0 +1,152 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/kernels.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// Drops the size-1 dims named by `axes`, or all of them when `axes` is
+// empty. Named dims of another size are kept.
+static std::vector<int64_t> SqueezeDims(const std::vector<int64_t>& in_dims,
+                                        const std::vector<int64_t>& axes) {
+  const int64_t rank = in_dims.size();
+  std::vector<bool> squeeze(rank, axes.empty());
+  for (auto axis : axes) {
+    if (rank == 0) {
+      break;
+    }
+    PD_CHECK(axis >= -rank && axis < rank,
+             "Each axis of squeeze must be in the range [%d, %d), but "
+             "received %d.",
+             -rank,
+             rank,
+             axis);
+    squeeze[axis < 0 ? axis + rank : axis] = true;
+  }
+  std::vector<int64_t> out_dims;
+  for (int64_t i = 0; i < rank; ++i) {
+    if (!(squeeze[i] && in_dims[i] == 1)) {
+      out_dims.push_back(in_dims[i]);
+    }
+  }
+  return out_dims;
+}
+
+template <typename T>
+void SqueezeKernel(const phi::Context& dev_ctx,
+                   const phi::DenseTensor& x,
+                   const phi::IntArray& axes,
+                   phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeCopy<T>(dev_ctx, x, SqueezeDims(x.dims(), axes.GetData()), out);
+}
+
+template <typename T>
+void SqueezeWithXShapeKernel(const phi::Context& dev_ctx,
+                             const phi::DenseTensor& x,
+                             const phi::IntArray& axes,
+                             phi::DenseTensor* out,
+                             phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  SqueezeKernel<T>(dev_ctx, x, axes, out);
+}
+
+template <typename T>
+void SqueezeStridedKernel(const phi::Context& dev_ctx,
+                          const phi::DenseTensor& x,
+                          const phi::IntArray& axes,
+                          phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeView<T>(dev_ctx, x, SqueezeDims(x.dims(), axes.GetData()), out);
+}
+
+template <typename T>
+void SqueezeWithXShapeStridedKernel(const phi::Context& dev_ctx,
+                                    const phi::DenseTensor& x,
+                                    const phi::IntArray& axes,
+                                    phi::DenseTensor* out,
+                                    phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  SqueezeStridedKernel<T>(dev_ctx, x, axes, out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(squeeze,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::SqueezeKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(squeeze_with_xshape,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::SqueezeWithXShapeKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(squeeze,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::SqueezeStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(squeeze_with_xshape,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::SqueezeWithXShapeStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
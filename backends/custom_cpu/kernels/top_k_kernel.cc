@@ -0,0 +1,123 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/funcs/sort.h"
+#include "kernels/kernels.h"
+#include "kernels/phi_funcs.h"
+#include "paddle/phi/capi/all.h"
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+template <typename T>
+void TopkKernel(const phi::Context& dev_ctx,
+                const phi::DenseTensor& x,
+                const phi::Scalar& k_scalar,
+                int axis,
+                bool largest,
+                bool sorted,
+                phi::DenseTensor* out,
+                phi::DenseTensor* indices) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  auto in_dims = x.dims();
+  const int rank = in_dims.size();
+  const int64_t k = k_scalar.to<int64_t>();
+
+  if (rank == 0) {
+    PD_CHECK(k == 0 || k == 1,
+             "k of top_k must be 0 or 1 for a 0-D input, but received %d.",
+             k);
+    T* out_data = dev_ctx.template Alloc<T>(out);
+    int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+    if (k == 1) {
+      out_data[0] = x.data<T>()[0];
+      ids_data[0] = 0;
+    }
+    return;
+  }
+
+  axis = axis < 0 ? axis + rank : axis;
+  PD_CHECK(k >= 0 && k <= in_dims[axis],
+           "k of top_k must be in the range [0, %d], but received %d.",
+           in_dims[axis],
+           k);
+  std::vector<int64_t> out_dims = in_dims;
+  out_dims[axis] = k;
+  out->Resize(out_dims);
+  indices->Resize(out_dims);
+  T* out_data = dev_ctx.template Alloc<T>(out);
+  int64_t* ids_data = dev_ctx.template Alloc<int64_t>(indices);
+  if (out->numel() == 0) {
+    return;
+  }
+
+  // The selection is always sorted, best first, which satisfies `sorted`
+  // either way.
+  if (axis + 1 == rank) {
+    const int64_t width = in_dims[axis];
+    TopKRows(
+        x.data<T>(), x.numel() / width, width, k, largest, out_data, ids_data);
+    return;
+  }
+
+  // Selects along the last dim of x with `axis` swapped to the end, then
+  // swaps the results back.
+  std::vector<int> trans(rank);
+  for (int i = 0; i < rank; ++i) {
+    trans[i] = i;
+  }
+  std::swap(trans[axis], trans[rank - 1]);
+  std::vector<int64_t> trans_dims(rank), trans_out_dims(rank);
+  for (int i = 0; i < rank; ++i) {
+    trans_dims[i] = in_dims[trans[i]];
+    trans_out_dims[i] = out_dims[trans[i]];
+  }
+
+  phi::DenseTensor trans_inp;
+  trans_inp.Resize(trans_dims);
+  dev_ctx.template Alloc<T>(&trans_inp);
+  TransposeKernel<T>(dev_ctx, x, trans, &trans_inp);
+
+  phi::DenseTensor tmp_out;
+  tmp_out.Resize(trans_out_dims);
+  T* t_out = dev_ctx.template Alloc<T>(&tmp_out);
+  phi::DenseTensor tmp_indices;
+  tmp_indices.Resize(trans_out_dims);
+  int64_t* t_ind = dev_ctx.template Alloc<int64_t>(&tmp_indices);
+
+  const int64_t width = trans_dims[rank - 1];
+  TopKRows(trans_inp.data<T>(),
+           trans_inp.numel() / width,
+           width,
+           k,
+           largest,
+           t_out,
+           t_ind);
+
+  TransposeKernel<int64_t>(dev_ctx, tmp_indices, trans, indices);
+  TransposeKernel<T>(dev_ctx, tmp_out, trans, out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(topk,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::TopkKernel,
+                    float,
+                    double,
+                    int,
+                    int64_t) {}
@@ -12,8 +12,11 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
+#include "kernels/funcs/strided_copy.h"
 #include "paddle/phi/capi/all.h"
 #include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
@@ -22,46 +25,45 @@ void TransposeKernel(const phi::Context& ctx,
                      const phi::DenseTensor& x,
                      const std::vector<int>& axis,
                      phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(ctx);
   auto x_dims = x.dims();
-  auto out_dims = out->dims();
-
-  auto x_data = x.data<T>();
   auto out_data = ctx.template Alloc<T>(out);
   if (out->numel() == 0) {
     return;
   }
-  auto rank = x_dims.size();
-  if (rank == 1) {
-    memcpy(out_data, x_data, x.numel() * sizeof(T));
-  }
-  PD_CHECK(axis.size() == rank,
+  PD_CHECK(axis.size() == x_dims.size(),
            "axis.size (%d) must be equal the rank of input (%d).",
            axis.size(),
-           rank);
-
-  std::vector<size_t> step(out_dims.size(), 1);
-  for (auto i = out_dims.size() - 1; i > 0; --i) {
-    step[i - 1] = step[i] * out_dims[i];
+           x_dims.size());
+  std::vector<int> perm(axis);
+  for (auto& a : perm) {
+    a = a < 0 ? a + static_cast<int>(perm.size()) : a;
   }
+  custom_kernel::TransposeCompute(x_dims, perm, x.data<T>(), out_data);
+}
 
-  std::vector<size_t> index(rank, 0);
-  for (auto i = 0; i < x.numel(); ++i) {
-    std::vector<size_t> dst_index(rank, 0);
-    for (auto j = 0; j < rank; ++j) {
-      dst_index[j] = index[axis[j]];
-    }
-    out_data[phi::vec_product(dst_index, step)] = x_data[i];
-
-    index.back()++;
-    for (auto j = rank - 1; j > 0; --j) {
-      if (index[j] >= x_dims[j]) {
-        index[j - 1]++;
-        index[j] = 0;
-      } else {
-        break;
-      }
-    }
+template <typename T>
+void TransposeStridedKernel(const phi::Context& ctx,
+                            const phi::DenseTensor& x,
+                            const std::vector<int>& axis,
+                            phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(ctx);
+  auto x_dims = x.dims();
+  PD_CHECK(axis.size() == x_dims.size(),
+           "axis.size (%d) must be equal the rank of input (%d).",
+           axis.size(),
+           x_dims.size());
+  // Permuting the dims and strides of x is enough, no element moves.
+  auto x_strides = x.strides();
+  std::vector<int64_t> out_dims(axis.size()), out_strides(axis.size());
+  for (size_t i = 0; i < axis.size(); ++i) {
+    int a = axis[i] < 0 ? axis[i] + static_cast<int>(axis.size()) : axis[i];
+    out_dims[i] = x_dims[a];
+    out_strides[i] = x_strides[a];
   }
+  ShareView<T>(ctx, x, out_dims, out_strides, x.offset(), out);
 }
 
 }  // namespace custom_kernel
@@ -78,3 +80,18 @@ PD_BUILD_PHI_KERNEL(transpose,
                     int16_t,
                     int32_t,
                     int64_t) {}
+
+PD_BUILD_PHI_KERNEL(transpose,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::TransposeStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -12,25 +12,14 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
-#include <random>
-
+#include "kernels/funcs/random.h"
 #include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 namespace custom_kernel {
 
-template <typename T>
-inline void UniformRealDistribution(T *data,
-                                    const int64_t &size,
-                                    const float &min,
-                                    const float &max,
-                                    std::shared_ptr<std::mt19937_64> engine) {
-  std::uniform_real_distribution<T> dist(static_cast<T>(min),
-                                         static_cast<T>(max));
-  for (int64_t i = 0; i < size; ++i) {
-    data[i] = dist(*engine);
-  }
-}
-
 template <typename T>
 void UniformRawKernel(const phi::Context &dev_ctx,
                       const phi::IntArray &shape,
@@ -42,18 +31,15 @@ void UniformRawKernel(const phi::Context &dev_ctx,
                       int diag_step,
                       float diag_val,
                       phi::DenseTensor *out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   auto shape_data = shape.GetData();
 
   out->Resize(std::vector<int64_t>(shape_data.begin(), shape_data.end()));
   T *data = dev_ctx.template Alloc<T>(out);
   auto size = out->numel();
-  std::shared_ptr<std::mt19937_64> engine;
-
-  engine = std::make_shared<std::mt19937_64>();
-  engine->seed(seed);
-
-  UniformRealDistribution<T>(
-      data, size, min.to<float>(), max.to<float>(), engine);
+  UniformFill(
+      DrawState(seed, size), min.to<float>(), max.to<float>(), data, size);
   if (diag_num > 0) {
     PD_CHECK(size > (diag_num - 1) * (diag_step + 1),
              "ShapeInvalid: the diagonal's elements is equal (num-1) "
@@ -65,7 +51,7 @@ void UniformRawKernel(const phi::Context &dev_ctx,
              size);
     for (int64_t i = 0; i < diag_num; ++i) {
       int64_t pos = i * diag_step + i;
-      data[pos] = diag_val;
+      data[pos] = Convert<T>(diag_val);
     }
   }
 }
@@ -78,6 +64,8 @@ void UniformKernel(const phi::Context &dev_ctx,
                    const phi::Scalar &max,
                    int seed,
                    phi::DenseTensor *out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
   UniformRawKernel<T>(dev_ctx, shape, dtype, min, max, seed, 0, 0, 0.0f, out);
 }
 
@@ -88,11 +76,15 @@ PD_BUILD_PHI_KERNEL(uniform_raw,
                     ALL_LAYOUT,
                     custom_kernel::UniformRawKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
 
 PD_BUILD_PHI_KERNEL(uniform,
                     custom_cpu,
                     ALL_LAYOUT,
                     custom_kernel::UniformKernel,
                     float,
-                    double) {}
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,160 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "kernels/kernels.h"
+#include "paddle/phi/capi/all.h"
+#include "phi_funcs.h"  //NOLINT
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
+
+namespace custom_kernel {
+
+// Inserts a size-1 dim at each of `axes` in turn; a negative axis counts
+// from the end of the shape built so far.
+static std::vector<int64_t> UnsqueezeDims(const std::vector<int64_t>& in_dims,
+                                          const std::vector<int64_t>& axes) {
+  const int64_t out_rank = in_dims.size() + axes.size();
+  int64_t cur_rank = in_dims.size();
+  // 1 marks an inserted dim, 0 a dim of the input.
+  std::vector<int64_t> inserted(out_rank, 0);
+  for (auto axis : axes) {
+    int64_t cur = axis < 0 ? axis + cur_rank + 1 : axis;
+    PD_CHECK(cur >= 0 && cur <= cur_rank,
+             "Each axis of unsqueeze must be in the range [%d, %d], but "
+             "received %d.",
+             -cur_rank - 1,
+             cur_rank,
+             axis);
+    // Inserted dims at or after `cur` move one place back.
+    for (int64_t i = cur_rank; i >= cur; --i) {
+      if (inserted[i] == 1) {
+        inserted[i + 1] = 1;
+        inserted[i] = 0;
+      }
+    }
+    inserted[cur] = 1;
+    ++cur_rank;
+  }
+  std::vector<int64_t> out_dims(out_rank, 1);
+  for (int64_t i = 0, in_idx = 0; i < out_rank; ++i) {
+    if (inserted[i] == 0) {
+      out_dims[i] = in_dims[in_idx++];
+    }
+  }
+  return out_dims;
+}
+
+template <typename T>
+void UnsqueezeKernel(const phi::Context& dev_ctx,
+                     const phi::DenseTensor& x,
+                     const phi::IntArray& axes,
+                     phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeCopy<T>(dev_ctx, x, UnsqueezeDims(x.dims(), axes.GetData()), out);
+}
+
+template <typename T>
+void UnsqueezeWithXShapeKernel(const phi::Context& dev_ctx,
+                               const phi::DenseTensor& x,
+                               const phi::IntArray& axes,
+                               phi::DenseTensor* out,
+                               phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  UnsqueezeKernel<T>(dev_ctx, x, axes, out);
+}
+
+template <typename T>
+void UnsqueezeStridedKernel(const phi::Context& dev_ctx,
+                            const phi::DenseTensor& x,
+                            const phi::IntArray& axes,
+                            phi::DenseTensor* out) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  ReshapeView<T>(dev_ctx, x, UnsqueezeDims(x.dims(), axes.GetData()), out);
+}
+
+template <typename T>
+void UnsqueezeWithXShapeStridedKernel(const phi::Context& dev_ctx,
+                                      const phi::DenseTensor& x,
+                                      const phi::IntArray& axes,
+                                      phi::DenseTensor* out,
+                                      phi::DenseTensor* xshape) {
+  custom_cpu::WaitForStreamWork(dev_ctx.stream());
+  CUSTOM_CPU_TRACE_KERNEL(dev_ctx);
+  UnsqueezeStridedKernel<T>(dev_ctx, x, axes, out);
+}
+
+}  // namespace custom_kernel
+
+PD_BUILD_PHI_KERNEL(unsqueeze,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::UnsqueezeKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(unsqueeze_with_xshape,
+                    custom_cpu,
+                    ALL_LAYOUT,
+                    custom_kernel::UnsqueezeWithXShapeKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(unsqueeze,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::UnsqueezeStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
+
+PD_BUILD_PHI_KERNEL(unsqueeze_with_xshape,
+                    custom_cpu,
+                    STRIDED,
+                    custom_kernel::UnsqueezeWithXShapeStridedKernel,
+                    bool,
+                    uint8_t,
+                    int8_t,
+                    int16_t,
+                    int32_t,
+                    int64_t,
+                    float,
+                    double,
+                    phi::dtype::float16,
+                    phi::dtype::bfloat16) {}
@@ -0,0 +1,269 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/allocator.h"
+
+#include <sys/mman.h>
+
+#include <algorithm>
+#include <cstdlib>
+#include <iterator>
+#include <memory>
+#include <sstream>
+
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+
+constexpr size_t CachingAllocator::kAlignment;
+constexpr size_t CachingAllocator::kMinBlockSize;
+constexpr size_t CachingAllocator::kSmallLimit;
+constexpr size_t CachingAllocator::kLargeGranularity;
+
+namespace {
+
+// A cached large block is reused for a smaller request only while the slack
+// stays under 1/kLargeSlackRatio of the request.
+constexpr size_t kLargeSlackRatio = 8;
+
+inline size_t AlignUp(size_t size, size_t alignment) {
+  return (size + alignment - 1) / alignment * alignment;
+}
+
+}  // namespace
+
+std::string AllocatorStats::ToString() const {
+  std::ostringstream os;
+  os << "in_use " << (in_use >> 20) << " MB, peak " << (peak_in_use >> 20)
+     << " MB, cached " << (cached >> 20) << " MB, fragmentation "
+     << static_cast<int>(Fragmentation() * 100) << "%, cache hits "
+     << num_cache_hits << "/" << num_allocs << ", os allocs " << num_os_allocs
+     << ", os frees " << num_os_frees;
+  return os.str();
+}
+
+CachingAllocator& CachingAllocator::Instance(int device_id) {
+  static std::mutex mutex;
+  // Never destroyed: blocks may still be freed during static destruction.
+  static auto* allocators =
+      new std::map<int, std::unique_ptr<CachingAllocator>>();
+  std::lock_guard<std::mutex> lock(mutex);
+  auto& allocator = (*allocators)[device_id];
+  if (!allocator) {
+    allocator.reset(new CachingAllocator());
+  }
+  return *allocator;
+}
+
+CachingAllocator::CachingAllocator()
+    : caching_(EnvToBool("FLAGS_custom_cpu_caching_allocator", true)),
+      max_cached_(EnvToUInt("FLAGS_custom_cpu_allocator_max_cached_mb", 4096)
+                  << 20),
+      max_block_(EnvToUInt("FLAGS_custom_cpu_allocator_max_block_mb", 1024)
+                 << 20) {}
+
+CachingAllocator::~CachingAllocator() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  EmptyCacheLocked();
+}
+
+size_t CachingAllocator::RoundSize(size_t size) {
+  if (size <= kMinBlockSize) {
+    return kMinBlockSize;
+  }
+  if (size > kSmallLimit) {
+    return AlignUp(size, kLargeGranularity);
+  }
+  // Four classes between consecutive powers of two.
+  size_t power = kMinBlockSize;
+  while (power * 2 < size) {
+    power *= 2;
+  }
+  return AlignUp(size, std::max(power / 4, kAlignment));
+}
+
+void* CachingAllocator::AllocateFromOS(size_t size) {
+  void* ptr = nullptr;
+  if (size <= kSmallLimit) {
+    if (posix_memalign(&ptr, kAlignment, size) != 0) {
+      return nullptr;
+    }
+  } else {
+    // Page aligned, and unmapped straight back to the OS on release.
+    ptr = mmap(nullptr,
+               size,
+               PROT_READ | PROT_WRITE,
+               MAP_PRIVATE | MAP_ANONYMOUS,
+               -1,
+               0);
+    if (ptr == MAP_FAILED) {
+      return nullptr;
+    }
+  }
+  ++stats_.num_os_allocs;
+  return ptr;
+}
+
+void CachingAllocator::ReleaseToOS(void* ptr, size_t size) {
+  if (size <= kSmallLimit) {
+    free(ptr);
+  } else {
+    munmap(ptr, size);
+  }
+  ++stats_.num_os_frees;
+}
+
+void* CachingAllocator::Allocate(size_t size) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  ++stats_.num_allocs;
+  size_t block_size = RoundSize(size);
+  void* ptr = nullptr;
+
+  if (block_size <= kSmallLimit) {
+    auto& bin = small_bins_[block_size];
+    if (!bin.empty()) {
+      ptr = bin.back();
+      bin.pop_back();
+    }
+  } else {
+    auto it = large_blocks_.lower_bound(block_size);
+    if (it != large_blocks_.end() &&
+        it->first <= block_size + block_size / kLargeSlackRatio) {
+      block_size = it->first;
+      ptr = it->second;
+      large_blocks_.erase(it);
+    }
+  }
+
+  if (ptr) {
+    stats_.cached -= block_size;
+    ++stats_.num_cache_hits;
+  } else {
+    if (block_size > kSmallLimit) {
+      // The cached large blocks do not fit the sizes in use; give back as
+      // much as is about to be mapped, so that drifting sizes do not grow the
+      // arena without bound.
+      size_t released = 0;
+      auto it = large_blocks_.lower_bound(block_size);
+      while (released < block_size && it != large_blocks_.begin()) {
+        --it;
+        released += it->first;
+        stats_.cached -= it->first;
+        ReleaseToOS(it->second, it->first);
+        it = large_blocks_.erase(it);
+      }
+    }
+    ptr = AllocateFromOS(block_size);
+    if (!ptr && stats_.cached > 0) {
+      EmptyCacheLocked();
+      ptr = AllocateFromOS(block_size);
+    }
+    if (!ptr) {
+      return nullptr;
+    }
+  }
+
+  live_[ptr] = Block{block_size, size};
+  stats_.allocated += size;
+  stats_.in_use += block_size;
+  stats_.peak_in_use = std::max(stats_.peak_in_use, stats_.in_use);
+  return ptr;
+}
+
+bool CachingAllocator::Deallocate(void* ptr) {
+  if (!ptr) {
+    return true;
+  }
+  std::lock_guard<std::mutex> lock(mutex_);
+  auto it = live_.find(ptr);
+  if (it == live_.end()) {
+    return false;
+  }
+  Block block = it->second;
+  live_.erase(it);
+  stats_.allocated -= block.requested;
+  stats_.in_use -= block.size;
+
+  if (!caching_ || block.size > max_block_) {
+    ReleaseToOS(ptr, block.size);
+    return true;
+  }
+  if (block.size <= kSmallLimit) {
+    small_bins_[block.size].push_back(ptr);
+  } else {
+    large_blocks_.emplace(block.size, ptr);
+  }
+  stats_.cached += block.size;
+  if (stats_.cached > max_cached_) {
+    ReleaseCachedLocked(max_cached_);
+  }
+  return true;
+}
+
+void CachingAllocator::ReleaseCachedLocked(size_t target) {
+  // Large blocks first, they give back the most memory per call.
+  while (stats_.cached > target && !large_blocks_.empty()) {
+    auto it = std::prev(large_blocks_.end());
+    stats_.cached -= it->first;
+    ReleaseToOS(it->second, it->first);
+    large_blocks_.erase(it);
+  }
+  for (auto& bin : small_bins_) {
+    while (stats_.cached > target && !bin.second.empty()) {
+      stats_.cached -= bin.first;
+      ReleaseToOS(bin.second.back(), bin.first);
+      bin.second.pop_back();
+    }
+  }
+}
+
+void CachingAllocator::EmptyCacheLocked() { ReleaseCachedLocked(0); }
+
+void CachingAllocator::EmptyCache() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  EmptyCacheLocked();
+}
+
+AllocatorStats CachingAllocator::GetStats() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  return stats_;
+}
+
+PinnedHostMemory& PinnedHostMemory::Instance() {
+  static PinnedHostMemory memory;
+  return memory;
+}
+
+void PinnedHostMemory::Add(const void* ptr, size_t size) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  blocks_[reinterpret_cast<uintptr_t>(ptr)] = size;
+}
+
+void PinnedHostMemory::Remove(const void* ptr) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  blocks_.erase(reinterpret_cast<uintptr_t>(ptr));
+}
+
+bool PinnedHostMemory::Contains(const void* ptr, size_t size) {
+  const uintptr_t begin = reinterpret_cast<uintptr_t>(ptr);
+  std::lock_guard<std::mutex> lock(mutex_);
+  auto it = blocks_.upper_bound(begin);
+  if (it == blocks_.begin()) {
+    return false;
+  }
+  --it;
+  return begin + size <= it->first + it->second;
+}
+
+}  // namespace custom_cpu
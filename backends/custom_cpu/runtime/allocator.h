@@ -0,0 +1,133 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <map>
+#include <mutex>
+#include <string>
+#include <unordered_map>
+#include <vector>
+
+namespace custom_cpu {
+
+struct AllocatorStats {
+  size_t allocated = 0;    // bytes requested by live allocations
+  size_t in_use = 0;       // bytes of the blocks backing live allocations
+  size_t cached = 0;       // bytes of free blocks kept for reuse
+  size_t peak_in_use = 0;  // high-water mark of in_use
+  uint64_t num_allocs = 0;
+  uint64_t num_cache_hits = 0;
+  uint64_t num_os_allocs = 0;
+  uint64_t num_os_frees = 0;
+
+  size_t Reserved() const { return in_use + cached; }
+
+  // Share of the memory taken from the OS that does not back a live request,
+  // whether it is rounding slack inside a block or a cached free block.
+  double Fragmentation() const {
+    return Reserved() == 0 ? 0.0
+                           : 1.0 - static_cast<double>(allocated) / Reserved();
+  }
+
+  std::string ToString() const;
+};
+
+// Caches freed blocks so that repeated allocations of the same sizes (the
+// activations of a training step, say) are served without going back to the
+// OS. Requests up to kSmallLimit are rounded to one of four size classes per
+// power of two and kept in per-class free lists. Larger requests are mapped
+// directly from the OS in kLargeGranularity steps and cached in a best-fit
+// arena. Every block is aligned to kAlignment.
+//
+// Release to the OS is controlled by
+//   FLAGS_custom_cpu_allocator_max_cached_mb: cached bytes above this are
+//       returned to the OS, largest blocks first (default 4096).
+//   FLAGS_custom_cpu_allocator_max_block_mb: freed blocks larger than this
+//       are never cached (default 1024).
+//   FLAGS_custom_cpu_caching_allocator: set to 0 to return every block to the
+//       OS on free.
+class CachingAllocator {
+ public:
+  static constexpr size_t kAlignment = 64;
+  static constexpr size_t kMinBlockSize = 512;
+  static constexpr size_t kSmallLimit = 1 << 20;
+  static constexpr size_t kLargeGranularity = 64 << 10;
+
+  static CachingAllocator& Instance(int device_id);
+
+  CachingAllocator();
+  ~CachingAllocator();
+
+  CachingAllocator(const CachingAllocator&) = delete;
+  CachingAllocator& operator=(const CachingAllocator&) = delete;
+
+  // Returns nullptr when the OS is out of memory even after the cache has
+  // been emptied.
+  void* Allocate(size_t size);
+  // Returns false if `ptr` was not allocated here.
+  bool Deallocate(void* ptr);
+
+  // Returns every cached block to the OS.
+  void EmptyCache();
+
+  AllocatorStats GetStats();
+
+  // Size of the block that serves a request of `size` bytes.
+  static size_t RoundSize(size_t size);
+
+ private:
+  struct Block {
+    size_t size;
+    size_t requested;
+  };
+
+  void* AllocateFromOS(size_t size);
+  void ReleaseToOS(void* ptr, size_t size);
+  void ReleaseCachedLocked(size_t target);
+  void EmptyCacheLocked();
+
+  bool caching_;
+  size_t max_cached_;
+  size_t max_block_;
+
+  std::mutex mutex_;
+  AllocatorStats stats_;
+  std::unordered_map<void*, Block> live_;
+  std::unordered_map<size_t, std::vector<void*>> small_bins_;
+  std::multimap<size_t, void*> large_blocks_;
+};
+
+// Pinned host blocks, handed out by HostAllocate. Their lifetime is known to
+// the runtime, which waits for the queued copies that use a block before
+// freeing it, so only copies from and to them may be queued on a stream.
+// Pageable host memory belongs to the framework and may be freed or reused
+// as soon as the copy call returns.
+class PinnedHostMemory {
+ public:
+  static PinnedHostMemory& Instance();
+
+  void Add(const void* ptr, size_t size);
+  void Remove(const void* ptr);
+  // Whether [ptr, ptr + size) lies within one pinned block.
+  bool Contains(const void* ptr, size_t size);
+
+ private:
+  std::mutex mutex_;
+  std::map<uintptr_t, size_t> blocks_;
+};
+
+}  // namespace custom_cpu
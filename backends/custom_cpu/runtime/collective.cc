@@ -0,0 +1,612 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/collective.h"
+
+#include <fcntl.h>
+#include <sched.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <atomic>
+#include <cstring>
+#include <memory>
+
+#include "kernels/funcs/half.h"
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+namespace {
+
+// The 16-bit elements of a collective, converted by kernels/funcs/half.h.
+struct Float16Bits {
+  uint16_t bits;
+};
+
+struct BFloat16Bits {
+  uint16_t bits;
+};
+
+}  // namespace
+}  // namespace custom_cpu
+
+namespace custom_kernel {
+
+template <>
+struct HalfTraits<custom_cpu::Float16Bits>
+    : HalfTraitsBase<custom_cpu::Float16Bits, HalfFormat::kFloat16> {};
+
+template <>
+struct HalfTraits<custom_cpu::BFloat16Bits>
+    : HalfTraitsBase<custom_cpu::BFloat16Bits, HalfFormat::kBFloat16> {};
+
+}  // namespace custom_kernel
+
+namespace custom_cpu {
+
+struct alignas(64) SegmentHeader {
+  std::atomic<uint64_t> attached;
+};
+
+// Written only by the owning rank, polled by the others.
+struct alignas(64) RankFlags {
+  std::atomic<uint64_t> posted;    // chunk staged in the rank's slot
+  std::atomic<uint64_t> reduced;   // owned segment reduced in place
+  std::atomic<uint64_t> consumed;  // rank done reading peers' slots
+};
+
+// Chunk counters of the src -> dst mailbox.
+struct alignas(64) MailboxFlags {
+  std::atomic<uint64_t> sent;
+  std::atomic<uint64_t> received;
+};
+
+namespace {
+
+constexpr int kSpinsBeforeYield = 64;
+constexpr size_t kMinChunkBytes = 64 << 10;
+
+inline size_t AlignUp(size_t size, size_t alignment) {
+  return (size + alignment - 1) / alignment * alignment;
+}
+
+inline void WaitAtLeast(const std::atomic<uint64_t>& counter, uint64_t target) {
+  for (int spin = 0; counter.load(std::memory_order_acquire) < target; ++spin) {
+    if (spin >= kSpinsBeforeYield) {
+      sched_yield();
+    }
+  }
+}
+
+// How elements are loaded into and stored from the accumulator type.
+template <typename T>
+struct NativeIO {
+  using Storage = T;
+  using Acc = T;
+  static Acc Load(Storage v) { return v; }
+  static Storage Store(Acc v) { return v; }
+};
+
+// 16-bit elements are accumulated in float.
+template <typename T>
+struct HalfIO {
+  using Storage = T;
+  using Acc = float;
+  static Acc Load(Storage v) { return custom_kernel::Convert<float>(v); }
+  static Storage Store(Acc v) { return custom_kernel::Convert<T>(v); }
+};
+
+// Sum and product on 0/1 values act as logical or / and.
+struct BoolIO {
+  using Storage = uint8_t;
+  using Acc = uint8_t;
+  static Acc Load(Storage v) { return v != 0; }
+  static Storage Store(Acc v) { return v != 0; }
+};
+
+struct SumOp {
+  template <typename T>
+  static T Apply(T a, T b) {
+    return static_cast<T>(a + b);
+  }
+};
+
+struct ProductOp {
+  template <typename T>
+  static T Apply(T a, T b) {
+    return static_cast<T>(a * b);
+  }
+};
+
+struct MaxOp {
+  template <typename T>
+  static T Apply(T a, T b) {
+    return a > b ? a : b;
+  }
+};
+
+struct MinOp {
+  template <typename T>
+  static T Apply(T a, T b) {
+    return a < b ? a : b;
+  }
+};
+
+// dst[i] = op(srcs[0][i], ..., srcs[nsrc - 1][i]), accumulated blockwise so
+// that the inner loops run over contiguous elements. dst may alias a source.
+template <typename IO, typename Op>
+void ReduceBlocks(const char* const* srcs,
+                  size_t nsrc,
+                  char* dst,
+                  size_t n,
+                  size_t avg_divisor) {
+  using Storage = typename IO::Storage;
+  using Acc = typename IO::Acc;
+  constexpr size_t kBlock = 256;
+  Acc acc[kBlock];
+  for (size_t base = 0; base < n; base += kBlock) {
+    size_t m = std::min(kBlock, n - base);
+    auto* s0 = reinterpret_cast<const Storage*>(srcs[0]) + base;
+    for (size_t i = 0; i < m; ++i) {
+      acc[i] = IO::Load(s0[i]);
+    }
+    for (size_t k = 1; k < nsrc; ++k) {
+      auto* sk = reinterpret_cast<const Storage*>(srcs[k]) + base;
+      for (size_t i = 0; i < m; ++i) {
+        acc[i] = Op::Apply(acc[i], IO::Load(sk[i]));
+      }
+    }
+    if (avg_divisor > 1) {
+      for (size_t i = 0; i < m; ++i) {
+        acc[i] = static_cast<Acc>(acc[i] / static_cast<Acc>(avg_divisor));
+      }
+    }
+    auto* d = reinterpret_cast<Storage*>(dst) + base;
+    for (size_t i = 0; i < m; ++i) {
+      d[i] = IO::Store(acc[i]);
+    }
+  }
+}
+
+template <typename IO>
+void ReduceWithIO(
+    CclReduceOp op, const char* const* srcs, size_t nsrc, char* dst, size_t n) {
+  switch (op) {
+    case CclReduceOp::kSum:
+      ReduceBlocks<IO, SumOp>(srcs, nsrc, dst, n, 1);
+      break;
+    case CclReduceOp::kAvg:
+      ReduceBlocks<IO, SumOp>(srcs, nsrc, dst, n, nsrc);
+      break;
+    case CclReduceOp::kMax:
+      ReduceBlocks<IO, MaxOp>(srcs, nsrc, dst, n, 1);
+      break;
+    case CclReduceOp::kMin:
+      ReduceBlocks<IO, MinOp>(srcs, nsrc, dst, n, 1);
+      break;
+    case CclReduceOp::kProduct:
+      ReduceBlocks<IO, ProductOp>(srcs, nsrc, dst, n, 1);
+      break;
+  }
+}
+
+void ReduceSegment(CclDataType dtype,
+                   CclReduceOp op,
+                   const char* const* srcs,
+                   size_t nsrc,
+                   char* dst,
+                   size_t n) {
+  switch (dtype) {
+    case CclDataType::kFloat64:
+      ReduceWithIO<NativeIO<double>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kFloat32:
+      ReduceWithIO<NativeIO<float>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kFloat16:
+      ReduceWithIO<HalfIO<Float16Bits>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kBFloat16:
+      ReduceWithIO<HalfIO<BFloat16Bits>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kInt64:
+      ReduceWithIO<NativeIO<int64_t>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kInt32:
+      ReduceWithIO<NativeIO<int32_t>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kInt16:
+      ReduceWithIO<NativeIO<int16_t>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kInt8:
+      ReduceWithIO<NativeIO<int8_t>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kUInt8:
+      ReduceWithIO<NativeIO<uint8_t>>(op, srcs, nsrc, dst, n);
+      break;
+    case CclDataType::kBool:
+      ReduceWithIO<BoolIO>(op, srcs, nsrc, dst, n);
+      break;
+  }
+}
+
+thread_local int tls_group_depth = 0;
+
+}  // namespace
+
+size_t CclDataTypeSize(CclDataType dtype) {
+  switch (dtype) {
+    case CclDataType::kFloat64:
+    case CclDataType::kInt64:
+      return 8;
+    case CclDataType::kFloat32:
+    case CclDataType::kInt32:
+      return 4;
+    case CclDataType::kFloat16:
+    case CclDataType::kBFloat16:
+    case CclDataType::kInt16:
+      return 2;
+    case CclDataType::kInt8:
+    case CclDataType::kUInt8:
+    case CclDataType::kBool:
+      return 1;
+  }
+  return 1;
+}
+
+ShmComm::ShmComm(std::string name, size_t nranks, size_t rank)
+    : name_(std::move(name)),
+      nranks_(nranks),
+      rank_(rank),
+      send_seq_(nranks, 0),
+      recv_seq_(nranks, 0) {}
+
+ShmComm* ShmComm::Create(const std::string& name, size_t nranks, size_t rank) {
+  if (nranks == 0 || rank >= nranks) {
+    return nullptr;
+  }
+  std::string shm_name = name.empty() || name[0] != '/' ? "/" + name : name;
+  std::unique_ptr<ShmComm> comm(new ShmComm(shm_name, nranks, rank));
+
+  size_t chunk_bytes = EnvToUInt("FLAGS_custom_cpu_ccl_chunk_kb", 2048) << 10;
+  comm->slot_bytes_ = AlignUp(std::max(chunk_bytes, kMinChunkBytes), 64);
+
+  size_t flags_offset = AlignUp(sizeof(SegmentHeader), 64);
+  size_t mailbox_offset = flags_offset + nranks * sizeof(RankFlags);
+  size_t slots_offset =
+      AlignUp(mailbox_offset + nranks * nranks * sizeof(MailboxFlags), 4096);
+  size_t mail_offset = slots_offset + 2 * nranks * comm->slot_bytes_;
+  comm->map_bytes_ = mail_offset + nranks * nranks * comm->slot_bytes_;
+
+  int fd = shm_open(shm_name.c_str(), O_CREAT | O_RDWR, 0600);
+  if (fd < 0) {
+    return nullptr;
+  }
+  // Every rank truncates to the same size, whoever gets there first creates
+  // a zero-filled segment.
+  if (ftruncate(fd, comm->map_bytes_) != 0) {
+    close(fd);
+    return nullptr;
+  }
+  void* base = mmap(
+      nullptr, comm->map_bytes_, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  close(fd);
+  if (base == MAP_FAILED) {
+    return nullptr;
+  }
+
+  char* bytes = static_cast<char*>(base);
+  comm->base_ = base;
+  comm->header_ = reinterpret_cast<SegmentHeader*>(bytes);
+  comm->flags_ = reinterpret_cast<RankFlags*>(bytes + flags_offset);
+  comm->mailboxes_ = reinterpret_cast<MailboxFlags*>(bytes + mailbox_offset);
+  comm->slots_ = bytes + slots_offset;
+  comm->mail_data_ = bytes + mail_offset;
+
+  comm->header_->attached.fetch_add(1, std::memory_order_acq_rel);
+  WaitAtLeast(comm->header_->attached, nranks);
+  if (rank == 0) {
+    // Everyone has the segment mapped; drop the name so that nothing is left
+    // behind in /dev/shm if a rank dies.
+    shm_unlink(shm_name.c_str());
+  }
+  return comm.release();
+}
+
+ShmComm::~ShmComm() {
+  if (base_) {
+    munmap(base_, map_bytes_);
+  }
+}
+
+char* ShmComm::Slot(size_t rank, uint64_t seq) const {
+  return slots_ + (rank * 2 + seq % 2) * slot_bytes_;
+}
+
+char* ShmComm::Mailbox(size_t src, size_t dst) const {
+  return mail_data_ + (src * nranks_ + dst) * slot_bytes_;
+}
+
+void ShmComm::Segment(
+    size_t n, size_t nranks, size_t r, size_t* begin, size_t* end) {
+  *begin = n * r / nranks;
+  *end = n * (r + 1) / nranks;
+}
+
+uint64_t ShmComm::BeginChunk() {
+  uint64_t seq = ++seq_;
+  if (seq > 2) {
+    for (size_t r = 0; r < nranks_; ++r) {
+      WaitAtLeast(flags_[r].consumed, seq - 2);
+    }
+  }
+  return seq;
+}
+
+void ShmComm::Post(uint64_t seq) {
+  flags_[rank_].posted.store(seq, std::memory_order_release);
+}
+
+void ShmComm::MarkReduced(uint64_t seq) {
+  flags_[rank_].reduced.store(seq, std::memory_order_release);
+}
+
+void ShmComm::MarkConsumed(uint64_t seq) {
+  flags_[rank_].consumed.store(seq, std::memory_order_release);
+}
+
+void ShmComm::WaitPosted(size_t rank, uint64_t seq) const {
+  WaitAtLeast(flags_[rank].posted, seq);
+}
+
+void ShmComm::WaitAllPosted(uint64_t seq) const {
+  for (size_t r = 0; r < nranks_; ++r) {
+    WaitPosted(r, seq);
+  }
+}
+
+void ShmComm::WaitReduced(size_t rank, uint64_t seq) const {
+  WaitAtLeast(flags_[rank].reduced, seq);
+}
+
+void ShmComm::AllReduce(const void* send_buf,
+                        void* recv_buf,
+                        size_t count,
+                        CclDataType dtype,
+                        CclReduceOp op) {
+  Reduce(send_buf, recv_buf, count, dtype, op, nranks_);
+}
+
+// root == nranks_ means every rank receives the result.
+void ShmComm::Reduce(const void* send_buf,
+                     void* recv_buf,
+                     size_t count,
+                     CclDataType dtype,
+                     CclReduceOp op,
+                     size_t root) {
+  const size_t esz = CclDataTypeSize(dtype);
+  const size_t chunk = slot_bytes_ / esz;
+  auto* send = static_cast<const char*>(send_buf);
+  auto* recv = static_cast<char*>(recv_buf);
+  std::vector<const char*> srcs(nranks_);
+
+  for (size_t off = 0; off < count; off += chunk) {
+    size_t n = std::min(chunk, count - off);
+    uint64_t seq = BeginChunk();
+    memcpy(Slot(rank_, seq), send + off * esz, n * esz);
+    Post(seq);
+    WaitAllPosted(seq);
+
+    // Reduce-scatter: this rank owns one segment of the chunk and reduces it
+    // in place in its own slot.
+    size_t begin, end;
+    Segment(n, nranks_, rank_, &begin, &end);
+    for (size_t r = 0; r < nranks_; ++r) {
+      srcs[r] = Slot(r, seq) + begin * esz;
+    }
+    ReduceSegment(dtype,
+                  op,
+                  srcs.data(),
+                  nranks_,
+                  Slot(rank_, seq) + begin * esz,
+                  end - begin);
+    MarkReduced(seq);
+
+    // Allgather of the reduced segments.
+    if (root == nranks_ || root == rank_) {
+      for (size_t r = 0; r < nranks_; ++r) {
+        WaitReduced(r, seq);
+        Segment(n, nranks_, r, &begin, &end);
+        memcpy(recv + (off + begin) * esz,
+               Slot(r, seq) + begin * esz,
+               (end - begin) * esz);
+      }
+    }
+    MarkConsumed(seq);
+  }
+}
+
+void ShmComm::Broadcast(void* buf,
+                        size_t count,
+                        CclDataType dtype,
+                        size_t root) {
+  const size_t esz = CclDataTypeSize(dtype);
+  const size_t chunk = slot_bytes_ / esz;
+  auto* data = static_cast<char*>(buf);
+
+  for (size_t off = 0; off < count; off += chunk) {
+    size_t n = std::min(chunk, count - off);
+    uint64_t seq = BeginChunk();
+    if (rank_ == root) {
+      memcpy(Slot(root, seq), data + off * esz, n * esz);
+      Post(seq);
+    } else {
+      WaitPosted(root, seq);
+      memcpy(data + off * esz, Slot(root, seq), n * esz);
+    }
+    MarkConsumed(seq);
+  }
+}
+
+void ShmComm::AllGather(const void* send_buf,
+                        void* recv_buf,
+                        size_t count,
+                        CclDataType dtype) {
+  const size_t esz = CclDataTypeSize(dtype);
+  const size_t chunk = slot_bytes_ / esz;
+  auto* send = static_cast<const char*>(send_buf);
+  auto* recv = static_cast<char*>(recv_buf);
+
+  for (size_t off = 0; off < count; off += chunk) {
+    size_t n = std::min(chunk, count - off);
+    uint64_t seq = BeginChunk();
+    memcpy(Slot(rank_, seq), send + off * esz, n * esz);
+    Post(seq);
+    for (size_t r = 0; r < nranks_; ++r) {
+      WaitPosted(r, seq);
+      memcpy(recv + (r * count + off) * esz, Slot(r, seq), n * esz);
+    }
+    MarkConsumed(seq);
+  }
+}
+
+void ShmComm::ReduceScatter(const void* send_buf,
+                            void* recv_buf,
+                            size_t recv_count,
+                            CclDataType dtype,
+                            CclReduceOp op) {
+  const size_t esz = CclDataTypeSize(dtype);
+  // A slot stages one piece of every rank's block.
+  const size_t chunk = std::max<size_t>(slot_bytes_ / (esz * nranks_), 1);
+  auto* send = static_cast<const char*>(send_buf);
+  auto* recv = static_cast<char*>(recv_buf);
+  std::vector<const char*> srcs(nranks_);
+
+  for (size_t off = 0; off < recv_count; off += chunk) {
+    size_t n = std::min(chunk, recv_count - off);
+    uint64_t seq = BeginChunk();
+    char* slot = Slot(rank_, seq);
+    for (size_t j = 0; j < nranks_; ++j) {
+      memcpy(slot + j * n * esz, send + (j * recv_count + off) * esz, n * esz);
+    }
+    Post(seq);
+    WaitAllPosted(seq);
+    for (size_t r = 0; r < nranks_; ++r) {
+      srcs[r] = Slot(r, seq) + rank_ * n * esz;
+    }
+    ReduceSegment(dtype, op, srcs.data(), nranks_, recv + off * esz, n);
+    MarkConsumed(seq);
+  }
+}
+
+bool ShmComm::TryProgress(P2POp* op) {
+  if (op->done >= op->bytes) {
+    return true;
+  }
+  size_t n = std::min(slot_bytes_, op->bytes - op->done);
+  if (op->is_send) {
+    MailboxFlags& box = mailboxes_[rank_ * nranks_ + op->peer];
+    uint64_t k = send_seq_[op->peer] + 1;
+    // Single-chunk mailbox: the previous chunk must have been taken.
+    if (box.received.load(std::memory_order_acquire) < k - 1) {
+      return false;
+    }
+    memcpy(Mailbox(rank_, op->peer), op->buf + op->done, n);
+    box.sent.store(k, std::memory_order_release);
+    send_seq_[op->peer] = k;
+  } else {
+    MailboxFlags& box = mailboxes_[op->peer * nranks_ + rank_];
+    uint64_t k = recv_seq_[op->peer] + 1;
+    if (box.sent.load(std::memory_order_acquire) < k) {
+      return false;
+    }
+    memcpy(op->buf + op->done, Mailbox(op->peer, rank_), n);
+    box.received.store(k, std::memory_order_release);
+    recv_seq_[op->peer] = k;
+  }
+  op->done += n;
+  return op->done >= op->bytes;
+}
+
+void ShmComm::RunToCompletion(std::vector<P2POp>* ops) {
+  size_t pending = ops->size();
+  std::vector<bool> finished(ops->size(), false);
+  int idle_passes = 0;
+  while (pending > 0) {
+    bool progressed = false;
+    for (size_t i = 0; i < ops->size(); ++i) {
+      if (finished[i]) {
+        continue;
+      }
+      P2POp& op = (*ops)[i];
+      size_t before = op.done;
+      if (op.comm->TryProgress(&op)) {
+        finished[i] = true;
+        --pending;
+        progressed = true;
+      } else if (op.done != before) {
+        progressed = true;
+      }
+    }
+    if (progressed) {
+      idle_passes = 0;
+    } else if (++idle_passes >= kSpinsBeforeYield) {
+      sched_yield();
+    }
+  }
+}
+
+std::vector<ShmComm::P2POp>& ShmComm::GroupOps() {
+  thread_local std::vector<P2POp> ops;
+  return ops;
+}
+
+void ShmComm::Send(const void* buf, size_t bytes, size_t peer) {
+  P2POp op{this,
+           true,
+           const_cast<char*>(static_cast<const char*>(buf)),
+           bytes,
+           peer,
+           0};
+  if (tls_group_depth > 0) {
+    GroupOps().push_back(op);
+    return;
+  }
+  std::vector<P2POp> ops{op};
+  RunToCompletion(&ops);
+}
+
+void ShmComm::Recv(void* buf, size_t bytes, size_t peer) {
+  P2POp op{this, false, static_cast<char*>(buf), bytes, peer, 0};
+  if (tls_group_depth > 0) {
+    GroupOps().push_back(op);
+    return;
+  }
+  std::vector<P2POp> ops{op};
+  RunToCompletion(&ops);
+}
+
+void ShmComm::GroupStart() { ++tls_group_depth; }
+
+void ShmComm::GroupEnd() {
+  if (tls_group_depth == 0 || --tls_group_depth > 0) {
+    return;
+  }
+  std::vector<P2POp> ops;
+  ops.swap(GroupOps());
+  RunToCompletion(&ops);
+}
+
+}  // namespace custom_cpu
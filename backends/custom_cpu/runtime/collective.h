@@ -0,0 +1,160 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace custom_cpu {
+
+enum class CclDataType {
+  kFloat64,
+  kFloat32,
+  kFloat16,
+  kBFloat16,
+  kInt64,
+  kInt32,
+  kInt16,
+  kInt8,
+  kUInt8,
+  kBool,
+};
+
+enum class CclReduceOp { kSum, kAvg, kMax, kMin, kProduct };
+
+size_t CclDataTypeSize(CclDataType dtype);
+
+struct SegmentHeader;
+struct RankFlags;
+struct MailboxFlags;
+
+// Intra-node communicator over one named POSIX shared-memory segment that all
+// ranks map. Each rank owns two staging slots (chunks alternate between them
+// so that a rank can stage chunk i + 1 while peers still read chunk i) and a
+// mailbox per peer for point-to-point messages. Progress is tracked with
+// monotonic per-rank counters in the segment, so no locks are shared between
+// processes.
+//
+// Reductions are chunked: every rank stages a chunk, rank r reduces the r-th
+// segment of it across all slots (reduce-scatter), then every rank copies the
+// reduced segments out (allgather). All ranks must issue the same sequence of
+// collectives, as with NCCL.
+//
+// FLAGS_custom_cpu_ccl_chunk_kb sets the slot size (default 2048 KB); it has
+// to be the same on every rank.
+class ShmComm {
+ public:
+  // Maps (creating if needed) the segment `name` and waits until all
+  // `nranks` ranks have attached. Returns nullptr on failure.
+  static ShmComm* Create(const std::string& name, size_t nranks, size_t rank);
+
+  ~ShmComm();
+
+  ShmComm(const ShmComm&) = delete;
+  ShmComm& operator=(const ShmComm&) = delete;
+
+  size_t Rank() const { return rank_; }
+  size_t NRanks() const { return nranks_; }
+  const std::string& Name() const { return name_; }
+
+  void AllReduce(const void* send_buf,
+                 void* recv_buf,
+                 size_t count,
+                 CclDataType dtype,
+                 CclReduceOp op);
+  void Reduce(const void* send_buf,
+              void* recv_buf,
+              size_t count,
+              CclDataType dtype,
+              CclReduceOp op,
+              size_t root);
+  void Broadcast(void* buf, size_t count, CclDataType dtype, size_t root);
+  // recv_buf holds nranks * count elements, ordered by rank.
+  void AllGather(const void* send_buf,
+                 void* recv_buf,
+                 size_t count,
+                 CclDataType dtype);
+  // send_buf holds nranks * recv_count elements; rank r receives the
+  // reduction of the r-th block.
+  void ReduceScatter(const void* send_buf,
+                     void* recv_buf,
+                     size_t recv_count,
+                     CclDataType dtype,
+                     CclReduceOp op);
+
+  // Point-to-point. Inside GroupStart()/GroupEnd() the calls only queue the
+  // transfer, and GroupEnd() progresses all queued transfers together, so
+  // that paired sends and receives between two ranks cannot deadlock.
+  void Send(const void* buf, size_t bytes, size_t peer);
+  void Recv(void* buf, size_t bytes, size_t peer);
+
+  static void GroupStart();
+  static void GroupEnd();
+
+ private:
+  struct P2POp {
+    ShmComm* comm;
+    bool is_send;
+    char* buf;
+    size_t bytes;
+    size_t peer;
+    size_t done;
+  };
+
+  ShmComm(std::string name, size_t nranks, size_t rank);
+
+  char* Slot(size_t rank, uint64_t seq) const;
+  char* Mailbox(size_t src, size_t dst) const;
+
+  // Claims the next chunk sequence number and waits until every rank has
+  // finished reading the slot it maps to.
+  uint64_t BeginChunk();
+  void Post(uint64_t seq);
+  void MarkReduced(uint64_t seq);
+  void MarkConsumed(uint64_t seq);
+  void WaitPosted(size_t rank, uint64_t seq) const;
+  void WaitAllPosted(uint64_t seq) const;
+  void WaitReduced(size_t rank, uint64_t seq) const;
+
+  // The part [begin, end) of an n-element chunk that rank `r` reduces.
+  static void Segment(
+      size_t n, size_t nranks, size_t r, size_t* begin, size_t* end);
+
+  bool TryProgress(P2POp* op);
+  static void RunToCompletion(std::vector<P2POp>* ops);
+  // Transfers queued by this thread since GroupStart().
+  static std::vector<P2POp>& GroupOps();
+
+  std::string name_;
+  size_t nranks_;
+  size_t rank_;
+  size_t slot_bytes_ = 0;
+  size_t map_bytes_ = 0;
+  void* base_ = nullptr;
+  SegmentHeader* header_ = nullptr;
+  RankFlags* flags_ = nullptr;
+  MailboxFlags* mailboxes_ = nullptr;
+  char* slots_ = nullptr;
+  char* mail_data_ = nullptr;
+
+  // Chunks this rank has started; identical on every rank between calls.
+  uint64_t seq_ = 0;
+  std::vector<uint64_t> send_seq_;
+  std::vector<uint64_t> recv_seq_;
+};
+
+}  // namespace custom_cpu
@@ -12,24 +12,129 @@
 // See the License for the specific language governing permissions and
 // limitations under the License.
 
-#include <errno.h>
-#include <fcntl.h>
-#include <semaphore.h>
-#include <sys/types.h>
-#include <sys/wait.h>
 #include <unistd.h>
 
+#include <algorithm>
 #include <cstdint>
 #include <cstdio>
 #include <cstring>
 #include <iostream>
+#include <random>
+#include <string>
+#include <vector>
 
+#include "kernels/funcs/random.h"
+#include "kernels/funcs/thread_pool.h"
+#include "paddle/phi/api/profiler/trace_event.h"
 #include "paddle/phi/backends/device_ext.h"
-
-#define MEMORY_FRACTION 0.5f
+#include "runtime/allocator.h"
+#include "runtime/collective.h"
+#include "runtime/flags.h"
+#include "runtime/stream.h"
+#include "runtime/tracer.h"
 
 static int global_current_device = 0;
 
+// Async copies between device memory and pinned host memory are queued on
+// the stream worker, so they overlap with compute on the launching thread.
+// Kernels and custom ops run on the launching thread, but call
+// WaitForStreamWork before they start, so they still see the copies they
+// consume. Copies from and to pageable host memory run inline, as the
+// framework may free or reuse that memory once the call returns.
+// FLAGS_custom_cpu_async_copy=0 runs every copy inline.
+static const bool kAsyncCopy = EnvToBool("FLAGS_custom_cpu_async_copy", true);
+
+static inline custom_cpu::Stream *ToStream(C_Stream stream) {
+  return reinterpret_cast<custom_cpu::Stream *>(stream);
+}
+
+static inline custom_cpu::Event *ToEvent(C_Event event) {
+  return reinterpret_cast<custom_cpu::Event *>(event);
+}
+
+static inline uint64_t StreamId(C_Stream stream) {
+  return stream ? ToStream(stream)->Id() : 0;
+}
+
+// Copy kinds, also used as the names of the traced copies.
+static const char kCopyH2D[] = "MEMCPY_HtoD";
+static const char kCopyD2H[] = "MEMCPY_DtoH";
+static const char kCopyD2D[] = "MEMCPY_DtoD";
+static const char kCopyP2P[] = "MEMCPY_PtoP";
+
+static void TracedCopy(const char *kind,
+                       int device_id,
+                       uint64_t stream_id,
+                       uint32_t correlation_id,
+                       void *dst,
+                       const void *src,
+                       size_t size) {
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kMemcpy,
+                               kind,
+                               device_id,
+                               stream_id,
+                               size,
+                               correlation_id);
+  memcpy(dst, src, size);
+}
+
+// A copy on the calling thread, after the queued copies that use the same
+// memory.
+static void SyncCopy(const char *kind,
+                     int device_id,
+                     uint64_t stream_id,
+                     void *dst,
+                     const void *src,
+                     size_t size) {
+  auto &uses = custom_cpu::StreamMemoryUses::Instance();
+  uses.WaitFor(dst, size);
+  uses.WaitFor(src, size);
+  TracedCopy(kind, device_id, stream_id, 0, dst, src, size);
+}
+
+// Whether the host side of a copy, if any, outlives the copy call.
+static bool CanQueueCopy(const char *kind,
+                         void *dst,
+                         const void *src,
+                         size_t size) {
+  auto &pinned = custom_cpu::PinnedHostMemory::Instance();
+  if (kind == kCopyH2D) {
+    return pinned.Contains(src, size);
+  }
+  if (kind == kCopyD2H) {
+    return pinned.Contains(dst, size);
+  }
+  return true;
+}
+
+static void CopyOnStream(const char *kind,
+                         int device_id,
+                         C_Stream stream,
+                         void *dst,
+                         const void *src,
+                         size_t size) {
+  if (kAsyncCopy && stream && CanQueueCopy(kind, dst, src, size)) {
+    uint32_t correlation_id = custom_cpu::Tracer::Enabled()
+                                  ? custom_cpu::Tracer::NextCorrelationId()
+                                  : 0;
+    custom_cpu::TraceScope trace(custom_cpu::TraceKind::kRuntimeApi,
+                                 "AsyncMemCpy",
+                                 device_id,
+                                 StreamId(stream),
+                                 size,
+                                 correlation_id);
+    uint64_t stream_id = StreamId(stream);
+    uint64_t seq = ToStream(stream)->Enqueue([=] {
+      TracedCopy(kind, device_id, stream_id, correlation_id, dst, src, size);
+    });
+    auto &uses = custom_cpu::StreamMemoryUses::Instance();
+    uses.Record(dst, size, ToStream(stream), seq);
+    uses.Record(src, size, ToStream(stream), seq);
+  } else {
+    SyncCopy(kind, device_id, StreamId(stream), dst, src, size);
+  }
+}
+
 C_Status Init() {
   std::cout << "custom_cpu plugin compiled with ";
 #ifdef __clang__
@@ -42,11 +147,15 @@ C_Status Init() {
 
 C_Status InitDevice(const C_Device device) {
   global_current_device = device->id;
+  custom_kernel::ThreadPool::SetCurrentDevice(device->id);
+  custom_kernel::Generator::SetCurrentDevice(device->id);
   return C_SUCCESS;
 }
 
 C_Status SetDevice(const C_Device device) {
   global_current_device = device->id;
+  custom_kernel::ThreadPool::SetCurrentDevice(device->id);
+  custom_kernel::Generator::SetCurrentDevice(device->id);
   return C_SUCCESS;
 }
 
@@ -55,7 +164,16 @@ C_Status GetDevice(const C_Device device) {
   return C_SUCCESS;
 }
 
-C_Status DestroyDevice(const C_Device device) { return C_SUCCESS; }
+C_Status DestroyDevice(const C_Device device) {
+  if (EnvToBool("FLAGS_custom_cpu_allocator_print_stats", false)) {
+    std::cout << "custom_cpu:" << device->id << " allocator: "
+              << custom_cpu::CachingAllocator::Instance(device->id)
+                     .GetStats()
+                     .ToString()
+              << std::endl;
+  }
+  return C_SUCCESS;
+}
 
 C_Status Finalize() { return C_SUCCESS; }
 
@@ -70,20 +188,54 @@ C_Status GetDevicesList(size_t *devices) {
   return C_SUCCESS;
 }
 
-C_Status MemCpy(const C_Device device,
-                void *dst,
-                const void *src,
-                size_t size) {
-  memcpy(dst, src, size);
+C_Status MemCpyH2D(const C_Device device,
+                   void *dst,
+                   const void *src,
+                   size_t size) {
+  SyncCopy(kCopyH2D, device->id, 0, dst, src, size);
   return C_SUCCESS;
 }
 
-C_Status AsyncMemCpy(const C_Device device,
-                     C_Stream stream,
-                     void *dst,
-                     const void *src,
-                     size_t size) {
-  memcpy(dst, src, size);
+C_Status MemCpyD2H(const C_Device device,
+                   void *dst,
+                   const void *src,
+                   size_t size) {
+  SyncCopy(kCopyD2H, device->id, 0, dst, src, size);
+  return C_SUCCESS;
+}
+
+C_Status MemCpyD2D(const C_Device device,
+                   void *dst,
+                   const void *src,
+                   size_t size) {
+  SyncCopy(kCopyD2D, device->id, 0, dst, src, size);
+  return C_SUCCESS;
+}
+
+C_Status AsyncMemCpyH2D(const C_Device device,
+                        C_Stream stream,
+                        void *dst,
+                        const void *src,
+                        size_t size) {
+  CopyOnStream(kCopyH2D, device->id, stream, dst, src, size);
+  return C_SUCCESS;
+}
+
+C_Status AsyncMemCpyD2H(const C_Device device,
+                        C_Stream stream,
+                        void *dst,
+                        const void *src,
+                        size_t size) {
+  CopyOnStream(kCopyD2H, device->id, stream, dst, src, size);
+  return C_SUCCESS;
+}
+
+C_Status AsyncMemCpyD2D(const C_Device device,
+                        C_Stream stream,
+                        void *dst,
+                        const void *src,
+                        size_t size) {
+  CopyOnStream(kCopyD2D, device->id, stream, dst, src, size);
   return C_SUCCESS;
 }
 
@@ -92,7 +244,7 @@ C_Status MemCpyP2P(const C_Device dst_device,
                    void *dst,
                    const void *src,
                    size_t size) {
-  memcpy(dst, src, size);
+  SyncCopy(kCopyP2P, dst_device->id, 0, dst, src, size);
   return C_SUCCESS;
 }
 
@@ -102,13 +254,33 @@ C_Status AsyncMemCpyP2P(const C_Device dst_device,
                         void *dst,
                         const void *src,
                         size_t size) {
-  memcpy(dst, src, size);
+  CopyOnStream(kCopyP2P, dst_device->id, stream, dst, src, size);
   return C_SUCCESS;
 }
 
 C_Status Allocate(const C_Device device, void **ptr, size_t size) {
+  custom_cpu::TraceScope trace(
+      custom_cpu::TraceKind::kRuntimeApi, "Allocate", device->id, 0, size);
+  *ptr = custom_cpu::CachingAllocator::Instance(device->id).Allocate(size);
+  return *ptr ? C_SUCCESS : C_FAILED;
+}
+
+C_Status Deallocate(const C_Device device, void *ptr, size_t size) {
+  custom_cpu::TraceScope trace(
+      custom_cpu::TraceKind::kRuntimeApi, "Deallocate", device->id, 0, size);
+  // A queued copy may still read from or write to this block.
+  custom_cpu::StreamMemoryUses::Instance().WaitFor(ptr, size);
+  return custom_cpu::CachingAllocator::Instance(device->id).Deallocate(ptr)
+             ? C_SUCCESS
+             : C_FAILED;
+}
+
+// Pinned host and unified memory are plain host memory and stay out of the
+// device arena and its statistics.
+C_Status HostAllocate(const C_Device device, void **ptr, size_t size) {
   auto data = malloc(size);
   if (data) {
+    custom_cpu::PinnedHostMemory::Instance().Add(data, size);
     *ptr = data;
     return C_SUCCESS;
   } else {
@@ -117,43 +289,107 @@ C_Status Allocate(const C_Device device, void **ptr, size_t size) {
   return C_FAILED;
 }
 
-C_Status Deallocate(const C_Device device, void *ptr, size_t size) {
+C_Status HostDeallocate(const C_Device device, void *ptr, size_t size) {
+  custom_cpu::StreamMemoryUses::Instance().WaitFor(ptr, size);
+  custom_cpu::PinnedHostMemory::Instance().Remove(ptr);
   free(ptr);
   return C_SUCCESS;
 }
 
+C_Status DeviceMemSet(const C_Device device,
+                      void *ptr,
+                      unsigned char value,
+                      size_t size) {
+  custom_cpu::TraceScope trace(
+      custom_cpu::TraceKind::kMemset, "MEMSET", device->id, 0, size);
+  custom_cpu::StreamMemoryUses::Instance().WaitFor(ptr, size);
+  memset(ptr, value, size);
+  return C_SUCCESS;
+}
+
 C_Status CreateStream(const C_Device device, C_Stream *stream) {
-  stream = nullptr;
+  *stream = reinterpret_cast<C_Stream>(new custom_cpu::Stream(device->id));
   return C_SUCCESS;
 }
 
 C_Status DestroyStream(const C_Device device, C_Stream stream) {
+  delete ToStream(stream);
+  return C_SUCCESS;
+}
+
+C_Status QueryStream(const C_Device device, C_Stream stream) {
+  if (!stream) {
+    return C_SUCCESS;
+  }
+  return ToStream(stream)->Idle() ? C_SUCCESS : C_FAILED;
+}
+
+C_Status AddCallback(const C_Device device,
+                     C_Stream stream,
+                     C_Callback callback,
+                     void *user_data) {
+  if (!stream) {
+    C_Status ret = C_SUCCESS;
+    callback(device, stream, user_data, &ret);
+    return ret;
+  }
+  // The caller's C_Device may not outlive this call, keep a copy.
+  C_Device_st device_copy = *device;
+  ToStream(stream)->Enqueue([=]() mutable {
+    C_Status ret = C_SUCCESS;
+    callback(&device_copy, stream, user_data, &ret);
+  });
   return C_SUCCESS;
 }
 
 C_Status CreateEvent(const C_Device device, C_Event *event) {
+  *event = reinterpret_cast<C_Event>(new custom_cpu::Event());
   return C_SUCCESS;
 }
 
 C_Status RecordEvent(const C_Device device, C_Stream stream, C_Event event) {
+  ToEvent(event)->Record(ToStream(stream));
   return C_SUCCESS;
 }
 
+C_Status QueryEvent(const C_Device device, C_Event event) {
+  return ToEvent(event)->Query() ? C_SUCCESS : C_FAILED;
+}
+
 C_Status DestroyEvent(const C_Device device, C_Event event) {
+  delete ToEvent(event);
   return C_SUCCESS;
 }
 
-C_Status SyncDevice(const C_Device device) { return C_SUCCESS; }
+C_Status SyncDevice(const C_Device device) {
+  custom_cpu::SynchronizeDeviceStreams(device->id);
+  return C_SUCCESS;
+}
 
 C_Status SyncStream(const C_Device device, C_Stream stream) {
+  if (stream) {
+    ToStream(stream)->Synchronize();
+  }
   return C_SUCCESS;
 }
 
-C_Status SyncEvent(const C_Device device, C_Event event) { return C_SUCCESS; }
+C_Status SyncEvent(const C_Device device, C_Event event) {
+  ToEvent(event)->Synchronize();
+  return C_SUCCESS;
+}
 
 C_Status StreamWaitEvent(const C_Device device,
                          C_Stream stream,
                          C_Event event) {
+  auto point = ToEvent(event)->Snapshot();
+  if (!point.first || point.first->Reached(point.second)) {
+    return C_SUCCESS;
+  }
+  if (!stream) {
+    point.first->WaitFor(point.second);
+    return C_SUCCESS;
+  }
+  ToStream(stream)->Enqueue([point] { point.first->WaitFor(point.second); });
   return C_SUCCESS;
 }
 
@@ -162,79 +398,164 @@ C_Status VisibleDevices(size_t *devices) { return C_SUCCESS; }
 C_Status DeviceMemStats(const C_Device device,
                         size_t *total_memory,
                         size_t *free_memory) {
-  float memusage;
   FILE *fp;
   char buffer[1024];
   size_t byte_read;
   char *pos;
+  size_t mem_total = 0, mem_available = 0;
 
   fp = fopen("/proc/meminfo", "r");
-  byte_read = fread(buffer, 1, sizeof(buffer), fp);
+  byte_read = fread(buffer, 1, sizeof(buffer) - 1, fp);
   fclose(fp);
   buffer[byte_read] = '\0';
   pos = strstr(buffer, "MemTotal:");
-  sscanf(pos, "MemTotal: %lu kB", total_memory);
-  pos = strstr(pos, "MemFree:");
-  sscanf(pos, "MemFree: %lu kB", free_memory);
-  *total_memory = *total_memory * 1024;
-  *free_memory = *free_memory * 1024;
-  *free_memory = *free_memory * MEMORY_FRACTION;
-
+  sscanf(pos, "MemTotal: %lu kB", &mem_total);
+  pos = strstr(buffer, "MemAvailable:");
+  if (!pos) {
+    pos = strstr(buffer, "MemFree:");
+    sscanf(pos, "MemFree: %lu kB", &mem_available);
+  } else {
+    sscanf(pos, "MemAvailable: %lu kB", &mem_available);
+  }
+  mem_total *= 1024;
+  mem_available *= 1024;
+
+  // Blocks cached by the arena are free from the device's point of view but
+  // not from the OS's.
+  auto stats = custom_cpu::CachingAllocator::Instance(device->id).GetStats();
+  *total_memory = mem_total;
+  *free_memory = std::min(mem_available + stats.cached,
+                          mem_total - std::min(mem_total, stats.in_use));
   return C_SUCCESS;
 }
 
 C_Status DeviceMinChunkSize(const C_Device device, size_t *size) {
-  *size = 512;
+  *size = custom_cpu::CachingAllocator::kMinBlockSize;
   return C_SUCCESS;
 }
 
-struct C_CCLComm_st {
-  size_t rank;
-  size_t nranks;
-  sem_t *sig;
-  sem_t *sig_2;
-  std::string sig_name;
-  std::string sig_2_name;
-};
+static inline custom_cpu::ShmComm *ToComm(C_CCLComm comm) {
+  return reinterpret_cast<custom_cpu::ShmComm *>(comm);
+}
+
+static bool ToCclDataType(C_DataType data_type,
+                          custom_cpu::CclDataType *dtype) {
+  switch (data_type) {
+    case C_DataType::FLOAT64:
+      *dtype = custom_cpu::CclDataType::kFloat64;
+      return true;
+    case C_DataType::FLOAT32:
+      *dtype = custom_cpu::CclDataType::kFloat32;
+      return true;
+    case C_DataType::FLOAT16:
+      *dtype = custom_cpu::CclDataType::kFloat16;
+      return true;
+    case C_DataType::BFLOAT16:
+      *dtype = custom_cpu::CclDataType::kBFloat16;
+      return true;
+    case C_DataType::INT64:
+      *dtype = custom_cpu::CclDataType::kInt64;
+      return true;
+    case C_DataType::INT32:
+      *dtype = custom_cpu::CclDataType::kInt32;
+      return true;
+    case C_DataType::INT16:
+      *dtype = custom_cpu::CclDataType::kInt16;
+      return true;
+    case C_DataType::INT8:
+      *dtype = custom_cpu::CclDataType::kInt8;
+      return true;
+    case C_DataType::UINT8:
+      *dtype = custom_cpu::CclDataType::kUInt8;
+      return true;
+    case C_DataType::BOOL:
+      *dtype = custom_cpu::CclDataType::kBool;
+      return true;
+    default:
+      return false;
+  }
+}
+
+static bool ToCclReduceOp(C_CCLReduceOp op, custom_cpu::CclReduceOp *ccl_op) {
+  switch (op) {
+    case C_CCLReduceOp::SUM:
+      *ccl_op = custom_cpu::CclReduceOp::kSum;
+      return true;
+    case C_CCLReduceOp::AVG:
+      *ccl_op = custom_cpu::CclReduceOp::kAvg;
+      return true;
+    case C_CCLReduceOp::MAX:
+      *ccl_op = custom_cpu::CclReduceOp::kMax;
+      return true;
+    case C_CCLReduceOp::MIN:
+      *ccl_op = custom_cpu::CclReduceOp::kMin;
+      return true;
+    case C_CCLReduceOp::PRODUCT:
+      *ccl_op = custom_cpu::CclReduceOp::kProduct;
+      return true;
+    default:
+      return false;
+  }
+}
+
+// Collectives run on the calling thread, like the kernels. Work already
+// queued on the stream (async copies, callbacks) is finished first so that
+// the buffers are in their stream-ordered state.
+static void SyncBeforeCollective(C_Stream stream) {
+  if (stream) {
+    ToStream(stream)->Synchronize();
+  }
+}
+
+static int CollectiveDeviceId(C_Stream stream) {
+  return stream ? ToStream(stream)->DeviceId() : global_current_device;
+}
 
-// for unittest
 C_Status XcclGetUniqueIdSize(size_t *sz) {
-  *sz = sizeof(size_t);
+  *sz = 64;
   return C_SUCCESS;
 }
 
 C_Status XcclGetUniqueId(C_CCLRootId *unique_id) {
-  auto ptr = reinterpret_cast<int8_t *>(unique_id->data);
-  for (auto i = 0; i < unique_id->sz - 1; ++i) {
-    ptr[i] = static_cast<int8_t>(std::rand() % ('z' - 'a') + 'a');
+  // The id names the shared-memory segment, keep it unique across jobs on
+  // the same host.
+  std::random_device rd;
+  char name[64];
+  snprintf(name,
+           sizeof(name),
+           "/custom_cpu_ccl_%d_%08x%08x",
+           static_cast<int>(getpid()),
+           rd(),
+           rd());
+  if (unique_id->sz <= strlen(name)) {
+    return C_FAILED;
   }
-  ptr[unique_id->sz - 1] = '\0';
+  memset(unique_id->data, 0, unique_id->sz);
+  memcpy(unique_id->data, name, strlen(name));
   return C_SUCCESS;
 }
 
-C_Status XcclCommInitRank(size_t ranks,
+C_Status XcclCommInitRank(size_t nranks,
                           C_CCLRootId *unique_id,
                           size_t rank,
                           C_CCLComm *comm) {
-  auto sig = sem_open(static_cast<char *>(unique_id->data), O_CREAT, 0644, 0);
-  auto sig_2 =
-      sem_open(static_cast<char *>(unique_id->data) + 1, O_CREAT, 0644, 0);
-  *comm =
-      new C_CCLComm_st({rank,
-                        ranks,
-                        sig,
-                        sig_2,
-                        std::string(static_cast<char *>(unique_id->data)),
-                        std::string(static_cast<char *>(unique_id->data) + 1)});
+  auto shm_comm = custom_cpu::ShmComm::Create(
+      std::string(static_cast<char *>(unique_id->data)), nranks, rank);
+  if (!shm_comm) {
+    return C_FAILED;
+  }
+  *comm = reinterpret_cast<C_CCLComm>(shm_comm);
   return C_SUCCESS;
 }
 
 C_Status XcclDestroyComm(C_CCLComm comm) {
-  if (comm) {
-    sem_unlink(comm->sig_name.c_str());
-    sem_unlink(comm->sig_2_name.c_str());
-    delete comm;
-  }
+  delete ToComm(comm);
+  return C_SUCCESS;
+}
+
+C_Status XcclGetCommName(C_CCLComm comm, char *comm_name) {
+  auto &name = ToComm(comm)->Name();
+  memcpy(comm_name, name.c_str(), name.size() + 1);
   return C_SUCCESS;
 }
 
@@ -245,19 +566,18 @@ C_Status XcclAllReduce(void *send_buf,
                        C_CCLReduceOp op,
                        C_CCLComm comm,
                        C_Stream stream) {
-  sem_post(comm->sig);
-
-  if (comm->rank == 0) {
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_wait(comm->sig);
-    }
-
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_post(comm->sig_2);
-    }
+  custom_cpu::CclDataType dtype;
+  custom_cpu::CclReduceOp ccl_op;
+  if (!ToCclDataType(data_type, &dtype) || !ToCclReduceOp(op, &ccl_op)) {
+    return C_FAILED;
   }
-
-  sem_wait(comm->sig_2);
+  SyncBeforeCollective(stream);
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kCollective,
+                               "AllReduce",
+                               CollectiveDeviceId(stream),
+                               StreamId(stream),
+                               count * custom_cpu::CclDataTypeSize(dtype));
+  ToComm(comm)->AllReduce(send_buf, recv_buf, count, dtype, ccl_op);
   return C_SUCCESS;
 }
 
@@ -267,39 +587,236 @@ C_Status XcclBroadcast(void *buf,
                        size_t root,
                        C_CCLComm comm,
                        C_Stream stream) {
-  sem_post(comm->sig);
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
+  }
+  SyncBeforeCollective(stream);
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kCollective,
+                               "Broadcast",
+                               CollectiveDeviceId(stream),
+                               StreamId(stream),
+                               count * custom_cpu::CclDataTypeSize(dtype));
+  ToComm(comm)->Broadcast(buf, count, dtype, root);
+  return C_SUCCESS;
+}
 
-  if (comm->rank == 0) {
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_wait(comm->sig);
-    }
+C_Status XcclReduce(void *send_buf,
+                    void *recv_buf,
+                    size_t count,
+                    C_DataType data_type,
+                    C_CCLReduceOp op,
+                    size_t root,
+                    C_CCLComm comm,
+                    C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  custom_cpu::CclReduceOp ccl_op;
+  if (!ToCclDataType(data_type, &dtype) || !ToCclReduceOp(op, &ccl_op)) {
+    return C_FAILED;
+  }
+  SyncBeforeCollective(stream);
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kCollective,
+                               "Reduce",
+                               CollectiveDeviceId(stream),
+                               StreamId(stream),
+                               count * custom_cpu::CclDataTypeSize(dtype));
+  ToComm(comm)->Reduce(send_buf, recv_buf, count, dtype, ccl_op, root);
+  return C_SUCCESS;
+}
 
-    for (auto i = 0; i < comm->nranks; ++i) {
-      sem_post(comm->sig_2);
-    }
+C_Status XcclAllGather(void *send_buf,
+                       void *recv_buf,
+                       size_t count,
+                       C_DataType data_type,
+                       C_CCLComm comm,
+                       C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
   }
+  SyncBeforeCollective(stream);
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kCollective,
+                               "AllGather",
+                               CollectiveDeviceId(stream),
+                               StreamId(stream),
+                               count * custom_cpu::CclDataTypeSize(dtype));
+  ToComm(comm)->AllGather(send_buf, recv_buf, count, dtype);
+  return C_SUCCESS;
+}
+
+C_Status XcclReduceScatter(void *send_buf,
+                           void *recv_buf,
+                           size_t count,
+                           C_DataType data_type,
+                           C_CCLReduceOp op,
+                           C_CCLComm comm,
+                           C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  custom_cpu::CclReduceOp ccl_op;
+  if (!ToCclDataType(data_type, &dtype) || !ToCclReduceOp(op, &ccl_op)) {
+    return C_FAILED;
+  }
+  SyncBeforeCollective(stream);
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kCollective,
+                               "ReduceScatter",
+                               CollectiveDeviceId(stream),
+                               StreamId(stream),
+                               count * custom_cpu::CclDataTypeSize(dtype));
+  ToComm(comm)->ReduceScatter(send_buf, recv_buf, count, dtype, ccl_op);
+  return C_SUCCESS;
+}
 
-  sem_wait(comm->sig_2);
+C_Status XcclGroupStart() {
+  custom_cpu::ShmComm::GroupStart();
   return C_SUCCESS;
 }
 
+C_Status XcclGroupEnd() {
+  custom_cpu::TraceScope trace(
+      custom_cpu::TraceKind::kCollective, "GroupEnd", global_current_device);
+  custom_cpu::ShmComm::GroupEnd();
+  return C_SUCCESS;
+}
+
+C_Status XcclSend(void *send_buf,
+                  size_t count,
+                  C_DataType data_type,
+                  size_t dest_rank,
+                  C_CCLComm comm,
+                  C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
+  }
+  SyncBeforeCollective(stream);
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kCollective,
+                               "Send",
+                               CollectiveDeviceId(stream),
+                               StreamId(stream),
+                               count * custom_cpu::CclDataTypeSize(dtype));
+  ToComm(comm)->Send(
+      send_buf, count * custom_cpu::CclDataTypeSize(dtype), dest_rank);
+  return C_SUCCESS;
+}
+
+C_Status XcclRecv(void *recv_buf,
+                  size_t count,
+                  C_DataType data_type,
+                  size_t src_rank,
+                  C_CCLComm comm,
+                  C_Stream stream) {
+  custom_cpu::CclDataType dtype;
+  if (!ToCclDataType(data_type, &dtype)) {
+    return C_FAILED;
+  }
+  SyncBeforeCollective(stream);
+  custom_cpu::TraceScope trace(custom_cpu::TraceKind::kCollective,
+                               "Recv",
+                               CollectiveDeviceId(stream),
+                               StreamId(stream),
+                               count * custom_cpu::CclDataTypeSize(dtype));
+  ToComm(comm)->Recv(
+      recv_buf, count * custom_cpu::CclDataTypeSize(dtype), src_rank);
+  return C_SUCCESS;
+}
+
+static void AddTraceEvent(C_Profiler prof,
+                          const custom_cpu::TraceRecord &record) {
+  if (record.kind == custom_cpu::TraceKind::kRuntimeApi) {
+    phi::RuntimeTraceEvent event;
+    event.name = record.name;
+    event.start_ns = record.start_ns;
+    event.end_ns = record.end_ns;
+    event.process_id = static_cast<uint32_t>(getpid());
+    event.thread_id = record.thread_id;
+    event.correlation_id = record.correlation_id;
+    event.callback_id = 0;
+    profiler_add_runtime_trace_event(prof, &event);
+    return;
+  }
+
+  phi::DeviceTraceEvent event;
+  event.name = record.name;
+  event.start_ns = record.start_ns;
+  event.end_ns = record.end_ns;
+  event.device_id = record.device_id;
+  event.context_id = 0;
+  event.stream_id = record.stream_id;
+  event.correlation_id = record.correlation_id;
+  switch (record.kind) {
+    case custom_cpu::TraceKind::kMemcpy:
+      event.type = phi::TracerEventType::Memcpy;
+      event.memcpy_info.num_bytes = record.bytes;
+      snprintf(
+          event.memcpy_info.copy_kind, phi::kMemKindMaxLen, "%s", record.name);
+      snprintf(event.memcpy_info.src_kind, phi::kMemKindMaxLen, "%s", "");
+      snprintf(event.memcpy_info.dst_kind, phi::kMemKindMaxLen, "%s", "");
+      break;
+    case custom_cpu::TraceKind::kMemset:
+      event.type = phi::TracerEventType::Memset;
+      event.memset_info.num_bytes = record.bytes;
+      snprintf(
+          event.memset_info.memory_kind, phi::kMemKindMaxLen, "%s", "Device");
+      event.memset_info.value = 0;
+      break;
+    case custom_cpu::TraceKind::kCollective:
+      event.type = phi::TracerEventType::Communication;
+      memset(&event.kernel_info, 0, sizeof(event.kernel_info));
+      break;
+    case custom_cpu::TraceKind::kStreamTask:
+      event.type = phi::TracerEventType::UserDefined;
+      memset(&event.kernel_info, 0, sizeof(event.kernel_info));
+      break;
+    default:
+      event.type = phi::TracerEventType::Kernel;
+      memset(&event.kernel_info, 0, sizeof(event.kernel_info));
+      break;
+  }
+  profiler_add_device_trace_event(prof, &event);
+}
+
 C_Status ProfilerInitialize(C_Profiler prof, void **user_data) {
   return C_SUCCESS;
 }
 
 C_Status ProfilerFinalize(C_Profiler prof, void *user_data) {
+  custom_cpu::Tracer::Stop();
   return C_SUCCESS;
 }
 
-C_Status ProfilerPrepare(C_Profiler prof, void *user_data) { return C_SUCCESS; }
+C_Status ProfilerPrepare(C_Profiler prof, void *user_data) {
+  // Throw away whatever is left over from a previous session.
+  std::vector<custom_cpu::TraceRecord> stale;
+  custom_cpu::Tracer::Drain(&stale);
+  return C_SUCCESS;
+}
 
-C_Status ProfilerStart(C_Profiler prof, void *user_data) { return C_SUCCESS; }
+C_Status ProfilerStart(C_Profiler prof, void *user_data) {
+  custom_cpu::Tracer::Start();
+  return C_SUCCESS;
+}
 
-C_Status ProfilerStop(C_Profiler prof, void *user_data) { return C_SUCCESS; }
+C_Status ProfilerStop(C_Profiler prof, void *user_data) {
+  custom_cpu::Tracer::Stop();
+  return C_SUCCESS;
+}
 
 C_Status ProfilerCollectData(C_Profiler prof,
                              uint64_t start_ns,
                              void *user_data) {
+  std::vector<custom_cpu::TraceRecord> records;
+  uint64_t dropped = custom_cpu::Tracer::Drain(&records);
+  if (dropped > 0) {
+    std::cerr << "custom_cpu profiler: " << dropped
+              << " trace records were dropped, raise "
+                 "FLAGS_custom_cpu_trace_buffer_size"
+              << std::endl;
+  }
+  for (auto &record : records) {
+    if (record.start_ns >= start_ns) {
+      AddTraceEvent(prof, record);
+    }
+  }
   return C_SUCCESS;
 }
 
@@ -322,30 +839,34 @@ void InitPlugin(CustomRuntimeParams *params) {
 
   params->interface->create_stream = CreateStream;
   params->interface->destroy_stream = DestroyStream;
+  params->interface->query_stream = QueryStream;
+  params->interface->stream_add_callback = AddCallback;
 
   params->interface->create_event = CreateEvent;
   params->interface->destroy_event = DestroyEvent;
   params->interface->record_event = RecordEvent;
+  params->interface->query_event = QueryEvent;
 
   params->interface->synchronize_device = SyncDevice;
   params->interface->synchronize_stream = SyncStream;
   params->interface->synchronize_event = SyncEvent;
   params->interface->stream_wait_event = StreamWaitEvent;
 
-  params->interface->memory_copy_h2d = MemCpy;
-  params->interface->memory_copy_d2d = MemCpy;
-  params->interface->memory_copy_d2h = MemCpy;
+  params->interface->memory_copy_h2d = MemCpyH2D;
+  params->interface->memory_copy_d2d = MemCpyD2D;
+  params->interface->memory_copy_d2h = MemCpyD2H;
   params->interface->memory_copy_p2p = MemCpyP2P;
-  params->interface->async_memory_copy_h2d = AsyncMemCpy;
-  params->interface->async_memory_copy_d2d = AsyncMemCpy;
-  params->interface->async_memory_copy_d2h = AsyncMemCpy;
+  params->interface->async_memory_copy_h2d = AsyncMemCpyH2D;
+  params->interface->async_memory_copy_d2d = AsyncMemCpyD2D;
+  params->interface->async_memory_copy_d2h = AsyncMemCpyD2H;
   params->interface->async_memory_copy_p2p = AsyncMemCpyP2P;
   params->interface->device_memory_allocate = Allocate;
-  params->interface->host_memory_allocate = Allocate;
-  params->interface->unified_memory_allocate = Allocate;
+  params->interface->host_memory_allocate = HostAllocate;
+  params->interface->unified_memory_allocate = HostAllocate;
   params->interface->device_memory_deallocate = Deallocate;
-  params->interface->host_memory_deallocate = Deallocate;
-  params->interface->unified_memory_deallocate = Deallocate;
+  params->interface->host_memory_deallocate = HostDeallocate;
+  params->interface->unified_memory_deallocate = HostDeallocate;
+  params->interface->device_memory_set = DeviceMemSet;
 
   params->interface->get_device_count = GetDevicesCount;
   params->interface->get_device_list = GetDevicesList;
@@ -356,8 +877,16 @@ void InitPlugin(CustomRuntimeParams *params) {
   params->interface->xccl_get_unique_id = XcclGetUniqueId;
   params->interface->xccl_comm_init_rank = XcclCommInitRank;
   params->interface->xccl_destroy_comm = XcclDestroyComm;
+  params->interface->xccl_get_comm_name = XcclGetCommName;
   params->interface->xccl_all_reduce = XcclAllReduce;
   params->interface->xccl_broadcast = XcclBroadcast;
+  params->interface->xccl_reduce = XcclReduce;
+  params->interface->xccl_all_gather = XcclAllGather;
+  params->interface->xccl_reduce_scatter = XcclReduceScatter;
+  params->interface->xccl_group_start = XcclGroupStart;
+  params->interface->xccl_group_end = XcclGroupEnd;
+  params->interface->xccl_send = XcclSend;
+  params->interface->xccl_recv = XcclRecv;
 
   params->interface->profiler_collect_trace_data = ProfilerCollectData;
   params->interface->profiler_initialize = ProfilerInitialize;
@@ -0,0 +1,219 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/stream.h"
+
+#include <algorithm>
+#include <unordered_set>
+#include <vector>
+
+#include "runtime/tracer.h"
+
+namespace custom_cpu {
+
+namespace {
+
+// The stream whose worker is running on this thread. A task (such as a host
+// callback) that synchronizes its own stream would otherwise wait on itself.
+thread_local Stream* tls_current_stream = nullptr;
+
+std::mutex& RegistryMutex() {
+  static std::mutex mutex;
+  return mutex;
+}
+
+std::unordered_set<Stream*>& Registry() {
+  static std::unordered_set<Stream*> streams;
+  return streams;
+}
+
+std::atomic<uint64_t> next_stream_id{1};
+
+}  // namespace
+
+void CompletionCounter::Advance(uint64_t value) {
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    value_.store(value, std::memory_order_release);
+  }
+  cv_.notify_all();
+}
+
+void CompletionCounter::WaitFor(uint64_t target) {
+  if (Reached(target)) {
+    return;
+  }
+  std::unique_lock<std::mutex> lock(mutex_);
+  cv_.wait(lock, [&] { return Reached(target); });
+}
+
+Stream::Stream(int device_id)
+    : device_id_(device_id),
+      id_(next_stream_id.fetch_add(1, std::memory_order_relaxed)),
+      counter_(std::make_shared<CompletionCounter>()),
+      worker_([this] { WorkerLoop(); }) {
+  std::lock_guard<std::mutex> lock(RegistryMutex());
+  Registry().insert(this);
+}
+
+Stream::~Stream() {
+  {
+    std::lock_guard<std::mutex> lock(RegistryMutex());
+    Registry().erase(this);
+  }
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    stop_ = true;
+  }
+  cv_.notify_one();
+  // The worker drains everything already queued before it exits.
+  worker_.join();
+}
+
+uint64_t Stream::Enqueue(std::function<void()> task) {
+  uint64_t seq;
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    tasks_.push_back(std::move(task));
+    seq = enqueued_.load(std::memory_order_relaxed) + 1;
+    enqueued_.store(seq, std::memory_order_release);
+  }
+  cv_.notify_one();
+  return seq;
+}
+
+void Stream::Synchronize() {
+  if (tls_current_stream == this) {
+    return;
+  }
+  counter_->WaitFor(LastEnqueued());
+}
+
+void Stream::WorkerLoop() {
+  tls_current_stream = this;
+  uint64_t done = 0;
+  while (true) {
+    std::function<void()> task;
+    {
+      std::unique_lock<std::mutex> lock(mutex_);
+      cv_.wait(lock, [this] { return stop_ || !tasks_.empty(); });
+      if (tasks_.empty()) {
+        return;
+      }
+      task = std::move(tasks_.front());
+      tasks_.pop_front();
+    }
+    {
+      TraceScope trace(TraceKind::kStreamTask, "StreamTask", device_id_, id_);
+      task();
+    }
+    counter_->Advance(++done);
+  }
+}
+
+void Event::Record(Stream* stream) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  if (stream) {
+    counter_ = stream->Counter();
+    target_ = stream->LastEnqueued();
+  } else {
+    counter_.reset();
+    target_ = 0;
+  }
+}
+
+std::pair<std::shared_ptr<CompletionCounter>, uint64_t> Event::Snapshot() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  return {counter_, target_};
+}
+
+bool Event::Query() {
+  auto point = Snapshot();
+  return !point.first || point.first->Reached(point.second);
+}
+
+void Event::Synchronize() {
+  auto point = Snapshot();
+  if (point.first) {
+    point.first->WaitFor(point.second);
+  }
+}
+
+void SynchronizeDeviceStreams(int device_id) {
+  // Snapshot the counters rather than the streams, so a stream destroyed
+  // concurrently is not touched after the registry lock is dropped.
+  std::vector<std::pair<std::shared_ptr<CompletionCounter>, uint64_t>> points;
+  {
+    std::lock_guard<std::mutex> lock(RegistryMutex());
+    for (auto* stream : Registry()) {
+      if (stream->DeviceId() == device_id && stream != tls_current_stream) {
+        points.emplace_back(stream->Counter(), stream->LastEnqueued());
+      }
+    }
+  }
+  for (auto& point : points) {
+    point.first->WaitFor(point.second);
+  }
+}
+
+void WaitForStreamWork(void* stream) {
+  if (stream) {
+    static_cast<Stream*>(stream)->Synchronize();
+  }
+}
+
+StreamMemoryUses& StreamMemoryUses::Instance() {
+  static StreamMemoryUses uses;
+  return uses;
+}
+
+void StreamMemoryUses::Record(const void* ptr,
+                              size_t size,
+                              Stream* stream,
+                              uint64_t seq) {
+  const uintptr_t begin = reinterpret_cast<uintptr_t>(ptr);
+  std::lock_guard<std::mutex> lock(mutex_);
+  // Uses whose task has run are dropped here, so the list stays as long as
+  // the copies in flight.
+  uses_.erase(std::remove_if(uses_.begin(),
+                             uses_.end(),
+                             [](const Use& use) {
+                               return use.counter->Reached(use.target);
+                             }),
+              uses_.end());
+  uses_.push_back({begin, begin + size, stream->Counter(), seq});
+}
+
+void StreamMemoryUses::WaitFor(const void* ptr, size_t size) {
+  const uintptr_t begin = reinterpret_cast<uintptr_t>(ptr);
+  const uintptr_t end = begin + size;
+  // A task of the current stream cannot wait for the tasks queued after it.
+  const CompletionCounter* own =
+      tls_current_stream ? tls_current_stream->Counter().get() : nullptr;
+  std::vector<std::pair<std::shared_ptr<CompletionCounter>, uint64_t>> points;
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    for (const auto& use : uses_) {
+      if (use.begin < end && begin < use.end && use.counter.get() != own &&
+          !use.counter->Reached(use.target)) {
+        points.emplace_back(use.counter, use.target);
+      }
+    }
+  }
+  for (auto& point : points) {
+    point.first->WaitFor(point.second);
+  }
+}
+
+}  // namespace custom_cpu
@@ -0,0 +1,147 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <atomic>
+#include <condition_variable>
+#include <cstdint>
+#include <deque>
+#include <functional>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <utility>
+#include <vector>
+
+namespace custom_cpu {
+
+// Number of tasks a stream has finished. Events keep a reference to the
+// counter of the stream they were recorded on, so they stay valid after the
+// stream itself is destroyed.
+class CompletionCounter {
+ public:
+  uint64_t Value() const { return value_.load(std::memory_order_acquire); }
+  bool Reached(uint64_t target) const { return Value() >= target; }
+
+  void Advance(uint64_t value);
+  void WaitFor(uint64_t target);
+
+ private:
+  std::atomic<uint64_t> value_{0};
+  std::mutex mutex_;
+  std::condition_variable cv_;
+};
+
+// An in-order work queue drained by one worker thread. Every task gets a
+// sequence number; the stream's CompletionCounter reaches that number once
+// the task and everything queued before it have run.
+class Stream {
+ public:
+  explicit Stream(int device_id);
+  ~Stream();
+
+  Stream(const Stream&) = delete;
+  Stream& operator=(const Stream&) = delete;
+
+  int DeviceId() const { return device_id_; }
+  // Unique among the streams of the process, starting from 1 (0 stands for
+  // the null stream in traces).
+  uint64_t Id() const { return id_; }
+
+  // Queues `task` and returns its sequence number.
+  uint64_t Enqueue(std::function<void()> task);
+
+  // Sequence number of the most recently queued task.
+  uint64_t LastEnqueued() const {
+    return enqueued_.load(std::memory_order_acquire);
+  }
+
+  const std::shared_ptr<CompletionCounter>& Counter() const { return counter_; }
+
+  bool Idle() { return counter_->Reached(LastEnqueued()); }
+  // Blocks until every task queued so far has run. A no-op when called from
+  // one of this stream's own tasks.
+  void Synchronize();
+
+ private:
+  void WorkerLoop();
+
+  int device_id_;
+  uint64_t id_;
+  std::shared_ptr<CompletionCounter> counter_;
+
+  std::mutex mutex_;
+  std::condition_variable cv_;
+  std::deque<std::function<void()>> tasks_;
+  // Written under mutex_, read without it.
+  std::atomic<uint64_t> enqueued_{0};
+  bool stop_ = false;
+  std::thread worker_;
+};
+
+// A point in a stream's task sequence. An event that was never recorded is
+// complete.
+class Event {
+ public:
+  void Record(Stream* stream);
+  bool Query();
+  void Synchronize();
+
+  // Returns the counter and target that define completion, so that a wait
+  // can be queued without holding on to the event.
+  std::pair<std::shared_ptr<CompletionCounter>, uint64_t> Snapshot();
+
+ private:
+  std::mutex mutex_;
+  std::shared_ptr<CompletionCounter> counter_;
+  uint64_t target_ = 0;
+};
+
+// Blocks until every stream created on `device_id` is idle.
+void SynchronizeDeviceStreams(int device_id);
+
+// Kernels run on the thread that launches them. Called at the top of every
+// kernel and custom op launched on `stream` (a C_Stream, possibly null), this
+// blocks until the tasks queued on that stream so far, async copies and
+// cross-stream waits included, have run, which orders the kernel as if it
+// had been queued too. Costs an atomic load when the stream is idle.
+void WaitForStreamWork(void* stream);
+
+// Memory ranges read or written by queued stream tasks. Freeing or
+// overwriting memory synchronously waits for the tasks that use it, rather
+// than for every stream of the device.
+class StreamMemoryUses {
+ public:
+  static StreamMemoryUses& Instance();
+
+  // Records that task `seq` of `stream` uses [ptr, ptr + size).
+  void Record(const void* ptr, size_t size, Stream* stream, uint64_t seq);
+  // Blocks until every recorded task that uses part of [ptr, ptr + size)
+  // has run.
+  void WaitFor(const void* ptr, size_t size);
+
+ private:
+  struct Use {
+    uintptr_t begin;
+    uintptr_t end;
+    std::shared_ptr<CompletionCounter> counter;
+    uint64_t target;
+  };
+
+  std::mutex mutex_;
+  std::vector<Use> uses_;
+};
+
+}  // namespace custom_cpu
@@ -0,0 +1,171 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include "runtime/tracer.h"
+
+#include <sys/syscall.h>
+#include <time.h>
+#include <unistd.h>
+
+#include <memory>
+#include <mutex>
+
+#include "runtime/flags.h"
+
+namespace custom_cpu {
+
+std::atomic<bool> Tracer::enabled_{false};
+
+namespace {
+
+// Single-producer single-consumer ring. `head` is advanced by the owning
+// thread after a record is written, `tail` by the collector after the
+// records up to it are read.
+class TraceRing {
+ public:
+  TraceRing(size_t capacity, uint32_t thread_id)
+      : mask_(capacity - 1), records_(capacity), thread_id_(thread_id) {}
+
+  void Push(const TraceRecord& record) {
+    uint64_t head = head_.load(std::memory_order_relaxed);
+    if (head - tail_.load(std::memory_order_acquire) > mask_) {
+      dropped_.fetch_add(1, std::memory_order_relaxed);
+      return;
+    }
+    auto& slot = records_[head & mask_];
+    slot = record;
+    slot.thread_id = thread_id_;
+    head_.store(head + 1, std::memory_order_release);
+  }
+
+  void Drain(std::vector<TraceRecord>* records) {
+    uint64_t tail = tail_.load(std::memory_order_relaxed);
+    uint64_t head = head_.load(std::memory_order_acquire);
+    for (; tail != head; ++tail) {
+      records->push_back(records_[tail & mask_]);
+    }
+    tail_.store(tail, std::memory_order_release);
+  }
+
+  bool Empty() const {
+    return head_.load(std::memory_order_acquire) ==
+           tail_.load(std::memory_order_relaxed);
+  }
+
+  uint64_t TakeDropped() {
+    return dropped_.exchange(0, std::memory_order_relaxed);
+  }
+
+  void Orphan() { orphaned_.store(true, std::memory_order_release); }
+  bool Orphaned() const { return orphaned_.load(std::memory_order_acquire); }
+
+ private:
+  const uint64_t mask_;
+  std::vector<TraceRecord> records_;
+  const uint32_t thread_id_;
+  std::atomic<uint64_t> head_{0};
+  std::atomic<uint64_t> tail_{0};
+  std::atomic<uint64_t> dropped_{0};
+  std::atomic<bool> orphaned_{false};
+};
+
+struct RingRegistry {
+  std::mutex mutex;
+  std::vector<std::shared_ptr<TraceRing>> rings;
+};
+
+// Never destroyed: threads may still record during static destruction.
+RingRegistry& Registry() {
+  static auto* registry = new RingRegistry();
+  return *registry;
+}
+
+size_t RingCapacity() {
+  static const size_t capacity = [] {
+    size_t requested = EnvToUInt("FLAGS_custom_cpu_trace_buffer_size", 32768);
+    size_t capacity = 1024;
+    while (capacity < requested) {
+      capacity *= 2;
+    }
+    return capacity;
+  }();
+  return capacity;
+}
+
+// The ring outlives its thread in the registry until the collector has read
+// what is left in it.
+struct ThreadRing {
+  ~ThreadRing() {
+    if (ring) {
+      ring->Orphan();
+    }
+  }
+  std::shared_ptr<TraceRing> ring;
+};
+
+TraceRing* CurrentRing() {
+  static thread_local ThreadRing thread_ring;
+  if (!thread_ring.ring) {
+    thread_ring.ring = std::make_shared<TraceRing>(
+        RingCapacity(), static_cast<uint32_t>(syscall(SYS_gettid)));
+    auto& registry = Registry();
+    std::lock_guard<std::mutex> lock(registry.mutex);
+    registry.rings.push_back(thread_ring.ring);
+  }
+  return thread_ring.ring.get();
+}
+
+std::atomic<uint32_t> correlation_id{0};
+
+}  // namespace
+
+void Tracer::Start() { enabled_.store(true, std::memory_order_relaxed); }
+
+void Tracer::Stop() { enabled_.store(false, std::memory_order_relaxed); }
+
+uint64_t Tracer::NowNs() {
+  struct timespec ts;
+  clock_gettime(CLOCK_REALTIME, &ts);
+  return static_cast<uint64_t>(ts.tv_sec) * 1000000000ULL + ts.tv_nsec;
+}
+
+uint32_t Tracer::NextCorrelationId() {
+  uint32_t id = correlation_id.fetch_add(1, std::memory_order_relaxed) + 1;
+  return id == 0 ? NextCorrelationId() : id;
+}
+
+void Tracer::Record(const TraceRecord& record) { CurrentRing()->Push(record); }
+
+uint64_t Tracer::Drain(std::vector<TraceRecord>* records) {
+  auto& registry = Registry();
+  std::lock_guard<std::mutex> lock(registry.mutex);
+  uint64_t dropped = 0;
+  auto& rings = registry.rings;
+  for (auto it = rings.begin(); it != rings.end();) {
+    auto& ring = *it;
+    // Read the flag first: once the owner has exited, nothing is pushed
+    // after the drain below.
+    bool orphaned = ring->Orphaned();
+    ring->Drain(records);
+    dropped += ring->TakeDropped();
+    if (orphaned && ring->Empty()) {
+      it = rings.erase(it);
+    } else {
+      ++it;
+    }
+  }
+  return dropped;
+}
+
+}  // namespace custom_cpu
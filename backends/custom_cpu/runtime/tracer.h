@@ -0,0 +1,161 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <atomic>
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+
+#include "runtime/stream.h"
+
+namespace custom_cpu {
+
+enum class TraceKind : uint8_t {
+  kRuntimeApi,  // a runtime entry point, as seen by the calling thread
+  kKernel,
+  kMemcpy,
+  kMemset,
+  kCollective,
+  kStreamTask,  // any task run by a stream worker
+};
+
+// `name` must point to a string with static storage duration (a literal or
+// __func__); records are copied around by value and read long after the
+// scope that produced them.
+struct TraceRecord {
+  const char* name;
+  TraceKind kind;
+  int device_id;
+  uint64_t stream_id;
+  uint64_t start_ns;
+  uint64_t end_ns;
+  uint64_t bytes;
+  uint32_t correlation_id;
+  uint32_t thread_id;
+};
+
+// Host-side tracer. Every thread that records gets its own ring buffer; the
+// owning thread is the only writer and the collector the only reader, so
+// recording takes no lock. When tracing is off a scope costs one relaxed
+// atomic load.
+//
+// FLAGS_custom_cpu_trace_buffer_size sets the ring size in records per
+// thread (default 32768). Records that do not fit are dropped and counted.
+class Tracer {
+ public:
+  static bool Enabled() { return enabled_.load(std::memory_order_relaxed); }
+  static void Start();
+  static void Stop();
+
+  // CLOCK_REALTIME in nanoseconds, the clock the framework's tracer uses.
+  static uint64_t NowNs();
+
+  // Ids that tie a runtime call to the device activity it issued. Never 0.
+  static uint32_t NextCorrelationId();
+
+  // Appends `record` to the calling thread's ring.
+  static void Record(const TraceRecord& record);
+
+  // Moves every buffered record into `records`, and returns the number of
+  // records dropped since the previous call.
+  static uint64_t Drain(std::vector<TraceRecord>* records);
+
+ private:
+  static std::atomic<bool> enabled_;
+};
+
+// Records the lifetime of the scope.
+class TraceScope {
+ public:
+  TraceScope(TraceKind kind,
+             const char* name,
+             int device_id = 0,
+             uint64_t stream_id = 0,
+             uint64_t bytes = 0,
+             uint32_t correlation_id = 0)
+      : active_(Tracer::Enabled()) {
+    if (active_) {
+      record_.name = name;
+      record_.kind = kind;
+      record_.device_id = device_id;
+      record_.stream_id = stream_id;
+      record_.bytes = bytes;
+      record_.correlation_id = correlation_id;
+      record_.start_ns = Tracer::NowNs();
+    }
+  }
+
+  ~TraceScope() {
+    if (active_) {
+      record_.end_ns = Tracer::NowNs();
+      Tracer::Record(record_);
+    }
+  }
+
+  TraceScope(const TraceScope&) = delete;
+  TraceScope& operator=(const TraceScope&) = delete;
+
+ private:
+  bool active_;
+  TraceRecord record_;
+};
+
+// A kernel scope, recorded against the kernel's stream. Kernels that call
+// other kernels (the non-raw elementwise kernels, say) are recorded once, by
+// the outermost scope.
+class KernelTraceScope {
+ public:
+  KernelTraceScope(const char* name, void* stream)
+      : counted_(Tracer::Enabled()), active_(counted_ && Depth()++ == 0) {
+    if (active_) {
+      record_ = TraceRecord();
+      record_.name = name;
+      record_.kind = TraceKind::kKernel;
+      record_.stream_id = stream ? static_cast<Stream*>(stream)->Id() : 0;
+      record_.start_ns = Tracer::NowNs();
+    }
+  }
+
+  ~KernelTraceScope() {
+    if (counted_) {
+      --Depth();
+    }
+    if (active_) {
+      record_.end_ns = Tracer::NowNs();
+      Tracer::Record(record_);
+    }
+  }
+
+  KernelTraceScope(const KernelTraceScope&) = delete;
+  KernelTraceScope& operator=(const KernelTraceScope&) = delete;
+
+ private:
+  static int& Depth() {
+    static thread_local int depth = 0;
+    return depth;
+  }
+
+  bool counted_;
+  bool active_;
+  TraceRecord record_;
+};
+
+}  // namespace custom_cpu
+
+// Put at the top of a kernel body; ctx is the kernel's context.
+#define CUSTOM_CPU_TRACE_KERNEL(ctx)                             \
+  ::custom_cpu::KernelTraceScope custom_cpu_kernel_trace_scope_( \
+      __func__, (ctx).stream())
@@ -0,0 +1,85 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Replays the allocation pattern of a training loop (the same activation
+// sizes allocated, written and freed every step) against malloc/free and
+// against the caching allocator, and prints the allocator statistics.
+//
+//   ./allocator_benchmark [steps]
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <vector>
+
+#include "runtime/allocator.h"
+
+namespace {
+
+// Activation sizes of one step, from a few KB of biases up to 32 MB
+// feature maps.
+std::vector<size_t> StepSizes() {
+  std::vector<size_t> sizes;
+  for (int layer = 0; layer < 24; ++layer) {
+    sizes.push_back(4096 + layer * 512);
+    sizes.push_back((256 << 10) + layer * 4096);
+    sizes.push_back((8 << 20) + layer * (64 << 10));
+  }
+  sizes.push_back(32 << 20);
+  return sizes;
+}
+
+template <typename Alloc, typename Free>
+double RunSteps(int steps, Alloc alloc, Free dealloc) {
+  auto sizes = StepSizes();
+  std::vector<void*> ptrs(sizes.size());
+  auto start = std::chrono::steady_clock::now();
+  for (int step = 0; step < steps; ++step) {
+    for (size_t i = 0; i < sizes.size(); ++i) {
+      ptrs[i] = alloc(sizes[i]);
+      memset(ptrs[i], step, sizes[i]);
+    }
+    for (size_t i = sizes.size(); i-- > 0;) {
+      dealloc(ptrs[i]);
+    }
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / steps;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int steps = argc > 1 ? std::atoi(argv[1]) : 20;
+
+  double t_malloc = RunSteps(
+      steps,
+      [](size_t size) { return malloc(size); },
+      [](void* p) { free(p); });
+
+  custom_cpu::CachingAllocator allocator;
+  double t_cached = RunSteps(
+      steps,
+      [&](size_t size) { return allocator.Allocate(size); },
+      [&](void* p) { allocator.Deallocate(p); });
+
+  std::printf("per step  malloc/free %.2f ms  caching %.2f ms  speedup %.2fx\n",
+              t_malloc * 1e3,
+              t_cached * 1e3,
+              t_malloc / t_cached);
+  std::printf("%s\n", allocator.GetStats().ToString().c_str());
+  return 0;
+}
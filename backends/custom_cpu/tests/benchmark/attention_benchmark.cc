@@ -0,0 +1,459 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Flash attention against the matmul -> softmax -> matmul composition it
+// replaces, which materializes the [batch, heads, seq_q, seq_k] scores.
+// Shapes cover causal prefill, GQA, a padding mask and dropout. Outputs and
+// gradients are checked against the composition, and the peak score memory
+// of both is reported.
+//
+//   ./attention_benchmark [repeat]
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <limits>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/attention.h"
+
+namespace {
+
+using custom_kernel::AttentionDropout;
+using custom_kernel::AttentionMask;
+using custom_kernel::AttentionShape;
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+std::vector<float> Random(int64_t n, uint32_t seed) {
+  std::mt19937 gen(seed);
+  std::uniform_real_distribution<float> dist(-1.f, 1.f);
+  std::vector<float> v(n);
+  for (auto& x : v) {
+    x = dist(gen);
+  }
+  return v;
+}
+
+double RelError(const std::vector<float>& ref, const std::vector<float>& got) {
+  double err = 0, scale = 1e-12;
+  for (size_t i = 0; i < ref.size(); ++i) {
+    err = std::max(err, std::fabs(static_cast<double>(ref[i]) - got[i]));
+    scale = std::max(scale, std::fabs(static_cast<double>(ref[i])));
+  }
+  return err / scale;
+}
+
+// The composition: per batch and head, scores = scale * q k^T + mask, a
+// row softmax, dropout, then out = p v. Keeps p and the dropout factors for
+// the backward.
+struct Composite {
+  AttentionShape a;
+  std::vector<float> p;
+  std::vector<float> z;
+
+  float* P(int64_t b, int64_t h) {
+    return p.data() + (b * a.heads + h) * a.seq_q * a.seq_k;
+  }
+  float* Z(int64_t b, int64_t h) {
+    return z.data() + (b * a.heads + h) * a.seq_q * a.seq_k;
+  }
+
+  void Forward(const float* q,
+               const float* k,
+               const float* v,
+               const AttentionMask<float>& mask,
+               const AttentionDropout& dropout,
+               float* out) {
+    namespace gemm = custom_kernel::gemm;
+    const int64_t d = a.head_dim;
+    const int64_t group = a.heads / a.kv_heads;
+    p.resize(a.batch * a.heads * a.seq_q * a.seq_k);
+    z.assign(dropout.p > 0 ? p.size() : 0, 1.f);
+    for (int64_t b = 0; b < a.batch; ++b) {
+      for (int64_t h = 0; h < a.heads; ++h) {
+        const float* qh = q + (b * a.seq_q * a.heads + h) * d;
+        const float* kh = k + (b * a.seq_k * a.kv_heads + h / group) * d;
+        const float* vh = v + (b * a.seq_k * a.kv_heads + h / group) * d;
+        float* s = P(b, h);
+        gemm::GemmStrided<float>(a.seq_q,
+                                 a.seq_k,
+                                 d,
+                                 a.scale,
+                                 qh,
+                                 a.heads * d,
+                                 1,
+                                 0,
+                                 kh,
+                                 1,
+                                 a.kv_heads * d,
+                                 0,
+                                 0,
+                                 s,
+                                 a.seq_k,
+                                 1,
+                                 0);
+        for (int64_t i = 0; i < a.seq_q; ++i) {
+          float* row = s + i * a.seq_k;
+          if (mask.data) {
+            const float* m = mask.data + b * mask.batch_stride +
+                             h * mask.head_stride + i * a.seq_k;
+            for (int64_t j = 0; j < a.seq_k; ++j) {
+              row[j] += m[j];
+            }
+          }
+          int64_t end = custom_kernel::detail::KeyEnd(a, i);
+          float mx = -std::numeric_limits<float>::infinity();
+          for (int64_t j = 0; j < end; ++j) {
+            mx = std::max(mx, row[j]);
+          }
+          float sum = 0;
+          for (int64_t j = 0; j < a.seq_k; ++j) {
+            row[j] = j < end && mx > -std::numeric_limits<float>::infinity()
+                         ? std::exp(row[j] - mx)
+                         : 0.f;
+            sum += row[j];
+          }
+          for (int64_t j = 0; j < a.seq_k; ++j) {
+            row[j] = sum > 0 ? row[j] / sum : 0.f;
+          }
+        }
+        if (dropout.p > 0) {
+          custom_kernel::detail::DropoutBlock(
+              a, dropout, b, h, 0, a.seq_q, 0, a.seq_k, Z(b, h));
+        }
+        std::vector<float> pd(s, s + a.seq_q * a.seq_k);
+        for (size_t i = 0; i < z.size() / a.batch / a.heads; ++i) {
+          pd[i] *= Z(b, h)[i];
+        }
+        gemm::GemmStrided<float>(a.seq_q,
+                                 d,
+                                 a.seq_k,
+                                 1,
+                                 pd.data(),
+                                 a.seq_k,
+                                 1,
+                                 0,
+                                 vh,
+                                 a.kv_heads * d,
+                                 1,
+                                 0,
+                                 0,
+                                 out + (b * a.seq_q * a.heads + h) * d,
+                                 a.heads * d,
+                                 1,
+                                 0);
+      }
+    }
+  }
+
+  void Backward(const float* q,
+                const float* k,
+                const float* v,
+                const float* dout,
+                float* dq,
+                float* dk,
+                float* dv) {
+    namespace gemm = custom_kernel::gemm;
+    const int64_t d = a.head_dim;
+    const int64_t group = a.heads / a.kv_heads;
+    const int64_t n = a.seq_q * a.seq_k;
+    std::fill(dk, dk + a.batch * a.seq_k * a.kv_heads * d, 0.f);
+    std::fill(dv, dv + a.batch * a.seq_k * a.kv_heads * d, 0.f);
+    std::vector<float> pd(n), dp(n);
+    for (int64_t b = 0; b < a.batch; ++b) {
+      for (int64_t h = 0; h < a.heads; ++h) {
+        const int64_t q_off = (b * a.seq_q * a.heads + h) * d;
+        const int64_t kv_off = (b * a.seq_k * a.kv_heads + h / group) * d;
+        const float* ph = P(b, h);
+        for (int64_t i = 0; i < n; ++i) {
+          pd[i] = z.empty() ? ph[i] : ph[i] * Z(b, h)[i];
+        }
+        // dv += pd^T dout, dp = dout v^T.
+        gemm::GemmStrided<float>(a.seq_k,
+                                 d,
+                                 a.seq_q,
+                                 1,
+                                 pd.data(),
+                                 1,
+                                 a.seq_k,
+                                 0,
+                                 dout + q_off,
+                                 a.heads * d,
+                                 1,
+                                 0,
+                                 1,
+                                 dv + kv_off,
+                                 a.kv_heads * d,
+                                 1,
+                                 0);
+        gemm::GemmStrided<float>(a.seq_q,
+                                 a.seq_k,
+                                 d,
+                                 1,
+                                 dout + q_off,
+                                 a.heads * d,
+                                 1,
+                                 0,
+                                 v + kv_off,
+                                 1,
+                                 a.kv_heads * d,
+                                 0,
+                                 0,
+                                 dp.data(),
+                                 a.seq_k,
+                                 1,
+                                 0);
+        for (int64_t i = 0; i < a.seq_q; ++i) {
+          float* g = dp.data() + i * a.seq_k;
+          if (!z.empty()) {
+            for (int64_t j = 0; j < a.seq_k; ++j) {
+              g[j] *= Z(b, h)[i * a.seq_k + j];
+            }
+          }
+          float dot = 0;
+          for (int64_t j = 0; j < a.seq_k; ++j) {
+            dot += g[j] * ph[i * a.seq_k + j];
+          }
+          for (int64_t j = 0; j < a.seq_k; ++j) {
+            g[j] = ph[i * a.seq_k + j] * (g[j] - dot);
+          }
+        }
+        gemm::GemmStrided<float>(a.seq_q,
+                                 d,
+                                 a.seq_k,
+                                 a.scale,
+                                 dp.data(),
+                                 a.seq_k,
+                                 1,
+                                 0,
+                                 k + kv_off,
+                                 a.kv_heads * d,
+                                 1,
+                                 0,
+                                 0,
+                                 dq + q_off,
+                                 a.heads * d,
+                                 1,
+                                 0);
+        gemm::GemmStrided<float>(a.seq_k,
+                                 d,
+                                 a.seq_q,
+                                 a.scale,
+                                 dp.data(),
+                                 1,
+                                 a.seq_k,
+                                 0,
+                                 q + q_off,
+                                 a.heads * d,
+                                 1,
+                                 0,
+                                 1,
+                                 dk + kv_off,
+                                 a.kv_heads * d,
+                                 1,
+                                 0);
+      }
+    }
+  }
+};
+
+bool Run(const char* name,
+         AttentionShape a,
+         bool padding_mask,
+         float dropout_p,
+         bool backward,
+         int repeat) {
+  const int64_t q_size = a.batch * a.seq_q * a.heads * a.head_dim;
+  const int64_t kv_size = a.batch * a.seq_k * a.kv_heads * a.head_dim;
+  auto q = Random(q_size, 1);
+  auto k = Random(kv_size, 2);
+  auto v = Random(kv_size, 3);
+  auto dout = Random(q_size, 4);
+  // A padding mask per batch, broadcast over heads: the last keys of each
+  // sequence but the first are padding.
+  std::vector<float> mask_data;
+  AttentionMask<float> mask;
+  if (padding_mask) {
+    mask_data.assign(a.batch * a.seq_q * a.seq_k, 0.f);
+    for (int64_t b = 0; b < a.batch; ++b) {
+      for (int64_t i = 0; i < a.seq_q; ++i) {
+        for (int64_t j = a.seq_k - b * a.seq_k / 4; j < a.seq_k; ++j) {
+          mask_data[(b * a.seq_q + i) * a.seq_k + j] =
+              -std::numeric_limits<float>::infinity();
+        }
+      }
+    }
+    mask.data = mask_data.data();
+    mask.batch_stride = a.seq_q * a.seq_k;
+  }
+  AttentionDropout dropout;
+  dropout.p = dropout_p;
+  dropout.state = {1234, 0};
+
+  Composite ref{a, {}, {}};
+  std::vector<float> ref_out(q_size), out(q_size);
+  std::vector<float> lse(a.batch * a.heads * a.seq_q);
+  double ref_s = Seconds(repeat, [&] {
+    ref.Forward(q.data(), k.data(), v.data(), mask, dropout, ref_out.data());
+  });
+  double flash_s = Seconds(repeat, [&] {
+    custom_kernel::FlashAttentionForward(
+        a, q.data(), k.data(), v.data(), mask, dropout, out.data(), lse.data());
+  });
+  double err = RelError(ref_out, out);
+  double score_mb = a.batch * a.heads * a.seq_q * a.seq_k * 4.0 / (1 << 20);
+  double block_mb =
+      custom_kernel::ThreadPool::Instance().NumThreads() *
+      (custom_kernel::kAttnBlockQ * custom_kernel::kAttnBlockK * 2 +
+       (custom_kernel::kAttnBlockQ * 2 + custom_kernel::kAttnBlockK * 2) *
+           a.head_dim) *
+      4.0 / (1 << 20);
+  std::printf(
+      "%-26s fwd  composite %9.3f ms  flash %9.3f ms  %5.2fx  "
+      "scores %8.1f MB -> %5.2f MB  err %.1e\n",
+      name,
+      ref_s * 1e3,
+      flash_s * 1e3,
+      ref_s / flash_s,
+      score_mb,
+      block_mb,
+      err);
+  bool ok = err < 1e-4;
+  if (!backward) {
+    return ok;
+  }
+  std::vector<float> rdq(q_size), rdk(kv_size), rdv(kv_size);
+  std::vector<float> dq(q_size), dk(kv_size), dv(kv_size);
+  double ref_bwd_s = Seconds(repeat, [&] {
+    ref.Backward(q.data(),
+                 k.data(),
+                 v.data(),
+                 dout.data(),
+                 rdq.data(),
+                 rdk.data(),
+                 rdv.data());
+  });
+  double flash_bwd_s = Seconds(repeat, [&] {
+    custom_kernel::FlashAttentionBackward(a,
+                                          q.data(),
+                                          k.data(),
+                                          v.data(),
+                                          out.data(),
+                                          dout.data(),
+                                          lse.data(),
+                                          mask,
+                                          dropout,
+                                          dq.data(),
+                                          dk.data(),
+                                          dv.data());
+  });
+  double grad_err =
+      std::max({RelError(rdq, dq), RelError(rdk, dk), RelError(rdv, dv)});
+  std::printf(
+      "%-26s bwd  composite %9.3f ms  flash %9.3f ms  %5.2fx  "
+      "grad err %.1e\n",
+      name,
+      ref_bwd_s * 1e3,
+      flash_bwd_s * 1e3,
+      ref_bwd_s / flash_bwd_s,
+      grad_err);
+  return ok && grad_err < 1e-4;
+}
+
+AttentionShape Shape(int64_t batch,
+                     int64_t seq_q,
+                     int64_t seq_k,
+                     int64_t heads,
+                     int64_t kv_heads,
+                     int64_t head_dim,
+                     bool causal) {
+  return {batch,
+          seq_q,
+          seq_k,
+          heads,
+          kv_heads,
+          head_dim,
+          1.0f / std::sqrt(static_cast<float>(head_dim)),
+          causal};
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 3;
+  bool ok = true;
+  ok &= Run("prefill 1x512 h16 d64",
+            Shape(1, 512, 512, 16, 16, 64, false),
+            false,
+            0,
+            true,
+            repeat);
+  ok &= Run("causal 1x1024 h16 d64",
+            Shape(1, 1024, 1024, 16, 16, 64, true),
+            false,
+            0,
+            true,
+            repeat);
+  ok &= Run("causal 1x2048 h8 d128",
+            Shape(1, 2048, 2048, 8, 8, 128, true),
+            false,
+            0,
+            false,
+            repeat);
+  ok &= Run("gqa 1x1024 h32 kv8 d128",
+            Shape(1, 1024, 1024, 32, 8, 128, true),
+            false,
+            0,
+            true,
+            repeat);
+  ok &= Run("padding mask 4x256 h8",
+            Shape(4, 256, 256, 8, 8, 64, false),
+            true,
+            0,
+            true,
+            repeat);
+  ok &= Run("dropout 0.1 2x256 h8",
+            Shape(2, 256, 256, 8, 8, 64, false),
+            false,
+            0.1f,
+            true,
+            repeat);
+  ok &= Run("decode 8x1 kv2048 h32",
+            Shape(8, 1, 2048, 32, 8, 128, true),
+            false,
+            0,
+            false,
+            repeat);
+  ok &= Run("causal q<k 2x100 kv300",
+            Shape(2, 100, 300, 4, 2, 32, true),
+            false,
+            0,
+            true,
+            repeat);
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,312 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// A serving simulator around the step_paddle scheduler. A stream of
+// requests with random prompt and output lengths is served by a batch of
+// slots whose decoder KV blocks come from a pool of `budget` blocks; the
+// model is simulated, one token per running sequence per step. Each budget
+// reports the steps taken, the tokens generated per step, the preemptions
+// and the prompt and generated tokens prefilled again on recovery, and the
+// time spent in BlockStep. Every step checks that no block is lost or held
+// twice, that every KV write lands in an allocated block and that a
+// recovered sequence is prefilled with its own tokens.
+//
+//   ./block_step_benchmark [requests] [bsz]
+
+#include <chrono>
+#include <cinttypes>
+#include <cstdio>
+#include <cstdlib>
+#include <deque>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/block_step.h"
+
+namespace {
+
+constexpr int kBlockSize = 16;
+constexpr int kMaxPrompt = 256;
+constexpr int kMaxOutput = 512;
+constexpr int64_t kFirstToken = 1;
+
+struct Request {
+  int prompt;
+  int output;
+};
+
+int64_t Token(int request, int64_t step) { return request * 4096 + step; }
+
+struct Result {
+  int steps = 0;
+  int64_t generated = 0;
+  int64_t recomputed = 0;
+  int preempted = 0;
+  int recovered = 0;
+  double seconds = 0;
+  bool ok = true;
+};
+
+class Simulator {
+ public:
+  Simulator(int bsz, int budget) : bsz_(bsz), budget_(budget) {
+    const int pre_ids_len = kMaxOutput + kBlockSize;
+    const int encoder_blocks = (kMaxPrompt + kBlockSize - 1) / kBlockSize;
+    max_decoder_ = pre_ids_len / kBlockSize;
+    per_seq_ = encoder_blocks + max_decoder_ + 1;
+    ids_len_ = kMaxPrompt + kMaxOutput;
+    stop_.assign(bsz, 1);
+    block_step_.assign(bsz, 0);
+    this_time_.assign(bsz, 0);
+    ori_.assign(bsz, 0);
+    encoder_.assign(bsz, 0);
+    decoder_.assign(bsz, 0);
+    tables_.assign(bsz * per_seq_, -1);
+    encoder_lens_.assign(bsz, 0);
+    step_list_.assign(bsz, -1);
+    recover_list_.assign(bsz, -1);
+    need_list_.assign(bsz, -1);
+    used_.assign(bsz, 0);
+    free_list_.resize(budget);
+    for (int i = 0; i < budget; ++i) {
+      free_list_[i] = budget - 1 - i;
+    }
+    free_len_ = budget;
+    input_ids_.assign(bsz * ids_len_, 0);
+    pre_ids_.assign(bsz * pre_ids_len, -1);
+    step_idx_.assign(bsz, 0);
+    next_tokens_.assign(bsz, 0);
+    request_.assign(bsz, -1);
+    // Encoder blocks come from a separate host pool, large enough for a
+    // prompt in every slot; ids are offset past the decoder pool.
+    for (int i = bsz * encoder_blocks; i-- > 0;) {
+      host_pool_.push_back(budget + i);
+    }
+
+    state_.bsz = bsz;
+    state_.block_num_per_seq = per_seq_;
+    state_.block_size = kBlockSize;
+    state_.max_decoder_block_num = max_decoder_;
+    state_.stop_flags = reinterpret_cast<bool*>(stop_.data());
+    state_.seq_lens_this_time = this_time_.data();
+    state_.ori_seq_lens_encoder = ori_.data();
+    state_.seq_lens_encoder = encoder_.data();
+    state_.seq_lens_decoder = decoder_.data();
+    state_.block_tables = tables_.data();
+    state_.encoder_block_lens = encoder_lens_.data();
+    state_.is_block_step = reinterpret_cast<bool*>(block_step_.data());
+    state_.step_block_list = step_list_.data();
+    state_.step_lens = &step_len_;
+    state_.recover_block_list = recover_list_.data();
+    state_.recover_lens = &recover_len_;
+    state_.need_block_list = need_list_.data();
+    state_.need_block_len = &need_len_;
+    state_.used_list_len = used_.data();
+    state_.free_list = free_list_.data();
+    state_.free_list_len = &free_len_;
+    state_.input_ids = input_ids_.data();
+    state_.input_ids_stride = ids_len_;
+    state_.pre_ids = pre_ids_.data();
+    state_.pre_ids_stride = pre_ids_len;
+    state_.step_idx = step_idx_.data();
+    state_.next_tokens = next_tokens_.data();
+    state_.first_token_id = kFirstToken;
+  }
+
+  Result Run(const std::vector<Request>& requests) {
+    Result result;
+    std::deque<int> queue;
+    for (size_t r = 0; r < requests.size(); ++r) {
+      queue.push_back(static_cast<int>(r));
+    }
+    int live = 0;
+    while (!queue.empty() || live > 0) {
+      for (int i = 0; i < bsz_; ++i) {
+        if (!stop_[i] || block_step_[i]) {
+          continue;
+        }
+        if (request_[i] >= 0) {
+          Finish(i);
+          --live;
+        }
+        if (!queue.empty()) {
+          Insert(i, queue.front(), requests[queue.front()]);
+          queue.pop_front();
+          ++live;
+        }
+      }
+      for (int i = 0; i < bsz_; ++i) {
+        if (!stop_[i] && this_time_[i] > 0) {
+          result.ok = result.ok && Forward(i, requests[request_[i]], &result);
+        }
+      }
+      auto start = std::chrono::steady_clock::now();
+      auto stats = custom_kernel::BlockStep(state_);
+      std::chrono::duration<double> elapsed =
+          std::chrono::steady_clock::now() - start;
+      result.seconds += elapsed.count();
+      result.preempted += stats.preempted;
+      result.recovered += stats.recovered;
+      result.ok = result.ok && CheckBlocks();
+      if (++result.steps > 1000000) {
+        result.ok = false;
+        break;
+      }
+    }
+    return result;
+  }
+
+ private:
+  int* Row(int i) { return tables_.data() + i * per_seq_; }
+
+  void Insert(int i, int r, const Request& request) {
+    request_[i] = r;
+    ori_[i] = encoder_[i] = this_time_[i] = request.prompt;
+    decoder_[i] = 0;
+    step_idx_[i] = 0;
+    stop_[i] = 0;
+    int blocks = (request.prompt + kBlockSize - 1) / kBlockSize;
+    encoder_lens_[i] = blocks;
+    int* row = Row(i);
+    for (int j = 0; j < per_seq_; ++j) {
+      row[j] = -1;
+    }
+    for (int j = 0; j < blocks; ++j) {
+      row[j] = host_pool_.back();
+      host_pool_.pop_back();
+    }
+    int64_t* ids = input_ids_.data() + i * ids_len_;
+    ids[0] = kFirstToken;
+    for (int j = 1; j < request.prompt; ++j) {
+      ids[j] = Token(r, -j);
+    }
+  }
+
+  // The host returns the encoder blocks of a finished sequence; the step
+  // has already taken back its decoder blocks.
+  void Finish(int i) {
+    int* row = Row(i);
+    int blocks = (ori_[i] + kBlockSize - 1) / kBlockSize;
+    for (int j = 0; j < blocks; ++j) {
+      host_pool_.push_back(row[j]);
+      row[j] = -1;
+    }
+    request_[i] = -1;
+  }
+
+  // Prefills or decodes sequence i by one token. Returns false when its KV
+  // cache or its prefill input is wrong.
+  bool Forward(int i, const Request& request, Result* result) {
+    const int* row = Row(i);
+    const int r = request_[i];
+    const int64_t* ids = input_ids_.data() + i * ids_len_;
+    bool ok = true;
+    if (encoder_[i] > 0) {
+      for (int p = 0; p < encoder_[i]; ++p) {
+        ok = ok && row[p / kBlockSize] >= 0;
+        int64_t expected = p == 0        ? kFirstToken
+                           : p < ori_[i] ? Token(r, -p)
+                                         : Token(r, p - ori_[i] + 1);
+        ok = ok && ids[p] == expected;
+      }
+      if (encoder_[i] > ori_[i]) {
+        result->recomputed += encoder_[i];
+      }
+      decoder_[i] = encoder_[i];
+      encoder_[i] = 0;
+    } else {
+      ok = ok && row[decoder_[i] / kBlockSize] >= 0;
+      ++decoder_[i];
+    }
+    int64_t token = Token(r, ++step_idx_[i]);
+    pre_ids_[i * state_.pre_ids_stride + step_idx_[i]] = token;
+    next_tokens_[i] = token;
+    input_ids_[i * ids_len_] = token;
+    this_time_[i] = 1;
+    ++result->generated;
+    if (step_idx_[i] == request.output) {
+      stop_[i] = 1;
+      this_time_[i] = 0;
+    }
+    return ok;
+  }
+
+  // Every decoder block is either free or in exactly one table.
+  bool CheckBlocks() {
+    std::vector<int> seen(budget_, 0);
+    for (int j = 0; j < free_len_; ++j) {
+      ++seen[free_list_[j]];
+    }
+    for (int i = 0; i < bsz_; ++i) {
+      const int* row = Row(i);
+      for (int j = 0; j < used_[i] && !block_step_[i]; ++j) {
+        ++seen[row[encoder_lens_[i] + j]];
+      }
+    }
+    for (int count : seen) {
+      if (count != 1) {
+        return false;
+      }
+    }
+    return true;
+  }
+
+  int bsz_;
+  int budget_;
+  int max_decoder_;
+  int per_seq_;
+  int ids_len_;
+  std::vector<char> stop_, block_step_;
+  std::vector<int> this_time_, ori_, encoder_, decoder_, tables_, encoder_lens_,
+      step_list_, recover_list_, need_list_, used_, free_list_;
+  int step_len_ = 0;
+  int recover_len_ = 0;
+  int need_len_ = 0;
+  int free_len_ = 0;
+  std::vector<int64_t> input_ids_, pre_ids_, step_idx_, next_tokens_;
+  std::vector<int> request_, host_pool_;
+  custom_kernel::BlockStepState state_;
+};
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int num_requests = argc > 1 ? std::atoi(argv[1]) : 1024;
+  int bsz = argc > 2 ? std::atoi(argv[2]) : 32;
+  std::mt19937 rng(2024);
+  std::uniform_int_distribution<int> prompt(16, kMaxPrompt);
+  std::uniform_int_distribution<int> output(16, kMaxOutput);
+  std::vector<Request> requests(num_requests);
+  for (auto& request : requests) {
+    request = {prompt(rng), output(rng)};
+  }
+  for (int budget : {64, 128, 256, 384, 512}) {
+    Simulator simulator(bsz, budget);
+    Result result = simulator.Run(requests);
+    std::printf(
+        "budget %5d blocks  %7d steps  %6.2f tokens/step"
+        "  %6d preempted  %6d recovered  %8" PRId64
+        " recomputed"
+        "  %6.2f us/step  %s\n",
+        budget,
+        result.steps,
+        static_cast<double>(result.generated) / result.steps,
+        result.preempted,
+        result.recovered,
+        static_cast<int64_t>(result.recomputed),
+        result.seconds * 1e6 / result.steps,
+        result.ok ? "ok" : "MISMATCH");
+  }
+  return 0;
+}
@@ -0,0 +1,225 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// The cast engine against the body of the previous kernel, which took every
+// element through static_cast<float> and the scalar constructors of
+// phi::dtype::float16 and bfloat16, on the pairs that AMP and data loading
+// hit most. Those constructors are reproduced below as Paddle builds them for
+// the CPU. The mismatch column counts elements where the two differ: the
+// previous kernel truncated when narrowing to float16 and bfloat16, where the
+// engine rounds to nearest even, and took int64 through float. Pairs without
+// a 16-bit side were already plain loops that are bound by memory bandwidth,
+// so on one thread the engine only matches them.
+//
+//   ./cast_benchmark [repeat]
+
+#include <chrono>
+#include <cinttypes>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/cast.h"
+
+namespace {
+
+// phi::dtype::float16 as built for the CPU without native float16: the
+// software conversions of paddle/phi/common/float16.h.
+struct Float16 {
+  uint16_t x;
+
+  Float16() = default;
+
+  explicit Float16(float val) {
+    Bits v, s;
+    v.f = val;
+    uint32_t sign = v.si & kSigN;
+    v.si ^= sign;
+    sign >>= kShiftSign;
+    s.si = kMulN;
+    s.si = s.f * v.f;
+    v.si ^= (s.si ^ v.si) & -(kMinN > v.si);
+    v.si ^= (kInfN ^ v.si) & -((kInfN > v.si) & (v.si > kMaxN));
+    v.si ^= (kNanN ^ v.si) & -((kNanN > v.si) & (v.si > kInfN));
+    v.ui >>= kShift;
+    v.si ^= ((v.si - kMaxD) ^ v.si) & -(v.si > kMaxC);
+    v.si ^= ((v.si - kMinD) ^ v.si) & -(v.si > kSubC);
+    x = v.ui | sign;
+  }
+
+  explicit operator float() const {
+    Bits v;
+    v.ui = x;
+    int32_t sign = v.si & kSigC;
+    v.si ^= sign;
+    sign <<= kShiftSign;
+    v.si ^= ((v.si + kMinD) ^ v.si) & -(v.si > kSubC);
+    v.si ^= ((v.si + kMaxD) ^ v.si) & -(v.si > kMaxC);
+    Bits s;
+    s.si = kMulC;
+    s.f *= v.si;
+    int32_t mask = -(kNorC > v.si);
+    v.si <<= kShift;
+    v.si ^= (s.si ^ v.si) & mask;
+    v.si |= sign;
+    return v.f;
+  }
+
+ private:
+  union Bits {
+    float f;
+    int32_t si;
+    uint32_t ui;
+  };
+
+  static constexpr int kShift = 13;
+  static constexpr int kShiftSign = 16;
+  static constexpr int32_t kInfN = 0x7F800000;
+  static constexpr int32_t kMaxN = 0x477FE000;
+  static constexpr int32_t kMinN = 0x38800000;
+  static constexpr uint32_t kSigN = 0x80000000;
+  static constexpr int32_t kInfC = kInfN >> kShift;
+  static constexpr int32_t kNanN = (kInfC + 1) << kShift;
+  static constexpr int32_t kMaxC = kMaxN >> kShift;
+  static constexpr int32_t kMinC = kMinN >> kShift;
+  static constexpr int32_t kSigC = static_cast<int32_t>(0xFFFF8000u);
+  static constexpr int32_t kMulN = 0x52000000;
+  static constexpr int32_t kMulC = 0x33800000;
+  static constexpr int32_t kSubC = 0x003FF;
+  static constexpr int32_t kNorC = 0x00400;
+  static constexpr int32_t kMaxD = kInfC - kMaxC - 1;
+  static constexpr int32_t kMinD = kMinC - kSubC - 1;
+};
+
+// phi::dtype::bfloat16 as built for the CPU: narrowing keeps the top half of
+// the float.
+struct BFloat16 {
+  uint16_t x;
+
+  BFloat16() = default;
+
+  explicit BFloat16(float val) {
+    std::memcpy(&x, reinterpret_cast<char*>(&val) + 2, 2);
+  }
+
+  explicit operator float() const {
+    float val = 0.f;
+    uint16_t temp = x;
+    std::memcpy(reinterpret_cast<char*>(&val) + 2, &temp, 2);
+    return val;
+  }
+};
+
+}  // namespace
+
+namespace custom_kernel {
+
+template <>
+struct HalfTraits<Float16> : HalfTraitsBase<Float16, HalfFormat::kFloat16> {};
+
+template <>
+struct HalfTraits<BFloat16> : HalfTraitsBase<BFloat16, HalfFormat::kBFloat16> {
+};
+
+}  // namespace custom_kernel
+
+namespace {
+
+using custom_kernel::Convert;
+
+// The loop of the previous CastKernel.
+template <typename From, typename To>
+void NaiveCast(const From* x_data, To* out_data, int64_t numel) {
+  for (auto i = 0; i < numel; ++i) {
+    out_data[i] = static_cast<To>(static_cast<float>(x_data[i]));
+  }
+}
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+template <typename From>
+std::vector<From> Random(int64_t n) {
+  std::mt19937_64 gen(0);
+  std::uniform_real_distribution<double> dist(-1e3, 1e3);
+  std::vector<From> v(n);
+  for (auto& x : v) {
+    x = Convert<From>(dist(gen));
+  }
+  return v;
+}
+
+template <>
+std::vector<int64_t> Random<int64_t>(int64_t n) {
+  std::mt19937_64 gen(0);
+  std::vector<int64_t> v(n);
+  for (auto& x : v) {
+    x = static_cast<int64_t>(gen() >> 8);
+  }
+  return v;
+}
+
+template <typename From, typename To>
+void Run(const char* name, int64_t numel, int repeat) {
+  auto x = Random<From>(numel);
+  std::vector<To> naive(numel), engine(numel);
+  double naive_s =
+      Seconds(repeat, [&] { NaiveCast(x.data(), naive.data(), numel); });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::CastCompute(x.data(), engine.data(), numel);
+  });
+  int64_t mismatch = 0;
+  for (int64_t i = 0; i < numel; ++i) {
+    mismatch += std::memcmp(&naive[i], &engine[i], sizeof(To)) != 0;
+  }
+  double bytes = numel * (sizeof(From) + sizeof(To));
+  std::printf(
+      "%-14s naive %7.3f ms  engine %7.3f ms  %6.2f GB/s  %5.1fx"
+      "  mismatch %" PRId64 "\n",
+      name,
+      naive_s * 1e3,
+      engine_s * 1e3,
+      bytes / engine_s * 1e-9,
+      naive_s / engine_s,
+      static_cast<int64_t>(mismatch));
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 8;
+  const int64_t numel = 1 << 24;
+  Run<float, Float16>("fp32 -> fp16", numel, repeat);
+  Run<Float16, float>("fp16 -> fp32", numel, repeat);
+  Run<float, BFloat16>("fp32 -> bf16", numel, repeat);
+  Run<BFloat16, float>("bf16 -> fp32", numel, repeat);
+  Run<Float16, BFloat16>("fp16 -> bf16", numel, repeat);
+  Run<BFloat16, Float16>("bf16 -> fp16", numel, repeat);
+  Run<float, float>("fp32 -> fp32", numel, repeat);
+  Run<double, float>("fp64 -> fp32", numel, repeat);
+  Run<int64_t, double>("int64 -> fp64", numel, repeat);
+  Run<int64_t, Float16>("int64 -> fp16", numel, repeat);
+  return 0;
+}
@@ -0,0 +1,200 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Shared-memory collectives: forks one process per rank, checks every
+// collective against the expected result, then reports allreduce bandwidth
+// over a range of message sizes. busbw = algbw * 2 (n - 1) / n, as in
+// nccl-tests, so that numbers are comparable across rank counts.
+//
+//   ./collective_benchmark [nranks] [max_mb]
+
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <string>
+#include <vector>
+
+#include "runtime/collective.h"
+
+namespace {
+
+using custom_cpu::CclDataType;
+using custom_cpu::CclReduceOp;
+using custom_cpu::ShmComm;
+
+bool Check(bool ok, const char* what, size_t rank) {
+  if (!ok) {
+    std::fprintf(stderr, "rank %zu: %s mismatch\n", rank, what);
+  }
+  return ok;
+}
+
+bool TestCorrectness(ShmComm* comm) {
+  size_t rank = comm->Rank();
+  size_t nranks = comm->NRanks();
+  // Not a multiple of the chunk or of nranks, to exercise the tails.
+  size_t count = (3 << 20) / sizeof(float) + 7;
+  bool ok = true;
+
+  std::vector<float> send(count), recv(count);
+  for (size_t i = 0; i < count; ++i) {
+    send[i] = static_cast<float>(rank + 1 + i % 5);
+  }
+  comm->AllReduce(send.data(),
+                  recv.data(),
+                  count,
+                  CclDataType::kFloat32,
+                  CclReduceOp::kSum);
+  for (size_t i = 0; i < count && ok; ++i) {
+    float expected = nranks * (nranks + 1) / 2.f + nranks * (i % 5);
+    ok = Check(recv[i] == expected, "allreduce sum", rank);
+  }
+
+  std::vector<int64_t> ints(count, static_cast<int64_t>(rank));
+  std::vector<int64_t> maxs(count);
+  comm->AllReduce(
+      ints.data(), maxs.data(), count, CclDataType::kInt64, CclReduceOp::kMax);
+  for (size_t i = 0; i < count && ok; ++i) {
+    ok = Check(
+        maxs[i] == static_cast<int64_t>(nranks - 1), "allreduce max", rank);
+  }
+
+  std::vector<double> bcast(count, rank == 0 ? 3.5 : 0.0);
+  comm->Broadcast(bcast.data(), count, CclDataType::kFloat64, 0);
+  for (size_t i = 0; i < count && ok; ++i) {
+    ok = Check(bcast[i] == 3.5, "broadcast", rank);
+  }
+
+  size_t block = 1000;
+  std::vector<int32_t> mine(block, static_cast<int32_t>(rank));
+  std::vector<int32_t> gathered(block * nranks);
+  comm->AllGather(mine.data(), gathered.data(), block, CclDataType::kInt32);
+  for (size_t i = 0; i < gathered.size() && ok; ++i) {
+    ok = Check(
+        gathered[i] == static_cast<int32_t>(i / block), "allgather", rank);
+  }
+
+  std::vector<int32_t> scatter_in(block * nranks, 1), scatter_out(block);
+  comm->ReduceScatter(scatter_in.data(),
+                      scatter_out.data(),
+                      block,
+                      CclDataType::kInt32,
+                      CclReduceOp::kSum);
+  for (size_t i = 0; i < block && ok; ++i) {
+    ok = Check(
+        scatter_out[i] == static_cast<int32_t>(nranks), "reducescatter", rank);
+  }
+
+  // Ring exchange: every rank sends to the next and receives from the
+  // previous inside one group.
+  std::vector<char> out(1 << 20, static_cast<char>(rank)), in(1 << 20);
+  size_t next = (rank + 1) % nranks;
+  size_t prev = (rank + nranks - 1) % nranks;
+  ShmComm::GroupStart();
+  comm->Send(out.data(), out.size(), next);
+  comm->Recv(in.data(), in.size(), prev);
+  ShmComm::GroupEnd();
+  for (size_t i = 0; i < in.size() && ok; ++i) {
+    ok = Check(in[i] == static_cast<char>(prev), "send/recv", rank);
+  }
+  return ok;
+}
+
+void BenchAllReduce(ShmComm* comm, size_t max_bytes) {
+  size_t nranks = comm->NRanks();
+  std::vector<float> send(max_bytes / sizeof(float), 1.f);
+  std::vector<float> recv(send.size());
+  if (comm->Rank() == 0) {
+    std::printf("%12s %12s %12s %12s\n",
+                "bytes",
+                "time(us)",
+                "algbw(GB/s)",
+                "busbw(GB/s)");
+  }
+  for (size_t bytes = 4 << 10; bytes <= max_bytes; bytes *= 4) {
+    size_t count = bytes / sizeof(float);
+    int iters = static_cast<int>(std::max<size_t>(5, (256 << 20) / bytes));
+    comm->AllReduce(send.data(),
+                    recv.data(),
+                    count,
+                    CclDataType::kFloat32,
+                    CclReduceOp::kSum);
+    auto start = std::chrono::steady_clock::now();
+    for (int i = 0; i < iters; ++i) {
+      comm->AllReduce(send.data(),
+                      recv.data(),
+                      count,
+                      CclDataType::kFloat32,
+                      CclReduceOp::kSum);
+    }
+    std::chrono::duration<double> elapsed =
+        std::chrono::steady_clock::now() - start;
+    double seconds = elapsed.count() / iters;
+    double algbw = bytes / seconds / 1e9;
+    if (comm->Rank() == 0) {
+      std::printf("%12zu %12.1f %12.2f %12.2f\n",
+                  bytes,
+                  seconds * 1e6,
+                  algbw,
+                  algbw * 2 * (nranks - 1) / nranks);
+    }
+  }
+}
+
+int RunRank(const std::string& name,
+            size_t nranks,
+            size_t rank,
+            size_t max_bytes) {
+  ShmComm* comm = ShmComm::Create(name, nranks, rank);
+  if (!comm) {
+    std::fprintf(stderr, "rank %zu: failed to create communicator\n", rank);
+    return 1;
+  }
+  bool ok = TestCorrectness(comm);
+  if (ok) {
+    BenchAllReduce(comm, max_bytes);
+  }
+  delete comm;
+  return ok ? 0 : 1;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  size_t nranks = argc > 1 ? std::atoi(argv[1]) : 4;
+  size_t max_mb = argc > 2 ? std::atoi(argv[2]) : 64;
+  std::string name = "/custom_cpu_ccl_bench_" + std::to_string(getpid());
+
+  std::vector<pid_t> children;
+  for (size_t rank = 1; rank < nranks; ++rank) {
+    pid_t pid = fork();
+    if (pid == 0) {
+      _exit(RunRank(name, nranks, rank, max_mb << 20));
+    }
+    children.push_back(pid);
+  }
+  int failed = RunRank(name, nranks, 0, max_mb << 20);
+  for (pid_t pid : children) {
+    int status = 0;
+    waitpid(pid, &status, 0);
+    if (!WIFEXITED(status) || WEXITSTATUS(status) != 0) {
+      failed = 1;
+    }
+  }
+  std::printf("%s\n", failed ? "FAILED" : "all collectives correct");
+  return failed;
+}
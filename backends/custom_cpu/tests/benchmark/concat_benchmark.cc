@@ -0,0 +1,169 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// concat, split and stack shapes through the concat engine against the
+// previous concat kernel, which handed whole output rows to threads: a
+// concat along axis 0 is a single row and ran on one thread, and narrow
+// rows cost a memcpy call each. Split uses the same loop in reverse. Every
+// case runs on pools of 1 and max_threads threads and is checked against
+// the previous result.
+//
+//   ./concat_benchmark [max_threads] [repeat]
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/concat.h"
+
+namespace {
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+// The previous kernel, generalized to split with `gather` false.
+void RowConcat(int64_t rows,
+               const std::vector<int64_t>& widths,
+               const std::vector<float*>& parts,
+               float* whole,
+               bool gather) {
+  int64_t row_size = 0;
+  for (auto w : widths) {
+    row_size += w;
+  }
+  int64_t grain =
+      std::max<int64_t>(1, custom_kernel::kElementwiseGrainSize / row_size);
+  custom_kernel::ParallelFor(0, rows, grain, [&](int64_t begin, int64_t end) {
+    for (int64_t i = begin; i < end; ++i) {
+      float* row = whole + i * row_size;
+      for (size_t j = 0; j < parts.size(); ++j) {
+        float* part = parts[j] + i * widths[j];
+        if (gather) {
+          std::memcpy(row, part, widths[j] * sizeof(float));
+        } else {
+          std::memcpy(part, row, widths[j] * sizeof(float));
+        }
+        row += widths[j];
+      }
+    }
+  });
+}
+
+void Run(const std::string& name,
+         bool split,
+         int64_t rows,
+         const std::vector<int64_t>& widths,
+         int max_threads,
+         int repeat) {
+  int64_t row_size = 0;
+  for (auto w : widths) {
+    row_size += w;
+  }
+  std::vector<std::vector<float>> parts(widths.size());
+  std::vector<float*> part_data(widths.size());
+  for (size_t j = 0; j < widths.size(); ++j) {
+    parts[j].resize(rows * widths[j]);
+    for (size_t i = 0; i < parts[j].size(); ++i) {
+      parts[j][i] = static_cast<float>(j * 7 + i % 1013);
+    }
+    part_data[j] = parts[j].data();
+  }
+  std::vector<float> whole(rows * row_size);
+  RowConcat(rows, widths, part_data, whole.data(), true);
+  auto expected = parts;
+  auto reference = whole;
+  const double mb = rows * row_size * sizeof(float) / 1048576.0;
+  for (int threads : {1, max_threads}) {
+    custom_kernel::ThreadPool pool(threads);
+    custom_kernel::ScopedThreadPool scope(&pool);
+    double before = Seconds(repeat, [&] {
+      RowConcat(rows, widths, part_data, whole.data(), !split);
+    });
+    double after = Seconds(repeat, [&] {
+      if (split) {
+        custom_kernel::SplitCompute(rows, widths, whole.data(), part_data);
+      } else {
+        std::vector<const float*> inputs(part_data.begin(), part_data.end());
+        custom_kernel::ConcatCompute(rows, widths, inputs, whole.data());
+      }
+    });
+    bool ok = split ? parts == expected : whole == reference;
+    std::printf(
+        "%-28s %7.1f MB  %d thr  rows %8.3f ms  engine %8.3f ms"
+        "  %5.2fx  %5.1f GB/s  %s\n",
+        name.c_str(),
+        mb,
+        threads,
+        before * 1e3,
+        after * 1e3,
+        before / after,
+        2 * mb / 1024 / after,
+        ok ? "ok" : "MISMATCH");
+    if (max_threads == 1) {
+      break;
+    }
+  }
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int max_threads = argc > 1 ? std::atoi(argv[1]) : 8;
+  int repeat = argc > 2 ? std::atoi(argv[2]) : 8;
+  // KV-cache append: [4, 1023, 8, 128] + [4, 1, 8, 128] along the sequence.
+  Run("kv append axis 1",
+      false,
+      4,
+      {1023 * 8 * 128, 8 * 128},
+      max_threads,
+      repeat);
+  // Two [1024, 4096] halves along axis 0: a single row.
+  Run("concat axis 0",
+      false,
+      1,
+      {1024 * 4096, 1024 * 4096},
+      max_threads,
+      repeat);
+  // 64-way stack of [4096] vectors.
+  Run("stack 64 x [4096]",
+      false,
+      1,
+      std::vector<int64_t>(64, 4096),
+      max_threads,
+      repeat);
+  // [65536, 4] + [65536, 4] along the last axis: narrow rows.
+  Run("concat narrow rows", false, 65536, {4, 4}, max_threads, repeat);
+  // Fused QKV projection [512, 3 * 4096] into q, k and v.
+  Run("qkv split", true, 512, {4096, 4096, 4096}, max_threads, repeat);
+  // GQA QKV [512, (32 + 8 + 8) * 128] into q, k and v.
+  Run("gqa qkv split",
+      true,
+      512,
+      {32 * 128, 8 * 128, 8 * 128},
+      max_threads,
+      repeat);
+  return 0;
+}
@@ -0,0 +1,271 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// conv2d through the convolution engine against direct nested loops, on
+// ResNet-50 and MobileNetV2 layer shapes in both layouts. 3x3 layers that go
+// through Winograd are also timed on the im2col path. The gradients are
+// checked against the same loops on small shapes covering groups,
+// dilations, strides and channel multipliers.
+//
+//   ./conv_benchmark [repeat]
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/conv.h"
+
+namespace {
+
+using custom_kernel::ConvShape;
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+ConvShape MakeShape(int64_t n,
+                    int64_t c,
+                    int64_t h,
+                    int64_t oc,
+                    int64_t k,
+                    int64_t stride,
+                    int64_t pad,
+                    int64_t dilation,
+                    int64_t groups,
+                    bool channels_last) {
+  ConvShape s;
+  s.batch = n;
+  s.in_channels = c;
+  s.in_h = s.in_w = h;
+  s.out_channels = oc;
+  s.kernel_h = s.kernel_w = k;
+  s.stride_h = s.stride_w = stride;
+  s.pad_h = s.pad_w = pad;
+  s.dilation_h = s.dilation_w = dilation;
+  s.groups = groups;
+  s.channels_last = channels_last;
+  s.out_h = s.out_w = (h + 2 * pad - dilation * (k - 1) - 1) / stride + 1;
+  return s;
+}
+
+int64_t InIndex(
+    const ConvShape& s, int64_t n, int64_t c, int64_t h, int64_t w) {
+  return s.channels_last ? ((n * s.in_h + h) * s.in_w + w) * s.in_channels + c
+                         : ((n * s.in_channels + c) * s.in_h + h) * s.in_w + w;
+}
+
+int64_t OutIndex(
+    const ConvShape& s, int64_t n, int64_t c, int64_t h, int64_t w) {
+  return s.channels_last
+             ? ((n * s.out_h + h) * s.out_w + w) * s.out_channels + c
+             : ((n * s.out_channels + c) * s.out_h + h) * s.out_w + w;
+}
+
+// Calls f(x index, w index, out index) for every multiply of the
+// convolution.
+template <typename F>
+void ForEachTap(const ConvShape& s, F&& f) {
+  const int64_t cg = s.InGroupChannels();
+  const int64_t ocg = s.OutGroupChannels();
+  for (int64_t n = 0; n < s.batch; ++n) {
+    for (int64_t oc = 0; oc < s.out_channels; ++oc) {
+      const int64_t g = oc / ocg;
+      for (int64_t oh = 0; oh < s.out_h; ++oh) {
+        for (int64_t ow = 0; ow < s.out_w; ++ow) {
+          for (int64_t c = 0; c < cg; ++c) {
+            for (int64_t kh = 0; kh < s.kernel_h; ++kh) {
+              int64_t ih = oh * s.stride_h - s.pad_h + kh * s.dilation_h;
+              if (ih < 0 || ih >= s.in_h) {
+                continue;
+              }
+              for (int64_t kw = 0; kw < s.kernel_w; ++kw) {
+                int64_t iw = ow * s.stride_w - s.pad_w + kw * s.dilation_w;
+                if (iw < 0 || iw >= s.in_w) {
+                  continue;
+                }
+                f(InIndex(s, n, g * cg + c, ih, iw),
+                  ((oc * cg + c) * s.kernel_h + kh) * s.kernel_w + kw,
+                  OutIndex(s, n, oc, oh, ow));
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+
+std::vector<float> Random(int64_t n, uint32_t seed) {
+  std::mt19937 gen(seed);
+  std::uniform_real_distribution<float> dist(-1.f, 1.f);
+  std::vector<float> v(n);
+  for (auto& x : v) {
+    x = dist(gen);
+  }
+  return v;
+}
+
+// Largest difference relative to the largest reference magnitude.
+double RelError(const std::vector<float>& ref, const std::vector<float>& got) {
+  double err = 0, scale = 1e-12;
+  for (size_t i = 0; i < ref.size(); ++i) {
+    err = std::max(err, std::fabs(static_cast<double>(ref[i]) - got[i]));
+    scale = std::max(scale, std::fabs(static_cast<double>(ref[i])));
+  }
+  return err / scale;
+}
+
+int64_t InSize(const ConvShape& s) {
+  return s.batch * s.in_channels * s.InPlane();
+}
+int64_t OutSize(const ConvShape& s) {
+  return s.batch * s.out_channels * s.OutPlane();
+}
+int64_t FilterSize(const ConvShape& s) {
+  return s.out_channels * s.PatchSize();
+}
+
+bool RunForward(const char* name, const ConvShape& s, int repeat) {
+  auto x = Random(InSize(s), 1);
+  auto w = Random(FilterSize(s), 2);
+  std::vector<float> ref(OutSize(s)), out(OutSize(s));
+  double naive_s = Seconds(repeat, [&] {
+    std::fill(ref.begin(), ref.end(), 0.f);
+    ForEachTap(s, [&](int64_t xi, int64_t wi, int64_t oi) {
+      ref[oi] += x[xi] * w[wi];
+    });
+  });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::ConvForward(s, x.data(), w.data(), out.data());
+  });
+  double err = RelError(ref, out);
+  double gflop = 2.0 * OutSize(s) * s.PatchSize() * 1e-9;
+  const char* path = custom_kernel::detail::IsDepthwise(s)   ? "depthwise"
+                     : custom_kernel::detail::UseWinograd(s) ? "winograd"
+                                                             : "im2col";
+  std::printf(
+      "%-22s %s %-9s  loops %9.3f ms  engine %8.3f ms  %6.2fx  "
+      "%6.1f GFLOP/s  err %.1e",
+      name,
+      s.channels_last ? "NHWC" : "NCHW",
+      path,
+      naive_s * 1e3,
+      engine_s * 1e3,
+      naive_s / engine_s,
+      gflop / engine_s,
+      err);
+  if (custom_kernel::detail::UseWinograd(s)) {
+    double im2col_s = Seconds(repeat, [&] {
+      custom_kernel::detail::Im2ColForward(s, x.data(), w.data(), out.data());
+    });
+    std::printf("  im2col %8.3f ms", im2col_s * 1e3);
+  }
+  std::printf("\n");
+  return err < 1e-4;
+}
+
+bool RunBackward(const char* name, const ConvShape& s) {
+  auto x = Random(InSize(s), 3);
+  auto w = Random(FilterSize(s), 4);
+  auto dout = Random(OutSize(s), 5);
+  std::vector<float> dx_ref(InSize(s)), dw_ref(FilterSize(s));
+  ForEachTap(s, [&](int64_t xi, int64_t wi, int64_t oi) {
+    dx_ref[xi] += dout[oi] * w[wi];
+    dw_ref[wi] += dout[oi] * x[xi];
+  });
+  std::vector<float> dx(InSize(s)), dw(FilterSize(s));
+  custom_kernel::ConvBackwardData(s, w.data(), dout.data(), dx.data());
+  custom_kernel::ConvBackwardFilter(s, x.data(), dout.data(), dw.data());
+  double dx_err = RelError(dx_ref, dx);
+  double dw_err = RelError(dw_ref, dw);
+  bool ok = dx_err < 1e-4 && dw_err < 1e-4;
+  std::printf("%-22s %s grad  dx err %.1e  dw err %.1e  %s\n",
+              name,
+              s.channels_last ? "NHWC" : "NCHW",
+              dx_err,
+              dw_err,
+              ok ? "ok" : "MISMATCH");
+  return ok;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 3;
+  bool ok = true;
+  for (bool nhwc : {false, true}) {
+    // ResNet-50, batch 1.
+    ok &= RunForward("resnet conv1 7x7/2",
+                     MakeShape(1, 3, 224, 64, 7, 2, 3, 1, 1, nhwc),
+                     repeat);
+    ok &= RunForward("resnet 3x3 64 56x56",
+                     MakeShape(1, 64, 56, 64, 3, 1, 1, 1, 1, nhwc),
+                     repeat);
+    ok &= RunForward("resnet 1x1 64>256 56",
+                     MakeShape(1, 64, 56, 256, 1, 1, 0, 1, 1, nhwc),
+                     repeat);
+    ok &= RunForward("resnet 3x3 128 28x28",
+                     MakeShape(1, 128, 28, 128, 3, 1, 1, 1, 1, nhwc),
+                     repeat);
+    ok &= RunForward("resnet 3x3/2 128>256",
+                     MakeShape(1, 128, 28, 256, 3, 2, 1, 1, 1, nhwc),
+                     repeat);
+    ok &= RunForward("resnet 3x3 512 7x7",
+                     MakeShape(1, 512, 7, 512, 3, 1, 1, 1, 1, nhwc),
+                     repeat);
+    // MobileNetV2, batch 1.
+    ok &= RunForward("mbv2 dw 3x3 32 112",
+                     MakeShape(1, 32, 112, 32, 3, 1, 1, 1, 32, nhwc),
+                     repeat);
+    ok &= RunForward("mbv2 dw 3x3/2 144 56",
+                     MakeShape(1, 144, 56, 144, 3, 2, 1, 1, 144, nhwc),
+                     repeat);
+    ok &= RunForward("mbv2 dw 3x3 960 7",
+                     MakeShape(1, 960, 7, 960, 3, 1, 1, 1, 960, nhwc),
+                     repeat);
+    ok &= RunForward("mbv2 1x1 96>24 56",
+                     MakeShape(1, 96, 56, 24, 1, 1, 0, 1, 1, nhwc),
+                     repeat);
+  }
+  for (bool nhwc : {false, true}) {
+    ok &=
+        RunBackward("3x3 pad 1", MakeShape(2, 8, 13, 12, 3, 1, 1, 1, 1, nhwc));
+    ok &= RunBackward("5x5/2 dilation 2",
+                      MakeShape(2, 6, 17, 4, 5, 2, 3, 2, 1, nhwc));
+    ok &= RunBackward("3x3/2 groups 2",
+                      MakeShape(3, 8, 11, 6, 3, 2, 0, 1, 2, nhwc));
+    ok &= RunBackward("1x1 groups 4",
+                      MakeShape(2, 16, 9, 8, 1, 1, 0, 1, 4, nhwc));
+    ok &= RunBackward("dw 3x3 multiplier 2",
+                      MakeShape(2, 8, 10, 16, 3, 1, 1, 1, 8, nhwc));
+    ok &= RunBackward("dw 5x5/2 dilation 2",
+                      MakeShape(2, 8, 15, 8, 5, 2, 2, 2, 8, nhwc));
+    ok &= RunForward("winograd 3x3 odd 15",
+                     MakeShape(2, 16, 15, 24, 3, 1, 2, 1, 1, nhwc),
+                     1);
+  }
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,257 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// GFLOP/s of the blocked GEMM engine against the scalar loops that
+// matmul_kernel.cc used before, plus a max-abs-diff check for every
+// trans_x / trans_y / trans_out / reduce_bs combination.
+//
+//   ./gemm_benchmark [repeat]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/gemm.h"
+
+namespace {
+
+// The loop nest the matmul kernels used before the GEMM engine.
+template <typename T>
+void ReferenceBatchedGEMM(bool trans_x,
+                          bool trans_y,
+                          size_t M,
+                          size_t K,
+                          size_t N,
+                          const T* x,
+                          const T* y,
+                          T* out,
+                          size_t batch_size,
+                          bool x_is_larger,
+                          bool trans_out,
+                          bool bs_flag,
+                          bool reduce_bs) {
+  memset(out, 0, sizeof(T) * (reduce_bs ? M * N : batch_size * M * N));
+  for (size_t bs = 0; bs < batch_size; ++bs) {
+    for (size_t m = 0; m < M; ++m) {
+      for (size_t n = 0; n < N; ++n) {
+        auto out_bs = reduce_bs ? 0 : bs * M * N;
+        auto* out_data =
+            trans_out ? &out[out_bs + n * M + m] : &out[out_bs + m * N + n];
+        auto x_bs = (x_is_larger || bs_flag) ? bs * M * K : 0;
+        auto y_bs = (!x_is_larger || bs_flag) ? bs * N * K : 0;
+        for (size_t k = 0; k < K; ++k) {
+          auto x_dat = trans_x ? x[x_bs + k * M + m] : x[x_bs + m * K + k];
+          auto y_dat = trans_y ? y[y_bs + n * K + k] : y[y_bs + k * N + n];
+          *out_data += x_dat * y_dat;
+        }
+      }
+    }
+  }
+}
+
+template <typename T>
+void EngineBatchedGEMM(bool trans_x,
+                       bool trans_y,
+                       size_t M,
+                       size_t K,
+                       size_t N,
+                       const T* x,
+                       const T* y,
+                       T* out,
+                       size_t batch_size,
+                       bool x_is_larger,
+                       bool trans_out,
+                       bool bs_flag,
+                       bool reduce_bs) {
+  custom_kernel::gemm::BatchedGemm<T>(trans_x,
+                                      trans_y,
+                                      trans_out,
+                                      M,
+                                      N,
+                                      K,
+                                      static_cast<T>(1),
+                                      x,
+                                      (x_is_larger || bs_flag) ? M * K : 0,
+                                      y,
+                                      (!x_is_larger || bs_flag) ? N * K : 0,
+                                      static_cast<T>(0),
+                                      out,
+                                      reduce_bs ? 0 : M * N,
+                                      batch_size);
+}
+
+template <typename T>
+std::vector<T> RandomVector(size_t n, std::mt19937* gen) {
+  std::uniform_real_distribution<double> dist(-1.0, 1.0);
+  std::vector<T> v(n);
+  for (auto& e : v) {
+    e = static_cast<T>(dist(*gen));
+  }
+  return v;
+}
+
+template <typename F>
+double SecondsPerCall(F&& f, int repeat) {
+  f();  // warm up
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+template <typename T>
+bool CheckCombinations() {
+  std::mt19937 gen(2024);
+  const size_t M = 37, K = 53, N = 29, B = 3;
+  auto x = RandomVector<T>(B * M * K, &gen);
+  auto y = RandomVector<T>(B * K * N, &gen);
+  bool ok = true;
+  for (int flags = 0; flags < 32; ++flags) {
+    bool trans_x = flags & 1, trans_y = flags & 2, trans_out = flags & 4;
+    bool x_is_larger = flags & 8, reduce_bs = flags & 16;
+    bool bs_flag = reduce_bs;
+    std::vector<T> ref(B * M * N), out(B * M * N);
+    ReferenceBatchedGEMM(trans_x,
+                         trans_y,
+                         M,
+                         K,
+                         N,
+                         x.data(),
+                         y.data(),
+                         ref.data(),
+                         B,
+                         x_is_larger,
+                         trans_out,
+                         bs_flag,
+                         reduce_bs);
+    EngineBatchedGEMM(trans_x,
+                      trans_y,
+                      M,
+                      K,
+                      N,
+                      x.data(),
+                      y.data(),
+                      out.data(),
+                      B,
+                      x_is_larger,
+                      trans_out,
+                      bs_flag,
+                      reduce_bs);
+    double max_diff = 0;
+    for (size_t i = 0; i < (reduce_bs ? M * N : B * M * N); ++i) {
+      max_diff =
+          std::max(max_diff, std::fabs(static_cast<double>(ref[i] - out[i])));
+    }
+    if (max_diff > 1e-3) {
+      std::printf(
+          "MISMATCH trans_x=%d trans_y=%d trans_out=%d "
+          "x_is_larger=%d reduce_bs=%d max_diff=%g\n",
+          trans_x,
+          trans_y,
+          trans_out,
+          x_is_larger,
+          reduce_bs,
+          max_diff);
+      ok = false;
+    }
+  }
+  return ok;
+}
+
+template <typename T>
+void Bench(const char* name,
+           size_t B,
+           size_t M,
+           size_t K,
+           size_t N,
+           bool trans_x,
+           bool trans_y,
+           int repeat) {
+  std::mt19937 gen(0);
+  auto x = RandomVector<T>(B * M * K, &gen);
+  auto y = RandomVector<T>(B * K * N, &gen);
+  std::vector<T> ref(B * M * N), out(B * M * N);
+  double flops = 2.0 * B * M * N * K;
+
+  double t_ref = SecondsPerCall(
+      [&] {
+        ReferenceBatchedGEMM(trans_x,
+                             trans_y,
+                             M,
+                             K,
+                             N,
+                             x.data(),
+                             y.data(),
+                             ref.data(),
+                             B,
+                             true,
+                             false,
+                             true,
+                             false);
+      },
+      std::max(1, repeat / 10));
+  double t_new = SecondsPerCall(
+      [&] {
+        EngineBatchedGEMM(trans_x,
+                          trans_y,
+                          M,
+                          K,
+                          N,
+                          x.data(),
+                          y.data(),
+                          out.data(),
+                          B,
+                          true,
+                          false,
+                          true,
+                          false);
+      },
+      repeat);
+  std::printf(
+      "%-26s %4zux%4zux%4zux%4zu  loops %8.2f GFLOP/s  "
+      "engine %8.2f GFLOP/s  speedup %6.1fx\n",
+      name,
+      B,
+      M,
+      K,
+      N,
+      flops / t_ref * 1e-9,
+      flops / t_new * 1e-9,
+      t_ref / t_new);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 10;
+  std::printf("threads: %d\n",
+              custom_kernel::ThreadPool::Instance().NumThreads());
+  if (!CheckCombinations<float>() || !CheckCombinations<double>()) {
+    return 1;
+  }
+  Bench<float>("mnist fc fwd", 1, 64, 784, 10, false, false, repeat);
+  Bench<float>("mnist fc dW (x^T dy)", 1, 784, 64, 10, true, false, repeat);
+  Bench<float>("mlp 64x1024x1024", 1, 64, 1024, 1024, false, false, repeat);
+  Bench<float>("square 512", 1, 512, 512, 512, false, false, repeat);
+  Bench<float>("square 512 (x^T y^T)", 1, 512, 512, 512, true, true, repeat);
+  Bench<float>("attention bmm 8x128x64", 8, 128, 64, 128, false, true, repeat);
+  Bench<double>("square 256 fp64", 1, 256, 256, 256, false, false, repeat);
+  return 0;
+}
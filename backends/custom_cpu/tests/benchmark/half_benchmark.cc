@@ -0,0 +1,288 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// The engines on float16 and bfloat16 storage against float32. The 16-bit
+// runs compute in float, so the error column, the largest relative error
+// against a double-precision reference computed from the same rounded
+// inputs, should stay at the rounding error of the output type. Softmax
+// probabilities below the smallest normal float16, 6.1e-5, are compared
+// absolutely since float16 keeps only a few bits of them.
+//
+//   ./half_benchmark [repeat]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/broadcast.h"
+#include "kernels/funcs/gemm.h"
+#include "kernels/funcs/half.h"
+#include "kernels/funcs/reduce.h"
+#include "kernels/funcs/softmax.h"
+
+namespace {
+
+// Bit-compatible stand-ins for phi::dtype::float16 and phi::dtype::bfloat16.
+struct Float16 {
+  uint16_t x;
+};
+
+struct BFloat16 {
+  uint16_t x;
+};
+
+}  // namespace
+
+namespace custom_kernel {
+
+template <>
+struct HalfTraits<Float16> : HalfTraitsBase<Float16, HalfFormat::kFloat16> {};
+
+template <>
+struct HalfTraits<BFloat16> : HalfTraitsBase<BFloat16, HalfFormat::kBFloat16> {
+};
+
+}  // namespace custom_kernel
+
+namespace {
+
+using custom_kernel::AccType;
+using custom_kernel::Convert;
+
+template <typename T>
+const char* Name();
+template <>
+const char* Name<float>() {
+  return "fp32";
+}
+template <>
+const char* Name<Float16>() {
+  return "fp16";
+}
+template <>
+const char* Name<BFloat16>() {
+  return "bf16";
+}
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+template <typename T>
+std::vector<T> Random(int64_t n, float lo, float hi, uint32_t seed) {
+  std::mt19937 gen(seed);
+  std::uniform_real_distribution<float> dist(lo, hi);
+  std::vector<T> v(n);
+  for (auto& x : v) {
+    x = Convert<T>(dist(gen));
+  }
+  return v;
+}
+
+template <typename T>
+double At(const std::vector<T>& v, int64_t i) {
+  return Convert<float>(v[i]);
+}
+
+// Largest |got - ref| / max(|ref|, floor) over all elements.
+template <typename T>
+double MaxRelError(const std::vector<T>& got,
+                   const std::vector<double>& ref,
+                   double floor) {
+  double err = 0;
+  for (size_t i = 0; i < ref.size(); ++i) {
+    err = std::max(
+        err, std::abs(At(got, i) - ref[i]) / std::max(std::abs(ref[i]), floor));
+  }
+  return err;
+}
+
+void Report(const char* op,
+            const char* type,
+            double seconds,
+            double fp32_seconds,
+            double bytes,
+            double err) {
+  std::printf("%-34s %s %8.3f ms  %6.2f GB/s  %5.2fx vs fp32  err %.1e\n",
+              op,
+              type,
+              seconds * 1e3,
+              bytes / seconds * 1e-9,
+              fp32_seconds / seconds,
+              err);
+}
+
+template <typename T>
+double RunGemm(int64_t m, int64_t n, int64_t k, int repeat, double fp32_s) {
+  auto a = Random<T>(m * k, -1.f, 1.f, 1);
+  auto b = Random<T>(k * n, -1.f, 1.f, 2);
+  std::vector<T> c(m * n);
+  double s = Seconds(repeat, [&] {
+    custom_kernel::gemm::Gemm<T>(false,
+                                 false,
+                                 false,
+                                 m,
+                                 n,
+                                 k,
+                                 AccType<T>(1),
+                                 a.data(),
+                                 b.data(),
+                                 AccType<T>(0),
+                                 c.data());
+  });
+  std::vector<double> ref(m * n, 0.0);
+  for (int64_t i = 0; i < m; ++i) {
+    for (int64_t p = 0; p < k; ++p) {
+      double av = At(a, i * k + p);
+      for (int64_t j = 0; j < n; ++j) {
+        ref[i * n + j] += av * At(b, p * n + j);
+      }
+    }
+  }
+  std::string op = "gemm " + std::to_string(m) + "x" + std::to_string(n) + "x" +
+                   std::to_string(k);
+  Report(op.c_str(),
+         Name<T>(),
+         s,
+         fp32_s ? fp32_s : s,
+         (m * k + k * n + m * n) * sizeof(T),
+         MaxRelError(c, ref, std::sqrt(static_cast<double>(k))));
+  return s;
+}
+
+template <typename T>
+double RunAdd(int64_t rows, int64_t cols, int repeat, double fp32_s) {
+  auto x = Random<T>(rows * cols, -10.f, 10.f, 3);
+  auto y = Random<T>(cols, -10.f, 10.f, 4);
+  std::vector<T> out(rows * cols);
+  custom_kernel::BroadcastIndexer<2> indexer(
+      {rows, cols}, {{{rows, cols}, {cols}}}, -1);
+  using AccT = AccType<T>;
+  double s = Seconds(repeat, [&] {
+    custom_kernel::BroadcastCompute(
+        indexer,
+        out.data(),
+        [](AccT a, AccT b) { return a + b; },
+        x.data(),
+        y.data());
+  });
+  std::vector<double> ref(rows * cols);
+  for (int64_t i = 0; i < rows * cols; ++i) {
+    ref[i] = At(x, i) + At(y, i % cols);
+  }
+  Report("add [4096,4096]+[4096]",
+         Name<T>(),
+         s,
+         fp32_s ? fp32_s : s,
+         2.0 * rows * cols * sizeof(T),
+         MaxRelError(out, ref, 1e-3));
+  return s;
+}
+
+template <typename T>
+double RunSum(int64_t rows, int64_t cols, int repeat, double fp32_s) {
+  auto x = Random<T>(rows * cols, -1.f, 1.f, 5);
+  std::vector<T> out(cols);
+  using AccT = AccType<T>;
+  double s = Seconds(repeat, [&] {
+    custom_kernel::ReduceCompute<T, AccT, T>({rows, cols},
+                                             {0},
+                                             x.data(),
+                                             out.data(),
+                                             custom_kernel::SumReducer<AccT>());
+  });
+  std::vector<double> ref(cols, 0.0);
+  for (int64_t i = 0; i < rows; ++i) {
+    for (int64_t j = 0; j < cols; ++j) {
+      ref[j] += At(x, i * cols + j);
+    }
+  }
+  Report("sum [4096,4096] axis 0",
+         Name<T>(),
+         s,
+         fp32_s ? fp32_s : s,
+         1.0 * rows * cols * sizeof(T),
+         MaxRelError(out, ref, std::sqrt(static_cast<double>(rows))));
+  return s;
+}
+
+template <typename T>
+double RunSoftmax(int64_t rows, int64_t cols, int repeat, double fp32_s) {
+  auto x = Random<T>(rows * cols, -10.f, 10.f, 6);
+  std::vector<T> y(rows * cols);
+  double s = Seconds(repeat, [&] {
+    custom_kernel::SoftmaxCompute(x.data(), y.data(), rows, cols, 1);
+  });
+  std::vector<double> ref(rows * cols);
+  for (int64_t r = 0; r < rows; ++r) {
+    double m = -INFINITY, sum = 0;
+    for (int64_t j = 0; j < cols; ++j) {
+      m = std::max(m, At(x, r * cols + j));
+    }
+    for (int64_t j = 0; j < cols; ++j) {
+      sum += std::exp(At(x, r * cols + j) - m);
+    }
+    for (int64_t j = 0; j < cols; ++j) {
+      ref[r * cols + j] = std::exp(At(x, r * cols + j) - m) / sum;
+    }
+  }
+  Report("softmax [1024,32000] axis 1",
+         Name<T>(),
+         s,
+         fp32_s ? fp32_s : s,
+         2.0 * rows * cols * sizeof(T),
+         MaxRelError(y, ref, 6.1e-5));
+  return s;
+}
+
+template <typename Fn>
+void RunAll(const Fn& fn) {
+  double fp32 = fn(float(), 0.0);
+  fn(Float16(), fp32);
+  fn(BFloat16(), fp32);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 8;
+  RunAll([&](auto t, double fp32_s) {
+    return RunGemm<decltype(t)>(512, 512, 512, repeat, fp32_s);
+  });
+  RunAll([&](auto t, double fp32_s) {
+    return RunGemm<decltype(t)>(64, 64, 4096, repeat, fp32_s);
+  });
+  RunAll([&](auto t, double fp32_s) {
+    return RunAdd<decltype(t)>(4096, 4096, repeat, fp32_s);
+  });
+  RunAll([&](auto t, double fp32_s) {
+    return RunSum<decltype(t)>(4096, 4096, repeat, fp32_s);
+  });
+  RunAll([&](auto t, double fp32_s) {
+    return RunSoftmax<decltype(t)>(1024, 32000, repeat, fp32_s);
+  });
+  return 0;
+}
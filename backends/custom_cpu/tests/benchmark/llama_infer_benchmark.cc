@@ -0,0 +1,345 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// The per-step helpers of the llama serving loop through the llama_infer
+// engine, for a decode batch of growing size. Every helper is checked
+// against a serial reference written from the op definitions: padding
+// removal and restoration, the stop check, the token penalties and the KV
+// cache write. The penalty reference counts repeats in a dense [bsz, vocab]
+// tensor, as the NPU op does.
+//
+//   ./llama_infer_benchmark [repeat]
+
+#include <chrono>
+#include <cinttypes>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/llama_infer.h"
+
+namespace {
+
+constexpr int64_t kMaxSeqLen = 1024;
+constexpr int64_t kVocab = 32000;
+constexpr int64_t kDimEmbed = 4096;
+constexpr int64_t kHeads = 8;
+// Cache length of the write_cache_kv check, which holds two caches.
+constexpr int64_t kCacheLen = 128;
+constexpr int64_t kDimHead = 128;
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+bool CheckPadding(int64_t bsz,
+                  const std::vector<int64_t>& input_ids,
+                  const std::vector<int>& seq_lens,
+                  int repeat,
+                  double* seconds) {
+  std::vector<int> cum_offsets(bsz);
+  int64_t token_num = 0, padding = 0;
+  for (int64_t b = 0; b < bsz; ++b) {
+    padding += kMaxSeqLen - seq_lens[b];
+    cum_offsets[b] = padding;
+    token_num += seq_lens[b];
+  }
+  std::vector<int64_t> packed(token_num);
+  std::vector<int> cum_out(bsz), offsets(token_num), cu_q(bsz + 1),
+      cu_k(bsz + 1);
+  *seconds = Seconds(repeat, [&] {
+    custom_kernel::GetPaddingOffsetCompute(bsz,
+                                           kMaxSeqLen,
+                                           input_ids.data(),
+                                           cum_offsets.data(),
+                                           seq_lens.data(),
+                                           packed.data(),
+                                           cum_out.data(),
+                                           offsets.data(),
+                                           cu_q.data(),
+                                           cu_k.data());
+  });
+  int64_t t = 0;
+  for (int64_t b = 0; b < bsz; ++b) {
+    if (cu_q[b] != t || cum_out[b] != b * kMaxSeqLen - t) {
+      return false;
+    }
+    for (int64_t s = 0; s < seq_lens[b]; ++s, ++t) {
+      if (packed[t] != input_ids[b * kMaxSeqLen + s] ||
+          offsets[t] != cum_out[b]) {
+        return false;
+      }
+    }
+  }
+  return cu_q[bsz] == token_num && cu_k == cu_q;
+}
+
+bool CheckRebuild(int64_t bsz, int repeat, double* seconds) {
+  std::mt19937 gen(1);
+  std::vector<float> tmp_out(bsz * 2 * kDimEmbed);
+  for (auto& e : tmp_out) {
+    e = static_cast<float>(gen() % 1000);
+  }
+  // Every other sequence is stopped and gets a zero row.
+  std::vector<int64_t> rows(bsz);
+  for (int64_t b = 0; b < bsz; ++b) {
+    rows[b] = b % 2 ? -1 : 2 * b + 1;
+  }
+  std::vector<float> out(bsz * kDimEmbed);
+  *seconds = Seconds(repeat, [&] {
+    custom_kernel::GatherRowsCompute(
+        bsz, kDimEmbed, rows.data(), tmp_out.data(), out.data());
+  });
+  for (int64_t b = 0; b < bsz; ++b) {
+    for (int64_t j = 0; j < kDimEmbed; ++j) {
+      float ref = rows[b] < 0 ? 0.f : tmp_out[rows[b] * kDimEmbed + j];
+      if (out[b * kDimEmbed + j] != ref) {
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+bool CheckStop(int64_t bsz, int repeat, double* seconds) {
+  std::mt19937 gen(2);
+  const std::vector<int64_t> end_ids = {2, 7};
+  std::vector<int64_t> topk0(bsz);
+  std::vector<int> seq_lens(bsz);
+  std::vector<char> stop0(bsz);
+  for (int64_t b = 0; b < bsz; ++b) {
+    topk0[b] = gen() % 10;
+    stop0[b] = gen() % 4 == 0;
+    seq_lens[b] = gen() % 3;
+  }
+  std::vector<int64_t> topk, next(bsz, -5);
+  std::vector<char> stop;
+  *seconds = Seconds(repeat, [&] {
+    topk = topk0;
+    stop = stop0;
+    custom_kernel::SetStopValueV2Compute(bsz,
+                                         seq_lens.data(),
+                                         end_ids.data(),
+                                         end_ids.size(),
+                                         topk.data(),
+                                         reinterpret_cast<bool*>(stop.data()),
+                                         next.data());
+  });
+  for (int64_t b = 0; b < bsz; ++b) {
+    bool is_end = topk0[b] == 2 || topk0[b] == 7;
+    if (stop0[b]) {
+      int64_t ref = seq_lens[b] == 0 ? -1 : 2;
+      if (topk[b] != ref || !stop[b]) {
+        return false;
+      }
+    } else if (topk[b] != topk0[b] || next[b] != topk0[b] ||
+               stop[b] != is_end) {
+      return false;
+    }
+  }
+  return true;
+}
+
+// The NPU op: copy the logits, count repeats into a zeroed [bsz, vocab]
+// tensor, then apply the penalties over the whole vocab.
+void DensePenalty(int64_t bsz,
+                  int64_t pre_len,
+                  const std::vector<int64_t>& pre_ids,
+                  const std::vector<float>& logits,
+                  const float* alpha,
+                  const float* beta,
+                  const float* gamma,
+                  const float* temp,
+                  std::vector<int>* repeat,
+                  std::vector<float>* out) {
+  *out = logits;
+  std::fill(repeat->begin(), repeat->end(), 0);
+  for (int64_t b = 0; b < bsz; ++b) {
+    for (int64_t i = 0; i < pre_len && pre_ids[b * pre_len + i] >= 0; ++i) {
+      ++(*repeat)[b * kVocab + pre_ids[b * pre_len + i]];
+    }
+  }
+  for (int64_t b = 0; b < bsz; ++b) {
+    for (int64_t i = 0; i < kVocab; ++i) {
+      float logit = (*out)[b * kVocab + i];
+      int n = (*repeat)[b * kVocab + i];
+      if (n) {
+        logit = logit < 0 ? logit * alpha[b] : logit / alpha[b];
+        logit -= n * beta[b] + gamma[b];
+      }
+      (*out)[b * kVocab + i] = logit / temp[b];
+    }
+  }
+}
+
+bool CheckPenalty(int64_t bsz,
+                  int64_t generated,
+                  int repeat,
+                  double* dense_s,
+                  double* seconds) {
+  std::mt19937 gen(3);
+  std::uniform_real_distribution<float> dist(-4.f, 4.f);
+  std::vector<float> logits(bsz * kVocab);
+  for (auto& e : logits) {
+    e = dist(gen);
+  }
+  const int64_t pre_len = kMaxSeqLen;
+  std::vector<int64_t> pre_ids(bsz * pre_len, -1);
+  for (int64_t b = 0; b < bsz; ++b) {
+    for (int64_t i = 0; i < generated; ++i) {
+      // A skewed draw, so that some tokens repeat many times.
+      pre_ids[b * pre_len + i] = gen() % (gen() % 2 ? 64 : kVocab);
+    }
+  }
+  std::vector<float> alpha(bsz, 1.2f), beta(bsz, 0.1f), gamma(bsz, 0.3f),
+      temp(bsz, 0.7f);
+  std::vector<int64_t> cur_len(bsz, generated), min_len(bsz, 0), eos = {2};
+  std::vector<int> repeat_times(bsz * kVocab);
+  std::vector<float> ref, out;
+  *dense_s = Seconds(repeat, [&] {
+    DensePenalty(bsz,
+                 pre_len,
+                 pre_ids,
+                 logits,
+                 alpha.data(),
+                 beta.data(),
+                 gamma.data(),
+                 temp.data(),
+                 &repeat_times,
+                 &ref);
+  });
+  *seconds = Seconds(repeat, [&] {
+    out = logits;
+    custom_kernel::TokenPenaltyCompute(bsz,
+                                       kVocab,
+                                       pre_ids.data(),
+                                       pre_len,
+                                       out.data(),
+                                       alpha.data(),
+                                       beta.data(),
+                                       gamma.data(),
+                                       temp.data(),
+                                       nullptr,
+                                       0,
+                                       cur_len.data(),
+                                       min_len.data(),
+                                       eos.data(),
+                                       1);
+  });
+  for (size_t i = 0; i < out.size(); ++i) {
+    if (std::abs(out[i] - ref[i]) > 1e-5f * (1 + std::abs(ref[i]))) {
+      return false;
+    }
+  }
+  return true;
+}
+
+bool CheckWriteCache(int64_t bsz,
+                     int64_t seq_len,
+                     int repeat,
+                     double* seconds) {
+  const int64_t n = bsz * kHeads * seq_len * kDimHead;
+  const int64_t cache_n = bsz * kHeads * kCacheLen * kDimHead;
+  std::vector<float> k(n), v(n), cache_k(cache_n), cache_v(cache_n);
+  for (int64_t i = 0; i < n; ++i) {
+    k[i] = static_cast<float>(i);
+    v[i] = static_cast<float>(-i);
+  }
+  std::vector<int> seq_lens(bsz);
+  for (int64_t b = 0; b < bsz; ++b) {
+    seq_lens[b] = seq_len - b % 3;
+  }
+  *seconds = Seconds(repeat, [&] {
+    custom_kernel::WriteCacheKVCompute(bsz,
+                                       kHeads,
+                                       seq_len,
+                                       kDimHead,
+                                       kCacheLen,
+                                       k.data(),
+                                       v.data(),
+                                       seq_lens.data(),
+                                       cache_k.data(),
+                                       cache_v.data());
+  });
+  constexpr int64_t x = 16 / sizeof(float);
+  for (int64_t bh = 0; bh < bsz * kHeads; ++bh) {
+    for (int64_t s = 0; s < seq_lens[bh / kHeads]; ++s) {
+      for (int64_t d = 0; d < kDimHead; ++d) {
+        int64_t src = (bh * seq_len + s) * kDimHead + d;
+        int64_t k_dst =
+            ((bh * kDimHead / x + d / x) * kCacheLen + s) * x + d % x;
+        int64_t v_dst = (bh * kCacheLen + s) * kDimHead + d;
+        if (cache_k[k_dst] != k[src] || cache_v[v_dst] != v[src]) {
+          return false;
+        }
+      }
+    }
+  }
+  return true;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  const int repeat = argc > 1 ? std::atoi(argv[1]) : 10;
+  std::mt19937 gen(0);
+  bool ok = true;
+  for (int64_t bsz : {1, 16, 64, 256}) {
+    std::vector<int64_t> input_ids(bsz * kMaxSeqLen);
+    std::vector<int> seq_lens(bsz);
+    for (int64_t i = 0; i < bsz * kMaxSeqLen; ++i) {
+      input_ids[i] = gen() % kVocab;
+    }
+    for (int64_t b = 0; b < bsz; ++b) {
+      seq_lens[b] = 1 + gen() % kMaxSeqLen;
+    }
+    double padding_s, rebuild_s, stop_s, dense_s, penalty_s, cache_s;
+    bool checks[] = {
+        CheckPadding(bsz, input_ids, seq_lens, repeat, &padding_s),
+        CheckRebuild(bsz, repeat, &rebuild_s),
+        CheckStop(bsz, repeat, &stop_s),
+        CheckPenalty(bsz, 256, repeat, &dense_s, &penalty_s),
+        CheckWriteCache(bsz, 16, repeat, &cache_s),
+    };
+    bool step_ok = true;
+    for (bool c : checks) {
+      step_ok = step_ok && c;
+    }
+    ok = ok && step_ok;
+    std::printf("bsz %4" PRId64
+                "  get_padding_offset %8.3f ms  rebuild_padding "
+                "%8.3f ms  stop %7.4f ms\n"
+                "           token_penalty dense %8.3f ms  engine %8.3f ms  "
+                "%5.2fx  write_cache_kv %8.3f ms  %s\n",
+                static_cast<int64_t>(bsz),
+                padding_s * 1e3,
+                rebuild_s * 1e3,
+                stop_s * 1e3,
+                dense_s * 1e3,
+                penalty_s * 1e3,
+                dense_s / penalty_s,
+                cache_s * 1e3,
+                step_ok ? "ok" : "MISMATCH");
+  }
+  return ok ? 0 : 1;
+}
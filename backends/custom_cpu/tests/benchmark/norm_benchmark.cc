@@ -0,0 +1,245 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Fused bias + residual + rms_norm / layer_norm rows through the norm engine
+// against the unfused graph they replace: an add for the bias, an add for
+// the residual, then a norm that reads its input once for the statistics
+// and once more to normalize. The error column is the largest absolute
+// error against a double-precision reference.
+//
+//   ./norm_benchmark [repeat]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/norm.h"
+
+namespace {
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+// One op of the unfused graph: out = a + b, b broadcast over rows when it
+// has `cols` elements.
+void Add(const std::vector<float>& a,
+         const std::vector<float>& b,
+         std::vector<float>* out,
+         int64_t cols) {
+  out->resize(a.size());
+  for (size_t i = 0; i < a.size(); ++i) {
+    (*out)[i] = a[i] + b[b.size() == a.size() ? i : i % cols];
+  }
+}
+
+void UnfusedNorm(bool rms,
+                 const std::vector<float>& x,
+                 int64_t rows,
+                 int64_t cols,
+                 const std::vector<float>& w,
+                 const std::vector<float>& b,
+                 std::vector<float>* out,
+                 std::vector<float>* stat) {
+  out->resize(x.size());
+  for (int64_t r = 0; r < rows; ++r) {
+    const float* row = x.data() + r * cols;
+    float mean = 0, var = 0;
+    for (int64_t j = 0; j < cols; ++j) {
+      mean += rms ? 0 : row[j];
+      var += row[j] * row[j];
+    }
+    mean /= cols;
+    var = var / cols - mean * mean;
+    const float rstd = 1.f / std::sqrt(var + 1e-6f);
+    for (int64_t j = 0; j < cols; ++j) {
+      (*out)[r * cols + j] = (row[j] - mean) * rstd * w[j] + (rms ? 0 : b[j]);
+    }
+    (*stat)[r] = rstd;
+  }
+}
+
+double MaxError(bool rms,
+                const std::vector<float>& y,
+                int64_t rows,
+                int64_t cols,
+                const std::vector<float>& w,
+                const std::vector<float>& b,
+                const std::vector<float>& out) {
+  double err = 0;
+  for (int64_t r = 0; r < rows; ++r) {
+    const float* row = y.data() + r * cols;
+    double mean = 0, var = 0;
+    for (int64_t j = 0; j < cols; ++j) {
+      mean += rms ? 0 : row[j];
+    }
+    mean /= cols;
+    for (int64_t j = 0; j < cols; ++j) {
+      var += (row[j] - mean) * (row[j] - mean);
+    }
+    const double rstd = 1 / std::sqrt(var / cols + 1e-6);
+    for (int64_t j = 0; j < cols; ++j) {
+      double ref = (row[j] - mean) * rstd * w[j] + (rms ? 0 : b[j]);
+      err = std::max(err, std::abs(out[r * cols + j] - ref));
+    }
+  }
+  return err;
+}
+
+void Run(bool rms, int64_t rows, int64_t cols, int repeat) {
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> dist(-2.f, 2.f);
+  std::vector<float> x(rows * cols), residual(rows * cols), dout(rows * cols);
+  std::vector<float> bias(cols), w(cols), b(cols);
+  for (auto* v : {&x, &residual, &dout, &bias, &w, &b}) {
+    for (auto& e : *v) {
+      e = dist(gen);
+    }
+  }
+  std::vector<float> t0, t1, naive, naive_stat(rows);
+  double naive_s = Seconds(repeat, [&] {
+    Add(x, bias, &t0, cols);
+    Add(t0, residual, &t1, cols);
+    UnfusedNorm(rms, t1, rows, cols, w, b, &naive, &naive_stat);
+  });
+
+  custom_kernel::NormInputs<float> in;
+  in.x = x.data();
+  in.residual = residual.data();
+  in.bias = bias.data();
+  in.weight = w.data();
+  in.norm_bias = rms ? nullptr : b.data();
+  std::vector<float> out(rows * cols), residual_out(rows * cols);
+  std::vector<float> mean(rows), stat(rows);
+  double fused_s = Seconds(repeat, [&] {
+    if (rms) {
+      custom_kernel::RmsNormForward(
+          rows, cols, in, 1e-6f, out.data(), residual_out.data(), stat.data());
+    } else {
+      custom_kernel::LayerNormForward(rows,
+                                      cols,
+                                      in,
+                                      1e-6f,
+                                      out.data(),
+                                      residual_out.data(),
+                                      mean.data(),
+                                      stat.data());
+    }
+  });
+  std::string name = (rms ? "rms_norm   " : "layer_norm ") +
+                     std::to_string(rows) + "x" + std::to_string(cols);
+  std::printf(
+      "%-22s fwd  unfused %8.3f ms  fused %8.3f ms  %5.2fx"
+      "  err %.1e -> %.1e\n",
+      name.c_str(),
+      naive_s * 1e3,
+      fused_s * 1e3,
+      naive_s / fused_s,
+      MaxError(rms, t1, rows, cols, w, b, naive),
+      MaxError(rms, t1, rows, cols, w, b, out));
+
+  // The backward against central differences of the forward on a few
+  // elements, for the row input and both parameters.
+  std::vector<float> dx(rows * cols), dw(cols), db(cols);
+  custom_kernel::NormParamGrads<float> grads;
+  grads.weight = dw.data();
+  grads.norm_bias = rms ? nullptr : db.data();
+  fused_s = Seconds(repeat, [&] {
+    if (rms) {
+      custom_kernel::RmsNormBackward(
+          rows, cols, in, stat.data(), dout.data(), dx.data(), grads);
+    } else {
+      custom_kernel::LayerNormBackward(rows,
+                                       cols,
+                                       in,
+                                       1e-6f,
+                                       mean.data(),
+                                       stat.data(),
+                                       dout.data(),
+                                       dx.data(),
+                                       grads);
+    }
+  });
+  auto loss = [&](std::vector<float>* param, int64_t i, double delta) {
+    float saved = (*param)[i];
+    (*param)[i] = saved + delta;
+    std::vector<float> t, y, s(rows);
+    Add(x, bias, &t, cols);
+    Add(t, residual, &y, cols);
+    std::vector<double> yd(y.begin(), y.end());
+    (*param)[i] = saved;
+    double l = 0;
+    for (int64_t r = 0; r < rows; ++r) {
+      double m = 0, v = 0;
+      for (int64_t j = 0; j < cols; ++j) {
+        m += rms ? 0 : yd[r * cols + j];
+      }
+      m /= cols;
+      for (int64_t j = 0; j < cols; ++j) {
+        v += (yd[r * cols + j] - m) * (yd[r * cols + j] - m);
+      }
+      const double rstd = 1 / std::sqrt(v / cols + 1e-6);
+      for (int64_t j = 0; j < cols; ++j) {
+        double wj = w[j], bj = rms ? 0 : b[j];
+        if (j == i && param != &x) {
+          (param == &w ? wj : bj) += delta;
+        }
+        l += ((yd[r * cols + j] - m) * rstd * wj + bj) * dout[r * cols + j];
+      }
+    }
+    return l;
+  };
+  double grad_err = 0;
+  std::mt19937 pick(1);
+  for (int k = 0; k < 4; ++k) {
+    const int64_t i = pick() % (rows * cols), j = pick() % cols;
+    const double h = 1e-2;
+    double num = (loss(&x, i, h) - loss(&x, i, -h)) / (2 * h);
+    grad_err = std::max(grad_err, std::abs(num - dx[i]) / (1 + std::abs(num)));
+    num = (loss(&w, j, h) - loss(&w, j, -h)) / (2 * h);
+    grad_err = std::max(grad_err, std::abs(num - dw[j]) / (1 + std::abs(num)));
+    if (!rms) {
+      num = (loss(&b, j, h) - loss(&b, j, -h)) / (2 * h);
+      grad_err =
+          std::max(grad_err, std::abs(num - db[j]) / (1 + std::abs(num)));
+    }
+  }
+  std::printf("%-22s bwd  fused %8.3f ms  grad err %.1e\n",
+              name.c_str(),
+              fused_s * 1e3,
+              grad_err);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 8;
+  for (bool rms : {true, false}) {
+    Run(rms, 16, 4096, repeat * 16);
+    Run(rms, 512, 4096, repeat);
+    Run(rms, 256, 8192, repeat);
+  }
+  return 0;
+}
@@ -0,0 +1,191 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Adam and momentum steps over a model of many small parameters, launched
+// once per parameter as the single-tensor kernels do against one merged
+// multi-tensor pass. Both update in place, and the merged results are
+// checked to match the per-parameter ones bit for bit.
+//
+//   ./optimizer_benchmark [num_params] [repeat]
+
+#include <chrono>
+#include <cinttypes>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/optimizer.h"
+
+namespace {
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+// Flat storage for the state of every parameter, and its split into
+// per-parameter tensors.
+struct Model {
+  std::vector<int64_t> sizes;
+  std::vector<int64_t> offsets;
+  std::vector<float> param, grad, moment1, moment2;
+
+  Model(int num_params, uint32_t seed) {
+    std::mt19937 gen(seed);
+    // Mostly bias and norm vectors, some weight matrices.
+    std::uniform_int_distribution<int64_t> small(64, 4096);
+    std::uniform_int_distribution<int64_t> large(1 << 16, 1 << 18);
+    int64_t total = 0;
+    for (int i = 0; i < num_params; ++i) {
+      sizes.push_back(i % 8 == 0 ? large(gen) : small(gen));
+      offsets.push_back(total);
+      total += sizes.back();
+    }
+    std::uniform_real_distribution<float> dist(-1.f, 1.f);
+    for (auto* v : {&param, &grad, &moment1, &moment2}) {
+      v->resize(total);
+      for (auto& x : *v) {
+        x = dist(gen);
+      }
+    }
+    for (auto& x : moment2) {
+      x = x * x;
+    }
+  }
+
+  int64_t numel() const { return static_cast<int64_t>(param.size()); }
+
+  std::vector<custom_kernel::AdamTensor<float, float>> AdamTensors() {
+    std::vector<custom_kernel::AdamTensor<float, float>> tensors;
+    for (size_t i = 0; i < sizes.size(); ++i) {
+      int64_t o = offsets[i];
+      tensors.push_back({&param[o],
+                         &grad[o],
+                         &moment1[o],
+                         &moment2[o],
+                         nullptr,
+                         nullptr,
+                         &param[o],
+                         &moment1[o],
+                         &moment2[o],
+                         nullptr,
+                         nullptr,
+                         sizes[i],
+                         1e-3f,
+                         0.9f,
+                         0.999f});
+    }
+    return tensors;
+  }
+
+  std::vector<custom_kernel::MomentumTensor<float, float>> MomentumTensors() {
+    std::vector<custom_kernel::MomentumTensor<float, float>> tensors;
+    for (size_t i = 0; i < sizes.size(); ++i) {
+      int64_t o = offsets[i];
+      tensors.push_back({&param[o],
+                         &grad[o],
+                         &moment1[o],
+                         nullptr,
+                         &param[o],
+                         &moment1[o],
+                         nullptr,
+                         sizes[i],
+                         1e-2f,
+                         1e-4f});
+    }
+    return tensors;
+  }
+};
+
+bool SameBits(const Model& a, const Model& b) {
+  return std::memcmp(a.param.data(),
+                     b.param.data(),
+                     a.param.size() * sizeof(float)) == 0 &&
+         std::memcmp(a.moment1.data(),
+                     b.moment1.data(),
+                     a.moment1.size() * sizeof(float)) == 0 &&
+         std::memcmp(a.moment2.data(),
+                     b.moment2.data(),
+                     a.moment2.size() * sizeof(float)) == 0;
+}
+
+void Report(const char* op,
+            const Model& model,
+            double per_param_s,
+            double merged_s,
+            bool same) {
+  std::printf("%-10s %4zu params %9" PRId64
+              " elems  per-param %8.3f ms  merged "
+              "%8.3f ms  %5.2fx  %s\n",
+              op,
+              model.sizes.size(),
+              static_cast<int64_t>(model.numel()),
+              per_param_s * 1e3,
+              merged_s * 1e3,
+              per_param_s / merged_s,
+              same ? "identical" : "MISMATCH");
+}
+
+bool RunAdam(int num_params, int repeat) {
+  Model per_param(num_params, 0), merged(num_params, 0);
+  custom_kernel::AdamConfig<float> config = {0.9f, 0.999f, 1e-8f, 0.f, false};
+  auto per_param_tensors = per_param.AdamTensors();
+  auto merged_tensors = merged.AdamTensors();
+  double per_param_s = Seconds(repeat, [&] {
+    for (const auto& t : per_param_tensors) {
+      custom_kernel::AdamCompute<float, float>({t}, config);
+    }
+  });
+  double merged_s = Seconds(
+      repeat, [&] { custom_kernel::AdamCompute(merged_tensors, config); });
+  bool same = SameBits(per_param, merged);
+  Report("adam", merged, per_param_s, merged_s, same);
+  return same;
+}
+
+bool RunMomentum(int num_params, int repeat) {
+  Model per_param(num_params, 1), merged(num_params, 1);
+  custom_kernel::MomentumConfig<float> config = {0.9f, true, 1.f};
+  auto per_param_tensors = per_param.MomentumTensors();
+  auto merged_tensors = merged.MomentumTensors();
+  double per_param_s = Seconds(repeat, [&] {
+    for (const auto& t : per_param_tensors) {
+      custom_kernel::MomentumCompute<float, float>({t}, config);
+    }
+  });
+  double merged_s = Seconds(
+      repeat, [&] { custom_kernel::MomentumCompute(merged_tensors, config); });
+  bool same = SameBits(per_param, merged);
+  Report("momentum", merged, per_param_s, merged_s, same);
+  return same;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int num_params = argc > 1 ? std::atoi(argv[1]) : 400;
+  int repeat = argc > 2 ? std::atoi(argv[2]) : 8;
+  bool ok = RunAdam(num_params, repeat);
+  ok &= RunMomentum(num_params, repeat);
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,145 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Random fills through the Philox engine against the previous uniform
+// kernel, which seeded a std::mt19937_64 per call and filled the tensor
+// serially. Every Philox fill is repeated on pools of 1 to max_threads
+// threads and checked to give the same bits.
+//
+//   ./random_benchmark [max_threads] [repeat]
+
+#include <chrono>
+#include <cinttypes>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/random.h"
+
+namespace {
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+// Times `fill(out)` on pools of 1 to max_threads threads and checks that
+// they all write the same bytes.
+template <typename T, typename F>
+bool RunFill(const char* name,
+             int64_t n,
+             int max_threads,
+             int repeat,
+             double previous_s,
+             const F& fill) {
+  std::vector<T> first(n), out(n);
+  bool same = true;
+  for (int threads = 1; threads <= max_threads; threads *= 2) {
+    custom_kernel::ThreadPool pool(threads);
+    custom_kernel::ScopedThreadPool scope(&pool);
+    double s = Seconds(repeat, [&] { fill(out.data()); });
+    if (threads == 1) {
+      first = out;
+    }
+    same &= std::memcmp(first.data(), out.data(), n * sizeof(T)) == 0;
+    std::printf("%-16s %9" PRId64 "  %2d threads  %8.3f ms  %6.2f Gval/s",
+                name,
+                static_cast<int64_t>(n),
+                threads,
+                s * 1e3,
+                n / s * 1e-9);
+    if (previous_s > 0) {
+      std::printf("  %5.2fx previous", previous_s / s);
+    }
+    std::printf("\n");
+  }
+  std::printf(
+      "%-16s %s across thread counts\n", name, same ? "identical" : "MISMATCH");
+  return same;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int max_threads = argc > 1 ? std::atoi(argv[1]) : 4;
+  int repeat = argc > 2 ? std::atoi(argv[2]) : 5;
+  const int64_t n = 1 << 24;
+  const custom_kernel::PhiloxState state = {2024, 0};
+  bool ok = true;
+
+  std::vector<float> previous(n);
+  double previous_s = Seconds(repeat, [&] {
+    std::mt19937_64 engine(2024);
+    std::uniform_real_distribution<float> dist(-1.f, 1.f);
+    for (auto& v : previous) {
+      v = dist(engine);
+    }
+  });
+  std::printf("%-16s %9" PRId64 "  mt19937_64  %8.3f ms\n",
+              "previous uniform",
+              static_cast<int64_t>(n),
+              previous_s * 1e3);
+
+  ok &= RunFill<float>(
+      "uniform float", n, max_threads, repeat, previous_s, [&](float* out) {
+        custom_kernel::UniformFill(state, -1.f, 1.f, out, n);
+      });
+  ok &= RunFill<double>(
+      "uniform double", n, max_threads, repeat, 0, [&](double* out) {
+        custom_kernel::UniformFill(state, -1.f, 1.f, out, n);
+      });
+  ok &= RunFill<float>(
+      "gaussian float", n, max_threads, repeat, 0, [&](float* out) {
+        custom_kernel::GaussianFill(state, 0.f, 1.f, out, n);
+      });
+  ok &= RunFill<int64_t>(
+      "randint int64", n, max_threads, repeat, 0, [&](int64_t* out) {
+        custom_kernel::RandintFill(state, -5, 100, out, n);
+      });
+  std::vector<float> x(n, 1.f);
+  std::vector<uint8_t> mask(n);
+  ok &= RunFill<float>(
+      "dropout float", n, max_threads, repeat, 0, [&](float* out) {
+        custom_kernel::DropoutCompute(
+            state, x.data(), 0.1f, true, out, mask.data(), n);
+      });
+
+  // Moments of the fills, as a sanity check of the distributions.
+  std::vector<float> g(n);
+  custom_kernel::GaussianFill(state, 0.f, 1.f, g.data(), n);
+  double sum = 0, sum_sq = 0;
+  for (float v : g) {
+    sum += v;
+    sum_sq += static_cast<double>(v) * v;
+  }
+  double kept = 0;
+  for (uint8_t m : mask) {
+    kept += m;
+  }
+  std::printf("gaussian mean %.4f var %.4f, dropout keep rate %.4f (0.9)\n",
+              sum / n,
+              sum_sq / n - (sum / n) * (sum / n),
+              kept / n);
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,163 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Float sum through the reduction engine against the index-vector loop the
+// reduce kernels used before, on the common reduction patterns. The error
+// columns are the largest relative error against a double-precision sum.
+//
+//   ./reduce_benchmark [repeat]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/reduce.h"
+
+namespace {
+
+// The previous kernels: walk every input element and scatter it into its
+// output through two dot products of an index vector with the strides.
+template <typename T>
+void NaiveSum(const std::vector<int64_t>& dims,
+              const std::vector<int64_t>& reduce_dims,
+              const T* x,
+              T* out,
+              int64_t out_numel) {
+  std::vector<int64_t> out_dims(dims);
+  for (auto d : reduce_dims) {
+    out_dims[d] = 1;
+  }
+  size_t rank = dims.size();
+  std::vector<int64_t> index(rank, 0), step(rank, 1), dst_step(rank, 1);
+  for (size_t i = rank - 1; i > 0; --i) {
+    step[i - 1] = step[i] * dims[i];
+    dst_step[i - 1] = dst_step[i] * out_dims[i];
+  }
+  for (auto d : reduce_dims) {
+    dst_step[d] = 0;
+  }
+  int64_t numel = 1;
+  for (auto d : dims) {
+    numel *= d;
+  }
+  std::fill(out, out + out_numel, T(0));
+  for (int64_t i = 0; i < numel; ++i) {
+    int64_t src = 0, dst = 0;
+    for (size_t j = 0; j < rank; ++j) {
+      src += step[j] * index[j];
+      dst += dst_step[j] * index[j];
+    }
+    out[dst] += x[src];
+    index.back()++;
+    for (size_t j = rank - 1; j > 0; --j) {
+      if (index[j] >= dims[j]) {
+        index[j] = 0;
+        index[j - 1]++;
+      } else {
+        break;
+      }
+    }
+  }
+}
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+std::string ToString(const std::vector<int64_t>& v) {
+  std::string s = "[";
+  for (size_t i = 0; i < v.size(); ++i) {
+    s += (i ? "," : "") + std::to_string(v[i]);
+  }
+  return s + "]";
+}
+
+void Run(const std::vector<int64_t>& dims,
+         const std::vector<int64_t>& reduce_dims,
+         int repeat) {
+  int64_t numel = 1;
+  for (auto d : dims) {
+    numel *= d;
+  }
+  custom_kernel::ReducePlan plan(dims, reduce_dims);
+  int64_t out_numel = plan.out_numel();
+
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> dist(0.f, 1.f);
+  std::vector<float> x(numel);
+  for (auto& v : x) {
+    v = dist(gen);
+  }
+  std::vector<double> x64(x.begin(), x.end());
+  std::vector<double> ref(out_numel);
+  custom_kernel::ReduceCompute<double, double, double>(
+      dims,
+      reduce_dims,
+      x64.data(),
+      ref.data(),
+      custom_kernel::SumReducer<double>());
+
+  std::vector<float> naive(out_numel), engine(out_numel);
+  double naive_s = Seconds(std::max(1, repeat / 4), [&] {
+    NaiveSum(dims, reduce_dims, x.data(), naive.data(), out_numel);
+  });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::ReduceCompute<float, float, float>(
+        dims,
+        reduce_dims,
+        x.data(),
+        engine.data(),
+        custom_kernel::SumReducer<float>());
+  });
+
+  double naive_err = 0, engine_err = 0;
+  for (int64_t i = 0; i < out_numel; ++i) {
+    naive_err = std::max(naive_err, std::abs(naive[i] - ref[i]) / ref[i]);
+    engine_err = std::max(engine_err, std::abs(engine[i] - ref[i]) / ref[i]);
+  }
+  std::printf(
+      "%-22s axes %-8s naive %8.2f ms  engine %7.2f ms  %6.1fx"
+      "  err %.1e -> %.1e\n",
+      ToString(dims).c_str(),
+      ToString(reduce_dims).c_str(),
+      naive_s * 1e3,
+      engine_s * 1e3,
+      naive_s / engine_s,
+      naive_err,
+      engine_err);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 8;
+  Run({1 << 24}, {0}, repeat);
+  Run({4096, 4096}, {1}, repeat);
+  Run({4096, 4096}, {0}, repeat);
+  Run({64, 512, 512}, {1}, repeat);
+  Run({32, 64, 64, 64}, {0, 2}, repeat);
+  Run({1 << 22, 4}, {0}, repeat);
+  return 0;
+}
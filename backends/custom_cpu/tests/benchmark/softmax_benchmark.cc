@@ -0,0 +1,234 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Float softmax and fused softmax + cross-entropy (forward and backward)
+// through the softmax engine against the loops the kernels used before. The
+// error column is the largest relative error of the softmax against a
+// double-precision reference.
+//
+//   ./softmax_benchmark [repeat]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/softmax.h"
+
+namespace {
+
+// The previous softmax: three passes per row and a heap buffer per row.
+void NaiveSoftmax(
+    const float* in, float* out, int64_t outer, int64_t axis, int64_t inner) {
+  int64_t n = axis * inner;
+  for (int64_t i = 0; i < outer; ++i) {
+    for (int64_t k = 0; k < inner; ++k) {
+      float max_val = in[i * n + k];
+      for (int64_t j = 0; j < axis; ++j) {
+        max_val = std::max(max_val, in[i * n + j * inner + k]);
+      }
+      auto exps = new float[axis];
+      for (int64_t j = 0; j < axis; ++j) {
+        float v = in[i * n + j * inner + k] - max_val;
+        exps[j] = std::exp(std::max(v, -64.f));
+      }
+      float sum = 0;
+      for (int64_t j = 0; j < axis; ++j) {
+        sum += exps[j];
+      }
+      for (int64_t j = 0; j < axis; ++j) {
+        out[i * n + j * inner + k] = exps[j] / sum;
+      }
+      delete[] exps;
+    }
+  }
+}
+
+// The previous cross-entropy forward re-read the probabilities, and its
+// backward copied them before two passes over the gradient.
+void NaiveCrossEntropy(const float* prob,
+                       const int64_t* label,
+                       float* loss,
+                       int64_t rows,
+                       int64_t axis) {
+  for (int64_t r = 0; r < rows; ++r) {
+    loss[r] = -std::log(prob[r * axis + label[r]]);
+  }
+}
+
+void NaiveCrossEntropyGrad(const float* prob,
+                           const int64_t* label,
+                           const float* dy,
+                           float* dx,
+                           int64_t rows,
+                           int64_t axis) {
+  std::copy(prob, prob + rows * axis, dx);
+  for (int64_t r = 0; r < rows; ++r) {
+    for (int64_t j = 0; j < axis; ++j) {
+      dx[r * axis + j] *= dy[r];
+    }
+  }
+  for (int64_t r = 0; r < rows; ++r) {
+    dx[r * axis + label[r]] -= dy[r];
+  }
+}
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+std::string ToString(const std::vector<int64_t>& v) {
+  std::string s = "[";
+  for (size_t i = 0; i < v.size(); ++i) {
+    s += (i ? "," : "") + std::to_string(v[i]);
+  }
+  return s + "]";
+}
+
+double MaxRelError(const std::vector<float>& x,
+                   const std::vector<float>& y,
+                   int64_t outer,
+                   int64_t axis,
+                   int64_t inner) {
+  double err = 0;
+  for (int64_t o = 0; o < outer; ++o) {
+    for (int64_t k = 0; k < inner; ++k) {
+      auto at = [&](int64_t j) { return (o * axis + j) * inner + k; };
+      double m = -INFINITY, s = 0;
+      for (int64_t j = 0; j < axis; ++j) {
+        m = std::max(m, static_cast<double>(x[at(j)]));
+      }
+      for (int64_t j = 0; j < axis; ++j) {
+        s += std::exp(std::max(x[at(j)] - m, -64.0));
+      }
+      for (int64_t j = 0; j < axis; ++j) {
+        double ref = std::exp(std::max(x[at(j)] - m, -64.0)) / s;
+        err = std::max(err, std::abs(y[at(j)] - ref) / ref);
+      }
+    }
+  }
+  return err;
+}
+
+void RunSoftmax(int64_t outer, int64_t axis, int64_t inner, int repeat) {
+  int64_t numel = outer * axis * inner;
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> dist(-10.f, 10.f);
+  std::vector<float> x(numel), naive(numel), engine(numel);
+  for (auto& v : x) {
+    v = dist(gen);
+  }
+  double naive_s = Seconds(std::max(1, repeat / 4), [&] {
+    NaiveSoftmax(x.data(), naive.data(), outer, axis, inner);
+  });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::SoftmaxCompute(x.data(), engine.data(), outer, axis, inner);
+  });
+  std::printf(
+      "softmax %-16s naive %8.3f ms  engine %7.3f ms  %5.1fx"
+      "  err %.1e -> %.1e\n",
+      ToString({outer, axis, inner}).c_str(),
+      naive_s * 1e3,
+      engine_s * 1e3,
+      naive_s / engine_s,
+      MaxRelError(x, naive, outer, axis, inner),
+      MaxRelError(x, engine, outer, axis, inner));
+}
+
+void RunCrossEntropy(int64_t rows, int64_t axis, int repeat) {
+  int64_t numel = rows * axis;
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> dist(-10.f, 10.f);
+  std::vector<float> x(numel), prob(numel), softmax(numel), dx(numel);
+  std::vector<float> loss(rows), fused_loss(rows), dy(rows, 1.f);
+  std::vector<int64_t> label(rows);
+  for (auto& v : x) {
+    v = dist(gen);
+  }
+  for (auto& l : label) {
+    l = gen() % axis;
+  }
+  double naive_s = Seconds(std::max(1, repeat / 4), [&] {
+    NaiveSoftmax(x.data(), prob.data(), rows, axis, 1);
+    NaiveCrossEntropy(prob.data(), label.data(), loss.data(), rows, axis);
+  });
+  double fused_s = Seconds(repeat, [&] {
+    custom_kernel::SoftmaxCrossEntropyCompute(x.data(),
+                                              label.data(),
+                                              softmax.data(),
+                                              fused_loss.data(),
+                                              rows,
+                                              axis,
+                                              1,
+                                              -100);
+  });
+  double loss_err = 0;
+  for (int64_t r = 0; r < rows; ++r) {
+    loss_err = std::max(loss_err,
+                        std::abs(fused_loss[r] - loss[r]) /
+                            static_cast<double>(std::abs(loss[r])));
+  }
+  std::printf(
+      "ce fwd  %-16s naive %8.3f ms  fused  %7.3f ms  %5.1fx"
+      "  loss diff %.1e\n",
+      ToString({rows, axis}).c_str(),
+      naive_s * 1e3,
+      fused_s * 1e3,
+      naive_s / fused_s,
+      loss_err);
+
+  naive_s = Seconds(std::max(1, repeat / 4), [&] {
+    NaiveCrossEntropyGrad(
+        prob.data(), label.data(), dy.data(), dx.data(), rows, axis);
+  });
+  fused_s = Seconds(repeat, [&] {
+    custom_kernel::SoftmaxCrossEntropyGradCompute(softmax.data(),
+                                                  label.data(),
+                                                  dy.data(),
+                                                  dx.data(),
+                                                  rows,
+                                                  axis,
+                                                  1,
+                                                  -100);
+  });
+  std::printf("ce bwd  %-16s naive %8.3f ms  fused  %7.3f ms  %5.1fx\n",
+              ToString({rows, axis}).c_str(),
+              naive_s * 1e3,
+              fused_s * 1e3,
+              naive_s / fused_s);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 8;
+  RunSoftmax(4096, 128, 1, repeat);
+  RunSoftmax(256, 1000, 1, repeat);
+  RunSoftmax(16, 32000, 1, repeat);
+  RunSoftmax(64, 1000, 16, repeat);
+  RunCrossEntropy(256, 1000, repeat);
+  RunCrossEntropy(32, 32000, repeat);
+  RunCrossEntropy(8, 128000, repeat);
+  return 0;
+}
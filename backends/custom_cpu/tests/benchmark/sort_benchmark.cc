@@ -0,0 +1,202 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Row sorts and top-k through the sort engine against the previous argsort
+// loop, which sorted (value, index) pairs one row at a time with a NaN-aware
+// comparator. Before top_k was registered, the k best had to come from a
+// full argsort. Rows hold repeated values and NaNs, and every result is
+// checked against the stable comparison sort.
+//
+//   ./sort_benchmark [repeat]
+
+#include <algorithm>
+#include <chrono>
+#include <cinttypes>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <limits>
+#include <random>
+#include <utility>
+#include <vector>
+
+#include "kernels/funcs/sort.h"
+
+namespace {
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+// The previous FullSort, stable variant.
+template <typename T>
+void NaiveSort(const T* x,
+               int64_t height,
+               int64_t width,
+               bool descending,
+               T* out,
+               int64_t* indices) {
+  for (int64_t i = 0; i < height; ++i) {
+    std::vector<std::pair<T, int64_t>> col_vec;
+    col_vec.reserve(width);
+    for (int64_t j = 0; j < width; ++j) {
+      col_vec.push_back(std::pair<T, int64_t>(x[i * width + j], j));
+    }
+    std::stable_sort(
+        col_vec.begin(),
+        col_vec.end(),
+        [&](const std::pair<T, int64_t>& l, const std::pair<T, int64_t>& r) {
+          if (descending)
+            return (std::isnan(static_cast<double>(l.first)) &&
+                    !std::isnan(static_cast<double>(r.first))) ||
+                   (l.first > r.first);
+          else
+            return (!std::isnan(static_cast<double>(l.first)) &&
+                    std::isnan(static_cast<double>(r.first))) ||
+                   (l.first < r.first);
+        });
+    for (int64_t j = 0; j < width; ++j) {
+      out[i * width + j] = col_vec[j].first;
+      indices[i * width + j] = col_vec[j].second;
+    }
+  }
+}
+
+template <typename T>
+std::vector<T> MakeRows(int64_t numel, uint32_t seed) {
+  std::mt19937 gen(seed);
+  std::uniform_int_distribution<int> dist(-20000, 20000);
+  std::vector<T> x(numel);
+  for (auto& v : x) {
+    // Floats get fractions, and every type gets repeated values.
+    v = static_cast<T>(dist(gen)) / (std::is_integral<T>::value ? 1 : 7);
+  }
+  if (std::numeric_limits<T>::has_quiet_NaN) {
+    for (int64_t i = 0; i < numel; i += 997) {
+      x[i] = std::numeric_limits<T>::quiet_NaN();
+    }
+  }
+  return x;
+}
+
+// Values compare equal when both are NaN.
+template <typename T>
+bool SameValues(const std::vector<T>& a, const std::vector<T>& b) {
+  for (size_t i = 0; i < a.size(); ++i) {
+    if (!(a[i] == b[i] || (a[i] != a[i] && b[i] != b[i]))) {
+      return false;
+    }
+  }
+  return true;
+}
+
+template <typename T>
+bool RunSort(const char* type,
+             int64_t height,
+             int64_t width,
+             bool descending,
+             int repeat) {
+  auto x = MakeRows<T>(height * width, 1);
+  std::vector<T> naive_out(x.size()), out(x.size());
+  std::vector<int64_t> naive_idx(x.size()), idx(x.size());
+  double naive_s = Seconds(repeat, [&] {
+    NaiveSort(x.data(),
+              height,
+              width,
+              descending,
+              naive_out.data(),
+              naive_idx.data());
+  });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::SortRows(
+        x.data(), height, width, descending, out.data(), idx.data());
+  });
+  bool same = SameValues(naive_out, out) && naive_idx == idx;
+  std::printf("argsort %-7s %6" PRId64 " x %-7" PRId64
+              " %-4s  previous %9.3f ms  engine "
+              "%8.3f ms  %6.2fx  %s\n",
+              type,
+              static_cast<int64_t>(height),
+              static_cast<int64_t>(width),
+              descending ? "desc" : "asc",
+              naive_s * 1e3,
+              engine_s * 1e3,
+              naive_s / engine_s,
+              same ? "ok" : "MISMATCH");
+  return same;
+}
+
+template <typename T>
+bool RunTopK(
+    const char* type, int64_t height, int64_t width, int64_t k, int repeat) {
+  auto x = MakeRows<T>(height * width, 2);
+  std::vector<T> sorted(x.size()), out(height * k);
+  std::vector<int64_t> sorted_idx(x.size()), idx(height * k);
+  double naive_s = Seconds(repeat, [&] {
+    NaiveSort(x.data(), height, width, true, sorted.data(), sorted_idx.data());
+  });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::TopKRows(
+        x.data(), height, width, k, true, out.data(), idx.data());
+  });
+  bool same = true;
+  for (int64_t i = 0; i < height && same; ++i) {
+    std::vector<T> ref(sorted.begin() + i * width,
+                       sorted.begin() + i * width + k);
+    std::vector<T> got(out.begin() + i * k, out.begin() + (i + 1) * k);
+    same = SameValues(ref, got) && std::equal(idx.begin() + i * k,
+                                              idx.begin() + (i + 1) * k,
+                                              sorted_idx.begin() + i * width);
+  }
+  std::printf("top_k   %-7s %6" PRId64 " x %-7" PRId64 " k=%-6" PRId64
+              " argsort %9.3f ms  top_k "
+              "%8.3f ms  %6.2fx  %s\n",
+              type,
+              static_cast<int64_t>(height),
+              static_cast<int64_t>(width),
+              static_cast<int64_t>(k),
+              naive_s * 1e3,
+              engine_s * 1e3,
+              naive_s / engine_s,
+              same ? "ok" : "MISMATCH");
+  return same;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 3;
+  bool ok = true;
+  ok &= RunSort<float>("float", 16, 100000, false, repeat);
+  ok &= RunSort<float>("float", 16, 100000, true, repeat);
+  ok &= RunSort<double>("double", 16, 100000, false, repeat);
+  ok &= RunSort<int32_t>("int32", 16, 100000, false, repeat);
+  ok &= RunSort<int64_t>("int64", 16, 100000, true, repeat);
+  ok &= RunSort<float>("float", 8192, 64, false, repeat);
+  ok &= RunSort<float>("float", 2048, 512, true, repeat);
+  for (int64_t k : {1, 50, 1000, 6000, 30000}) {
+    ok &= RunTopK<float>("float", 16, 100000, k, repeat);
+  }
+  ok &= RunTopK<int64_t>("int64", 16, 100000, 50, repeat);
+  ok &= RunTopK<float>("float", 8192, 64, 8, repeat);
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,206 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Scaling of the kernel engines over pools of 1 to N threads, a check that a
+// deterministic pool sums floats to the same bits on every pool size, and a
+// check that an exception thrown by a chunk reaches the caller. N defaults
+// to the number of hardware threads.
+//
+//   ./thread_pool_benchmark [max_threads] [repeat]
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <functional>
+#include <random>
+#include <stdexcept>
+#include <thread>
+#include <vector>
+
+#include "kernels/funcs/broadcast.h"
+#include "kernels/funcs/reduce.h"
+#include "kernels/funcs/softmax.h"
+#include "kernels/funcs/strided_copy.h"
+#include "kernels/funcs/thread_pool.h"
+
+namespace {
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+struct Workload {
+  const char* name;
+  std::function<void()> run;
+};
+
+void RunScaling(const std::vector<Workload>& workloads,
+                int max_threads,
+                int repeat) {
+  std::printf("%-28s", "threads");
+  for (int n = 1; n <= max_threads; ++n) {
+    std::printf("%10d", n);
+  }
+  std::printf("\n");
+  for (const auto& workload : workloads) {
+    std::vector<double> times;
+    for (int n = 1; n <= max_threads; ++n) {
+      custom_kernel::ThreadPool pool(n);
+      custom_kernel::ScopedThreadPool scope(&pool);
+      times.push_back(Seconds(repeat, workload.run));
+    }
+    std::printf("%-28s", workload.name);
+    for (double t : times) {
+      std::printf("%8.2fms", t * 1e3);
+    }
+    std::printf("\n%-28s", "  speedup");
+    for (double t : times) {
+      std::printf("%9.2fx", times[0] / t);
+    }
+    std::printf("\n");
+  }
+}
+
+float DeterministicSum(const std::vector<float>& x, int threads) {
+  custom_kernel::ThreadPool pool(threads, /*deterministic=*/true);
+  custom_kernel::ScopedThreadPool scope(&pool);
+  return custom_kernel::ParallelReduce(
+      0,
+      static_cast<int64_t>(x.size()),
+      4096,
+      0.f,
+      [&](int64_t begin, int64_t end) {
+        float sum = 0;
+        for (int64_t i = begin; i < end; ++i) {
+          sum += x[i];
+        }
+        return sum;
+      },
+      [](float a, float b) { return a + b; });
+}
+
+bool CheckDeterministic(int max_threads) {
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> dist(-1.f, 1.f);
+  std::vector<float> x(1 << 22);
+  for (auto& v : x) {
+    v = dist(gen);
+  }
+  float expected = DeterministicSum(x, 1);
+  bool ok = true;
+  for (int n = 2; n <= std::max(max_threads, 4); ++n) {
+    float sum = DeterministicSum(x, n);
+    ok &= std::memcmp(&sum, &expected, sizeof(float)) == 0;
+  }
+  std::printf("deterministic sum of %zu floats on 1..%d threads: %s\n",
+              x.size(),
+              std::max(max_threads, 4),
+              ok ? "identical" : "MISMATCH");
+  return ok;
+}
+
+// Chunks that throw, on the workers or on the caller, must not take the
+// process down: the exception reaches the caller, and the pool keeps
+// splitting the next jobs across threads.
+bool CheckExceptions(int max_threads) {
+  custom_kernel::ThreadPool pool(std::max(max_threads, 4));
+  custom_kernel::ScopedThreadPool scope(&pool);
+  bool caught = false;
+  try {
+    custom_kernel::ParallelFor(0, 1 << 20, 1, [](int64_t begin, int64_t end) {
+      if (begin > 0) {
+        throw std::runtime_error("chunk failed");
+      }
+    });
+  } catch (const std::runtime_error&) {
+    caught = true;
+  }
+  std::atomic<int> chunks{0};
+  custom_kernel::ParallelFor(
+      0, 1 << 20, 1, [&](int64_t begin, int64_t end) { ++chunks; });
+  bool ok = caught && chunks.load() > 1;
+  std::printf("exception from a chunk: %s, next job in %d chunks: %s\n",
+              caught ? "rethrown" : "LOST",
+              chunks.load(),
+              ok ? "ok" : "FAILED");
+  return ok;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int max_threads = argc > 1
+                        ? std::atoi(argv[1])
+                        : static_cast<int>(std::thread::hardware_concurrency());
+  int repeat = argc > 2 ? std::atoi(argv[2]) : 8;
+  max_threads = std::max(max_threads, 1);
+
+  const int64_t rows = 4096, cols = 4096;
+  std::mt19937 gen(0);
+  std::uniform_real_distribution<float> dist(-10.f, 10.f);
+  std::vector<float> x(rows * cols), y(cols), out(rows * cols);
+  std::vector<float> sums(cols);
+  for (auto& v : x) {
+    v = dist(gen);
+  }
+  for (auto& v : y) {
+    v = dist(gen);
+  }
+  custom_kernel::BroadcastIndexer<2> indexer(
+      {rows, cols}, {{{rows, cols}, {cols}}}, -1);
+
+  std::vector<Workload> workloads = {
+      {"add [4096,4096]+[4096]",
+       [&] {
+         custom_kernel::BroadcastCompute(
+             indexer,
+             out.data(),
+             [](float a, float b) { return a + b; },
+             x.data(),
+             y.data());
+       }},
+      {"sum [4096,4096] axis 0",
+       [&] {
+         custom_kernel::ReduceCompute<float, float, float>(
+             {rows, cols},
+             {0},
+             x.data(),
+             sums.data(),
+             custom_kernel::SumReducer<float>());
+       }},
+      {"transpose [4096,4096]",
+       [&] {
+         custom_kernel::TransposeCompute<float>(
+             {rows, cols}, {1, 0}, x.data(), out.data());
+       }},
+      {"softmax [4096,4096] axis 1",
+       [&] {
+         custom_kernel::SoftmaxCompute(x.data(), out.data(), rows, cols, 1);
+       }},
+  };
+  RunScaling(workloads, max_threads, repeat);
+  bool ok = CheckDeterministic(max_threads);
+  ok = CheckExceptions(max_threads) && ok;
+  return ok ? 0 : 1;
+}
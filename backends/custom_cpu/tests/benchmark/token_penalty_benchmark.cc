@@ -0,0 +1,251 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Per decode step cost of the token penalties over vocab size x generated
+// length. The dense path is the NPU op: copy the logits, count every
+// pre_ids row into a zeroed vocab-sized tensor and rewrite the row. The
+// sparse path keeps the repeat counts in a TokenCounter, reads only the
+// token appended this step and touches only the logits of generated
+// tokens, in place. Both see the same logits every step and must agree;
+// one slot switches to a new sequence halfway through to exercise the
+// reset of its counts. A last check alternates two generation loops on a
+// TokenCounterPool and reuses one of their buffers for a new generation.
+//
+//   ./token_penalty_benchmark [steps]
+
+#include <chrono>
+#include <cinttypes>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+#include "kernels/funcs/llama_infer.h"
+
+namespace {
+
+constexpr int64_t kBatch = 8;
+
+double Now() {
+  return std::chrono::duration<double>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+// A skewed draw, so that some tokens repeat many times.
+int64_t DrawToken(std::mt19937* gen, int64_t vocab) {
+  return (*gen)() % ((*gen)() % 2 ? 64 : vocab);
+}
+
+bool Run(int64_t vocab, int64_t generated, int steps, bool temperature) {
+  std::mt19937 gen(vocab + generated);
+  std::uniform_real_distribution<float> dist(-4.f, 4.f);
+  const int64_t pre_len = generated + steps;
+  std::vector<int64_t> pre_ids(kBatch * pre_len, -1);
+  std::vector<int64_t> cur_len(kBatch, generated), min_len(kBatch, 0);
+  for (int64_t b = 0; b < kBatch; ++b) {
+    for (int64_t i = 0; i < generated; ++i) {
+      pre_ids[b * pre_len + i] = DrawToken(&gen, vocab);
+    }
+  }
+  std::vector<float> alpha(kBatch, 1.2f), beta(kBatch, 0.1f),
+      gamma(kBatch, 0.3f), temp(kBatch, 0.7f);
+  const float* temps = temperature ? temp.data() : nullptr;
+  const std::vector<int64_t> eos = {2}, bad = {5, 9};
+  std::vector<float> logits(kBatch * vocab), dense(kBatch * vocab),
+      sparse(kBatch * vocab);
+
+  custom_kernel::TokenCounter counter;
+  double dense_s = 0, sparse_s = 0, err = 0;
+  for (int s = -1; s < steps; ++s) {
+    if (s >= 0) {
+      for (int64_t b = 0; b < kBatch; ++b) {
+        pre_ids[b * pre_len + cur_len[b]++] = DrawToken(&gen, vocab);
+      }
+    }
+    if (s == steps / 2) {
+      // Slot 0 takes a new sequence with a few tokens of its own.
+      std::fill_n(pre_ids.begin(), pre_len, -1);
+      for (int64_t i = 0; i < 3; ++i) {
+        pre_ids[i] = DrawToken(&gen, vocab);
+      }
+      cur_len[0] = 3;
+      min_len[0] = 8;
+    }
+    for (auto& e : logits) {
+      e = dist(gen);
+    }
+    sparse = logits;
+    double start = Now();
+    dense = logits;
+    custom_kernel::TokenPenaltyCompute(kBatch,
+                                       vocab,
+                                       pre_ids.data(),
+                                       pre_len,
+                                       dense.data(),
+                                       alpha.data(),
+                                       beta.data(),
+                                       gamma.data(),
+                                       temps,
+                                       bad.data(),
+                                       bad.size(),
+                                       cur_len.data(),
+                                       min_len.data(),
+                                       eos.data(),
+                                       eos.size());
+    double mid = Now();
+    custom_kernel::SparseTokenPenaltyCompute(&counter,
+                                             kBatch,
+                                             vocab,
+                                             pre_ids.data(),
+                                             pre_len,
+                                             sparse.data(),
+                                             alpha.data(),
+                                             beta.data(),
+                                             gamma.data(),
+                                             temps,
+                                             bad.data(),
+                                             bad.size(),
+                                             cur_len.data(),
+                                             min_len.data(),
+                                             eos.data(),
+                                             eos.size());
+    double end = Now();
+    // The first call counts the whole prompt; steps are timed after it.
+    if (s >= 0) {
+      dense_s += mid - start;
+      sparse_s += end - mid;
+    }
+    for (size_t i = 0; i < dense.size(); ++i) {
+      err = std::max<double>(err, std::abs(dense[i] - sparse[i]));
+    }
+  }
+  const bool ok = err == 0;
+  std::printf("vocab %6" PRId64 "  generated %5" PRId64
+              "%s  dense %8.1f us  sparse %8.1f us"
+              "  %7.1fx  %s\n",
+              static_cast<int64_t>(vocab),
+              static_cast<int64_t>(generated),
+              temperature ? "  temperature" : "             ",
+              dense_s / steps * 1e6,
+              sparse_s / steps * 1e6,
+              dense_s / sparse_s,
+              ok ? "ok" : "MISMATCH");
+  return ok;
+}
+
+// Penalizes one step of `pre_ids` with the dense and the sparse path and
+// returns whether they agree.
+bool Step(custom_kernel::TokenCounterPool* pool,
+          const std::vector<int64_t>& pre_ids,
+          const std::vector<int64_t>& cur_len,
+          int64_t vocab,
+          std::mt19937* gen) {
+  const int64_t pre_len = pre_ids.size() / kBatch;
+  std::uniform_real_distribution<float> dist(-4.f, 4.f);
+  std::vector<float> dense(kBatch * vocab);
+  for (auto& e : dense) {
+    e = dist(*gen);
+  }
+  std::vector<float> sparse = dense;
+  const std::vector<float> alpha(kBatch, 1.2f), beta(kBatch, 0.1f),
+      gamma(kBatch, 0.3f);
+  const std::vector<int64_t> min_len(kBatch, 0), eos = {2};
+  custom_kernel::TokenPenaltyCompute(kBatch,
+                                     vocab,
+                                     pre_ids.data(),
+                                     pre_len,
+                                     dense.data(),
+                                     alpha.data(),
+                                     beta.data(),
+                                     gamma.data(),
+                                     nullptr,
+                                     nullptr,
+                                     0,
+                                     cur_len.data(),
+                                     min_len.data(),
+                                     eos.data(),
+                                     eos.size());
+  custom_kernel::SparseTokenPenaltyCompute(pool->Get(pre_ids.data()),
+                                           kBatch,
+                                           vocab,
+                                           pre_ids.data(),
+                                           pre_len,
+                                           sparse.data(),
+                                           alpha.data(),
+                                           beta.data(),
+                                           gamma.data(),
+                                           nullptr,
+                                           nullptr,
+                                           0,
+                                           cur_len.data(),
+                                           min_len.data(),
+                                           eos.data(),
+                                           eos.size());
+  return dense == sparse;
+}
+
+// Two generation loops alternate on one pool, then the first buffer is
+// refilled with a generation that keeps its first and last counted ids but
+// grew by four ids in one step, which only the cur_len check tells apart.
+bool RunReuse() {
+  const int64_t vocab = 1000, pre_len = 64;
+  std::mt19937 gen(7);
+  std::vector<int64_t> a(kBatch * pre_len, -1), b(kBatch * pre_len, -1);
+  std::vector<int64_t> len_a(kBatch, 0), len_b(kBatch, 0);
+  custom_kernel::TokenCounterPool pool;
+  bool ok = true;
+  for (int s = 0; s < 16; ++s) {
+    for (int64_t r = 0; r < kBatch; ++r) {
+      a[r * pre_len + len_a[r]++] = DrawToken(&gen, vocab);
+      b[r * pre_len + len_b[r]++] = DrawToken(&gen, vocab);
+    }
+    ok = Step(&pool, a, len_a, vocab, &gen) && ok;
+    ok = Step(&pool, b, len_b, vocab, &gen) && ok;
+  }
+  for (int64_t r = 0; r < kBatch; ++r) {
+    int64_t* row = a.data() + r * pre_len;
+    const int64_t last = row[len_a[r] - 1];
+    for (int64_t i = 1; i < len_a[r] - 1; ++i) {
+      row[i] = DrawToken(&gen, vocab);
+    }
+    row[len_a[r] - 1] = last;
+    for (int i = 0; i < 4; ++i) {
+      row[len_a[r] + i] = DrawToken(&gen, vocab);
+    }
+    ++len_a[r];
+  }
+  ok = Step(&pool, a, len_a, vocab, &gen) && ok;
+  std::printf("two generation loops and a reused buffer  %s\n",
+              ok ? "ok" : "MISMATCH");
+  return ok;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  const int steps = argc > 1 ? std::atoi(argv[1]) : 32;
+  bool ok = true;
+  for (int64_t vocab : {32000, 128000, 256000}) {
+    for (int64_t generated : {16, 256, 4096}) {
+      ok = Run(vocab, generated, steps, false) && ok;
+    }
+  }
+  for (int64_t generated : {16, 4096}) {
+    ok = Run(128000, generated, steps, true) && ok;
+  }
+  ok = RunReuse() && ok;
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,186 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Float transpose and strided copy through the strided-copy engine against
+// the per-element index loops the kernels used before. Bandwidth counts the
+// bytes read plus the bytes written; every result is checked against the
+// previous loop.
+//
+//   ./transpose_benchmark [repeat]
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <string>
+#include <vector>
+
+#include "kernels/funcs/strided_copy.h"
+
+namespace {
+
+// The previous strided copy: one div/mod chain per element over the source
+// strides.
+void NaiveStridedCopy(const std::vector<int64_t>& dims,
+                      const float* src,
+                      const std::vector<int64_t>& src_strides,
+                      float* dst,
+                      const std::vector<int64_t>& dst_strides) {
+  int64_t numel = 1;
+  for (auto d : dims) {
+    numel *= d;
+  }
+  int rank = static_cast<int>(dims.size());
+  for (int64_t i = 0; i < numel; ++i) {
+    int64_t src_offset = 0, dst_offset = 0, index = i;
+    for (int d = rank - 1; d >= 0; --d) {
+      src_offset += index % dims[d] * src_strides[d];
+      dst_offset += index % dims[d] * dst_strides[d];
+      index /= dims[d];
+    }
+    dst[dst_offset] = src[src_offset];
+  }
+}
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+template <typename T>
+std::string ToString(const std::vector<T>& v) {
+  std::string s = "[";
+  for (size_t i = 0; i < v.size(); ++i) {
+    s += (i ? "," : "") + std::to_string(v[i]);
+  }
+  return s + "]";
+}
+
+void Report(const char* name,
+            const std::string& shape,
+            const std::string& how,
+            int64_t numel,
+            double naive_s,
+            double engine_s,
+            bool ok) {
+  double bytes = 2.0 * numel * sizeof(float);
+  std::printf(
+      "%-10s %-20s %-12s naive %6.2f GB/s  engine %6.2f GB/s  %5.1fx"
+      "  %s\n",
+      name,
+      shape.c_str(),
+      how.c_str(),
+      bytes / naive_s * 1e-9,
+      bytes / engine_s * 1e-9,
+      naive_s / engine_s,
+      ok ? "ok" : "MISMATCH");
+}
+
+bool RunTranspose(const char* name,
+                  const std::vector<int64_t>& dims,
+                  const std::vector<int>& axis,
+                  int repeat) {
+  int64_t numel = 1;
+  for (auto d : dims) {
+    numel *= d;
+  }
+  std::vector<float> x(numel), naive(numel), engine(numel);
+  for (int64_t i = 0; i < numel; ++i) {
+    x[i] = static_cast<float>(i);
+  }
+  auto x_strides = custom_kernel::ContiguousStrides(dims);
+  std::vector<int64_t> out_dims, src_strides;
+  for (auto a : axis) {
+    out_dims.push_back(dims[a]);
+    src_strides.push_back(x_strides[a]);
+  }
+  auto out_strides = custom_kernel::ContiguousStrides(out_dims);
+
+  double naive_s = Seconds(std::max(1, repeat / 4), [&] {
+    NaiveStridedCopy(
+        out_dims, x.data(), src_strides, naive.data(), out_strides);
+  });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::TransposeCompute(dims, axis, x.data(), engine.data());
+  });
+  bool ok = naive == engine;
+  Report(name,
+         ToString(dims),
+         "axis " + ToString(axis),
+         numel,
+         naive_s,
+         engine_s,
+         ok);
+  return ok;
+}
+
+// Materializes x[..., begin:begin + extent] along the last dim.
+bool RunSlice(const std::vector<int64_t>& dims, int64_t extent, int repeat) {
+  int64_t numel = 1, src_numel = 1;
+  for (auto d : dims) {
+    src_numel *= d;
+  }
+  std::vector<int64_t> view(dims);
+  view.back() = extent;
+  for (auto d : view) {
+    numel *= d;
+  }
+  std::vector<float> x(src_numel), naive(numel), engine(numel);
+  for (int64_t i = 0; i < src_numel; ++i) {
+    x[i] = static_cast<float>(i);
+  }
+  auto src_strides = custom_kernel::ContiguousStrides(dims);
+  auto dst_strides = custom_kernel::ContiguousStrides(view);
+  const float* src = x.data() + 1;
+
+  double naive_s = Seconds(std::max(1, repeat / 4), [&] {
+    NaiveStridedCopy(view, src, src_strides, naive.data(), dst_strides);
+  });
+  double engine_s = Seconds(repeat, [&] {
+    custom_kernel::StridedCopyCompute(
+        view, src, src_strides, engine.data(), dst_strides);
+  });
+  bool ok = naive == engine;
+  Report("slice",
+         ToString(dims),
+         "last " + std::to_string(extent),
+         numel,
+         naive_s,
+         engine_s,
+         ok);
+  return ok;
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 8;
+  bool ok = true;
+  ok &= RunTranspose("2-D", {4096, 4096}, {1, 0}, repeat);
+  ok &= RunTranspose("2-D", {1 << 20, 3}, {1, 0}, repeat);
+  ok &= RunTranspose("NCHW>NHWC", {32, 64, 56, 56}, {0, 2, 3, 1}, repeat);
+  ok &= RunTranspose("NHWC>NCHW", {32, 56, 56, 64}, {0, 3, 1, 2}, repeat);
+  ok &= RunTranspose("NCHW>NHWC", {64, 3, 224, 224}, {0, 2, 3, 1}, repeat);
+  ok &= RunTranspose("BSHD>BHSD", {8, 1024, 16, 64}, {0, 2, 1, 3}, repeat);
+  ok &= RunTranspose("BHSD>BHDS", {8, 16, 1024, 64}, {0, 1, 3, 2}, repeat);
+  ok &= RunTranspose("5-D", {4, 8, 16, 32, 64}, {4, 2, 0, 3, 1}, repeat);
+  ok &= RunSlice({4096, 4096}, 2048, repeat);
+  ok &= RunSlice({1 << 20, 8}, 3, repeat);
+  return ok ? 0 : 1;
+}
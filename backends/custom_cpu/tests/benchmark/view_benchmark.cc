@@ -0,0 +1,210 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Indexing chains as the dense kernels run them, copying the whole tensor
+// at every slice, reshape and transpose, against the stride views of the
+// STRIDED kernels, which copy once when the consumer asks for contiguous
+// data. Both results are checked to match.
+//
+//   ./view_benchmark [repeat]
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <vector>
+
+#include "kernels/funcs/strided_copy.h"
+
+namespace {
+
+template <typename F>
+double Seconds(int repeat, F&& f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < repeat; ++i) {
+    f();
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  return elapsed.count() / repeat;
+}
+
+int64_t Numel(const std::vector<int64_t>& dims) {
+  int64_t numel = 1;
+  for (auto d : dims) {
+    numel *= d;
+  }
+  return numel;
+}
+
+// The metadata of a tensor the STRIDED kernels produce; offset is in
+// elements.
+struct View {
+  std::vector<int64_t> dims;
+  std::vector<int64_t> strides;
+  int64_t offset;
+};
+
+View Slice(View v, int axis, int64_t start, int64_t end) {
+  v.offset += start * v.strides[axis];
+  v.dims[axis] = end - start;
+  return v;
+}
+
+View Transpose(const View& v, const std::vector<int>& perm) {
+  View out = v;
+  for (size_t i = 0; i < perm.size(); ++i) {
+    out.dims[i] = v.dims[perm[i]];
+    out.strides[i] = v.strides[perm[i]];
+  }
+  return out;
+}
+
+// Reshapes in place when the strides allow it, else materializes `v` into
+// `scratch` as the STRIDED reshape does.
+View Reshape(const View& v,
+             const std::vector<int64_t>& dims,
+             const float* data,
+             std::vector<float>* scratch,
+             const float** out_data) {
+  View out = {dims, {}, v.offset};
+  if (custom_kernel::ReshapeStrides(v.dims, v.strides, dims, &out.strides)) {
+    *out_data = data;
+    return out;
+  }
+  scratch->resize(Numel(dims));
+  custom_kernel::StridedCopyCompute(v.dims,
+                                    data + v.offset,
+                                    v.strides,
+                                    scratch->data(),
+                                    custom_kernel::ContiguousStrides(v.dims));
+  *out_data = scratch->data();
+  return {dims, custom_kernel::ContiguousStrides(dims), 0};
+}
+
+// The contiguous copy a consumer of a view triggers.
+void Materialize(const View& v, const float* data, float* out) {
+  custom_kernel::StridedCopyCompute(v.dims,
+                                    data + v.offset,
+                                    v.strides,
+                                    out,
+                                    custom_kernel::ContiguousStrides(v.dims));
+}
+
+// Copies the dense slice [start, end) of `axis` out of a contiguous tensor.
+std::vector<int64_t> CopySlice(const std::vector<int64_t>& dims,
+                               int axis,
+                               int64_t start,
+                               int64_t end,
+                               const float* src,
+                               float* dst) {
+  View v = Slice(
+      {dims, custom_kernel::ContiguousStrides(dims), 0}, axis, start, end);
+  Materialize(v, src, dst);
+  return v.dims;
+}
+
+std::vector<int64_t> CopyTranspose(const std::vector<int64_t>& dims,
+                                   const std::vector<int>& perm,
+                                   const float* src,
+                                   float* dst) {
+  custom_kernel::TransposeCompute(dims, perm, src, dst);
+  return Transpose({dims, dims, 0}, perm).dims;
+}
+
+bool Report(const char* name,
+            int copies,
+            double copy_s,
+            double view_s,
+            const std::vector<float>& a,
+            const std::vector<float>& b) {
+  bool same = a.size() == b.size() &&
+              std::memcmp(a.data(), b.data(), a.size() * sizeof(float)) == 0;
+  std::printf(
+      "%-28s copy (%d copies) %8.3f ms  view (1 copy) %8.3f ms  "
+      "%5.2fx  %s\n",
+      name,
+      copies,
+      copy_s * 1e3,
+      view_s * 1e3,
+      copy_s / view_s,
+      same ? "identical" : "MISMATCH");
+  return same;
+}
+
+// Reads the first `seq` tokens of a [max_seq, heads, head_dim] KV cache as
+// [heads, seq, head_dim] for attention.
+bool RunKVCache(
+    int64_t max_seq, int64_t heads, int64_t head_dim, int64_t seq, int repeat) {
+  std::vector<int64_t> dims = {max_seq, heads, head_dim};
+  std::vector<float> cache(Numel(dims));
+  for (size_t i = 0; i < cache.size(); ++i) {
+    cache[i] = static_cast<float>(i % 1021);
+  }
+  std::vector<float> sliced(seq * heads * head_dim);
+  std::vector<float> copy_out(sliced.size()), view_out(sliced.size());
+  double copy_s = Seconds(repeat, [&] {
+    auto s = CopySlice(dims, 0, 0, seq, cache.data(), sliced.data());
+    CopyTranspose(s, {1, 0, 2}, sliced.data(), copy_out.data());
+  });
+  double view_s = Seconds(repeat, [&] {
+    View v = {dims, custom_kernel::ContiguousStrides(dims), 0};
+    v = Transpose(Slice(v, 0, 0, seq), {1, 0, 2});
+    Materialize(v, cache.data(), view_out.data());
+  });
+  return Report(
+      "kv-cache slice+transpose", 2, copy_s, view_s, copy_out, view_out);
+}
+
+// Splits the query out of a fused [seq, 3 * heads * head_dim] projection
+// into [heads, seq, head_dim].
+bool RunHeadSplit(int64_t seq, int64_t heads, int64_t head_dim, int repeat) {
+  const int64_t hidden = heads * head_dim;
+  std::vector<int64_t> dims = {seq, 3 * hidden};
+  std::vector<float> qkv(Numel(dims));
+  for (size_t i = 0; i < qkv.size(); ++i) {
+    qkv[i] = static_cast<float>(i % 1021);
+  }
+  std::vector<float> q(seq * hidden), reshaped(q.size());
+  std::vector<float> copy_out(q.size()), view_out(q.size()), scratch;
+  double copy_s = Seconds(repeat, [&] {
+    CopySlice(dims, 1, 0, hidden, qkv.data(), q.data());
+    std::memcpy(reshaped.data(), q.data(), q.size() * sizeof(float));
+    CopyTranspose(
+        {seq, heads, head_dim}, {1, 0, 2}, reshaped.data(), copy_out.data());
+  });
+  double view_s = Seconds(repeat, [&] {
+    View v = {dims, custom_kernel::ContiguousStrides(dims), 0};
+    const float* data = nullptr;
+    v = Reshape(Slice(v, 1, 0, hidden),
+                {seq, heads, head_dim},
+                qkv.data(),
+                &scratch,
+                &data);
+    Materialize(Transpose(v, {1, 0, 2}), data, view_out.data());
+  });
+  return Report(
+      "qkv slice+reshape+transpose", 3, copy_s, view_s, copy_out, view_out);
+}
+
+}  // namespace
+
+int main(int argc, char** argv) {
+  int repeat = argc > 1 ? std::atoi(argv[1]) : 8;
+  bool ok = RunKVCache(4096, 32, 128, 1024, repeat);
+  ok &= RunKVCache(4096, 32, 128, 3968, repeat);
+  ok &= RunHeadSplit(2048, 32, 128, repeat);
+  return ok ? 0 : 1;
+}
@@ -0,0 +1,150 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+def adam_step(inputs, attributes):
+    param = inputs["Param"]
+    grad = inputs["Grad"]
+    moment1 = inputs["Moment1"]
+    moment2 = inputs["Moment2"]
+    lr = inputs["LearningRate"]
+    beta1_pow = inputs["Beta1Pow"]
+    beta2_pow = inputs["Beta2Pow"]
+
+    epsilon = attributes["epsilon"]
+    beta1 = attributes["beta1"]
+    beta2 = attributes["beta2"]
+
+    if attributes.get("with_decay", False):
+        lr = lr * attributes.get("lr_ratio", 1.0)
+        param = param * (1.0 - lr * attributes["coeff"])
+
+    moment1_out = beta1 * moment1 + (1 - beta1) * grad
+    moment2_out = beta2 * moment2 + (1 - beta2) * np.square(grad)
+    lr_t = lr * np.sqrt(1 - beta2_pow) / (1 - beta1_pow)
+    param_out = param - lr_t * (
+        moment1_out / (np.sqrt(moment2_out) + epsilon * np.sqrt(1 - beta2_pow))
+    )
+    return param_out, moment1_out, moment2_out
+
+
+class TestAdamOp(OpTest):
+    def setUp(self):
+        self.op_type = "adam"
+        self.init_attrs()
+        param = np.random.uniform(-1, 1, (102, 105)).astype("float32")
+        grad = np.random.uniform(-1, 1, (102, 105)).astype("float32")
+        moment1 = np.random.uniform(-1, 1, (102, 105)).astype("float32")
+        moment2 = np.random.random((102, 105)).astype("float32")
+        beta1_pow = self.attrs["beta1"] ** 10
+        beta2_pow = self.attrs["beta2"] ** 10
+
+        self.inputs = {
+            "Param": param,
+            "Grad": grad,
+            "Moment1": moment1,
+            "Moment2": moment2,
+            "LearningRate": np.array([0.004]).astype("float32"),
+            "Beta1Pow": np.array([beta1_pow]).astype("float32"),
+            "Beta2Pow": np.array([beta2_pow]).astype("float32"),
+        }
+        param_out, moment1_out, moment2_out = adam_step(self.inputs, self.attrs)
+        self.outputs = {
+            "Moment1Out": moment1_out,
+            "Moment2Out": moment2_out,
+            "ParamOut": param_out,
+            "Beta1PowOut": np.array([beta1_pow]).astype("float32")
+            * self.attrs["beta1"],
+            "Beta2PowOut": np.array([beta2_pow]).astype("float32")
+            * self.attrs["beta2"],
+        }
+
+    def init_attrs(self):
+        self.attrs = {"epsilon": 1e-4, "beta1": 0.78, "beta2": 0.836}
+
+    def test_check_output(self):
+        self.check_output(atol=1e-5)
+
+
+class TestAdamWOp(TestAdamOp):
+    def setUp(self):
+        super().setUp()
+        self.op_type = "adamw"
+
+    def init_attrs(self):
+        self.attrs = {
+            "epsilon": 1e-4,
+            "beta1": 0.78,
+            "beta2": 0.836,
+            "coeff": 0.5,
+            "lr_ratio": 0.5,
+            "with_decay": True,
+        }
+
+
+class TestMergedAdam(unittest.TestCase):
+    # merged_adam, through use_multi_tensor, must match one adam per param.
+    def run_adam(self, use_multi_tensor):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        paddle.seed(10)
+        np.random.seed(10)
+        shapes = [(2, 3), (17,), (64, 33), (1,)]
+        params = [
+            paddle.create_parameter(
+                shape=list(s),
+                dtype="float32",
+                default_initializer=paddle.nn.initializer.Assign(
+                    np.random.random(s).astype("float32")
+                ),
+            )
+            for s in shapes
+        ]
+        grads = [np.random.random(s).astype("float32") for s in shapes]
+        opt = paddle.optimizer.Adam(
+            learning_rate=0.01,
+            parameters=params,
+            use_multi_tensor=use_multi_tensor,
+        )
+        for _ in range(3):
+            for p, g in zip(params, grads):
+                p._set_grad_ivar(paddle.to_tensor(g))
+            opt.step()
+        out = [p.numpy() for p in params]
+        paddle.enable_static()
+        return out
+
+    def test_merged_adam(self):
+        for single, merged in zip(self.run_adam(False), self.run_adam(True)):
+            np.testing.assert_allclose(single, merged, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    paddle.enable_static()
+    unittest.main()
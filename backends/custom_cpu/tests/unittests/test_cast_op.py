@@ -115,6 +115,24 @@ class TestCastOpFp32ToBf16(OpTest):
         self.check_output()
 
 
+class TestCastOpInt64ToFp64(OpTest):
+    # Integers above 2**24 are not exact in float32, so the cast must not
+    # go through it.
+    def setUp(self):
+        ipt = np.random.randint(2**40, 2**50, size=[10, 10]).astype("int64")
+        self.inputs = {"X": ipt}
+        self.outputs = {"Out": ipt.astype("float64")}
+        self.attrs = {
+            "in_dtype": int(core.VarDesc.VarType.INT64),
+            "out_dtype": int(core.VarDesc.VarType.FP64),
+        }
+        self.op_type = "cast"
+        self.__class__.no_need_check_grad = True
+
+    def test_check_output(self):
+        self.check_output(atol=0)
+
+
 class TestCastOpError(unittest.TestCase):
     def test_errors(self):
         with program_guard(Program(), Program()):
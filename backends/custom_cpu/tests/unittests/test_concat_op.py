@@ -74,5 +74,27 @@ class TestConcatOp2(TestConcatOp):
         self.axis = 1
 
 
+class TestConcatOpAxis0(TestConcatOp):
+    # A concat along axis 0 is a single row per input.
+    def init_test_data(self):
+        self.x0 = np.random.random((300, 130)).astype(self.dtype)
+        self.x1 = np.random.random((1, 130)).astype(self.dtype)
+        self.x2 = np.random.random((257, 130)).astype(self.dtype)
+        self.axis = 0
+
+
+class TestConcatOpNarrowRows(TestConcatOp):
+    # Many narrow rows, one input empty along the axis.
+    def init_test_data(self):
+        self.x0 = np.random.random((4000, 3)).astype(self.dtype)
+        self.x1 = np.random.random((4000, 0)).astype(self.dtype)
+        self.x2 = np.random.random((4000, 5)).astype(self.dtype)
+        self.axis = -1
+
+    def test_check_grad(self):
+        self.check_grad(["x0"], "Out", check_eager=True)
+        self.check_grad(["x2"], "Out", check_eager=True)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,245 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+def conv2d_naive(x, w, strides, paddings, dilations, groups):
+    # NCHW; paddings are top, bottom, left, right.
+    n, c, h, wd = x.shape
+    oc, cg, kh, kw = w.shape
+    sh, sw = strides
+    dh, dw = dilations
+    xp = np.pad(
+        x, ((0, 0), (0, 0), (paddings[0], paddings[1]), (paddings[2], paddings[3]))
+    )
+    oh = (xp.shape[2] - dh * (kh - 1) - 1) // sh + 1
+    ow = (xp.shape[3] - dw * (kw - 1) - 1) // sw + 1
+    out = np.zeros((n, oc, oh, ow), dtype=np.float64)
+    ocg = oc // groups
+    for g in range(groups):
+        xg = xp[:, g * cg : (g + 1) * cg]
+        wg = w[g * ocg : (g + 1) * ocg]
+        for i in range(kh):
+            for j in range(kw):
+                patch = xg[
+                    :,
+                    :,
+                    i * dh : i * dh + sh * (oh - 1) + 1 : sh,
+                    j * dw : j * dw + sw * (ow - 1) + 1 : sw,
+                ]
+                out[:, g * ocg : (g + 1) * ocg] += np.einsum(
+                    "nchw,oc->nohw", patch, wg[:, :, i, j]
+                )
+    return out.astype(x.dtype)
+
+
+def conv2d_transpose_naive(x, w, strides, paddings, dilations, groups):
+    # NCHW; w is [in_channels, out_channels / groups, kh, kw].
+    n, c, h, wd = x.shape
+    _, ocg, kh, kw = w.shape
+    sh, sw = strides
+    dh, dw = dilations
+    full_h = (h - 1) * sh + dh * (kh - 1) + 1
+    full_w = (wd - 1) * sw + dw * (kw - 1) + 1
+    out = np.zeros((n, ocg * groups, full_h, full_w), dtype=np.float64)
+    cg = c // groups
+    for g in range(groups):
+        xg = x[:, g * cg : (g + 1) * cg]
+        wg = w[g * cg : (g + 1) * cg]
+        for i in range(kh):
+            for j in range(kw):
+                out[
+                    :,
+                    g * ocg : (g + 1) * ocg,
+                    i * dh : i * dh + sh * (h - 1) + 1 : sh,
+                    j * dw : j * dw + sw * (wd - 1) + 1 : sw,
+                ] += np.einsum("nchw,co->nohw", xg, wg[:, :, i, j])
+    out = out[
+        :,
+        :,
+        paddings[0] : full_h - paddings[1],
+        paddings[2] : full_w - paddings[3],
+    ]
+    return out.astype(x.dtype)
+
+
+class TestConv2DOp(OpTest):
+    def setUp(self):
+        self.op_type = "conv2d"
+        self.dtype = "float64"
+        self.data_format = "NCHW"
+        self.strides = [1, 1]
+        self.paddings = [0, 0]
+        self.dilations = [1, 1]
+        self.groups = 1
+        self.init_test_case()
+        x = np.random.uniform(-1, 1, self.input_size).astype(self.dtype)
+        w = np.random.uniform(-1, 1, self.filter_size).astype(self.dtype)
+        pads = [self.paddings[0], self.paddings[0], self.paddings[1], self.paddings[1]]
+        out = conv2d_naive(x, w, self.strides, pads, self.dilations, self.groups)
+        if self.data_format == "NHWC":
+            x = x.transpose(0, 2, 3, 1)
+            out = out.transpose(0, 2, 3, 1)
+        self.inputs = {"Input": x, "Filter": w}
+        self.attrs = {
+            "strides": self.strides,
+            "paddings": self.paddings,
+            "dilations": self.dilations,
+            "groups": self.groups,
+            "data_format": self.data_format,
+        }
+        self.outputs = {"Output": out}
+
+    def init_test_case(self):
+        self.input_size = [2, 3, 5, 5]
+        self.filter_size = [6, 3, 3, 3]
+        self.paddings = [1, 1]
+
+    def test_check_output(self):
+        self.check_output()
+
+    def test_check_grad(self):
+        self.check_grad(["Input", "Filter"], "Output", max_relative_error=0.02)
+
+
+class TestWithStrideDilation(TestConv2DOp):
+    def init_test_case(self):
+        self.input_size = [2, 3, 11, 11]
+        self.filter_size = [4, 3, 3, 3]
+        self.strides = [2, 2]
+        self.paddings = [2, 1]
+        self.dilations = [2, 2]
+
+
+class TestWithGroup(TestConv2DOp):
+    def init_test_case(self):
+        self.input_size = [2, 4, 6, 6]
+        self.filter_size = [6, 2, 3, 3]
+        self.paddings = [1, 1]
+        self.groups = 2
+
+
+class TestWith1x1(TestConv2DOp):
+    def init_test_case(self):
+        self.input_size = [2, 6, 5, 5]
+        self.filter_size = [4, 6, 1, 1]
+
+
+class TestWithNHWC(TestConv2DOp):
+    def init_test_case(self):
+        self.input_size = [2, 3, 7, 7]
+        self.filter_size = [6, 3, 3, 3]
+        self.strides = [2, 2]
+        self.paddings = [1, 1]
+        self.data_format = "NHWC"
+
+
+# 3x3 stride 1 with 16 channels and 64 output tiles goes through Winograd.
+class TestWinograd(TestConv2DOp):
+    def init_test_case(self):
+        self.input_size = [1, 16, 16, 16]
+        self.filter_size = [16, 16, 3, 3]
+        self.paddings = [1, 1]
+        self.dtype = "float32"
+
+    def test_check_grad(self):
+        pass
+
+
+class TestWinogradNHWC(TestWinograd):
+    def init_test_case(self):
+        super().init_test_case()
+        self.data_format = "NHWC"
+
+
+class TestDepthwiseConv2DOp(TestConv2DOp):
+    def init_test_case(self):
+        self.op_type = "depthwise_conv2d"
+        self.input_size = [2, 4, 7, 7]
+        self.filter_size = [8, 1, 3, 3]
+        self.strides = [2, 2]
+        self.paddings = [1, 1]
+        self.groups = 4
+
+
+class TestDepthwiseConv2DOpNHWC(TestDepthwiseConv2DOp):
+    def init_test_case(self):
+        super().init_test_case()
+        self.data_format = "NHWC"
+
+
+class TestConv2DTransposeOp(OpTest):
+    def setUp(self):
+        self.op_type = "conv2d_transpose"
+        self.dtype = "float64"
+        self.init_test_case()
+        x = np.random.uniform(-1, 1, self.input_size).astype(self.dtype)
+        w = np.random.uniform(-1, 1, self.filter_size).astype(self.dtype)
+        pads = [self.paddings[0], self.paddings[0], self.paddings[1], self.paddings[1]]
+        out = conv2d_transpose_naive(
+            x, w, self.strides, pads, self.dilations, self.groups
+        )
+        self.inputs = {"Input": x, "Filter": w}
+        self.attrs = {
+            "strides": self.strides,
+            "paddings": self.paddings,
+            "dilations": self.dilations,
+            "groups": self.groups,
+            "data_format": "NCHW",
+        }
+        self.outputs = {"Output": out}
+
+    def init_test_case(self):
+        self.input_size = [2, 4, 5, 5]
+        self.filter_size = [4, 3, 3, 3]
+        self.strides = [2, 2]
+        self.paddings = [1, 1]
+        self.dilations = [1, 1]
+        self.groups = 1
+
+    def test_check_output(self):
+        self.check_output()
+
+    def test_check_grad(self):
+        self.check_grad(["Input", "Filter"], "Output", max_relative_error=0.02)
+
+
+class TestConv2DTransposeWithGroup(TestConv2DTransposeOp):
+    def init_test_case(self):
+        self.input_size = [2, 4, 6, 6]
+        self.filter_size = [4, 2, 3, 3]
+        self.strides = [1, 1]
+        self.paddings = [0, 0]
+        self.dilations = [2, 2]
+        self.groups = 2
+
+
+if __name__ == "__main__":
+    paddle.enable_static()
+    unittest.main()
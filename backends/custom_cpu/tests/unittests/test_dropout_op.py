@@ -0,0 +1,89 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+class TestDropoutOp(OpTest):
+    # p = 0 keeps everything.
+    def setUp(self):
+        self.op_type = "dropout"
+        x = np.random.random((32, 64)).astype("float32")
+        self.inputs = {"X": x}
+        self.attrs = {"dropout_prob": 0.0, "fix_seed": True, "is_test": False}
+        self.outputs = {"Out": x, "Mask": np.ones((32, 64)).astype("uint8")}
+
+    def test_check_output(self):
+        self.check_output()
+
+
+class TestDropoutOpAll(OpTest):
+    # p = 1 drops everything.
+    def setUp(self):
+        self.op_type = "dropout"
+        x = np.random.random((32, 64)).astype("float32")
+        self.inputs = {"X": x}
+        self.attrs = {"dropout_prob": 1.0, "fix_seed": True, "is_test": False}
+        self.outputs = {
+            "Out": np.zeros((32, 64)).astype("float32"),
+            "Mask": np.zeros((32, 64)).astype("uint8"),
+        }
+
+    def test_check_output(self):
+        self.check_output()
+
+
+class TestDropoutOpInference(OpTest):
+    # downgrade_in_infer scales by 1 - p at inference.
+    def setUp(self):
+        self.op_type = "dropout"
+        x = np.random.random((32, 64)).astype("float32")
+        self.inputs = {"X": x}
+        self.attrs = {"dropout_prob": 0.35, "fix_seed": True, "is_test": True}
+        self.outputs = {"Out": x * (1.0 - 0.35)}
+
+    def test_check_output(self):
+        self.check_output()
+
+
+class TestDropoutUpscale(unittest.TestCase):
+    # Kept values are scaled by 1 / (1 - p) and about p of them are dropped.
+    def test_upscale_in_train(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        paddle.seed(1)
+        x = paddle.ones([100000], dtype="float32")
+        out = paddle.nn.functional.dropout(x, p=0.2, training=True).numpy()
+        kept = out != 0
+        np.testing.assert_allclose(out[kept], 1.0 / 0.8, rtol=1e-6)
+        self.assertAlmostEqual(kept.mean(), 0.8, delta=0.01)
+        paddle.enable_static()
+
+
+if __name__ == "__main__":
+    paddle.enable_static()
+    unittest.main()
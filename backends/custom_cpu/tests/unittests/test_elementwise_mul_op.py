@@ -178,11 +178,39 @@ class TestElementwiseMulOp_broadcast_5(ElementwiseMulOp):
         self.init_kernel_type()
 
 
-# @unittest.skipIf(not core.is_compiled_with_cuda(),
-#                  "core is not compiled with CUDA")
-# class TestElementwiseMulOpFp16(ElementwiseMulOp):
-#     def init_dtype(self):
-#         self.dtype = np.float16
+class TestElementwiseMulOp_broadcast_large(ElementwiseMulOp):
+    # Large enough for the broadcast loop to be split across threads.
+    def init_input_output(self):
+        self.x = np.random.rand(4, 64, 512).astype(self.dtype)
+        self.y = np.random.rand(512).astype(self.dtype)
+        self.out = self.x * self.y
+
+    def test_check_grad_normal(self):
+        pass
+
+    def test_check_grad_ingore_x(self):
+        pass
+
+    def test_check_grad_ingore_y(self):
+        pass
+
+
+class TestElementwiseMulOpFp16(ElementwiseMulOp):
+    # float16 is computed in float32 and rounded once.
+    def init_dtype(self):
+        self.dtype = np.float16
+
+    def test_check_output(self):
+        self.check_output(atol=1e-3)
+
+    def test_check_grad_normal(self):
+        pass
+
+    def test_check_grad_ingore_x(self):
+        pass
+
+    def test_check_grad_ingore_y(self):
+        pass
 
 
 class TestElementwiseMulOp_commonuse_1(ElementwiseMulOp):
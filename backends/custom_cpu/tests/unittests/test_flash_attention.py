@@ -0,0 +1,144 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+import paddle
+import paddle.nn.functional as F
+from paddle.nn.functional.flash_attention import flash_attention
+
+
+def attention_naive(q, k, v, dout, mask=None, causal=False):
+    # q [b, sq, h, d], k and v [b, sk, kvh, d]; returns out and the grads of
+    # q, k and v for the upstream grad dout.
+    b, sq, h, d = q.shape
+    sk, kvh = k.shape[1], k.shape[2]
+    group = h // kvh
+    qt = q.transpose(0, 2, 1, 3).astype("float64")
+    kt = np.repeat(k.transpose(0, 2, 1, 3), group, axis=1).astype("float64")
+    vt = np.repeat(v.transpose(0, 2, 1, 3), group, axis=1).astype("float64")
+    dot = dout.transpose(0, 2, 1, 3).astype("float64")
+    s = qt @ kt.transpose(0, 1, 3, 2) / np.sqrt(d)
+    if mask is not None:
+        s = s + mask
+    if causal:
+        hidden = np.triu(np.ones((sq, sk), dtype=bool), k=sk - sq + 1)
+        s = np.where(hidden, -np.inf, s)
+    p = np.exp(s - s.max(axis=-1, keepdims=True))
+    p = p / p.sum(axis=-1, keepdims=True)
+    out = p @ vt
+    dp = dot @ vt.transpose(0, 1, 3, 2)
+    ds = p * (dp - (dp * p).sum(axis=-1, keepdims=True)) / np.sqrt(d)
+    dq = ds @ kt
+    dk = (ds.transpose(0, 1, 3, 2) @ qt).reshape(b, kvh, group, sk, d)
+    dv = (p.transpose(0, 1, 3, 2) @ dot).reshape(b, kvh, group, sk, d)
+    return (
+        out.transpose(0, 2, 1, 3),
+        dq.transpose(0, 2, 1, 3),
+        dk.sum(axis=2).transpose(0, 2, 1, 3),
+        dv.sum(axis=2).transpose(0, 2, 1, 3),
+    )
+
+
+class TestFlashAttention(unittest.TestCase):
+    def setUp(self):
+        self.init_shape()
+        np.random.seed(2024)
+        self.q = np.random.random(
+            (self.batch, self.seq_q, self.heads, self.head_dim)
+        ).astype("float32")
+        kv_shape = (self.batch, self.seq_k, self.kv_heads, self.head_dim)
+        self.k = np.random.random(kv_shape).astype("float32")
+        self.v = np.random.random(kv_shape).astype("float32")
+        self.dout = np.random.random(self.q.shape).astype("float32")
+
+    def init_shape(self):
+        self.batch, self.seq_q, self.seq_k = 2, 150, 150
+        self.heads, self.kv_heads, self.head_dim = 4, 4, 32
+        self.causal = False
+
+    def run_attention(self, mask=None):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        q, k, v = [
+            paddle.to_tensor(x, stop_gradient=False) for x in (self.q, self.k, self.v)
+        ]
+        if mask is None:
+            out, _ = flash_attention(q, k, v, causal=self.causal)
+        else:
+            out = F.scaled_dot_product_attention(
+                q, k, v, attn_mask=paddle.to_tensor(mask), is_causal=self.causal
+            )
+        out.backward(paddle.to_tensor(self.dout))
+        res = [out.numpy(), q.grad.numpy(), k.grad.numpy(), v.grad.numpy()]
+        paddle.enable_static()
+        return res
+
+    def check(self, mask=None):
+        expected = attention_naive(self.q, self.k, self.v, self.dout, mask, self.causal)
+        for actual, ref in zip(self.run_attention(mask), expected):
+            np.testing.assert_allclose(actual, ref, rtol=1e-4, atol=1e-4)
+
+    def test_attention(self):
+        self.check()
+
+    def test_padding_mask(self):
+        # Every batch hides a different number of trailing keys.
+        mask = np.zeros((self.batch, 1, self.seq_q, self.seq_k), "float32")
+        for i in range(self.batch):
+            mask[i, :, :, self.seq_k - 7 * (i + 1) :] = -1e4
+        self.check(mask)
+
+
+class TestFlashAttentionCausal(TestFlashAttention):
+    def init_shape(self):
+        self.batch, self.seq_q, self.seq_k = 2, 130, 130
+        self.heads, self.kv_heads, self.head_dim = 4, 4, 32
+        self.causal = True
+
+
+class TestFlashAttentionGQA(TestFlashAttention):
+    def init_shape(self):
+        self.batch, self.seq_q, self.seq_k = 1, 70, 200
+        self.heads, self.kv_heads, self.head_dim = 8, 2, 64
+        self.causal = True
+
+
+class TestFlashAttentionDropout(unittest.TestCase):
+    def test_dropout(self):
+        # A fixed seed and offset replay the same keep decisions.
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        np.random.seed(2024)
+        q = paddle.to_tensor(np.random.random((2, 64, 4, 32)).astype("float32"))
+        seed_offset = paddle.to_tensor(np.array([42, 0], dtype="int64"))
+        out1, probs = flash_attention(
+            q,
+            q,
+            q,
+            dropout=0.5,
+            return_softmax=True,
+            fixed_seed_offset=seed_offset,
+        )
+        out2, _ = flash_attention(q, q, q, dropout=0.5, fixed_seed_offset=seed_offset)
+        out3, _ = flash_attention(q, q, q, dropout=0.5, training=False)
+        np.testing.assert_array_equal(out1.numpy(), out2.numpy())
+        self.assertFalse(np.allclose(out1.numpy(), out3.numpy()))
+        np.testing.assert_allclose(probs.numpy().sum(-1), 1.0, rtol=1e-5)
+        paddle.enable_static()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+class TestGaussianRandomOp(OpTest):
+    def setUp(self):
+        self.op_type = "gaussian_random"
+        self.python_api = paddle.normal
+        self.init_dtype()
+        self.mean = 1.0
+        self.std = 2.0
+        self.attrs = {
+            "shape": [123, 92],
+            "mean": self.mean,
+            "std": self.std,
+            "seed": 10,
+            "dtype": paddle.base.core.VarDesc.VarType.FP32
+            if self.dtype == "float32"
+            else paddle.base.core.VarDesc.VarType.FP64,
+        }
+        self.inputs = {}
+        self.outputs = {"Out": np.zeros((123, 92), dtype=self.dtype)}
+
+    def init_dtype(self):
+        self.dtype = "float32"
+
+    def test_check_output(self):
+        self.check_output_customized(self.verify_output)
+
+    def verify_output(self, outs):
+        out = np.array(outs[0])
+        self.assertEqual(out.shape, (123, 92))
+        np.testing.assert_allclose(np.mean(out), self.mean, atol=0.1)
+        np.testing.assert_allclose(np.std(out), self.std, atol=0.1)
+
+
+class TestGaussianRandomOpFp64(TestGaussianRandomOp):
+    def init_dtype(self):
+        self.dtype = "float64"
+
+
+class TestRandomSeed(unittest.TestCase):
+    # A fixed seed gives the same values on every call, and the device
+    # generator moves on between calls.
+    def test_seed(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        a = paddle.uniform([1000], min=-1.0, max=1.0, seed=7).numpy()
+        b = paddle.uniform([1000], min=-1.0, max=1.0, seed=7).numpy()
+        np.testing.assert_array_equal(a, b)
+        c = paddle.uniform([1000], min=-1.0, max=1.0).numpy()
+        d = paddle.uniform([1000], min=-1.0, max=1.0).numpy()
+        self.assertFalse(np.array_equal(c, d))
+        paddle.enable_static()
+
+
+if __name__ == "__main__":
+    paddle.enable_static()
+    unittest.main()
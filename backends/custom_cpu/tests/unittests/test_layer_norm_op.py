@@ -0,0 +1,78 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+def layer_norm_naive(x, scale, bias, epsilon, begin_norm_axis):
+    rows = int(np.prod(x.shape[:begin_norm_axis]))
+    x2 = x.reshape(rows, -1)
+    mean = x2.mean(axis=1)
+    var = x2.var(axis=1)
+    y = (x2 - mean[:, None]) / np.sqrt(var[:, None] + epsilon)
+    if scale is not None:
+        y = y * scale
+    if bias is not None:
+        y = y + bias
+    return y.reshape(x.shape), mean, var
+
+
+class TestLayerNormOp(OpTest):
+    def setUp(self):
+        self.op_type = "layer_norm"
+        self.init_shape()
+        np.random.seed(2024)
+        x = np.random.uniform(-1, 1, self.shape).astype("float64")
+        cols = int(np.prod(self.shape[self.begin_norm_axis :]))
+        scale = np.random.uniform(0.5, 1.5, cols).astype("float64")
+        bias = np.random.uniform(-1, 1, cols).astype("float64")
+        y, mean, var = layer_norm_naive(x, scale, bias, 1e-5, self.begin_norm_axis)
+        self.inputs = {"X": x, "Scale": scale, "Bias": bias}
+        self.attrs = {"epsilon": 1e-5, "begin_norm_axis": self.begin_norm_axis}
+        self.outputs = {"Y": y, "Mean": mean, "Variance": var}
+
+    def init_shape(self):
+        self.shape = [8, 130]
+        self.begin_norm_axis = 1
+
+    def test_check_output(self):
+        self.check_output(atol=1e-7)
+
+    def test_check_grad(self):
+        self.check_grad(["X", "Scale", "Bias"], "Y")
+
+
+class TestLayerNormOp3D(TestLayerNormOp):
+    def init_shape(self):
+        self.shape = [2, 3, 4, 17]
+        self.begin_norm_axis = 2
+
+
+if __name__ == "__main__":
+    unittest.main()
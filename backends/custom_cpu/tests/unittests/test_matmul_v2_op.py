@@ -268,6 +268,24 @@ class TestMatMul2Dx3D_TransXY(TestMatMulOp):
         self.trans_y = True
 
 
+class TestMatMulOpFp16(TestMatMulOp):
+    # float16 inputs accumulate in float32 inside the GEMM.
+    def config(self):
+        self.x_shape = (4, 8)
+        self.y_shape = (8, 4)
+        self.trans_x = False
+        self.trans_y = False
+
+    def init_kernel_type(self):
+        self.dtype = "float16"
+
+    def test_check_output(self):
+        self.check_output(atol=5e-2, check_eager=False)
+
+    def test_check_grad(self):
+        pass
+
+
 if __name__ == "__main__":
     paddle.enable_static()
     unittest.main()
@@ -0,0 +1,132 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+def momentum_step(param, grad, velocity, lr, mu, use_nesterov, l2_coeff=0.0):
+    grad = grad + l2_coeff * param
+    velocity_out = mu * velocity + grad
+    if use_nesterov:
+        param_out = param - (grad + velocity_out * mu) * lr
+    else:
+        param_out = param - lr * velocity_out
+    return param_out, velocity_out
+
+
+class TestMomentumOp(OpTest):
+    def setUp(self):
+        self.op_type = "momentum"
+        self.init_attrs()
+        param = np.random.random((123, 321)).astype("float32")
+        grad = np.random.random((123, 321)).astype("float32")
+        velocity = np.zeros((123, 321)).astype("float32")
+        lr = np.array([0.001]).astype("float32")
+
+        self.inputs = {
+            "Param": param,
+            "Grad": grad,
+            "Velocity": velocity,
+            "LearningRate": lr,
+        }
+        param_out, velocity_out = momentum_step(
+            param,
+            grad,
+            velocity,
+            lr,
+            self.attrs["mu"],
+            self.attrs["use_nesterov"],
+            self.attrs.get("regularization_coeff", 0.0),
+        )
+        self.outputs = {"ParamOut": param_out, "VelocityOut": velocity_out}
+
+    def init_attrs(self):
+        self.attrs = {"mu": 0.0001, "use_nesterov": False}
+
+    def test_check_output(self):
+        self.check_output()
+
+
+class TestMomentumOpNesterov(TestMomentumOp):
+    def init_attrs(self):
+        self.attrs = {"mu": 0.0001, "use_nesterov": True}
+
+
+class TestMomentumOpL2Decay(TestMomentumOp):
+    def init_attrs(self):
+        self.attrs = {
+            "mu": 0.9,
+            "use_nesterov": False,
+            "regularization_method": "l2_decay",
+            "regularization_coeff": 0.1,
+        }
+
+
+class TestMergedMomentum(unittest.TestCase):
+    # merged_momentum, through use_multi_tensor, must match one momentum per
+    # param.
+    def run_momentum(self, use_multi_tensor):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        np.random.seed(10)
+        shapes = [(2, 3), (17,), (64, 33), (1,)]
+        params = [
+            paddle.create_parameter(
+                shape=list(s),
+                dtype="float32",
+                default_initializer=paddle.nn.initializer.Assign(
+                    np.random.random(s).astype("float32")
+                ),
+            )
+            for s in shapes
+        ]
+        grads = [np.random.random(s).astype("float32") for s in shapes]
+        opt = paddle.optimizer.Momentum(
+            learning_rate=0.01,
+            momentum=0.9,
+            parameters=params,
+            use_nesterov=True,
+            use_multi_tensor=use_multi_tensor,
+        )
+        for _ in range(3):
+            for p, g in zip(params, grads):
+                p._set_grad_ivar(paddle.to_tensor(g))
+            opt.step()
+        out = [p.numpy() for p in params]
+        paddle.enable_static()
+        return out
+
+    def test_merged_momentum(self):
+        single = self.run_momentum(False)
+        merged = self.run_momentum(True)
+        for s, m in zip(single, merged):
+            np.testing.assert_allclose(s, m, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    paddle.enable_static()
+    unittest.main()
@@ -180,6 +180,35 @@ class TestSumOp8D(OpTest):
         self.check_grad(["X"], "Out", check_eager=False)
 
 
+class TestSumOpLarge(OpTest):
+    # Long rows and long columns, so that the reduced dim itself is split
+    # across threads.
+    def setUp(self):
+        self.python_api = paddle.sum
+        self.op_type = "reduce_sum"
+        self.inputs = {"X": np.random.random((2, 40000, 3)).astype("float64")}
+        self.attrs = {"dim": [1]}
+        self.outputs = {"Out": self.inputs["X"].sum(axis=1)}
+
+    def test_check_output(self):
+        self.check_output(check_eager=False)
+
+
+class TestSumOpInt32(OpTest):
+    def setUp(self):
+        self.python_api = paddle.sum
+        self.op_type = "reduce_sum"
+        self.inputs = {"X": np.random.randint(-10, 10, (5, 6, 10)).astype("int32")}
+        self.attrs = {
+            "dim": [0, 2],
+            "out_dtype": int(convert_np_dtype_to_dtype_(np.int64)),
+        }
+        self.outputs = {"Out": self.inputs["X"].sum(axis=(0, 2)).astype("int64")}
+
+    def test_check_output(self):
+        self.check_output(check_eager=False)
+
+
 @skip_check_grad_ci(
     reason="reduce_max is discontinuous non-derivable function,"
     " its gradient check is not supported by unittest framework."
@@ -216,6 +245,78 @@ class TestMinOp(OpTest):
         self.check_output(check_eager=False)
 
 
+@skip_check_grad_ci(
+    reason="reduce_max is discontinuous non-derivable function,"
+    " its gradient check is not supported by unittest framework."
+)
+class TestMaxOpNegInfRow(OpTest):
+    """A row of -inf reduces to -inf, not to the lowest finite value."""
+
+    def setUp(self):
+        self.op_type = "reduce_max"
+        self.python_api = paddle.max
+        x = np.random.random((4, 6, 10)).astype("float32")
+        x[1, 2, :] = -np.inf
+        x[:, 3, 4] = -np.inf
+        self.inputs = {"X": x}
+        self.attrs = {"dim": [-1]}
+        self.outputs = {"Out": x.max(axis=tuple(self.attrs["dim"]))}
+
+    def test_check_output(self):
+        self.check_output(check_eager=False)
+
+
+class TestMaxOpNegInfColumn(TestMaxOpNegInfRow):
+    def setUp(self):
+        super().setUp()
+        self.attrs = {"dim": [0]}
+        self.outputs = {"Out": self.inputs["X"].max(axis=tuple(self.attrs["dim"]))}
+
+
+class TestMaxOpAllNegInf(TestMaxOpNegInfRow):
+    def setUp(self):
+        super().setUp()
+        self.inputs = {"X": np.full((4, 6, 10), -np.inf, dtype="float32")}
+        self.attrs = {"reduce_all": True}
+        self.outputs = {"Out": self.inputs["X"].max()}
+
+
+@skip_check_grad_ci(
+    reason="reduce_min is discontinuous non-derivable function,"
+    " its gradient check is not supported by unittest framework."
+)
+class TestMinOpPosInfRow(OpTest):
+    """A row of +inf reduces to +inf, not to the highest finite value."""
+
+    def setUp(self):
+        self.op_type = "reduce_min"
+        self.python_api = paddle.min
+        x = np.random.random((4, 6, 10)).astype("float32")
+        x[1, 2, :] = np.inf
+        x[:, 3, 4] = np.inf
+        self.inputs = {"X": x}
+        self.attrs = {"dim": [-1]}
+        self.outputs = {"Out": x.min(axis=tuple(self.attrs["dim"]))}
+
+    def test_check_output(self):
+        self.check_output(check_eager=False)
+
+
+class TestMinOpPosInfColumn(TestMinOpPosInfRow):
+    def setUp(self):
+        super().setUp()
+        self.attrs = {"dim": [0]}
+        self.outputs = {"Out": self.inputs["X"].min(axis=tuple(self.attrs["dim"]))}
+
+
+class TestMinOpAllPosInf(TestMinOpPosInfRow):
+    def setUp(self):
+        super().setUp()
+        self.inputs = {"X": np.full((4, 6, 10), np.inf, dtype="float32")}
+        self.attrs = {"reduce_all": True}
+        self.outputs = {"Out": self.inputs["X"].min()}
+
+
 class TestMin6DOp(OpTest):
     """Remove Min with subgradient from gradient check to confirm the success of CI."""
 
@@ -347,6 +347,28 @@ class TestDygraphReshapeInplaceAPI(TestDygraphReshapeAPI):
         self.reshape = paddle.reshape_
 
 
+class TestDygraphReshapeView(unittest.TestCase):
+    # Reshapes of strided views: the ones the strides allow stay views, the
+    # others materialize, and both must read like numpy.
+    def test_views(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        x_np = np.random.random([4, 6, 8]).astype("float32")
+        x = paddle.to_tensor(x_np)
+        # Splits a dim of a slice: a view.
+        out = paddle.reshape(x[:, 2:4], [4, 2, 2, 4])
+        np.testing.assert_array_equal(out.numpy(), x_np[:, 2:4].reshape([4, 2, 2, 4]))
+        # Merges dims a transpose swapped: a copy.
+        out = paddle.reshape(paddle.transpose(x, [0, 2, 1]), [4, 48])
+        np.testing.assert_array_equal(
+            out.numpy(), x_np.transpose([0, 2, 1]).reshape([4, 48])
+        )
+        out = paddle.flatten(x[1:3], start_axis=1)
+        np.testing.assert_array_equal(out.numpy(), x_np[1:3].reshape([2, 48]))
+        out = paddle.squeeze(paddle.unsqueeze(x[:, 1], [0, 2]), 0)
+        np.testing.assert_array_equal(out.numpy(), x_np[:, 1][:, None, :])
+        paddle.enable_static()
+
+
 if __name__ == "__main__":
     paddle.enable_static()
     unittest.main()
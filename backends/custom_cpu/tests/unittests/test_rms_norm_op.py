@@ -0,0 +1,128 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+import paddle
+from paddle.incubate.nn.functional import fused_layer_norm, fused_rms_norm
+
+
+def fused_input(x, bias, residual, residual_alpha=1.0):
+    y = x.astype("float64")
+    if bias is not None:
+        y = y + bias
+    if residual is not None:
+        y = y + residual_alpha * residual
+    return y
+
+
+def rms_norm_naive(y, weight, epsilon):
+    rstd = 1 / np.sqrt((y * y).mean(axis=-1, keepdims=True) + epsilon)
+    return y * rstd * weight
+
+
+def rms_norm_grad_naive(y, weight, epsilon, dout):
+    rstd = 1 / np.sqrt((y * y).mean(axis=-1, keepdims=True) + epsilon)
+    y_hat = y * rstd
+    g = dout * weight
+    dy = rstd * (g - y_hat * (g * y_hat).mean(axis=-1, keepdims=True))
+    dweight = (dout * y_hat).reshape(-1, y.shape[-1]).sum(axis=0)
+    return dy, dweight
+
+
+def layer_norm_naive(y, weight, norm_bias, epsilon):
+    mean = y.mean(axis=-1, keepdims=True)
+    var = y.var(axis=-1, keepdims=True)
+    return (y - mean) / np.sqrt(var + epsilon) * weight + norm_bias
+
+
+class FusedNormTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(2024)
+        self.x = np.random.uniform(-1, 1, (4, 7, 256)).astype("float32")
+        self.residual = np.random.uniform(-1, 1, self.x.shape).astype("float32")
+        self.bias = np.random.uniform(-1, 1, 256).astype("float32")
+        self.weight = np.random.uniform(0.5, 1.5, 256).astype("float32")
+        self.norm_bias = np.random.uniform(-1, 1, 256).astype("float32")
+        self.dout = np.random.uniform(-1, 1, self.x.shape).astype("float32")
+        self.epsilon = 1e-6
+
+
+class TestFusedRmsNorm(FusedNormTest):
+    def test_rms_norm(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        x = paddle.to_tensor(self.x, stop_gradient=False)
+        weight = paddle.to_tensor(self.weight, stop_gradient=False)
+        out = fused_rms_norm(x, weight, None, self.epsilon, begin_norm_axis=2)
+        if isinstance(out, (tuple, list)):
+            out = out[0]
+        out.backward(paddle.to_tensor(self.dout))
+        y = fused_input(self.x, None, None)
+        dy, dweight = rms_norm_grad_naive(y, self.weight, self.epsilon, self.dout)
+        np.testing.assert_allclose(
+            out.numpy(), rms_norm_naive(y, self.weight, self.epsilon), atol=1e-5
+        )
+        np.testing.assert_allclose(x.grad.numpy(), dy, atol=1e-5)
+        np.testing.assert_allclose(weight.grad.numpy(), dweight, rtol=1e-4)
+        paddle.enable_static()
+
+    def test_bias_residual(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        out, residual_out = fused_rms_norm(
+            paddle.to_tensor(self.x),
+            paddle.to_tensor(self.weight),
+            paddle.to_tensor(self.norm_bias),
+            self.epsilon,
+            begin_norm_axis=2,
+            bias=paddle.to_tensor(self.bias),
+            residual=paddle.to_tensor(self.residual),
+        )
+        y = fused_input(self.x, self.bias, self.residual)
+        np.testing.assert_allclose(residual_out.numpy(), y, atol=1e-6)
+        np.testing.assert_allclose(
+            out.numpy(),
+            rms_norm_naive(y, self.weight, self.epsilon) + self.norm_bias,
+            atol=1e-5,
+        )
+        paddle.enable_static()
+
+
+class TestFusedLayerNorm(FusedNormTest):
+    def test_bias_residual(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        out, residual_out = fused_layer_norm(
+            paddle.to_tensor(self.x),
+            paddle.to_tensor(self.weight),
+            paddle.to_tensor(self.norm_bias),
+            self.epsilon,
+            residual_alpha=0.5,
+            begin_norm_axis=2,
+            bias=paddle.to_tensor(self.bias),
+            residual=paddle.to_tensor(self.residual),
+        )[:2]
+        y = fused_input(self.x, self.bias, self.residual, 0.5)
+        np.testing.assert_allclose(residual_out.numpy(), y, atol=1e-6)
+        np.testing.assert_allclose(
+            out.numpy(),
+            layer_norm_naive(y, self.weight, self.norm_bias, self.epsilon),
+            atol=1e-5,
+        )
+        paddle.enable_static()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -618,6 +618,21 @@ class TestSliceApiWithDenseTensorArray(unittest.TestCase):
         self.assertTrue(np.array_equal(self.g_x2, np.ones_like(self.data)))
 
 
+class TestSliceView(unittest.TestCase):
+    # A slice and transpose of a KV cache, as attention reads it, and an
+    # elementwise consumer of the resulting non-contiguous view.
+    def test_kv_cache_view(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        cache_np = np.random.random([16, 4, 8]).astype("float32")
+        cache = paddle.to_tensor(cache_np)
+        kv = paddle.transpose(cache[2:10], [1, 0, 2])
+        expected = cache_np[2:10].transpose([1, 0, 2])
+        np.testing.assert_array_equal(kv.numpy(), expected)
+        np.testing.assert_allclose((kv + 1.0).numpy(), expected + 1.0)
+        np.testing.assert_array_equal(cache[3, :, 1:5].numpy(), cache_np[3, :, 1:5])
+        paddle.enable_static()
+
+
 class TestImperativeVarBaseGetItem(unittest.TestCase):
     def test_getitem_with_long(self):
         with base.dygraph.guard(paddle.CustomPlace("custom_cpu", 0)):
@@ -0,0 +1,104 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+import paddle
+from op_test import OpTest
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+class TestSplitOp(OpTest):
+    def setUp(self):
+        self.op_type = "split"
+        self.dtype = "float64"
+        self.init_data()
+        x = np.random.random(self.shape).astype(self.dtype)
+        self.inputs = {"X": x}
+        self.attrs = {"axis": self.axis, "sections": self.sections, "num": 0}
+        indices = np.cumsum(self.sections)[:-1]
+        outs = np.split(x, indices, axis=self.axis)
+        self.outputs = {"Out": [("out%d" % i, o) for i, o in enumerate(outs)]}
+
+    def init_data(self):
+        # A fused QKV projection with grouped kv heads.
+        self.shape = (16, 3, 48)
+        self.axis = 2
+        self.sections = [32, 8, 8]
+
+    def test_check_output(self):
+        self.check_output()
+
+    def test_check_grad(self):
+        self.check_grad(["X"], ["out0", "out1", "out2"])
+
+
+class TestSplitOpAxis0(TestSplitOp):
+    def init_data(self):
+        self.shape = (9, 4, 5)
+        self.axis = 0
+        self.sections = [2, 3, 4]
+
+
+class TestSplitOpInferSection(TestSplitOp):
+    def init_data(self):
+        self.shape = (4, 10, 3)
+        self.axis = -2
+        self.sections = [1, 6, 3]
+
+    def setUp(self):
+        super().setUp()
+        self.attrs["sections"] = [1, -1, 3]
+
+
+class TestSplitWithNum(TestSplitOp):
+    def init_data(self):
+        self.shape = (6, 12)
+        self.axis = 1
+        self.sections = [4, 4, 4]
+
+    def setUp(self):
+        super().setUp()
+        self.attrs["sections"] = []
+        self.attrs["num"] = 3
+
+
+class TestSplitView(unittest.TestCase):
+    # Split outputs are views of x under stride kernels and must stay
+    # correct when x is a view itself.
+    def test_split_of_transpose(self):
+        paddle.disable_static(paddle.CustomPlace("custom_cpu", 0))
+        x = np.random.random((6, 8, 5)).astype("float32")
+        xt = paddle.to_tensor(x).transpose([1, 0, 2])
+        outs = paddle.split(xt, [2, 1, 5], axis=0)
+        refs = np.split(x.transpose(1, 0, 2), [2, 3], axis=0)
+        for out, ref in zip(outs, refs):
+            np.testing.assert_array_equal(out.numpy(), ref)
+        paddle.enable_static()
+
+
+if __name__ == "__main__":
+    unittest.main()
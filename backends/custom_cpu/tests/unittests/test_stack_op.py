@@ -0,0 +1,79 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+
+import paddle
+from op_test import OpTest
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+class TestStackOp(OpTest):
+    def setUp(self):
+        self.op_type = "stack"
+        self.dtype = "float64"
+        self.init_data()
+        xs = [np.random.random(self.shape).astype(self.dtype) for _ in range(self.num)]
+        self.names = ["x%d" % i for i in range(self.num)]
+        self.inputs = {"X": list(zip(self.names, xs))}
+        self.attrs = {"axis": self.axis}
+        self.outputs = {"Y": np.stack(xs, axis=self.axis)}
+
+    def init_data(self):
+        self.shape = (5, 6, 7)
+        self.num = 4
+        self.axis = 0
+
+    def test_check_output(self):
+        self.check_output()
+
+    def test_check_grad(self):
+        self.check_grad(self.names, "Y")
+
+
+class TestStackOpInnerAxis(TestStackOp):
+    def init_data(self):
+        self.shape = (5, 6, 7)
+        self.num = 3
+        self.axis = 2
+
+
+class TestStackOpLastAxis(TestStackOp):
+    def init_data(self):
+        self.shape = (100, 3)
+        self.num = 2
+        self.axis = -1
+
+
+class TestStackOpSingle(TestStackOp):
+    def init_data(self):
+        self.shape = (3, 4)
+        self.num = 1
+        self.axis = 1
+
+
+if __name__ == "__main__":
+    unittest.main()
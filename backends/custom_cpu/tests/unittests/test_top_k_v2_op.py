@@ -0,0 +1,93 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import unittest
+import numpy as np
+from op_test import OpTest
+import paddle
+
+paddle.enable_static()
+
+
+def get_places(self):
+    return [paddle.CustomPlace("custom_cpu", 0)]
+
+
+OpTest._get_places = get_places
+
+
+def numpy_topk(x, k, axis, largest):
+    # Stable on -x so that ties go to the earlier index, as the kernel does.
+    key = -x if largest else x
+    indices = np.argsort(key, axis=axis, kind="stable")
+    indices = np.take(indices, np.arange(k), axis=axis)
+    return np.take_along_axis(x, indices, axis=axis), indices
+
+
+class TestTopkOp(OpTest):
+    def setUp(self):
+        self.op_type = "top_k_v2"
+        self.python_api = paddle.topk
+        self.init_args()
+        x = np.random.permutation(np.prod(self.shape)).reshape(self.shape)
+        x = x.astype(self.dtype)
+        self.inputs = {"X": x}
+        self.attrs = {"k": self.k, "axis": self.axis, "largest": self.largest}
+        out, indices = numpy_topk(x, self.k, self.axis, self.largest)
+        self.outputs = {"Out": out, "Indices": indices}
+
+    def init_args(self):
+        self.shape = (16, 100)
+        self.dtype = "float32"
+        self.k = 3
+        self.axis = -1
+        self.largest = True
+
+    def test_check_output(self):
+        self.check_output()
+
+
+class TestTopkOpSmallest(TestTopkOp):
+    def init_args(self):
+        self.shape = (16, 100)
+        self.dtype = "float64"
+        self.k = 5
+        self.axis = 1
+        self.largest = False
+
+
+class TestTopkOpAxis(TestTopkOp):
+    def init_args(self):
+        self.shape = (4, 50, 6)
+        self.dtype = "float32"
+        self.k = 7
+        self.axis = 1
+        self.largest = True
+
+
+# k above width / 64 partitions the row instead of keeping a heap.
+class TestTopkOpLargeK(TestTopkOp):
+    def init_args(self):
+        self.shape = (8, 1000)
+        self.dtype = "int64"
+        self.k = 300
+        self.axis = -1
+        self.largest = True
+
+
+if __name__ == "__main__":
+    paddle.enable_static()
+    unittest.main()
@@ -14,3 +14,4 @@
 
 from paddle_custom_device.intel_hpu.ops import *  # noqa
 from .layers import *  # noqa
+from .kv_cache import *  # noqa
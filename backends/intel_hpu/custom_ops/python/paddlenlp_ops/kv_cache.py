@@ -0,0 +1,251 @@
+# Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+import paddle
+
+__all__ = ["PagedKVCache"]
+
+
+def _index_copy(input, dim, index, source):
+    # input.index_copy_(dim, index, source): the index_copy op on intel_hpu,
+    # and a row scatter, which is the same copy along dim 0, elsewhere.
+    if input.place.is_custom_place():
+        from paddle_custom_device.intel_hpu.ops import index_copy
+
+        index_copy(input=input, dim=dim, index=index, source=source)
+    else:
+        assert dim == 0, "only copies along dim 0 are supported off intel_hpu"
+        paddle.scatter_(input, index, source, overwrite=True)
+
+
+class _Sequence:
+    def __init__(self):
+        self.blocks = []
+        self.token_ids = []
+        # Prefix key of every full block, chained through the ones before it.
+        self.keys = []
+
+
+class PagedKVCache:
+    """Key/value cache of all layers in a pool of fixed-size blocks.
+
+    Every layer has a key and a value pool of shape
+    [num_blocks * block_size, num_heads, head_dim], indexed by slot. A
+    sequence owns a block table, and its token i is stored in slot
+    block_table[i // block_size] * block_size + i % block_size, so memory
+    follows the tokens that are live rather than batch * max_seq_len. The
+    pools are never zero-filled: a slot is only read after it was written.
+
+    Blocks are reference counted. Full blocks are indexed by their tokens and
+    the tokens before them, so a prompt starting like an earlier one shares
+    its blocks. fork() shares all the blocks of a sequence. A shared block
+    that is partially filled is copied before a new token is written to it.
+    A freed block that holds a full prefix stays cached until a new block is
+    needed or reclaim() is called.
+
+    A step reserves slots for the new tokens of a sequence with
+    allocate_slots(), then writes their keys and values for every layer with
+    write().
+    """
+
+    def __init__(
+        self, num_layers, num_blocks, block_size, num_heads, head_dim, dtype="bfloat16"
+    ):
+        self.block_size = block_size
+        shape = [num_blocks * block_size, num_heads, head_dim]
+        self.key_caches = [paddle.empty(shape, dtype=dtype) for _ in range(num_layers)]
+        self.value_caches = [
+            paddle.empty(shape, dtype=dtype) for _ in range(num_layers)
+        ]
+        # The free list is a stack, so recently freed blocks are reused first.
+        self._free = list(reversed(range(num_blocks)))
+        self._ref = [0] * num_blocks
+        # prefix key -> block, and block -> (prefix key, parent key, tokens)
+        # for the blocks that can be shared.
+        self._prefix = {}
+        self._block_key = {}
+        # Unreferenced blocks that hold a prefix, least recently freed first.
+        self._cached = collections.OrderedDict()
+        self._seqs = {}
+
+    @property
+    def num_free_blocks(self):
+        """Blocks that can be allocated, cached prefix blocks included."""
+        return len(self._free) + len(self._cached)
+
+    @property
+    def num_cached_blocks(self):
+        return len(self._cached)
+
+    def num_tokens(self, seq_id):
+        return len(self._seqs[seq_id].token_ids)
+
+    def block_table(self, seq_id):
+        return list(self._seqs[seq_id].blocks)
+
+    def slot_mapping(self, seq_id):
+        """The slots of all the tokens of a sequence, as an int64 tensor."""
+        seq = self._seqs[seq_id]
+        bs = self.block_size
+        slots = [seq.blocks[i // bs] * bs + i % bs for i in range(len(seq.token_ids))]
+        return paddle.to_tensor(slots, dtype="int64")
+
+    def add_sequence(self, seq_id, prompt_ids=()):
+        """Starts a sequence and shares the cached blocks its prompt starts
+        with. Returns the number of prompt tokens whose keys and values are
+        already cached; the last prompt token is never among them, so that
+        the model computes its logits. The rest of the prompt is then passed
+        to allocate_slots()."""
+        assert seq_id not in self._seqs, f"sequence {seq_id} already exists"
+        seq = _Sequence()
+        self._seqs[seq_id] = seq
+        bs = self.block_size
+        for start in range(0, (len(prompt_ids) - 1) // bs * bs, bs):
+            tokens = tuple(prompt_ids[start : start + bs])
+            parent = seq.keys[-1] if seq.keys else None
+            key = hash((parent, tokens))
+            block = self._prefix.get(key)
+            if block is None or self._block_key[block][1:] != (parent, tokens):
+                break
+            self._acquire(block)
+            seq.blocks.append(block)
+            seq.token_ids.extend(tokens)
+            seq.keys.append(key)
+        return len(seq.token_ids)
+
+    def fork(self, parent_id, child_id):
+        """Starts child_id as a copy of parent_id that shares its blocks."""
+        assert child_id not in self._seqs, f"sequence {child_id} already exists"
+        parent = self._seqs[parent_id]
+        child = _Sequence()
+        child.blocks = list(parent.blocks)
+        child.token_ids = list(parent.token_ids)
+        child.keys = list(parent.keys)
+        for block in child.blocks:
+            self._acquire(block)
+        self._seqs[child_id] = child
+
+    def allocate_slots(self, seq_id, token_ids):
+        """Appends token_ids to a sequence and returns the int64 slots their
+        keys and values go to. Raises RuntimeError, and leaves the cache
+        unchanged, when there are not enough free blocks."""
+        seq = self._seqs[seq_id]
+        bs = self.block_size
+        num_tokens = len(seq.token_ids)
+        needed = -(-(num_tokens + len(token_ids)) // bs) - len(seq.blocks)
+        if token_ids and num_tokens % bs and self._ref[seq.blocks[-1]] > 1:
+            needed += 1
+        if needed > self.num_free_blocks:
+            raise RuntimeError(
+                f"PagedKVCache needs {needed} blocks for sequence {seq_id} "
+                f"but has {self.num_free_blocks} free"
+            )
+        slots = []
+        for token in token_ids:
+            offset = len(seq.token_ids) % bs
+            if offset == 0:
+                seq.blocks.append(self._allocate_block())
+            elif self._ref[seq.blocks[-1]] > 1:
+                seq.blocks[-1] = self._copy_on_write(seq.blocks[-1], offset)
+            slots.append(seq.blocks[-1] * bs + offset)
+            seq.token_ids.append(token)
+            if offset == bs - 1:
+                self._register(seq)
+        return paddle.to_tensor(slots, dtype="int64")
+
+    def write(self, layer, slots, key, value):
+        """Writes key and value, [len(slots), num_heads, head_dim], of one
+        layer to the slots returned by allocate_slots()."""
+        _index_copy(self.key_caches[layer], 0, slots, key)
+        _index_copy(self.value_caches[layer], 0, slots, value)
+
+    def gather(self, seq_id, layer):
+        """The keys and values of all the tokens of a sequence in one layer,
+        each [num_tokens, num_heads, head_dim]."""
+        slots = self.slot_mapping(seq_id)
+        return (
+            paddle.gather(self.key_caches[layer], slots),
+            paddle.gather(self.value_caches[layer], slots),
+        )
+
+    def free(self, seq_id):
+        """Ends a sequence and releases its blocks."""
+        seq = self._seqs.pop(seq_id)
+        # The last blocks are released first, so they are also evicted before
+        # the prefixes they extend.
+        for block in reversed(seq.blocks):
+            self._release(block)
+
+    def reclaim(self, num_blocks=None):
+        """Moves up to num_blocks cached prefix blocks, all of them by
+        default, to the free list. Returns how many were reclaimed."""
+        count = 0
+        while self._cached and (num_blocks is None or count < num_blocks):
+            block, _ = self._cached.popitem(last=False)
+            self._forget(block)
+            self._free.append(block)
+            count += 1
+        return count
+
+    def _acquire(self, block):
+        if self._ref[block] == 0:
+            del self._cached[block]
+        self._ref[block] += 1
+
+    def _release(self, block):
+        self._ref[block] -= 1
+        if self._ref[block] == 0:
+            if block in self._block_key:
+                self._cached[block] = None
+            else:
+                self._free.append(block)
+
+    def _allocate_block(self):
+        if self._free:
+            block = self._free.pop()
+        else:
+            block, _ = self._cached.popitem(last=False)
+            self._forget(block)
+        self._ref[block] = 1
+        return block
+
+    def _forget(self, block):
+        key = self._block_key.pop(block)[0]
+        if self._prefix.get(key) == block:
+            del self._prefix[key]
+
+    def _copy_on_write(self, block, num_tokens):
+        new_block = self._allocate_block()
+        bs = self.block_size
+        src = paddle.arange(block * bs, block * bs + num_tokens, dtype="int64")
+        dst = paddle.arange(new_block * bs, new_block * bs + num_tokens, dtype="int64")
+        for cache in self.key_caches + self.value_caches:
+            _index_copy(cache, 0, dst, paddle.gather(cache, src))
+        self._release(block)
+        return new_block
+
+    def _register(self, seq):
+        # Indexes the block the sequence just filled, unless an identical
+        # prefix is already cached.
+        bs = self.block_size
+        tokens = tuple(seq.token_ids[-bs:])
+        parent = seq.keys[-1] if seq.keys else None
+        key = hash((parent, tokens))
+        seq.keys.append(key)
+        block = seq.blocks[-1]
+        if key not in self._prefix and block not in self._block_key:
+            self._prefix[key] = block
+            self._block_key[block] = (key, parent, tokens)
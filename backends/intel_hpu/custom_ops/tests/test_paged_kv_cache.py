@@ -0,0 +1,153 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+import paddle
+import paddlenlp_ops
+
+
+class TestPagedKVCache(unittest.TestCase):
+    # Runs on CPU, where writes go through the row scatter that stands in
+    # for index_copy; TestPagedKVCacheHPU repeats it with the index_copy op.
+    def setUp(self):
+        paddle.set_device(self.device())
+        self.num_layers = 2
+        self.num_heads = 2
+        self.head_dim = 4
+        self.block_size = 4
+        self.cache = paddlenlp_ops.PagedKVCache(
+            self.num_layers,
+            num_blocks=8,
+            block_size=self.block_size,
+            num_heads=self.num_heads,
+            head_dim=self.head_dim,
+            dtype="float32",
+        )
+        self.rng = np.random.default_rng(0)
+        # Reference keys and values of every sequence, per layer.
+        self.expected = {}
+
+    def device(self):
+        return "cpu"
+
+    def append(self, seq_id, token_ids):
+        slots = self.cache.allocate_slots(seq_id, token_ids)
+        shape = (len(token_ids), self.num_heads, self.head_dim)
+        for layer in range(self.num_layers):
+            k = self.rng.standard_normal(shape).astype("float32")
+            v = self.rng.standard_normal(shape).astype("float32")
+            self.cache.write(layer, slots, paddle.to_tensor(k), paddle.to_tensor(v))
+            ref_k, ref_v = self.expected.setdefault((seq_id, layer), ([], []))
+            ref_k.extend(k)
+            ref_v.extend(v)
+
+    def check(self, seq_id):
+        for layer in range(self.num_layers):
+            k, v = self.cache.gather(seq_id, layer)
+            ref_k, ref_v = self.expected[(seq_id, layer)]
+            np.testing.assert_array_equal(k.numpy(), np.array(ref_k))
+            np.testing.assert_array_equal(v.numpy(), np.array(ref_v))
+
+    def test_prefill_and_decode(self):
+        self.assertEqual(self.cache.add_sequence(0, [1, 2, 3, 4, 5, 6]), 0)
+        self.append(0, [1, 2, 3, 4, 5, 6])
+        for token in range(7, 12):
+            self.append(0, [token])
+        self.assertEqual(self.cache.num_tokens(0), 11)
+        self.assertEqual(len(self.cache.block_table(0)), 3)
+        self.assertEqual(self.cache.num_free_blocks, 5)
+        self.check(0)
+
+    def test_prefix_sharing(self):
+        prompt = list(range(1, 11))
+        self.cache.add_sequence(0, prompt)
+        self.append(0, prompt)
+        # The two full blocks of the prompt are shared, and the rest of the
+        # prompt is written to a block of its own.
+        self.assertEqual(self.cache.add_sequence(1, prompt[:9] + [99]), 8)
+        self.expected[(1, 0)] = tuple(r[:8] for r in self.expected[(0, 0)])
+        self.expected[(1, 1)] = tuple(r[:8] for r in self.expected[(0, 1)])
+        self.append(1, [9, 99])
+        self.assertEqual(self.cache.block_table(1)[:2], self.cache.block_table(0)[:2])
+        self.assertEqual(self.cache.num_free_blocks, 4)
+        self.check(0)
+        self.check(1)
+
+        # A freed prefix stays cached and is found again.
+        self.cache.free(0)
+        self.cache.free(1)
+        self.assertEqual(self.cache.num_cached_blocks, 2)
+        self.assertEqual(self.cache.add_sequence(2, prompt), 8)
+        self.assertEqual(self.cache.num_cached_blocks, 0)
+
+    def test_fork_copy_on_write(self):
+        self.cache.add_sequence(0, [1, 2, 3, 4, 5, 6])
+        self.append(0, [1, 2, 3, 4, 5, 6])
+        self.cache.fork(0, 1)
+        for layer in range(self.num_layers):
+            self.expected[(1, layer)] = tuple(
+                list(r) for r in self.expected[(0, layer)]
+            )
+        self.assertEqual(self.cache.block_table(1), self.cache.block_table(0))
+        # The child writes to its copy of the partially filled block.
+        self.append(1, [7])
+        self.append(0, [8])
+        table0, table1 = self.cache.block_table(0), self.cache.block_table(1)
+        self.assertEqual(table0[0], table1[0])
+        self.assertNotEqual(table0[1], table1[1])
+        self.check(0)
+        self.check(1)
+
+    def test_free_and_reclaim(self):
+        self.cache.add_sequence(0, list(range(16)))
+        self.append(0, list(range(16)))
+        self.cache.add_sequence(1, [])
+        self.append(1, [1, 2, 3, 4, 5])
+        self.assertEqual(self.cache.num_free_blocks, 2)
+        self.cache.free(0)
+        # The full blocks of sequence 0 hold prefixes and stay cached.
+        self.assertEqual(self.cache.num_cached_blocks, 4)
+        self.assertEqual(self.cache.reclaim(1), 1)
+        self.assertEqual(self.cache.reclaim(), 3)
+        self.assertEqual(self.cache.num_cached_blocks, 0)
+        self.assertEqual(self.cache.num_free_blocks, 6)
+        self.check(1)
+
+    def test_out_of_blocks(self):
+        self.cache.add_sequence(0, [])
+        self.append(0, list(range(28)))
+        self.cache.add_sequence(1, [])
+        with self.assertRaises(RuntimeError):
+            self.cache.allocate_slots(1, list(range(5)))
+        # A failed allocation leaves the cache as it was.
+        self.assertEqual(self.cache.num_tokens(1), 0)
+        self.assertEqual(self.cache.num_free_blocks, 1)
+        self.append(1, [1, 2])
+        self.check(0)
+        self.check(1)
+
+
+@unittest.skipIf(
+    "intel_hpu" not in paddle.device.get_all_custom_device_type(),
+    "intel_hpu is not available",
+)
+class TestPagedKVCacheHPU(TestPagedKVCache):
+    def device(self):
+        return "intel_hpu"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -96,6 +96,28 @@ for i in range(inp_seq_len + 1, max_seq_len + 1):
     decode = k_cache(cur=key_state, dim=2, idx=token_idx)
     print(f"Paddle KVCache decode:{decode}")
 
+# paged case: the same prefill and decode in blocks of a PagedKVCache, which
+# are written with index_copy and never zero-filled
+paged_cache = paddlenlp_ops.PagedKVCache(
+    num_layers=1,
+    num_blocks=max_seq_len // 4,
+    block_size=4,
+    num_heads=num_key_value_heads,
+    head_dim=head_dim,
+    dtype=dtype,
+)
+paged_cache.add_sequence(0, list(range(inp_seq_len)))
+slots = paged_cache.allocate_slots(0, list(range(inp_seq_len)))
+prefill_states = key_states[0].transpose([1, 0, 2])
+paged_cache.write(0, slots, prefill_states, prefill_states)
+for i in range(inp_seq_len + 1, max_seq_len + 1):
+    slots = paged_cache.allocate_slots(0, [i - 1])
+    key_state = paddle.ones((1, num_key_value_heads, head_dim), dtype=dtype)
+    paged_cache.write(0, slots, key_state, key_state)
+paged_keys, _ = paged_cache.gather(0, 0)
+dense_keys = k_cache.cache[0].transpose([1, 0, 2])
+print(f"Paddle PagedKVCache matches KVCache:{paddle.allclose(paged_keys, dense_keys)}")
+
 
 if 0:
     # torch case
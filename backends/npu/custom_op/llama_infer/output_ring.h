@@ -0,0 +1,403 @@
+// Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#pragma once
+
+#include <errno.h>
+#include <fcntl.h>
+#include <linux/futex.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/file.h>
+#include <sys/ipc.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/syscall.h>
+#include <time.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <atomic>
+#include <cstdint>
+#include <cstring>
+#include <string>
+
+// A shared-memory ring that carries the tokens of each decode step from
+// save_output to its readers: get_output, or OutputRingReader in
+// paddle_custom_device.npu.serving for a serving front end in another
+// process. There is one writer, and every attached reader sees every
+// message. A message is the step's stop flag, its batch size and one token
+// per sequence, as the SysV queue carried them before.
+//
+// The writer never drops a message while a reader is attached: when the
+// ring is full it waits for the slowest reader and counts the message in
+// `overflow`. With no reader attached, messages are kept until the ring is
+// full, and later ones are dropped and counted in `dropped`. A reader
+// attaches at the oldest message kept, so a front end started after the
+// model still gets the first tokens.
+//
+// Readers and the writer only touch shared memory on the fast path. A
+// reader waiting in blocking mode sleeps on a futex that the writer wakes
+// only when someone sleeps; in busy-poll mode it spins instead. The layout
+// is fixed, and serving/output_ring.py reads it too.
+//
+// Environment, read by whoever creates the ring:
+//   FLAGS_npu_output_ring_name      shm name, defaults to one derived from
+//                                   ftok("./", 1) like the old queue key
+//   FLAGS_npu_output_ring_capacity  messages the ring holds (default 1024)
+//   FLAGS_npu_output_ring_max_bsz   tokens a message holds (default 512)
+//   FLAGS_npu_output_ring_busy_poll spin instead of sleeping (default 0)
+
+constexpr uint64_t kOutputRingMagic = 0x31474e4952445050ULL;  // "PPDRING1"
+constexpr uint32_t kOutputRingVersion = 1;
+constexpr int kOutputRingMaxReaders = 16;
+constexpr size_t kOutputRingHeaderBytes = 128;
+constexpr size_t kOutputRingReaderBytes = 64;
+
+struct OutputRingHeader {
+  std::atomic<uint64_t> magic;
+  uint32_t version;
+  uint32_t capacity;
+  uint32_t max_bsz;
+  uint32_t slot_bytes;
+  char pad0[40];
+  // Messages written, and the oldest one kept for readers.
+  std::atomic<uint64_t> write_seq;
+  std::atomic<uint64_t> retained_seq;
+  std::atomic<uint64_t> overflow;
+  std::atomic<uint64_t> dropped;
+  // Bumped on every message; blocking readers sleep on it.
+  std::atomic<uint32_t> futex;
+  std::atomic<uint32_t> sleepers;
+  char pad1[24];
+};
+
+// pid 0 marks a free entry. read_seq is the next message the reader takes.
+struct OutputRingReaderSlot {
+  std::atomic<uint64_t> pid;
+  std::atomic<uint64_t> read_seq;
+  char pad[48];
+};
+
+// A message slot: `seq` is the message number plus one once the message is
+// complete, and 0 while the writer fills it in.
+struct OutputRingSlot {
+  std::atomic<uint64_t> seq;
+  int32_t stop_flag;
+  int32_t bsz;
+  int32_t tokens[1];
+};
+
+static_assert(sizeof(OutputRingHeader) == kOutputRingHeaderBytes,
+              "the ring layout is shared with serving/output_ring.py");
+static_assert(sizeof(OutputRingReaderSlot) == kOutputRingReaderBytes,
+              "the ring layout is shared with serving/output_ring.py");
+static_assert(ATOMIC_LLONG_LOCK_FREE == 2,
+              "the ring needs lock-free 64-bit atomics");
+
+class OutputRing {
+ public:
+  // Maps the ring named by the environment, creating it if needed. Returns
+  // nullptr with a message on stderr when shared memory is unavailable.
+  static OutputRing* Open() {
+    std::string name = DefaultName();
+    int fd = shm_open(name.c_str(), O_CREAT | O_RDWR, 0666);
+    if (fd < 0) {
+      perror("output ring: shm_open");
+      return nullptr;
+    }
+    flock(fd, LOCK_EX);
+    struct stat st;
+    fstat(fd, &st);
+    size_t bytes = st.st_size;
+    if (bytes == 0) {
+      uint32_t capacity = std::max<uint32_t>(
+          1, EnvToUInt("FLAGS_npu_output_ring_capacity", 1024));
+      uint32_t max_bsz = std::max<uint32_t>(
+          1, EnvToUInt("FLAGS_npu_output_ring_max_bsz", 512));
+      uint32_t slot_bytes = SlotBytes(max_bsz);
+      bytes = SlotsOffset() + static_cast<size_t>(capacity) * slot_bytes;
+      if (ftruncate(fd, bytes) != 0) {
+        perror("output ring: ftruncate");
+        flock(fd, LOCK_UN);
+        close(fd);
+        return nullptr;
+      }
+      void* base =
+          mmap(nullptr, bytes, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+      if (base != MAP_FAILED) {
+        auto* header = static_cast<OutputRingHeader*>(base);
+        header->version = kOutputRingVersion;
+        header->capacity = capacity;
+        header->max_bsz = max_bsz;
+        header->slot_bytes = slot_bytes;
+        header->magic.store(kOutputRingMagic, std::memory_order_release);
+        munmap(base, bytes);
+      }
+    }
+    void* base =
+        mmap(nullptr, bytes, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (base == MAP_FAILED) {
+      perror("output ring: mmap");
+      flock(fd, LOCK_UN);
+      close(fd);
+      return nullptr;
+    }
+    auto* header = static_cast<OutputRingHeader*>(base);
+    if (header->magic.load(std::memory_order_acquire) != kOutputRingMagic ||
+        header->version != kOutputRingVersion) {
+      fprintf(stderr,
+              "output ring: /dev/shm%s is not a version %u ring\n",
+              name.c_str(),
+              kOutputRingVersion);
+      munmap(base, bytes);
+      flock(fd, LOCK_UN);
+      close(fd);
+      return nullptr;
+    }
+    flock(fd, LOCK_UN);
+    return new OutputRing(fd, base, bytes);
+  }
+
+  ~OutputRing() {
+    if (reader_ >= 0) {
+      Lock();
+      readers_[reader_].pid.store(0, std::memory_order_release);
+      Unlock();
+    }
+    munmap(base_, bytes_);
+    close(fd_);
+  }
+
+  int max_bsz() const { return header_->max_bsz; }
+
+  // Writes one message. Only one process may write a ring.
+  void Write(bool stop_flag, int bsz, const int64_t* tokens) {
+    const uint64_t seq = header_->write_seq.load(std::memory_order_relaxed);
+    if (seq - header_->retained_seq.load(std::memory_order_relaxed) >=
+        header_->capacity) {
+      if (!Reclaim(seq)) {
+        header_->dropped.fetch_add(1, std::memory_order_relaxed);
+        return;
+      }
+    }
+    OutputRingSlot* slot = Slot(seq);
+    slot->seq.store(0, std::memory_order_relaxed);
+    std::atomic_thread_fence(std::memory_order_release);
+    slot->stop_flag = stop_flag ? 1 : -1;
+    slot->bsz = bsz;
+    for (int i = 0; i < bsz; ++i) {
+      slot->tokens[i] = static_cast<int32_t>(tokens[i]);
+    }
+    slot->seq.store(seq + 1, std::memory_order_release);
+    header_->write_seq.store(seq + 1, std::memory_order_seq_cst);
+    header_->futex.fetch_add(1, std::memory_order_seq_cst);
+    if (header_->sleepers.load(std::memory_order_seq_cst) > 0) {
+      syscall(SYS_futex,
+              &header_->futex,
+              FUTEX_WAKE,
+              INT32_MAX,
+              nullptr,
+              nullptr,
+              0);
+    }
+  }
+
+  // Reads the next message into `out` as [stop_flag, bsz, tokens...].
+  // Returns false when there is none and `wait` is false. The first read
+  // attaches this process as a reader.
+  bool Read(int64_t* out, bool wait) {
+    if (reader_ < 0 && !Attach()) {
+      return false;
+    }
+    OutputRingReaderSlot& me = readers_[reader_];
+    while (true) {
+      uint64_t seq = me.read_seq.load(std::memory_order_relaxed);
+      if (header_->write_seq.load(std::memory_order_acquire) > seq) {
+        OutputRingSlot* slot = Slot(seq);
+        if (slot->seq.load(std::memory_order_acquire) == seq + 1) {
+          int bsz = std::min<int>(slot->bsz, header_->max_bsz);
+          out[0] = slot->stop_flag;
+          out[1] = bsz;
+          for (int i = 0; i < bsz; ++i) {
+            out[i + 2] = slot->tokens[i];
+          }
+          std::atomic_thread_fence(std::memory_order_acquire);
+          if (slot->seq.load(std::memory_order_relaxed) == seq + 1) {
+            me.read_seq.store(seq + 1, std::memory_order_release);
+            return true;
+          }
+        }
+        // The writer dropped this reader's messages while it was attaching;
+        // resume at the oldest one kept.
+        me.read_seq.store(
+            std::max(seq + 1,
+                     header_->retained_seq.load(std::memory_order_acquire)),
+            std::memory_order_release);
+        continue;
+      }
+      if (!wait) {
+        return false;
+      }
+      WaitForMessage(seq);
+    }
+  }
+
+ private:
+  OutputRing(int fd, void* base, size_t bytes)
+      : fd_(fd), base_(base), bytes_(bytes) {
+    char* p = static_cast<char*>(base);
+    header_ = reinterpret_cast<OutputRingHeader*>(p);
+    readers_ =
+        reinterpret_cast<OutputRingReaderSlot*>(p + kOutputRingHeaderBytes);
+    slots_ = p + SlotsOffset();
+    busy_poll_ = EnvToUInt("FLAGS_npu_output_ring_busy_poll", 0) != 0;
+  }
+
+  static uint64_t EnvToUInt(const char* name, uint64_t dflt) {
+    const char* value = getenv(name);
+    return value ? strtoull(value, nullptr, 10) : dflt;
+  }
+
+  static std::string DefaultName() {
+    const char* name = getenv("FLAGS_npu_output_ring_name");
+    if (name && name[0]) {
+      return name[0] == '/' ? name : std::string("/") + name;
+    }
+    char buf[64];
+    snprintf(buf,
+             sizeof(buf),
+             "/paddle_output_ring_%08x",
+             static_cast<unsigned>(ftok("./", 1)));
+    return buf;
+  }
+
+  static uint32_t SlotBytes(uint32_t max_bsz) {
+    size_t bytes = sizeof(uint64_t) + (max_bsz + 2) * sizeof(int32_t);
+    return static_cast<uint32_t>((bytes + 63) / 64 * 64);
+  }
+
+  static size_t SlotsOffset() {
+    return kOutputRingHeaderBytes +
+           kOutputRingMaxReaders * kOutputRingReaderBytes;
+  }
+
+  OutputRingSlot* Slot(uint64_t seq) const {
+    return reinterpret_cast<OutputRingSlot*>(
+        slots_ + (seq % header_->capacity) * header_->slot_bytes);
+  }
+
+  void Lock() { flock(fd_, LOCK_EX); }
+  void Unlock() { flock(fd_, LOCK_UN); }
+
+  bool Attach() {
+    Lock();
+    for (int i = 0; i < kOutputRingMaxReaders; ++i) {
+      if (readers_[i].pid.load(std::memory_order_acquire) == 0) {
+        readers_[i].read_seq.store(
+            header_->retained_seq.load(std::memory_order_acquire),
+            std::memory_order_relaxed);
+        readers_[i].pid.store(getpid(), std::memory_order_seq_cst);
+        reader_ = i;
+        break;
+      }
+    }
+    Unlock();
+    if (reader_ < 0) {
+      fprintf(stderr,
+              "output ring: all %d reader entries are taken\n",
+              kOutputRingMaxReaders);
+    }
+    return reader_ >= 0;
+  }
+
+  // Frees the slots every attached reader is done with, waiting for the
+  // slowest one if the ring stays full. Returns false when no reader is
+  // attached and the message has to be dropped.
+  bool Reclaim(uint64_t seq) {
+    bool counted = false;
+    for (int spins = 0;; ++spins) {
+      uint64_t oldest = seq;
+      bool attached = false;
+      for (int i = 0; i < kOutputRingMaxReaders; ++i) {
+        uint64_t pid = readers_[i].pid.load(std::memory_order_seq_cst);
+        if (pid == 0) {
+          continue;
+        }
+        if (spins > 0 && spins % 1024 == 0 &&
+            kill(static_cast<pid_t>(pid), 0) != 0 && errno == ESRCH) {
+          // The reader died without detaching.
+          Lock();
+          readers_[i].pid.compare_exchange_strong(pid, 0);
+          Unlock();
+          continue;
+        }
+        attached = true;
+        oldest = std::min(oldest,
+                          readers_[i].read_seq.load(std::memory_order_acquire));
+      }
+      if (!attached) {
+        return false;
+      }
+      header_->retained_seq.store(oldest, std::memory_order_seq_cst);
+      if (seq - oldest < header_->capacity) {
+        return true;
+      }
+      if (!counted) {
+        header_->overflow.fetch_add(1, std::memory_order_relaxed);
+        counted = true;
+      }
+      Pause(spins);
+    }
+  }
+
+  void Pause(int spins) const {
+    if (busy_poll_ || spins < 64) {
+      return;
+    }
+    struct timespec ts = {0, spins < 1024 ? 10000 : 200000};
+    nanosleep(&ts, nullptr);
+  }
+
+  void WaitForMessage(uint64_t seq) {
+    if (busy_poll_) {
+      return;
+    }
+    uint32_t observed = header_->futex.load(std::memory_order_seq_cst);
+    header_->sleepers.fetch_add(1, std::memory_order_seq_cst);
+    if (header_->write_seq.load(std::memory_order_seq_cst) <= seq) {
+      // Woken by the writer, or after a while to notice a writer that has
+      // gone away and come back.
+      struct timespec timeout = {0, 100000000};
+      syscall(SYS_futex,
+              &header_->futex,
+              FUTEX_WAIT,
+              observed,
+              &timeout,
+              nullptr,
+              0);
+    }
+    header_->sleepers.fetch_sub(1, std::memory_order_seq_cst);
+  }
+
+  int fd_;
+  void* base_;
+  size_t bytes_;
+  OutputRingHeader* header_;
+  OutputRingReaderSlot* readers_;
+  char* slots_;
+  bool busy_poll_;
+  int reader_ = -1;
+};
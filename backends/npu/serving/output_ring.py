@@ -0,0 +1,222 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reader for the shared-memory ring that save_output writes.
+
+A serving front end can take the tokens of every decode step straight from
+shared memory, without a syscall per step::
+
+    from paddle_custom_device.npu.serving import OutputRingReader
+
+    with OutputRingReader() as reader:
+        while True:
+            stop_flag, tokens = reader.read()
+            ...
+
+The layout is the one in custom_op/llama_infer/output_ring.h. Every reader
+sees every message, and the writer waits for the slowest reader instead of
+dropping messages.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+_MAGIC = 0x31474E4952445050
+_VERSION = 1
+_MAX_READERS = 16
+_HEADER_BYTES = 128
+_READER_BYTES = 64
+_SLOTS_OFFSET = _HEADER_BYTES + _MAX_READERS * _READER_BYTES
+
+# Byte offsets of the header fields.
+_OFF_MAGIC = 0
+_OFF_PARAMS = 8  # version, capacity, max_bsz, slot_bytes: 4 x uint32
+_OFF_WRITE_SEQ = 64
+_OFF_RETAINED_SEQ = 72
+_OFF_OVERFLOW = 80
+_OFF_DROPPED = 88
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def default_ring_name():
+    """The shm name save_output uses: FLAGS_npu_output_ring_name, or one
+    derived from ftok("./", 1) as the old message queue key was."""
+    name = os.getenv("FLAGS_npu_output_ring_name")
+    if name:
+        return name.lstrip("/")
+    st = os.stat("./")
+    key = (st.st_ino & 0xFFFF) | ((st.st_dev & 0xFF) << 16) | (1 << 24)
+    return "paddle_output_ring_%08x" % key
+
+
+class OutputRingReader:
+    """Attaches to the output ring as one of its readers.
+
+    Args:
+        name (str, optional): shm name of the ring. Defaults to the name
+            save_output uses when started from the same directory.
+        busy_poll (bool, optional): spin instead of sleeping while waiting.
+            Defaults to FLAGS_npu_output_ring_busy_poll.
+
+    The ring is created with FLAGS_npu_output_ring_capacity and
+    FLAGS_npu_output_ring_max_bsz if the model has not created it yet. The
+    reader starts at the oldest message the ring still holds.
+    """
+
+    def __init__(self, name=None, busy_poll=None):
+        self._name = name or default_ring_name()
+        if busy_poll is None:
+            busy_poll = _env_int("FLAGS_npu_output_ring_busy_poll", 0) != 0
+        self._busy_poll = busy_poll
+        # An uncontended lock round trip is a full memory barrier; it orders
+        # the loads of a slot against its sequence number.
+        self._fence = threading.Lock()
+        self._fd = os.open(
+            os.path.join("/dev/shm", self._name), os.O_RDWR | os.O_CREAT, 0o666
+        )
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            self._map = self._map_ring()
+            self._reader = self._attach()
+        except Exception:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            raise
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _map_ring(self):
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            capacity = max(1, _env_int("FLAGS_npu_output_ring_capacity", 1024))
+            max_bsz = max(1, _env_int("FLAGS_npu_output_ring_max_bsz", 512))
+            slot_bytes = (8 + 4 * (max_bsz + 2) + 63) // 64 * 64
+            size = _SLOTS_OFFSET + capacity * slot_bytes
+            os.ftruncate(self._fd, size)
+            ring = mmap.mmap(self._fd, size)
+            struct.pack_into(
+                "<4I", ring, _OFF_PARAMS, _VERSION, capacity, max_bsz, slot_bytes
+            )
+            struct.pack_into("<Q", ring, _OFF_MAGIC, _MAGIC)
+        else:
+            ring = mmap.mmap(self._fd, size)
+        magic = struct.unpack_from("<Q", ring, _OFF_MAGIC)[0]
+        params = struct.unpack_from("<4I", ring, _OFF_PARAMS)
+        if magic != _MAGIC or params[0] != _VERSION:
+            ring.close()
+            raise RuntimeError(
+                "/dev/shm/%s is not a version %d output ring" % (self._name, _VERSION)
+            )
+        _, self._capacity, self._max_bsz, self._slot_bytes = params
+        self._words = memoryview(ring).cast("Q")
+        self._ints = memoryview(ring).cast("i")
+        return ring
+
+    def _attach(self):
+        for i in range(_MAX_READERS):
+            pid_word = (_HEADER_BYTES + i * _READER_BYTES) // 8
+            if self._words[pid_word] == 0:
+                self._words[pid_word + 1] = self._words[_OFF_RETAINED_SEQ // 8]
+                self._words[pid_word] = os.getpid()
+                return pid_word
+        raise RuntimeError(
+            "all %d reader entries of the output ring are taken" % _MAX_READERS
+        )
+
+    @property
+    def max_bsz(self):
+        return self._max_bsz
+
+    def stats(self):
+        """Messages written, messages not yet read by this reader, messages
+        the writer had to wait for a full ring, and messages dropped while no
+        reader was attached."""
+        write_seq = self._words[_OFF_WRITE_SEQ // 8]
+        return {
+            "written": write_seq,
+            "pending": write_seq - self._words[self._reader + 1],
+            "overflow": self._words[_OFF_OVERFLOW // 8],
+            "dropped": self._words[_OFF_DROPPED // 8],
+        }
+
+    def read(self, wait=True, timeout=None):
+        """Returns the next message as (stop_flag, tokens), stop_flag being 1
+        while generation goes on and -1 once every sequence has stopped.
+        Returns None if there is no message and `wait` is False, or none
+        came within `timeout` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        spins = 0
+        while True:
+            seq = self._words[self._reader + 1]
+            if self._words[_OFF_WRITE_SEQ // 8] > seq:
+                message = self._take(seq)
+                if message is not None:
+                    return message
+                continue
+            if not wait or (deadline is not None and time.monotonic() > deadline):
+                return None
+            spins += 1
+            if not self._busy_poll and spins > 64:
+                time.sleep(1e-5 if spins < 1024 else 2e-4)
+
+    def _take(self, seq):
+        base = _SLOTS_OFFSET + (seq % self._capacity) * self._slot_bytes
+        with self._fence:
+            published = self._words[base // 8]
+        if published == seq + 1:
+            stop_flag = self._ints[base // 4 + 2]
+            bsz = min(self._ints[base // 4 + 3], self._max_bsz)
+            tokens = self._ints[base // 4 + 4 : base // 4 + 4 + bsz].tolist()
+            with self._fence:
+                published = self._words[base // 8]
+            if published == seq + 1:
+                self._words[self._reader + 1] = seq + 1
+                return stop_flag, tokens
+        # The writer went past this message while the reader was attaching;
+        # resume at the oldest message kept.
+        self._words[self._reader + 1] = max(
+            seq + 1, self._words[_OFF_RETAINED_SEQ // 8]
+        )
+        return None
+
+    def close(self):
+        """Detaches from the ring so the writer stops waiting for this
+        reader."""
+        if self._map is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._words[self._reader] = 0
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._words.release()
+        self._ints.release()
+        self._map.close()
+        self._map = None
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, "_map", None) is not None:
+            self.close()
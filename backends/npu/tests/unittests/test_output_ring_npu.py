@@ -0,0 +1,73 @@
+#   Copyright (c) 2024 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import os
+import unittest
+
+import numpy as np
+import paddle
+
+# The ops open the ring on their first call.
+os.environ["FLAGS_npu_output_ring_name"] = "paddle_output_ring_test_%d" % os.getpid()
+
+from paddle_custom_device.npu import get_output, save_output  # noqa: E402
+from paddle_custom_device.npu.serving import OutputRingReader  # noqa: E402
+
+MAX_BSZ = 512
+
+
+class TestOutputRing(unittest.TestCase):
+    def setUp(self):
+        paddle.set_device("npu")
+        np.random.seed(2024)
+
+    def tearDown(self):
+        shm = os.path.join("/dev/shm", os.environ["FLAGS_npu_output_ring_name"])
+        if os.path.exists(shm):
+            os.remove(shm)
+
+    def test_save_and_get_output(self):
+        reader = OutputRingReader()
+        steps = []
+        for bsz, not_need_stop in [(4, True), (1, True), (7, False)]:
+            tokens = np.random.randint(0, 32000, size=[bsz, 1]).astype("int64")
+            save_output(
+                paddle.to_tensor(tokens),
+                paddle.to_tensor([not_need_stop]),
+                0,
+            )
+            steps.append((1 if not_need_stop else -1, tokens.flatten().tolist()))
+
+        for expected in steps:
+            self.assertEqual(reader.read(timeout=10), expected)
+        self.assertIsNone(reader.read(wait=False))
+        self.assertEqual(reader.stats()["dropped"], 0)
+        reader.close()
+
+        # get_output is a reader of its own and sees every message too.
+        out = paddle.full([MAX_BSZ + 2], -1, dtype="int64").cpu()
+        for stop_flag, tokens in steps:
+            get_output(out, 0, True)
+            got = out.numpy()
+            self.assertEqual(got[0], stop_flag)
+            self.assertEqual(got[1], len(tokens))
+            self.assertEqual(got[2 : 2 + len(tokens)].tolist(), tokens)
+        get_output(out, 0, False)
+        self.assertEqual(out.numpy()[0], -2)
+
+
+if __name__ == "__main__":
+    unittest.main()